@@ -0,0 +1,186 @@
+from typing import Any, Dict, List, Tuple
+import asyncio
+import random
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+
+import game_sim
+from game_sim import stlat_list, team_names
+from src.common import BloodType
+from src.common import ForbiddenKnowledge as FK
+from src.common import MachineLearnedModel as Ml
+from src.game_state import GameState, InningHalf
+from src.model_registry import ModelRegistry
+from src.rng import RngStreams
+from src.team_state import TeamState
+
+SEASON = 11
+LINEUP_SIZE = 9
+# feature count and number of outcomes of each model, the shapes the real models are trained with
+MODEL_SHAPES = {
+    Ml.PITCH: (30, 4),
+    Ml.IS_HIT: (30, 3),
+    Ml.HIT_TYPE: (30, 4),
+    Ml.RUNNER_ADV_OUT: (22, 2),
+    Ml.RUNNER_ADV_HIT: (22, 2),
+    Ml.SB_ATTEMPT: (22, 2),
+    Ml.SB_SUCCESS: (22, 2),
+}
+TRAINING_ROWS = 400
+
+
+def synthetic_models(seed: int = 0) -> Dict[Ml, LogisticRegression]:
+    """Logistic regressions with the real models' shapes, fit to seeded noise.
+
+    Their predictions mean nothing but they cost what the real ones do to evaluate, which is all a benchmark
+    needs.  The same seed gives the same coefficients.
+    """
+    rng = np.random.default_rng(seed)
+    models = {}
+    for model, (features, outcomes) in MODEL_SHAPES.items():
+        x = rng.random((TRAINING_ROWS, features))
+        y = np.arange(TRAINING_ROWS) % outcomes
+        rng.shuffle(y)
+        models[model] = LogisticRegression(max_iter=200).fit(x, y)
+    return models
+
+
+def synthetic_registry(models: Dict[Ml, Any]) -> ModelRegistry:
+    registry = ModelRegistry(model_dir="nowhere")
+    for model, clf in models.items():
+        registry.register(model, clf)
+    return registry
+
+
+def sim_models(models: Dict[Ml, Any]) -> Dict[str, Any]:
+    """The models keyed the way game_sim.load_models keys them"""
+    return {model.name.lower(): clf for model, clf in models.items()}
+
+
+def synthetic_team_ids(count: int) -> List[str]:
+    if count > len(team_names):
+        raise ValueError(f"Only {len(team_names)} teams to build rosters for, asked for {count}")
+    return list(team_names)[:count]
+
+
+def player_id(team_id: str, slot: int) -> str:
+    return f"{team_id[:8]}-{slot}"
+
+
+def synthetic_players(team_ids: List[str], seed: int = 0) -> List[Dict[str, Any]]:
+    """A day's stlats file, LINEUP_SIZE hitters and a pitcher per team, as game_sim.load_day_stlats reads it"""
+    rng = random.Random(seed)
+    players = []
+    for team_id in team_ids:
+        for slot in range(LINEUP_SIZE + 1):
+            player = {
+                "player_id": player_id(team_id, slot),
+                "player_name": f"{team_names[team_id]} {slot}",
+                "team_id": team_id,
+                "blood": rng.randint(0, 12),
+                "position_type_id": "0" if slot < LINEUP_SIZE else "1",
+                "position_id": slot,
+            }
+            for stlat in stlat_list:
+                player[stlat] = rng.random()
+            players.append(player)
+    return players
+
+
+def synthetic_day(
+    games: int = 10,
+    day: int = 0,
+    seed: int = 0,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any], Dict[str, Any], Dict[str, int], Dict[str, str]]:
+    """A day of games with the dicts game_sim.load_day_stlats returns: games, player stlats, team stlats,
+    blood types and names"""
+    team_ids = synthetic_team_ids(2 * games)
+    rng = random.Random(seed)
+    player_stlats, team_stlats, player_blood_types, player_names = {}, {}, {}, {}
+    for player in synthetic_players(team_ids, seed):
+        player_stlats[player["player_id"]] = player
+        player_blood_types[player["player_id"]] = player["blood"]
+        player_names[player["player_id"]] = player["player_name"]
+        lineup = team_stlats.setdefault(player["team_id"], {"lineup": {}})["lineup"]
+        if player["position_type_id"] == "0":
+            lineup[player["player_id"]] = player
+    day_games = []
+    for index in range(games):
+        home, away = team_ids[2 * index], team_ids[2 * index + 1]
+        day_games.append({
+            "day": day, "season": SEASON, "homeTeam": home, "awayTeam": away,
+            "homePitcher": player_id(home, LINEUP_SIZE), "awayPitcher": player_id(away, LINEUP_SIZE),
+            "homePitcherName": player_names[player_id(home, LINEUP_SIZE)],
+            "awayPitcherName": player_names[player_id(away, LINEUP_SIZE)],
+            "homeTeamName": team_names[home], "awayTeamName": team_names[away],
+            "homeTeamNickname": team_names[home], "awayTeamNickname": team_names[away],
+            "outcomes": [], "homeOdds": rng.random(), "awayOdds": rng.random(),
+            "homeScore": rng.randint(0, 9), "awayScore": rng.randint(0, 9),
+        })
+    return day_games, player_stlats, team_stlats, player_blood_types, player_names
+
+
+def simulate_synthetic_day(
+    games: int = 2,
+    seed: int = 0,
+    sim_length: int = 8,
+    **simulate_args: Any,
+) -> Tuple[List[Dict[str, Any]], Tuple[int, int, Dict[str, Any], Dict[str, Any], str]]:
+    """A synthetic day's games and what game_sim.simulate returns for them with synthetic models.  Replicas
+    draw from RngStreams(seed) and nothing is logged or written unless simulate_args say otherwise."""
+    day_games, player_stlats, team_stlats, player_blood_types, player_names = synthetic_day(games, seed=seed)
+    clf = sim_models(synthetic_models(seed))
+    simulate_args = {"write_daily_results": False, "streams": RngStreams(seed), "log_games": False,
+                     **simulate_args}
+
+    async def run():
+        models = await game_sim.setup_models(day_games, clf, player_stlats, team_stlats)
+        return await game_sim.simulate(day_games, models, team_stlats, player_blood_types, player_names,
+                                       sim_length, **simulate_args)
+
+    return day_games, asyncio.run(run())
+
+
+def synthetic_team_state(team_id: str, seed: int = 0) -> TeamState:
+    """A fresh TeamState for team_id with seeded stlats, the same seed gives the same team"""
+    rng = random.Random(f"{seed}-{team_id}")
+    players = [player_id(team_id, slot) for slot in range(LINEUP_SIZE + 1)]
+    bloods = list(BloodType)
+    return TeamState(
+        team_id=team_id,
+        season=SEASON,
+        day=1,
+        num_bases=4,
+        balls_for_walk=4,
+        strikes_for_out=3,
+        outs_for_inning=3,
+        lineup={slot + 1: player for slot, player in enumerate(players[:LINEUP_SIZE])},
+        starting_pitcher=players[LINEUP_SIZE],
+        stlats={player: {FK[stlat.upper()]: rng.random() for stlat in stlat_list} for player in players},
+        game_stats={player: {} for player in players},
+        blood={player: rng.choice(bloods) for player in players},
+        player_names={player: f"{team_names[team_id]} {slot}" for slot, player in enumerate(players)},
+        cur_batter_pos=1,
+    )
+
+
+def synthetic_game_state(model_registry: ModelRegistry, seed: int = 0) -> GameState:
+    """A fresh game between the first two teams at the top of the first, rolling from a seeded random.Random"""
+    home, away = synthetic_team_ids(2)
+    return GameState(
+        game_id="benchmark",
+        season=SEASON,
+        day=1,
+        home_team=synthetic_team_state(home, seed),
+        away_team=synthetic_team_state(away, seed),
+        home_score=0,
+        away_score=0,
+        inning=1,
+        half=InningHalf.TOP,
+        outs=0,
+        strikes=0,
+        balls=0,
+        model_registry=model_registry,
+        rng=random.Random(seed),
+    )
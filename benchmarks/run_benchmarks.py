@@ -0,0 +1,271 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import game_sim
+from benchmarks.fixtures import sim_models, synthetic_day, synthetic_game_state, synthetic_models
+from benchmarks.fixtures import synthetic_registry, synthetic_team_ids, synthetic_team_state
+from src.common import MachineLearnedModel as Ml
+from src.game_state import GameState
+from src.rng import RngStreams
+
+SCHEMA_VERSION = 1
+DEFAULT_ROUNDS = 5
+# each round repeats its benchmark until at least this long has passed, so fast operations are timed in bulk
+DEFAULT_MIN_ROUND_TIME = 0.2
+DEFAULT_SIM_LENGTH = 10
+DEFAULT_GAMES = 10
+# a benchmark more than this much slower than the baseline is reported as a regression
+DEFAULT_THRESHOLD = 0.10
+
+
+class Benchmark(object):
+    def __init__(
+        self,
+        name: str,
+        unit: str,
+        run: Callable[..., int],
+        setup: Optional[Callable[[], Any]] = None,
+    ) -> None:
+        """One timed operation, run() does some whole number of units of work and returns how many.
+
+        With setup, run is called with what setup returns and only run is timed, for work that needs a fresh
+        fixture every call.
+        """
+        self.name = name
+        self.unit = unit
+        self.run = run
+        self.setup = setup
+
+    def _timed_run(self) -> Tuple[int, float]:
+        args = () if self.setup is None else (self.setup(),)
+        start = time.perf_counter()
+        units = self.run(*args)
+        return units, time.perf_counter() - start
+
+    def measure(self, rounds: int = DEFAULT_ROUNDS, min_round_time: float = DEFAULT_MIN_ROUND_TIME) -> Dict[str, Any]:
+        """Seconds per unit for each round after a warm up call, summarized over the rounds"""
+        self._timed_run()
+        per_unit = []
+        units = 0
+        for _ in range(rounds):
+            round_units = 0
+            elapsed = 0.0
+            while elapsed < min_round_time or round_units == 0:
+                units_run, seconds = self._timed_run()
+                round_units += units_run
+                elapsed += seconds
+            per_unit.append(elapsed / round_units)
+            units += round_units
+        median = statistics.median(per_unit)
+        return {
+            "unit": self.unit,
+            "rounds": rounds,
+            "units": units,
+            "median_seconds": median,
+            "min_seconds": min(per_unit),
+            "max_seconds": max(per_unit),
+            "per_second": 1.0 / median if median > 0.0 else float("inf"),
+        }
+
+
+def engine_benchmarks(
+    storage_dir: str,
+    seed: int = 0,
+    games: int = DEFAULT_GAMES,
+    sim_length: int = DEFAULT_SIM_LENGTH,
+) -> List[Benchmark]:
+    """The engine hot paths, all on synthetic rosters and models so no season data is needed.  Saved games go
+    to storage_dir."""
+    models = synthetic_models(seed)
+    registry = synthetic_registry(models)
+    clf = sim_models(models)
+    day = synthetic_day(games, seed=seed)
+    day_games, player_stlats, team_stlats, player_blood_types, player_names = day
+    team_id = synthetic_team_ids(1)[0]
+    game_path = os.path.join(storage_dir, "game_state.json")
+    synthetic_game_state(registry, seed).save(game_path)
+    roll_game = synthetic_game_state(registry, seed)
+    feature_vector = GameState.gen_model_fv(Ml.PITCH, roll_game.cur_batting_team, roll_game.cur_pitching_team,
+                                            roll_game.cur_batting_team.cur_batter)
+    defense_team = synthetic_team_state(team_id, seed)
+    sim_day_models = asyncio.run(game_sim.setup_models(day_games, clf, player_stlats, team_stlats))
+
+    def fresh_game() -> GameState:
+        game = synthetic_game_state(registry, seed)
+        game.precompute_probability_tables()
+        return game
+
+    def pitch_sim(game: GameState) -> int:
+        pitches = 0
+        while not game.is_game_over:
+            game.pitch_sim()
+            game.attempt_to_advance_inning()
+            pitches += 1
+        return pitches
+
+    def simulate_game(game: GameState) -> int:
+        game.simulate_game()
+        return 1
+
+    def generic_model_roll() -> int:
+        for _ in range(100):
+            roll_game.generic_model_roll(Ml.PITCH, feature_vector)
+        return 100
+
+    def team_state_init() -> int:
+        synthetic_team_state(team_id, seed)
+        return 1
+
+    def calculate_defense() -> int:
+        defense_team._calculate_defense()
+        return 1
+
+    def game_state_save() -> int:
+        roll_game.save(game_path)
+        return 1
+
+    def game_state_load() -> int:
+        GameState.load(game_path, registry)
+        return 1
+
+    def setup_models() -> int:
+        asyncio.run(game_sim.setup_models(day_games, clf, player_stlats, team_stlats))
+        return 1
+
+    def end_to_end() -> int:
+        asyncio.run(game_sim.simulate(day_games, sim_day_models, team_stlats, player_blood_types, player_names,
+                                      sim_length, write_daily_results=False, streams=RngStreams(seed),
+                                      log_games=False))
+        return len(day_games) * sim_length
+
+    return [
+        Benchmark("pitch_sim", "pitch", pitch_sim, fresh_game),
+        Benchmark("simulate_game", "game", simulate_game, fresh_game),
+        Benchmark("generic_model_roll", "roll", generic_model_roll),
+        Benchmark("team_state_init", "team", team_state_init),
+        Benchmark("calculate_defense", "team", calculate_defense),
+        Benchmark("game_state_save", "game", game_state_save),
+        Benchmark("game_state_load", "game", game_state_load),
+        Benchmark("setup_models", "day", setup_models),
+        Benchmark("end_to_end", "game", end_to_end),
+    ]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(
+    names: Optional[List[str]] = None,
+    rounds: int = DEFAULT_ROUNDS,
+    min_round_time: float = DEFAULT_MIN_ROUND_TIME,
+    seed: int = 0,
+    games: int = DEFAULT_GAMES,
+    sim_length: int = DEFAULT_SIM_LENGTH,
+) -> Dict[str, Any]:
+    """Measure the benchmarks, all of them or those in names, into a json ready report"""
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="benchmarks") as storage_dir:
+        benchmarks = engine_benchmarks(storage_dir, seed, games, sim_length)
+        known = [benchmark.name for benchmark in benchmarks]
+        for name in names or []:
+            if name not in known:
+                raise ValueError(f"Unknown benchmark {name}, expected one of {known}")
+        for benchmark in benchmarks:
+            if names and benchmark.name not in names:
+                continue
+            results[benchmark.name] = benchmark.measure(rounds, min_round_time)
+    return {
+        "schema": SCHEMA_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "config": {"seed": seed, "games": games, "sim_length": sim_length, "rounds": rounds,
+                   "min_round_time": min_round_time},
+        "benchmarks": results,
+    }
+
+
+def compare(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    threshold: float = DEFAULT_THRESHOLD,
+) -> List[Dict[str, Any]]:
+    """Per benchmark change in median time between two reports, only benchmarks both of them ran"""
+    rows = []
+    for name, result in current["benchmarks"].items():
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            continue
+        ratio = result["median_seconds"] / before["median_seconds"]
+        rows.append({"name": name, "baseline": before["median_seconds"], "current": result["median_seconds"],
+                     "ratio": ratio, "regression": ratio > 1.0 + threshold})
+    return rows
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"{'benchmark':<20} {'median':>12} {'per second':>14}"]
+    for name, result in report["benchmarks"].items():
+        lines.append(f"{name:<20} {result['median_seconds'] * 1e6:>10.1f}us {result['per_second']:>10.1f} "
+                     f"{result['unit']}/s")
+    return "\n".join(lines)
+
+
+def format_comparison(rows: List[Dict[str, Any]]) -> str:
+    lines = [f"{'benchmark':<20} {'baseline':>12} {'current':>12} {'change':>8}"]
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        lines.append(f"{row['name']:<20} {row['baseline'] * 1e6:>10.1f}us {row['current'] * 1e6:>10.1f}us "
+                     f"{row['ratio'] - 1.0:>+7.1%}{flag}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the engine hot paths on synthetic rosters and models")
+    parser.add_argument("names", nargs="*", help="benchmarks to run, all of them by default")
+    parser.add_argument("--output", help="write the json report here")
+    parser.add_argument("--compare", help="json report of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="fractional slow down that counts as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 on any regression")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS)
+    parser.add_argument("--min-round-time", type=float, default=DEFAULT_MIN_ROUND_TIME)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic rosters and models")
+    parser.add_argument("--games", type=int, default=DEFAULT_GAMES, help="games in the synthetic day")
+    parser.add_argument("--sim-length", type=int, default=DEFAULT_SIM_LENGTH,
+                        help="replicas per game in the end to end benchmark")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.names, args.rounds, args.min_round_time, args.seed, args.games, args.sim_length)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+    if args.compare:
+        with open(args.compare, "r") as baseline_file:
+            rows = compare(json.load(baseline_file), report, args.threshold)
+        print(format_comparison(rows))
+        if args.fail_on_regression and any(row["regression"] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
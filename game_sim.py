@@ -2,12 +2,23 @@ import asyncio
 import json
 import os
 import random
+from functools import lru_cache
 
-import requests
 import statistics
 
 from joblib import load
-from requests import Timeout
+
+from src.aggregators import GameAggregate, QuantileSketch
+from src.compiled_models import compiled_path, load_compiled
+from src.event_tape import EventTape, EventType
+from src.fetch import fetch_player_stats, get_fetcher
+from src.fused_models import FusedModel
+from src.game_log_archive import get_log_sink
+from src.model_row_cache import ModelRowCache
+from src.probability_cache import ProbabilityCache
+from src.rng import RngStreams
+from src.stlats_store import StlatsStore, group_day_stlats, group_season_games
+from src.variance_reduction import INDEPENDENT, SOBOL, SamplingAccumulator, replica_stream, sobol_points
 
 team_names = {
 "b72f3061-f573-40d7-832a-5ad475bd7909": "Lovers",
@@ -35,6 +46,8 @@ team_names = {
 team_effects = {"3f8bbb15-61c0-4e3f-8e4a-907a5fb1565e": {"growth": 8}}
 blood_effect = {"f02aeae2-5e6a-4098-9842-02d2273f25c7": {"base_instincts": {"season": 8, "blood": 4}}}
 base_instincts_procs = {8: {2: 0, 3: 0}, 9: {2: 0, 3: 0}, 10: {2: 0, 3: 0}}
+# source of every roll, the random module unless simulate installs a per replica stream with set_rng
+rng = random
 stlat_list = ["anticapitalism", "chasiness", "omniscience", "tenaciousness", "watchfulness", "pressurization",
               "cinnamon", "buoyancy", "divinity", "martyrdom", "moxie", "musclitude", "patheticism", "thwackability",
               "tragicness", "base_thirst", "continuation", "ground_friction", "indulgence", "laserlikeness",
@@ -42,20 +55,8 @@ stlat_list = ["anticapitalism", "chasiness", "omniscience", "tenaciousness", "wa
 
 
 async def retry_request(url, tries=10):
-    headers = {
-        'User-Agent': 'sibrGameSim/0.1test (tehstone#8448@sibr)'
-    }
-
-    for i in range(tries):
-        try:
-            response = requests.get(url, headers=headers)
-            if response.status_code == 200:
-                return response
-        except (Timeout, Exception):
-            continue
-        finally:
-            await asyncio.sleep(.5)
-    return None
+    """The url's response, None if every try failed, fetched without blocking the event loop"""
+    return await get_fetcher().get(url, tries)
 
 
 def apply_effect(def_stlats, effect, day):
@@ -71,10 +72,61 @@ def apply_effect_deep(def_stlats, effect, day):
     return def_stlats
 
 
-async def setup_models(games, clf, player_stlats, team_stlats):
+# the stlats each feature vector is built from, in order: the hitter's, the opposing pitcher's and the means of the
+# opposing defense's.  The runner vector is the hit vector without the hitter's first eight stlats
+HITTER_STLATS = ["buoyancy", "divinity", "martyrdom", "moxie", "musclitude", "patheticism",
+                 "thwackability", "tragicness", "base_thirst", "continuation",
+                 "ground_friction", "indulgence", "laserlikeness", "cinnamon", "pressurization"]
+RUNNER_STLATS = HITTER_STLATS[8:]
+PITCHER_STLATS = ["coldness", "overpowerment", "ruthlessness", "shakespearianism",
+                  "suppression", "unthwackability", "cinnamon", "pressurization"]
+DEFENSE_STLATS = ["anticapitalism", "chasiness", "omniscience", "tenaciousness",
+                  "watchfulness", "pressurization", "cinnamon"]
+# models that share the hit feature vector and the runner feature vector, each group is evaluated in one pass
+HIT_MODELS = ["pitch", "is_hit", "hit_type"]
+RUN_MODELS = ["runner_adv_out", "runner_adv_hit", "sb_attempt", "sb_success"]
+
+
+@lru_cache(maxsize=1024)
+def _defense_means(columns):
+    return [statistics.mean(column) for column in columns]
+
+
+def defense_means(defense):
+    """Mean of each of DEFENSE_STLATS over defense.  statistics.mean is exact and slow, the means are worked out
+    once per distinct defense since lineups change little from day to day"""
+    return _defense_means(tuple(tuple(float(d[stlat]) for d in defense.values()) for stlat in DEFENSE_STLATS))
+
+
+def side_features(hitters, pitcher, defense):
+    """The hit and runner feature vectors of each hitter facing pitcher and defense, effects already applied,
+    in hitter id order"""
+    opponent = [float(pitcher[stlat]) for stlat in PITCHER_STLATS] + defense_means(defense)
+    features = {}
+    for hitter_id in sorted(hitters):
+        hitter = hitters[hitter_id]
+        h_arr = [float(hitter[stlat]) for stlat in HITTER_STLATS] + opponent
+        r_arr = [float(hitter[stlat]) for stlat in RUNNER_STLATS] + opponent
+        features[hitter_id] = (h_arr, r_arr)
+    return features
+
+
+async def setup_models(games, clf, player_stlats, team_stlats, cache=None, probability_cache=None):
+    """Every hitter's probability rows for the day's games.
+
+    With a ModelRowCache each hitter's rows are keyed on their hit feature vector, which holds every value the
+    runner vector does.  Only hitters whose vector changed since the cache last saw it are run through the models,
+    a change to a stlat no vector uses invalidates nothing.  Those left over are looked up in
+    the ProbabilityCache if there is one, which carries rows from one run to the next."""
     models = {"pitch": {}, "is_hit": {}, "hit_type": {},
               "runner_adv_out": {}, "runner_adv_hit": {},
               "sb_attempt": {}, "sb_success": {}}
+    hitter_ids = []
+    hit_model_arrs = []
+    run_model_arrs = []
+    fresh_keys = []
+    if cache is not None:
+        cache.bind(clf)
     for game in games:
         if game["homePitcher"] not in player_stlats:
             continue
@@ -96,114 +148,85 @@ async def setup_models(games, clf, player_stlats, team_stlats):
                     away_defense = apply_effect_deep(away_defense, effect, game["day"])
                     away_hitters = apply_effect_deep(away_hitters, effect, game["day"])
                     away_pitcher = apply_effect(away_pitcher, effect, game["day"])
-        h_anticapitalism = statistics.mean([float(d["anticapitalism"]) for d in home_defense.values()])
-        h_chasiness = statistics.mean([float(d["chasiness"]) for d in home_defense.values()])
-        h_omniscience = statistics.mean([float(d["omniscience"]) for d in home_defense.values()])
-        h_tenaciousness = statistics.mean([float(d["tenaciousness"]) for d in home_defense.values()])
-        h_watchfulness = statistics.mean([float(d["watchfulness"]) for d in home_defense.values()])
-        h_defense_pressurization = statistics.mean([float(d["pressurization"]) for d in home_defense.values()])
-        h_defense_cinnamon = statistics.mean([float(d["cinnamon"]) for d in home_defense.values()])
-        a_anticapitalism = statistics.mean([float(d["anticapitalism"]) for d in away_defense.values()])
-        a_chasiness = statistics.mean([float(d["chasiness"]) for d in away_defense.values()])
-        a_omniscience = statistics.mean([float(d["omniscience"]) for d in away_defense.values()])
-        a_tenaciousness = statistics.mean([float(d["tenaciousness"]) for d in away_defense.values()])
-        a_watchfulness = statistics.mean([float(d["watchfulness"]) for d in away_defense.values()])
-        a_defense_pressurization = statistics.mean([float(d["pressurization"]) for d in away_defense.values()])
-        a_defense_cinnamon = statistics.mean([float(d["cinnamon"]) for d in away_defense.values()])
-        hit_model_arrs = []
-        run_model_arrs = []
-        sorted_h_hitters = {k: v for k, v in
-                            sorted(home_hitters.items(), key=lambda item: item[0])}
-        sorted_a_hitters = {k: v for k, v in
-                            sorted(away_hitters.items(), key=lambda item: item[0])}
-        for __, hitter in sorted_h_hitters.items():
-            h_arr = []
-            r_arr = []
-            for stlat in ["buoyancy", "divinity", "martyrdom", "moxie", "musclitude", "patheticism",
-                          "thwackability", "tragicness", "base_thirst", "continuation",
-                          "ground_friction", "indulgence", "laserlikeness", "cinnamon", "pressurization"]:
-                h_arr.append(float(hitter[stlat]))
-            for stlat in ['base_thirst', 'continuation', 'ground_friction', 'indulgence',
-                          'laserlikeness', 'cinnamon', 'pressurization']:
-                r_arr.append(float(hitter[stlat]))
-            for stlat in ["coldness", "overpowerment", "ruthlessness", "shakespearianism",
-                          "suppression", "unthwackability", "cinnamon", "pressurization"]:
-                h_arr.append(float(away_pitcher[stlat]))
-                r_arr.append(float(away_pitcher[stlat]))
-            h_arr += [a_anticapitalism, a_chasiness, a_omniscience, a_tenaciousness,
-                      a_watchfulness, a_defense_pressurization, a_defense_cinnamon]
-            r_arr += [a_anticapitalism, a_chasiness, a_omniscience, a_tenaciousness,
-                      a_watchfulness, a_defense_pressurization, a_defense_cinnamon]
+        features = side_features(home_hitters, away_pitcher, away_defense)
+        features.update(side_features(away_hitters, home_pitcher, home_defense))
+        for hitter_id, (h_arr, r_arr) in features.items():
+            if cache is not None:
+                key = tuple(h_arr)
+                rows = cache.get(key)
+                if rows is not None:
+                    for name, row in rows.items():
+                        models[name][hitter_id] = row
+                    continue
+                fresh_keys.append(key)
+            hitter_ids.append(hitter_id)
             hit_model_arrs.append(h_arr)
             run_model_arrs.append(r_arr)
-        for __, hitter in sorted_a_hitters.items():
-            h_arr = []
-            r_arr = []
-            for stlat in ["buoyancy", "divinity", "martyrdom", "moxie", "musclitude", "patheticism",
-                          "thwackability", "tragicness", "base_thirst", "continuation",
-                          "ground_friction", "indulgence", "laserlikeness", "cinnamon", "pressurization"]:
-                h_arr.append(float(hitter[stlat]))
-            for stlat in ['base_thirst', 'continuation', 'ground_friction', 'indulgence',
-                          'laserlikeness', 'cinnamon', 'pressurization']:
-                r_arr.append(float(hitter[stlat]))
-            for stlat in ["coldness", "overpowerment", "ruthlessness", "shakespearianism",
-                          "suppression", "unthwackability", "cinnamon", "pressurization"]:
-                h_arr.append(float(home_pitcher[stlat]))
-                r_arr.append(float(home_pitcher[stlat]))
-            h_arr += [h_anticapitalism, h_chasiness, h_omniscience, h_tenaciousness,
-                      h_watchfulness, h_defense_pressurization, h_defense_cinnamon]
-            r_arr += [h_anticapitalism, h_chasiness, h_omniscience, h_tenaciousness,
-                      h_watchfulness, h_defense_pressurization, h_defense_cinnamon]
-            hit_model_arrs.append(h_arr)
-            run_model_arrs.append(r_arr)
-        is_hit = clf["is_hit"].predict_proba(hit_model_arrs)
-        pitch = clf["pitch"].predict_proba(hit_model_arrs)
-        hit_type = clf["hit_type"].predict_proba(hit_model_arrs)
-
-        runner_adv_out = clf["runner_adv_out"].predict_proba(run_model_arrs)
-        runner_adv_hit = clf["runner_adv_hit"].predict_proba(run_model_arrs)
-        sb_attempt = clf["sb_attempt"].predict_proba(run_model_arrs)
-        sb_success = clf["sb_success"].predict_proba(run_model_arrs)
-        counter = 0
-        for hitter, __ in sorted_h_hitters.items():
-            models["is_hit"][hitter] = is_hit[counter]
-            models["pitch"][hitter] = pitch[counter]
-            models["hit_type"][hitter] = hit_type[counter]
-            models["runner_adv_out"][hitter] = runner_adv_out[counter]
-            models["runner_adv_hit"][hitter] = runner_adv_hit[counter]
-            models["sb_attempt"][hitter] = sb_attempt[counter]
-            models["sb_success"][hitter] = sb_success[counter]
-            counter += 1
-        for hitter, __ in sorted_a_hitters.items():
-            models["is_hit"][hitter] = is_hit[counter]
-            models["pitch"][hitter] = pitch[counter]
-            models["hit_type"][hitter] = hit_type[counter]
-            models["runner_adv_out"][hitter] = runner_adv_out[counter]
-            models["runner_adv_hit"][hitter] = runner_adv_hit[counter]
-            models["sb_attempt"][hitter] = sb_attempt[counter]
-            models["sb_success"][hitter] = sb_success[counter]
-            counter += 1
+
+    # every hitter of the day goes through each fused group at once, models indexes rows of the shared blocks
+    if hitter_ids:
+        hit_model = FusedModel({name: clf[name] for name in HIT_MODELS})
+        run_model = FusedModel({name: clf[name] for name in RUN_MODELS})
+        if probability_cache is not None:
+            hit_block = probability_cache.predict_block(hit_model, hitter_ids, hit_model_arrs)
+            run_block = probability_cache.predict_block(run_model, hitter_ids, run_model_arrs)
+        else:
+            hit_block = hit_model.predict_block(hitter_ids, hit_model_arrs)
+            run_block = run_model.predict_block(hitter_ids, run_model_arrs)
+        for name in HIT_MODELS:
+            models[name].update(hit_block.head_rows(name))
+        for name in RUN_MODELS:
+            models[name].update(run_block.head_rows(name))
+        # with a cache every fresh hitter has a key, in the order the rows were built
+        for hitter_id, key in zip(hitter_ids, fresh_keys):
+            cache.put(key, {name: models[name][hitter_id] for name in HIT_MODELS + RUN_MODELS})
 
     return models
 
 
-async def simulate(games, models, team_stlats, player_blood_types, player_names, sim_length):
+def set_rng(new_rng):
+    """Route simulate_event and base instincts rolls through new_rng, returns the previous source"""
+    global rng
+    previous = rng
+    rng = new_rng
+    return previous
+
+
+def game_stream_id(game):
+    """Key of a game's random streams, a team plays once a day so the home team identifies the game"""
+    return game.get("id", game["homeTeam"])
+
+
+async def simulate(games, models, team_stlats, player_blood_types, player_names, sim_length,
+                   write_daily_results=True, streams=None, log_games=True, stopping_rule=None, sampling=INDEPENDENT,
+                   aggregates=None, log_sink=None):
+    """Replicate every game sim_length times, or with a StoppingRule until its estimates have converged.
+
+    Adaptive runs report their replicas and precision with each result, stat sheets are scaled to sim_length.
+    sampling is a src.variance_reduction mode, anything but independent draws reports the variance reduction
+    it achieved on the run differential.  Runs given the same streams draw common random numbers.
+
+    Replicas are aggregated as they finish so memory does not grow with sim_length, pass a dict as aggregates
+    to get each game's src.aggregators.GameAggregate keyed by game_stream_id, e.g. to merge runs split across
+    workers.  Logged games go to log_sink, by default the process's src.game_log_archive sink, keyed by season,
+    day, game_stream_id and replica.
+
+    The per game result lines, sampling and adaptive reports, are returned along with the day's totals and are
+    written to the day's results file after a "Day:" header unless write_daily_results is False."""
+    if streams is None and sampling != INDEPENDENT:
+        streams = RngStreams(random.getrandbits(63))
     a_favored_wins, p_favored_wins, predicted_wins = 0, 0, 0
     day = games[0]['day']
     season = games[0]['season']
-    output_text = f"Day: {day}\n"
+    output_text = ""
     strikeouts = {}
     game_statsheets = {}
+    if log_games and log_sink is None:
+        log_sink = get_log_sink()
     for game in games:
-        home_scores = []
-        away_scores = []
-        home_shutout = 0
-        home_wins = 0
-        away_shutout = 0
-        away_wins = 0
-        home_struckout = []
-        away_struckout = []
-        innings = []
+        # replicas are folded into histograms as they finish, nothing per replica is kept
+        aggregate = GameAggregate()
+        run_differential = SamplingAccumulator(sampling) if sampling != INDEPENDENT else None
         homeTeam, awayTeam = game["homeTeam"], game["awayTeam"]
         home_name = team_names[homeTeam]
         away_name = team_names[awayTeam]
@@ -241,76 +264,96 @@ async def simulate(games, models, team_stlats, player_blood_types, player_names,
         if shakeup:
             continue
         log_game = False
-        for i in range(sim_length):
-            game_log = [f'Day {game["day"]}.',
-                        f'{game["homePitcherName"]} pitching for the {game["homeTeamName"]} at home.',
-                        f'{game["awayPitcherName"]} pitching for the {game["awayTeamName"]} on the road.']
-            home_score, away_score = 0, 0
-            home_order, away_order = 0, 0
-            home_strikeouts, away_strikeouts = 0, 0
-            inning = 0
-            while True:
-                game_log.append(f'\nTop of the {inning+1}, {game["awayTeamNickname"]} batting.')
-                game_log.append(f'{game["homeTeamNickname"]}: {home_score} -  {game["awayTeamNickname"]}: {away_score}')
-                a_runs, away_order, a_strikeouts, nlg = await simulate_inning(models, away_lineup, away_order,
-                                                                              game_statsheets, player_blood_types,
-                                                                              game, True, game_log, player_names,
-                                                                              f"Top of the {inning+1}", log_game)
-                log_game = nlg
-                away_score += a_runs
-                away_strikeouts += a_strikeouts
-                if inning == 8 and home_score != away_score:
-                    break
-                game_log.append(f'\nBottom of the {inning + 1}, {game["homeTeamNickname"]} batting.')
-                game_log.append(f'{game["homeTeamNickname"]}: {home_score} -  {game["awayTeamNickname"]}: {away_score}')
-                h_runs, home_order, h_strikeouts, nlg = await simulate_inning(models, home_lineup, home_order,
-                                                                              game_statsheets, player_blood_types,
-                                                                              game, False, game_log, player_names,
-                                                                              f'bottom of the {inning+1}', log_game)
-                log_game = nlg
-                home_score += h_runs
-                home_strikeouts += h_strikeouts
-
-                if inning >= 8 and home_score != away_score:
-                    break
-                inning += 1
-            innings.append(inning+1)
-            home_scores.append(home_score)
-            away_scores.append(away_score)
-            if home_score == 0:
-                home_shutout += 1
-                game_statsheets[game["awayPitcher"]]["shutouts"] += 1
-            if away_score == 0:
-                away_shutout += 1
-                game_statsheets[game["homePitcher"]]["shutouts"] += 1
-            if home_score > away_score:
-                home_wins += 1
-                game_statsheets[game["homePitcher"]]["wins"] += 1
-                game_statsheets[game["awayPitcher"]]["losses"] += 1
-                game_log.append(f'Game Over. {game["homeTeamName"]} win {home_score} - {away_score}')
-            else:
-                away_wins += 1
-                game_statsheets[game["awayPitcher"]]["wins"] += 1
-                game_statsheets[game["homePitcher"]]["losses"] += 1
-                game_log.append(f'Game Over. {game["awayTeamName"]} win {away_score} - {home_score}')
-            home_struckout.append(home_strikeouts)
-            away_struckout.append(away_strikeouts)
-            if log_game or i == 0:
-                if i == 0:
-                    filename = os.path.join('season_sim', 'game_logs',
-                                            f's{season}-d{day}_{away_name}-at-{home_name}.txt')
+        # one tape per game, reused by every replica, with log_games off nothing is recorded or written
+        tape = EventTape(enabled=log_games)
+        log_names = {**player_names, homeTeam: game["homeTeamName"], awayTeam: game["awayTeamName"],
+                     game["homePitcher"]: game["homePitcherName"], game["awayPitcher"]: game["awayPitcherName"]}
+        max_replicas = sim_length if stopping_rule is None else stopping_rule.max_replicas
+        points = None
+        if sampling == SOBOL:
+            seed = int(streams.seed_sequence(game["season"], game["day"], game_stream_id(game)).generate_state(1)[0])
+            points = sobol_points(range(max_replicas), seed=seed)
+        # the replica streams only stand in for the roll source during this game, the previous one is put back
+        previous_rng = rng
+        try:
+            for i in range(max_replicas):
+                if streams is not None:
+                    # every replica gets its own stream so any one of them can be replayed on its own
+                    set_rng(replica_stream(streams, game["season"], game["day"], game_stream_id(game), i, sampling,
+                                           points))
+                tape.start(awayTeam, homeTeam, game["awayPitcher"], game["homePitcher"], game["day"])
+                home_score, away_score = 0, 0
+                home_order, away_order = 0, 0
+                home_strikeouts, away_strikeouts = 0, 0
+                inning = 0
+                while True:
+                    tape.half_inning(inning + 1, False, None, game["homePitcher"])
+                    a_runs, away_order, a_strikeouts, nlg = await simulate_inning(models, away_lineup, away_order,
+                                                                                  game_statsheets, player_blood_types,
+                                                                                  game, True, tape,
+                                                                                  f"Top of the {inning+1}", log_game)
+                    log_game = nlg
+                    away_score += a_runs
+                    away_strikeouts += a_strikeouts
+                    if inning == 8 and home_score != away_score:
+                        break
+                    tape.half_inning(inning + 1, True, None, game["awayPitcher"])
+                    h_runs, home_order, h_strikeouts, nlg = await simulate_inning(models, home_lineup, home_order,
+                                                                                  game_statsheets, player_blood_types,
+                                                                                  game, False, tape,
+                                                                                  f'bottom of the {inning+1}', log_game)
+                    log_game = nlg
+                    home_score += h_runs
+                    home_strikeouts += h_strikeouts
+
+                    if inning >= 8 and home_score != away_score:
+                        break
+                    inning += 1
+                aggregate.update(home_score, away_score, home_strikeouts, away_strikeouts, inning + 1)
+                if run_differential is not None:
+                    run_differential.update(home_score - away_score)
+                if home_score == 0:
+                    game_statsheets[game["awayPitcher"]]["shutouts"] += 1
+                if away_score == 0:
+                    game_statsheets[game["homePitcher"]]["shutouts"] += 1
+                if home_score > away_score:
+                    game_statsheets[game["homePitcher"]]["wins"] += 1
+                    game_statsheets[game["awayPitcher"]]["losses"] += 1
                 else:
-                    filename = os.path.join('season_sim', 'game_logs',
-                                            f's{season}-d{day}_{away_name}-at-{home_name}_{i}.txt')
-                with open(filename, 'w') as file:
-                    for message in game_log:
-                        file.write(f"{message}\n")
-                log_game = False
-
-        home_scores.sort()
-        away_scores.sort()
-        home_struckout.sort(reverse=True)
-        away_struckout.sort(reverse=True)
+                    game_statsheets[game["awayPitcher"]]["wins"] += 1
+                    game_statsheets[game["homePitcher"]]["losses"] += 1
+                tape.record(EventType.GAME_OVER, None, None)
+                if log_games and (log_game or i == 0):
+                    # queued for the sink's writer thread, read back with src.game_log_archive.GameLogArchive
+                    log_sink.write(season, day, game_stream_id(game), i, tape.render(log_names), away_name, home_name)
+                    log_game = False
+                if stopping_rule is not None and stopping_rule.done(aggregate.home_wins, aggregate.home_runs,
+                                                                     aggregate.away_runs):
+                    break
+        finally:
+            set_rng(previous_rng)
+        if aggregates is not None:
+            aggregates[game_stream_id(game)] = aggregate
+        replicas = aggregate.replicas
+        if run_differential is not None:
+            run_differential = run_differential.estimate()
+            output_text += (f"{away_name} at {home_name}: {sampling} sampling, run differential "
+                            f"{run_differential.estimate:.2f} +/- {run_differential.std_error:.2f}, "
+                            f"{run_differential.variance_reduction:.2f}x variance reduction\n")
+        if stopping_rule is not None:
+            confidence = stopping_rule.confidence
+            home_wins, home_runs, away_runs = aggregate.home_wins, aggregate.home_runs, aggregate.away_runs
+            output_text += (
+                f"{away_name} at {home_name}: {replicas} replicas, "
+                f"home win {home_wins.mean:.3f} +/- {home_wins.proportion_half_width(confidence):.3f}, "
+                f"score {away_runs.mean:.2f} +/- {away_runs.half_width(confidence):.2f} - "
+                f"{home_runs.mean:.2f} +/- {home_runs.half_width(confidence):.2f} "
+                f"({confidence:.0%} confidence)\n"
+            )
+            scale = sim_length / replicas
+            for player in list(home_lineup.keys()) + list(away_lineup.keys()) + [game["homePitcher"],
+                                                                                game["awayPitcher"]]:
+                game_statsheets[player] = {k: v * scale for k, v in game_statsheets[player].items()}
 
         home_odds, away_odds = game["homeOdds"], game["awayOdds"]
 
@@ -320,15 +363,15 @@ async def simulate(games, models, team_stlats, player_blood_types, player_names,
         else:
             if away_odds > home_odds:
                 a_favored_wins += 1
-        if statistics.mean(home_scores) > statistics.mean(away_scores):
+        avg_home_score = aggregate.home_runs.mean
+        avg_away_score = aggregate.away_runs.mean
+        if avg_home_score > avg_away_score:
             if home_odds > away_odds:
                 p_favored_wins += 1
         else:
             if away_odds > home_odds:
                 p_favored_wins += 1
 
-        avg_home_score = statistics.mean(home_scores)
-        avg_away_score = statistics.mean(away_scores)
         if season == 10:
             avg_home_score = avg_home_score % 10
             avg_away_score = avg_away_score % 10
@@ -341,27 +384,37 @@ async def simulate(games, models, team_stlats, player_blood_types, player_names,
 
         strikeouts[game["homePitcher"]] = {
             "name": game["homePitcherName"],
-            "predicted_strikeouts": statistics.mean(away_struckout),
-            "sho_per": away_shutout / sim_length
+            "predicted_strikeouts": aggregate.away_strikeouts.mean,
+            "sho_per": aggregate.away_runs.frequency(0) / replicas
         }
         strikeouts[game["awayPitcher"]] = {
             "name": game["awayPitcherName"],
-            "predicted_strikeouts": statistics.mean(home_struckout),
-            "sho_per": home_shutout / sim_length
+            "predicted_strikeouts": aggregate.home_strikeouts.mean,
+            "sho_per": aggregate.home_runs.frequency(0) / replicas
         }
-
-    with open(os.path.join('season_sim', 'results', 'daily', f"s{season}_d{day}_results.txt"), 'a') as fd:
-        fd.write(output_text)
-    return predicted_wins, a_favored_wins, strikeouts, game_statsheets
+        if stopping_rule is not None:
+            win_half_width = aggregate.home_wins.proportion_half_width(stopping_rule.confidence)
+            strikeouts[game["homePitcher"]].update(replicas=replicas, win_per=aggregate.home_wins.mean,
+                                                   win_half_width=win_half_width)
+            strikeouts[game["awayPitcher"]].update(replicas=replicas, win_per=1.0 - aggregate.home_wins.mean,
+                                                   win_half_width=win_half_width)
+        if run_differential is not None:
+            for pitcher in [game["homePitcher"], game["awayPitcher"]]:
+                strikeouts[pitcher]["variance_reduction"] = run_differential.variance_reduction
+
+    if write_daily_results:
+        with open(os.path.join('season_sim', 'results', 'daily', f"s{season}_d{day}_results.txt"), 'a') as fd:
+            fd.write(f"Day: {day}\n{output_text}")
+    return predicted_wins, a_favored_wins, strikeouts, game_statsheets, output_text
 
 
 async def simulate_inning(models, lineup, order, stat_sheets, player_blood_types,
-                          game, top_of_inning, game_log, player_names, descriptor, log_game):
+                          game, top_of_inning, tape, descriptor, log_game):
     season = game["season"]
     if top_of_inning:
-        pitcher_id, hit_team_id, hit_team_name = game["homePitcher"], game["awayTeam"], game["awayTeamName"]
+        pitcher_id, hit_team_id = game["homePitcher"], game["awayTeam"]
     else:
-        pitcher_id, hit_team_id, hit_team_name = game["awayPitcher"], game["homeTeam"], game["homeTeamName"]
+        pitcher_id, hit_team_id = game["awayPitcher"], game["homeTeam"]
     bases = {1: None, 2: None, 3: None}
     inning_outs = 0
     score = 0
@@ -369,13 +422,13 @@ async def simulate_inning(models, lineup, order, stat_sheets, player_blood_types
     while True:
         hitter_id = list(lineup.keys())[order]
 
-        game_log.append(f'{player_names[hitter_id]} batting for the {hit_team_name}')
+        if tape.enabled:
+            tape.record(EventType.AT_BAT, hitter_id, pitcher_id, None, bases_mask(bases), inning_outs)
         outs, runs, bases, in_strikeouts, advance_order = await simulate_at_bat(bases, models, stat_sheets,
                                                                                 player_blood_types,
                                                                                 pitcher_id, hitter_id,
                                                                                 hit_team_id, season,
-                                                                                game_log, player_names,
-                                                                                inning_outs)
+                                                                                tape, inning_outs)
         inning_outs += outs
         strikeouts += in_strikeouts
         if advance_order:
@@ -396,7 +449,7 @@ async def simulate_inning(models, lineup, order, stat_sheets, player_blood_types
 
 async def simulate_at_bat(bases, models, stat_sheets, player_blood_types,
                           pitcher_id, hitter_id, hit_team_id, season,
-                          game_log, player_names, inning_outs):
+                          tape, inning_outs):
     stat_sheets[pitcher_id]["batters_faced"] += 1
     stat_sheets[hitter_id]["plate_appearances"] += 1
 
@@ -406,7 +459,7 @@ async def simulate_at_bat(bases, models, stat_sheets, player_blood_types,
     # ['single %', 'double %', 'triple %', 'hr %']
     while True:
         play, bases, at_bat_count, inc_order, p_runs, p_outs = await simulate_pitch(models, bases, at_bat_count,
-                                                                                    hitter_id, game_log, player_names)
+                                                                                    hitter_id, pitcher_id, tape)
         outs += p_outs
         if at_bat_count["outs"] == 3:
             advance_order = inc_order
@@ -419,7 +472,9 @@ async def simulate_at_bat(bases, models, stat_sheets, player_blood_types,
                 stat_sheets[hitter_id]["struckouts"] += 1
                 stat_sheets[pitcher_id]["strikeouts"] += 1
                 stat_sheets[hitter_id]["at_bats"] += 1
-                game_log.append(f'{player_names[hitter_id]} struck out.')
+                if tape.enabled:
+                    tape.record(EventType.STRIKEOUT, hitter_id, pitcher_id, None, bases_mask(bases),
+                                at_bat_count["outs"] + 1)
                 break
             elif at_bat_count["balls"] == 4:
                 base_instincts = False
@@ -430,17 +485,15 @@ async def simulate_at_bat(bases, models, stat_sheets, player_blood_types,
                                 if player_blood_types[hitter_id] == blood_effect[hit_team_id]["base_instincts"]["blood"]:
                                     base_instincts = True
                 complete = False
-                base_msg = ""
+                advance = 1
                 if base_instincts:
                     complete = True
-                    walk_chance = random.random()
+                    walk_chance = rng.random()
                     if walk_chance < .035:
                         advance = 3
-                        base_msg = " Base Instincts takes them to 3rd base."
                         base_instincts_procs[season][3] += 1
                     elif walk_chance < .19:
                         advance = 2
-                        base_msg = " Base Instincts takes them to 2nd base."
                         base_instincts_procs[season][2] += 1
                     else:
                         advance = 1
@@ -488,7 +541,9 @@ async def simulate_at_bat(bases, models, stat_sheets, player_blood_types,
                     bases[1] = hitter_id
                 stat_sheets[hitter_id]["walks"] += 1
                 stat_sheets[pitcher_id]["walks_issued"] += 1
-                game_log.append(f'{player_names[hitter_id]} drew a walk.{base_msg}')
+                if tape.enabled:
+                    tape.record(EventType.WALK, hitter_id, pitcher_id, None, bases_mask(bases), at_bat_count["outs"],
+                                runs, advance if complete else 1)
                 break
             else:
                 continue
@@ -521,10 +576,8 @@ async def simulate_at_bat(bases, models, stat_sheets, player_blood_types,
             stat_sheets[hitter_id]["hits"] += 1
             stat_sheets[pitcher_id]["hits_allowed"] += 1
 
-            run_msg = ""
-            if runs > 0:
-                run_msg = f" {runs} scores."
-            game_log.append(f'{player_names[hitter_id]} hit a single.{run_msg}')
+            if tape.enabled:
+                tape.record(EventType.SINGLE, hitter_id, pitcher_id, None, bases_mask(bases), at_bat_count["outs"], runs)
             break
         # double
         elif play == 1:
@@ -546,10 +599,8 @@ async def simulate_at_bat(bases, models, stat_sheets, player_blood_types,
             stat_sheets[hitter_id]["hits"] += 1
             stat_sheets[hitter_id]["doubles"] += 1
             stat_sheets[pitcher_id]["hits_allowed"] += 1
-            run_msg = ""
-            if runs > 0:
-                run_msg = f" {runs} scores."
-            game_log.append(f'{player_names[hitter_id]} hit a double.{run_msg}')
+            if tape.enabled:
+                tape.record(EventType.DOUBLE, hitter_id, pitcher_id, None, bases_mask(bases), at_bat_count["outs"], runs)
             break
         # triple or hr
         elif play >= 2:
@@ -568,19 +619,17 @@ async def simulate_at_bat(bases, models, stat_sheets, player_blood_types,
             if play == 2:
                 bases[3] = hitter_id
                 stat_sheets[hitter_id]["triples"] += 1
-                run_msg = ""
-                if runs > 0:
-                    run_msg = f" {runs} scores."
-                game_log.append(f'{player_names[hitter_id]} hit a triple.{run_msg}')
+                if tape.enabled:
+                    tape.record(EventType.TRIPLE, hitter_id, pitcher_id, None, bases_mask(bases), at_bat_count["outs"],
+                                runs)
                 break
             else:
                 runs += 1
                 stat_sheets[hitter_id]["homeruns"] += 1
                 stat_sheets[pitcher_id]["home_runs_allowed"] += 1
-                run_msg = ""
-                if runs > 0:
-                    run_msg = f" {runs} scores."
-                game_log.append(f'{player_names[hitter_id]} hit a home run.{run_msg}')
+                if tape.enabled:
+                    tape.record(EventType.HOME_RUN, hitter_id, pitcher_id, None, bases_mask(bases),
+                                at_bat_count["outs"], runs)
                 break
 
     stat_sheets[hitter_id]["rbis"] += runs
@@ -590,11 +639,11 @@ async def simulate_at_bat(bases, models, stat_sheets, player_blood_types,
     return outs, runs, bases, strikeouts, advance_order
 
 
-async def simulate_pitch(models, bases, at_bat_count, hitter_id, game_log, player_names):
+async def simulate_pitch(models, bases, at_bat_count, hitter_id, pitcher_id, tape):
     p_runs = 0
     p_outs = 0
     # check for steal attempt & result
-    bases, runs, outs = await simulate_stolen_base(models, bases, game_log, player_names)
+    bases, runs, outs = await simulate_stolen_base(models, bases, hitter_id, pitcher_id, tape, at_bat_count["outs"])
     p_runs += runs
     p_outs += outs
     at_bat_count["outs"] += outs
@@ -644,10 +693,9 @@ async def simulate_pitch(models, bases, at_bat_count, hitter_id, game_log, playe
                     else:
                         bases[cur+1] = bases[cur]
                         bases[cur] = None
-        if result == 0:
-            game_log.append(f'{player_names[hitter_id]} hit a flyout.')
-        if result == 1:
-            game_log.append(f'{player_names[hitter_id]} hit a ground out.')
+        if tape.enabled and (result == 0 or result == 1):
+            tape.record(EventType.FLYOUT if result == 0 else EventType.GROUNDOUT, hitter_id, pitcher_id, None,
+                        bases_mask(bases), at_bat_count["outs"])
         return -1, bases, at_bat_count, True, p_runs, p_outs
     else:
         hit_type_model = models["hit_type"][hitter_id]
@@ -655,7 +703,18 @@ async def simulate_pitch(models, bases, at_bat_count, hitter_id, game_log, playe
         return result, bases, at_bat_count, True, p_runs, p_outs
 
 
-async def simulate_stolen_base(models, bases, game_log, player_names):
+def bases_mask(bases):
+    """Occupancy bitmask of a {base: runner id or None} dict, bit base - 1 is set when the base is occupied"""
+    return (1 if bases[1] else 0) | (2 if bases[2] else 0) | (4 if bases[3] else 0)
+
+
+def record_steal(tape, caught, runner_id, base, hitter_id, pitcher_id, bases, outs):
+    if tape.enabled:
+        tape.record(EventType.CAUGHT_STEALING if caught else EventType.STOLEN_BASE, hitter_id, pitcher_id, runner_id,
+                    bases_mask(bases), outs + caught, 1 if base == 4 and not caught else 0, base)
+
+
+async def simulate_stolen_base(models, bases, hitter_id, pitcher_id, tape, inning_outs):
     runs, outs = 0, 0
     if bases[3]:
         runner_model = models["sb_attempt"][bases[3]]
@@ -667,13 +726,13 @@ async def simulate_stolen_base(models, bases, game_log, player_names):
             runner_model = models["sb_success"][bases[3]]
             result = await simulate_event(runner_model)
             # ['cs %', 'sb %']
+            runner_id = bases[3]
             if result == 0:
                 outs += 1
-                game_log.append(f'{player_names[bases[3]]} caught stealing 4th base.')
             else:
                 runs += 1
-                game_log.append(f'{player_names[bases[3]]} steals 4th base and scores.')
             bases[3] = None
+            record_steal(tape, result == 0, runner_id, 4, hitter_id, pitcher_id, bases, inning_outs)
             return bases, runs, outs
     elif bases[2] and not bases[3]:
         runner_model = models["sb_attempt"][bases[2]]
@@ -683,13 +742,13 @@ async def simulate_stolen_base(models, bases, game_log, player_names):
         else:
             runner_model = models["sb_success"][bases[2]]
             result = await simulate_event(runner_model)
+            runner_id = bases[2]
             if result == 0:
                 outs += 1
-                game_log.append(f'{player_names[bases[2]]} caught stealing 3rd base.')
             else:
                 bases[3] = bases[2]
-                game_log.append(f'{player_names[bases[2]]} steals 3rd base.')
             bases[2] = None
+            record_steal(tape, result == 0, runner_id, 3, hitter_id, pitcher_id, bases, inning_outs)
             return bases, runs, outs
     elif bases[1] and not bases[2]:
         runner_model = models["sb_attempt"][bases[1]]
@@ -699,13 +758,13 @@ async def simulate_stolen_base(models, bases, game_log, player_names):
         else:
             runner_model = models["sb_success"][bases[1]]
             result = await simulate_event(runner_model)
+            runner_id = bases[1]
             if result == 0:
                 outs += 1
-                game_log.append(f'{player_names[bases[1]]} caught stealing 2nd base.')
             else:
                 bases[2] = bases[1]
-                game_log.append(f'{player_names[bases[1]]} steals 2nd base.')
             bases[1] = None
+            record_steal(tape, result == 0, runner_id, 2, hitter_id, pitcher_id, bases, inning_outs)
             return bases, runs, outs
     return bases, runs, outs
 
@@ -713,7 +772,7 @@ async def simulate_stolen_base(models, bases, game_log, player_names):
 async def simulate_event(outputs, roll=None):
     if not roll:
         # generate random float between 0-1
-        roll = random.random()
+        roll = rng.random()
     total = 0
     # hitter is an array of probabilities for 7 outcomes
     # ['field_out %', 'strike_out %', 'walk %', 'single %', 'double %', 'triple %', 'hr %']
@@ -725,97 +784,124 @@ async def simulate_event(outputs, roll=None):
             return i
 
 
-async def setup(sim_length):
-    clf = {
+def load_models(compiled=False):
+    # compiled models are the numpy exports written by src.compiled_models, loading them needs no sklearn
+    if compiled:
+        return {name: load_compiled(compiled_path(path)) for name, path in model_paths().items()}
+    return {name: load(path) for name, path in model_paths().items()}
+
+
+def model_paths():
+    return {
            # old
-           "at_bat": load(os.path.join("season_sim", "models", "ab.joblib")),
-
-           "pitch": load(os.path.join("season_sim", "models", "pitch_v1.joblib")),
-           "is_hit": load(os.path.join("season_sim", "models", "is_hit_v1.joblib")),
-           "hit_type": load(os.path.join("season_sim", "models", "hit_type_v1.joblib")),
-           "runner_adv_out": load(os.path.join("season_sim", "models", "runner_advanced_on_out_v1.joblib")),
-           "runner_adv_hit": load(os.path.join("season_sim", "models", "extra_base_on_hit_v1.joblib")),
-           "sb_attempt": load(os.path.join("season_sim", "models", "sba_v1.joblib")),
-           "sb_success": load(os.path.join("season_sim", "models", "sb_success_v1.joblib"))
+           "at_bat": os.path.join("season_sim", "models", "ab.joblib"),
+
+           "pitch": os.path.join("season_sim", "models", "pitch_v1.joblib"),
+           "is_hit": os.path.join("season_sim", "models", "is_hit_v1.joblib"),
+           "hit_type": os.path.join("season_sim", "models", "hit_type_v1.joblib"),
+           "runner_adv_out": os.path.join("season_sim", "models", "runner_advanced_on_out_v1.joblib"),
+           "runner_adv_hit": os.path.join("season_sim", "models", "extra_base_on_hit_v1.joblib"),
+           "sb_attempt": os.path.join("season_sim", "models", "sba_v1.joblib"),
+           "sb_success": os.path.join("season_sim", "models", "sb_success_v1.joblib")
     }
 
+
+def load_season_games(season, store=None):
+    """A season's games by day, from a src.stlats_store.StlatsStore when given one instead of the json"""
+    if store is not None:
+        return store.season_games(season)
+    with open(os.path.join('season_sim', 'season_data', f"season{season+1}.json"), 'r',
+              encoding='utf8') as json_file:
+        raw_season_data = json.load(json_file)
+    return group_season_games(raw_season_data)
+
+
+def load_day_stlats(season, day, store=None):
+    """player_stlats, team_stlats, player_blood_types and player_names for a day, sliced out of store when given
+    one instead of parsed from the day's json"""
+    if store is not None:
+        return store.day_stlats(season, day)
+    with open(os.path.join('season_sim', 'stlats', f"s{season}_d{day}_stlats.json"), 'r', encoding='utf8') as json_file:
+        player_stlats_list = json.load(json_file)
+    return group_day_stlats(player_stlats_list)
+
+
+def new_statsheet():
+    return {"plate_appearances": 0, "at_bats": 0, "struckouts": 0, "walks": 0,
+            "hits": 0, "doubles": 0, "triples": 0, "quadruples": 0, "homeruns": 0,
+            "runs": 0, "rbis": 0, "stolen_bases": 0,
+            "caught_stealing": 0, "double_play": 0,
+            "wins": 0, "losses": 0, "shutouts": 0, "outs_recorded": 0,
+            "hits_allowed": 0, "home_runs_allowed": 0, "strikeouts": 0,
+            "walks_issued": 0, "batters_faced": 0, "runs_allowed": 0}
+
+
+def add_day_statsheets(season_statsheets, stat_sheets, sim_length):
+    for player in stat_sheets:
+        if player not in season_statsheets:
+            season_statsheets[player] = new_statsheet()
+        adjust_gs = {k: v / sim_length for k, v in stat_sheets[player].items()}
+        for key in adjust_gs:
+            season_statsheets[player][key] += adjust_gs[key]
+
+
+def write_season_results(season, sim_length, s_predicted_wins, s_a_favored_wins, daily_strikeouts,
+                         season_statsheets, outcome_text=""):
+    for player in season_statsheets:
+        season_statsheets[player] = {k: round(v) for k, v in season_statsheets[player].items()}
+    with open(os.path.join('season_sim', 'results', f"{season}_outcomes_{sim_length}.txt"), 'w', encoding='utf8') as fd:
+        fd.write(outcome_text)
+    s_predicted_wins_per = round((s_predicted_wins / 990) * 1000) / 10
+    s_a_favored_wins_per = round((s_a_favored_wins / 990) * 1000) / 10
+    print(f"{s_predicted_wins} ({s_predicted_wins_per}%) favored wins predicted - "
+          f"{s_a_favored_wins} ({s_a_favored_wins_per}%) actual favored wins. ")
+
+    with open(os.path.join('season_sim', 'results', f"{season}_k_sho_results_{sim_length}.json"), 'w',
+              encoding='utf8') as json_file:
+        json.dump(daily_strikeouts, json_file)
+    with open(os.path.join('season_sim', 'results', f"{season}_statsheets_{sim_length}.json"), 'w',
+              encoding='utf8') as json_file:
+        json.dump(season_statsheets, json_file)
+
+
+async def setup(sim_length, master_seed=None, stopping_rule=None, sampling=INDEPENDENT, store_dir=None,
+                probability_cache_path=None):
+    clf = load_models()
+    streams = RngStreams(master_seed) if master_seed is not None else None
+    store = StlatsStore(store_dir) if store_dir is not None else None
+    # rows of hitters whose matchup has not changed carry over from one day to the next
+    cache = ModelRowCache()
+    # and rows predicted by an earlier run carry over to this one
+    probability_cache = ProbabilityCache(probability_cache_path) if probability_cache_path is not None else None
+
     for season in range(7, 11):
         print(f"season {season}")
-        outcome_text = ""
         daily_strikeouts = {}
-        with open(os.path.join('season_sim', 'season_data', f"season{season+1}.json"), 'r',
-                  encoding='utf8') as json_file:
-            raw_season_data = json.load(json_file)
+        season_data = load_season_games(season, store)
         s_predicted_wins, s_a_favored_wins = 0, 0
-        season_data = {}
         season_statsheets = {}
-        for game in raw_season_data:
-            if game['day'] not in season_data:
-                season_data[game['day']] = []
-            season_data[game['day']].append(game)
         for day in range(0, 99):
             games = season_data[day]
             if day % 25 == 0:
                 print(f"day {day}")
-            with open(os.path.join('season_sim', 'stlats', f"s{season}_d{day}_stlats.json"), 'r', encoding='utf8') as json_file:
-                player_stlats_list = json.load(json_file)
-            player_stlats = {}
-            team_stlats = {}
-            player_blood_types = {}
-            player_names = {}
-            for player in player_stlats_list:
-                player_stlats[player["player_id"]] = player
-                player_blood_types[player["player_id"]] = player["blood"]
-                player_names[player["player_id"]] = player["player_name"]
-                if player["team_id"] not in team_stlats:
-                    team_stlats[player["team_id"]] = {"lineup": {}}
-                if player["position_type_id"] == '0':
-                    player_id = player["player_id"]
-                    team_stlats[player["team_id"]]["lineup"][player_id] = player
-            for team in team_stlats:
-                us_lineup = team_stlats[team]["lineup"]
-                sorted_lineup = {k: v for k, v in
-                                 sorted(us_lineup.items(), key=lambda item: item[1]["position_id"])}
-                team_stlats[team]["lineup"] = sorted_lineup
-
-            models = await setup_models(games, clf, player_stlats, team_stlats)
-
-            predicted_wins, a_favored_wins, strikeouts, stat_sheets = await simulate(games, models,
-                                                                                     team_stlats,
-                                                                                     player_blood_types,
-                                                                                     player_names, sim_length)
+            player_stlats, team_stlats, player_blood_types, player_names = load_day_stlats(season, day, store)
+
+            models = await setup_models(games, clf, player_stlats, team_stlats, cache, probability_cache)
+
+            predicted_wins, a_favored_wins, strikeouts, stat_sheets, _ = await simulate(games, models,
+                                                                                        team_stlats,
+                                                                                        player_blood_types,
+                                                                                        player_names, sim_length,
+                                                                                        streams=streams,
+                                                                                        stopping_rule=stopping_rule,
+                                                                                        sampling=sampling)
 
             daily_strikeouts[day] = strikeouts
             s_predicted_wins += predicted_wins
             s_a_favored_wins += a_favored_wins
-
-            for player in stat_sheets:
-                if player not in season_statsheets:
-                    season_statsheets[player] = {"plate_appearances": 0, "at_bats": 0, "struckouts": 0, "walks": 0,
-                                          "hits": 0, "doubles": 0, "triples": 0, "quadruples": 0, "homeruns": 0,
-                                          "runs": 0, "rbis": 0, "stolen_bases": 0,
-                                          "caught_stealing": 0, "double_play": 0,
-                                          "wins": 0, "losses": 0, "shutouts": 0, "outs_recorded": 0,
-                                          "hits_allowed": 0, "home_runs_allowed": 0, "strikeouts": 0,
-                                          "walks_issued": 0, "batters_faced": 0, "runs_allowed": 0}
-                adjust_gs = {k: v / sim_length for k, v in stat_sheets[player].items()}
-                for key in adjust_gs:
-                    season_statsheets[player][key] += adjust_gs[key]
-        for player in season_statsheets:
-            season_statsheets[player] = {k: round(v) for k, v in season_statsheets[player].items()}
-        with open(os.path.join('season_sim', 'results', f"{season}_outcomes_{sim_length}.txt"), 'w', encoding='utf8') as fd:
-            fd.write(outcome_text)
-        s_predicted_wins_per = round((s_predicted_wins / 990) * 1000) / 10
-        s_a_favored_wins_per = round((s_a_favored_wins / 990) * 1000) / 10
-        print(f"{s_predicted_wins} ({s_predicted_wins_per}%) favored wins predicted - "
-              f"{s_a_favored_wins} ({s_a_favored_wins_per}%) actual favored wins. ")
-
-        with open(os.path.join('season_sim', 'results', f"{season}_k_sho_results_{sim_length}.json"), 'w',
-                  encoding='utf8') as json_file:
-            json.dump(daily_strikeouts, json_file)
-        with open(os.path.join('season_sim', 'results', f"{season}_statsheets_{sim_length}.json"), 'w',
-                  encoding='utf8') as json_file:
-            json.dump(season_statsheets, json_file)
+            add_day_statsheets(season_statsheets, stat_sheets, sim_length)
+        write_season_results(season, sim_length, s_predicted_wins, s_a_favored_wins, daily_strikeouts,
+                             season_statsheets)
     print(base_instincts_procs)
 
 
@@ -837,6 +923,25 @@ async def sum_strikeouts(length):
         print(sorted_strikeouts.values())
 
 
+async def get_real_stats(length, fetcher=None):
+    """Download the actual stats of every player in the simulated statsheets, for compare_stats"""
+    fetcher = fetcher or get_fetcher()
+    for season in range(7, 11):
+        with open(os.path.join('season_sim', 'results', f"{season}_statsheets_{length}.json"), 'r',
+                  encoding='utf8') as json_file:
+            season_statsheets = json.load(json_file)
+        pitcher_ids = [pid for pid, values in season_statsheets.items() if values["outs_recorded"] > 0]
+        hitter_ids = [pid for pid, values in season_statsheets.items() if values["plate_appearances"] > 0]
+        # every 50 id chunk of both categories is in flight at once
+        pitcher_stats, hitter_stats = await asyncio.gather(
+            fetch_player_stats(fetcher, season, "pitching", pitcher_ids),
+            fetch_player_stats(fetcher, season, "batting", hitter_ids))
+        os.makedirs(os.path.join('season_sim', 'results', 'actual_stats'), exist_ok=True)
+        with open(os.path.join('season_sim', 'results', 'actual_stats', f"{season}_actual_stats.json"), 'w',
+                  encoding='utf8') as json_file:
+            json.dump({"hitting": hitter_stats, "pitching": pitcher_stats}, json_file)
+
+
 async def compare_stats(length):
     for season in range(7, 11):
         with open(os.path.join('season_sim', 'results', f"{season}_statsheets_{length}.json"), 'r',
@@ -897,32 +1002,36 @@ async def compare_stats(length):
             json.dump(pitching_diffs, json_file)
 
 
+HITTING_DIFF_STATS = ["plate_appearances", "at_bats", "struckouts", "walks", "hits", "doubles", "triples",
+                      "homeruns", "rbis"]
+PITCHING_DIFF_STATS = ["outs_recorded", "hits_allowed", "home_runs_allowed", "strikeouts", "walks_issued"]
+
+
+def new_diff_sketches():
+    """A quantile sketch per stat and direction, season sketches merge into the cumulative ones"""
+    return {"hitting": {direction: {stat: QuantileSketch() for stat in HITTING_DIFF_STATS}
+                        for direction in ["above", "below"]},
+            "pitching": {direction: {stat: QuantileSketch() for stat in PITCHING_DIFF_STATS}
+                         for direction in ["above", "below"]}}
+
+
 async def summarize_diffs():
-    all_diffs = {"hitting": {"above": {"plate_appearances": [], "at_bats": [], "struckouts": [],
-                                       "walks": [], "hits": [], "doubles": [], "triples": [],
-                                       "homeruns": [], "rbis": []},
-                             "below": {"plate_appearances": [], "at_bats": [], "struckouts": [],
-                                       "walks": [], "hits": [], "doubles": [], "triples": [],
-                                       "homeruns": [], "rbis": []}},
-                 "pitching": {"above": {"outs_recorded": [], "hits_allowed": [], "home_runs_allowed": [],
-                                        "strikeouts": [], "walks_issued": []},
-                              "below": {"outs_recorded": [], "hits_allowed": [], "home_runs_allowed": [],
-                                        "strikeouts": [], "walks_issued": []}}}
+    all_diffs = new_diff_sketches()
+    p_idxs = [.50, .75, .90, .99]
 
     def summary_message(stat_dict):
         summary_msg = ""
-        for stat, stat_list in stat_dict.items():
-            stat_list.sort()
-            if len(stat_list) < 4:
-                if len(stat_list) == 0:
+        for stat, sketch in stat_dict.items():
+            if sketch.count < 4:
+                if sketch.count == 0:
                     summary_msg += f"{stat} has no occurrences.\n"
                 else:
-                    summary_msg += f"{stat} has only {len(stat_list)} occurrences.\n"
+                    summary_msg += f"{stat} has only {sketch.count} occurrences.\n"
             else:
-                p_stat_list = score_percentiles(stat_list)
-                p_stat_list = [str(round(float(p) * 100000) / 100000) for p in p_stat_list]
-                min_d, max_d = round(stat_list[0] * 100000) / 100000, round(stat_list[-1] * 100000) / 100000
-                summary_msg += f"{stat} min diff: {min_d}, max diff: {max_d}, avg: {round(statistics.mean(stat_list) * 100000) / 100000}, " \
+                p_stat_list = [str(round(sketch.quantile(p) * 100000) / 100000) for p in p_idxs]
+                min_d, max_d = round(sketch.min * 100000) / 100000, round(sketch.max * 100000) / 100000
+                avg = round(sketch.mean * 100000) / 100000
+                summary_msg += f"{stat} min diff: {min_d}, max diff: {max_d}, avg: {avg}, " \
                                f"(50, 75, 90, 99)th percentiles: {', '.join(p_stat_list)}\n"
         return summary_msg
 
@@ -933,44 +1042,14 @@ async def summarize_diffs():
         with open(os.path.join('season_sim', 'results', 'stats', f"{season}_pitching_stat_diffs.json"), 'r',
                   encoding='utf8') as json_file:
             pitching_diffs = json.load(json_file)
-        season_diffs = {"hitting": {"above": {"plate_appearances": [], "at_bats": [], "struckouts": [],
-                                              "walks": [], "hits": [], "doubles": [], "triples": [],
-                                              "homeruns": [], "rbis": []},
-                                    "below": {"plate_appearances": [], "at_bats": [], "struckouts": [],
-                                              "walks": [], "hits": [], "doubles": [], "triples": [],
-                                              "homeruns": [], "rbis": []}},
-                        "pitching": {"above": {"outs_recorded": [], "hits_allowed": [], "home_runs_allowed": [],
-                                               "strikeouts": [], "walks_issued": []},
-                                     "below": {"outs_recorded": [], "hits_allowed": [], "home_runs_allowed": [],
-                                               "strikeouts": [], "walks_issued": []}}}
-        for diff in hitting_diffs["above"].values():
-            for key in diff:
-                season_diffs["hitting"]["above"][key].append(diff[key])
-                all_diffs["hitting"]["above"][key].append(diff[key])
-        for diff in hitting_diffs["below"].values():
-            for key in diff:
-                season_diffs["hitting"]["below"][key].append(diff[key])
-                all_diffs["hitting"]["below"][key].append(diff[key])
-        for diff in pitching_diffs["above"].values():
-            for key in diff:
-                season_diffs["pitching"]["above"][key].append(diff[key])
-                all_diffs["pitching"]["above"][key].append(diff[key])
-        for diff in pitching_diffs["below"].values():
-            for key in diff:
-                season_diffs["pitching"]["below"][key].append(diff[key])
-                all_diffs["pitching"]["below"][key].append(diff[key])
-        p_idxs = [.50, .75, .90, .99]
-
-        def score_percentiles(scores):
-            count = len(scores)
-            prob_vals = []
-            for p in p_idxs:
-                idx = round((p * count) - 1)
-                try:
-                    prob_vals.append(scores[idx])
-                except IndexError:
-                    print(1)
-            return [str(v) for v in prob_vals]
+        season_diffs = new_diff_sketches()
+        for kind, diffs in [("hitting", hitting_diffs), ("pitching", pitching_diffs)]:
+            for direction in ["above", "below"]:
+                for diff in diffs[direction].values():
+                    for key in diff:
+                        season_diffs[kind][direction][key].update(diff[key])
+                for stat, sketch in season_diffs[kind][direction].items():
+                    all_diffs[kind][direction][stat].merge(sketch)
 
         hitting_msg_a = summary_message(season_diffs["hitting"]["above"])
         hitting_msg_b = summary_message(season_diffs["hitting"]["below"])
@@ -988,11 +1067,12 @@ async def summarize_diffs():
     print(f"Seasons 8-11 cumulative stat diffs below actual\n{hitting_msg_b}\n{pitching_msg_b}")
 
 
-loop = asyncio.get_event_loop()
+if __name__ == "__main__":
+    loop = asyncio.get_event_loop()
 
-iterations = 10
-loop.run_until_complete(setup(iterations))
-loop.run_until_complete(sum_strikeouts(iterations))
-loop.run_until_complete(compare_stats(iterations))
-loop.run_until_complete(summarize_diffs())
-loop.close()
+    iterations = 10
+    loop.run_until_complete(setup(iterations))
+    loop.run_until_complete(sum_strikeouts(iterations))
+    loop.run_until_complete(compare_stats(iterations))
+    loop.run_until_complete(summarize_diffs())
+    loop.close()
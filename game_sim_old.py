@@ -3,11 +3,11 @@ import json
 import os
 import random
 
-import requests
 import statistics
 
 from joblib import load
-from requests import Timeout
+
+from src.fetch import fetch_player_stats, get_fetcher
 
 team_names = {
 "b72f3061-f573-40d7-832a-5ad475bd7909": "Lovers",
@@ -41,20 +41,8 @@ stlat_list = ["anticapitalism", "chasiness", "omniscience", "tenaciousness", "wa
               "coldness", "overpowerment", "ruthlessness", "shakespearianism", "suppression", "unthwackability"]
 
 async def retry_request(url, tries=10):
-    headers = {
-        'User-Agent': 'sibrGameSim/0.1test (tehstone#8448@sibr)'
-    }
-
-    for i in range(tries):
-        try:
-            response = requests.get(url, headers=headers)
-            if response.status_code == 200:
-                return response
-        except (Timeout, Exception):
-            continue
-        finally:
-            await asyncio.sleep(.5)
-    return None
+    """The url's response, None if every try failed, fetched without blocking the event loop"""
+    return await get_fetcher().get(url, tries)
 
 
 def apply_effect(def_stlats, effect, day):
@@ -798,24 +786,10 @@ async def get_real_stats():
                 hitter_ids.append(pid)
             if values["outs_recorded"] > 0:
                 pitcher_ids.append(pid)
-        pitcher_stats = {}
-        hitter_stats = {}
-        chunked_player_ids = [pitcher_ids[i:i + 50] for i in range(0, len(pitcher_ids), 50)]
-        for chunk in chunked_player_ids:
-            pids = ','.join(chunk)
-            url = f"https://api.blaseball-reference.com/v1/playerStats?category=pitching&season={season}&playerIds={pids}"
-            response = await retry_request(url)
-            player_stats = response.json()
-            for player in player_stats:
-                pitcher_stats[player["player_id"]] = player
-        chunked_player_ids = [hitter_ids[i:i + 50] for i in range(0, len(hitter_ids), 50)]
-        for chunk in chunked_player_ids:
-            pids = ','.join(chunk)
-            url = f"https://api.blaseball-reference.com/v1/playerStats?category=batting&season={season}&playerIds={pids}"
-            response = await retry_request(url)
-            player_stats = response.json()
-            for player in player_stats:
-                hitter_stats[player["player_id"]] = player
+        # every 50 id chunk of both categories is in flight at once
+        pitcher_stats, hitter_stats = await asyncio.gather(
+            fetch_player_stats(get_fetcher(), season, "pitching", pitcher_ids),
+            fetch_player_stats(get_fetcher(), season, "batting", hitter_ids))
         season_stats = {"hitting": hitter_stats, "pitching": pitcher_stats}
         with open(os.path.join('pendant_data', 'results', 'actual_stats', f"{season}_actual_stats.json"), 'w',
                   encoding='utf8') as json_file:
@@ -0,0 +1,194 @@
+import argparse
+import asyncio
+import os
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+
+import game_sim
+from src.model_row_cache import ModelRowCache
+from src.probability_cache import ProbabilityCache
+from src.rng import RngStreams
+from src.stlats_store import StlatsStore
+from src.running_stats import (DEFAULT_CONFIDENCE, DEFAULT_MAX_REPLICAS, DEFAULT_MIN_REPLICAS, DEFAULT_WIN_HALF_WIDTH,
+                               StoppingRule)
+from src.variance_reduction import INDEPENDENT, SAMPLING_MODES
+
+# Models are loaded once per worker process by _init_worker and reused for every work unit it runs, along with
+# the probability rows of every matchup the worker has already seen and, if given, the on disk probability cache
+# shared by every worker and every run.  Units are single games handed to whichever worker is free, so a worker's
+# rows only pay off for the teams it happens to draw again, the ProbabilityCache is what every worker shares
+_worker_clf = None
+_worker_cache = None
+_worker_probability_cache = None
+
+
+def _init_worker(compiled=False, probability_cache_path=None):
+    global _worker_clf, _worker_cache, _worker_probability_cache
+    _worker_clf = game_sim.load_models(compiled)
+    _worker_cache = ModelRowCache()
+    # each worker opens its own connection to the cache
+    _worker_probability_cache = (ProbabilityCache(probability_cache_path) if probability_cache_path is not None
+                                 else None)
+
+
+def game_stlats(game, player_stlats, team_stlats, player_blood_types, player_names):
+    """The slice of a day's stlats a single game needs, so workers are not shipped the whole league"""
+    game_teams = {}
+    player_ids = {game["homePitcher"], game["awayPitcher"]}
+    for team in [game["homeTeam"], game["awayTeam"]]:
+        if team in team_stlats:
+            game_teams[team] = team_stlats[team]
+            player_ids.update(team_stlats[team]["lineup"].keys())
+    game_players = {pid: player_stlats[pid] for pid in player_ids if pid in player_stlats}
+    game_blood = {pid: player_blood_types[pid] for pid in player_ids if pid in player_blood_types}
+    game_names = {pid: player_names[pid] for pid in player_ids if pid in player_names}
+    return game_players, game_teams, game_blood, game_names
+
+
+def simulate_unit(unit):
+    """Simulate one game of one day in a worker, returning everything the parent needs to merge"""
+    season, day, game_index, game, stlats, sim_length, master_seed, log_games, stopping_rule, sampling = unit
+    player_stlats, team_stlats, player_blood_types, player_names = stlats
+    # base instincts procs are tallied in a module global, count this unit's procs on their own
+    for procs in game_sim.base_instincts_procs.values():
+        for base in procs:
+            procs[base] = 0
+
+    async def run():
+        models = await game_sim.setup_models([game], _worker_clf, player_stlats, team_stlats, _worker_cache,
+                                             _worker_probability_cache)
+        # each replica draws from its own (master_seed, season, day, game, replica) stream, so results do not
+        # depend on which worker runs the unit or when
+        return await game_sim.simulate([game], models, team_stlats, player_blood_types, player_names,
+                                       sim_length, write_daily_results=False, streams=RngStreams(master_seed),
+                                       log_games=log_games, stopping_rule=stopping_rule, sampling=sampling)
+
+    predicted_wins, a_favored_wins, strikeouts, stat_sheets, output_text = asyncio.run(run())
+    return predicted_wins, a_favored_wins, strikeouts, stat_sheets, game_sim.base_instincts_procs, output_text
+
+
+class InlineExecutor(Executor):
+    """Runs work units in this process, used for a single worker so results can be checked without a pool"""
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+def run_season(executor, season, sim_length, master_seed, total_procs, log_games=True, stopping_rule=None,
+               sampling=INDEPENDENT, store=None):
+    print(f"season {season}")
+    season_data = game_sim.load_season_games(season, store)
+    # Units are submitted as each day's stlats are read so workers start while the parent keeps parsing
+    day_futures = {}
+    for day in range(0, 99):
+        games = season_data[day]
+        if day % 25 == 0:
+            print(f"day {day}")
+        with open(os.path.join('season_sim', 'results', 'daily', f"s{season}_d{day}_results.txt"), 'a') as fd:
+            fd.write(f"Day: {day}\n")
+        player_stlats, team_stlats, player_blood_types, player_names = game_sim.load_day_stlats(season, day, store)
+        day_futures[day] = [
+            executor.submit(simulate_unit, (
+                season, day, game_index, game,
+                game_stlats(game, player_stlats, team_stlats, player_blood_types, player_names),
+                sim_length, master_seed, log_games, stopping_rule, sampling,
+            ))
+            for game_index, game in enumerate(games)
+        ]
+
+    # Merge strictly in (day, game) order so the output does not depend on completion order
+    daily_strikeouts = {}
+    s_predicted_wins, s_a_favored_wins = 0, 0
+    season_statsheets = {}
+    for day in range(0, 99):
+        strikeouts = {}
+        stat_sheets = {}
+        output_text = ""
+        for future in day_futures[day]:
+            predicted_wins, a_favored_wins, game_strikeouts, game_sheets, procs, game_text = future.result()
+            output_text += game_text
+            s_predicted_wins += predicted_wins
+            s_a_favored_wins += a_favored_wins
+            strikeouts.update(game_strikeouts)
+            for player, sheet in game_sheets.items():
+                if player not in stat_sheets:
+                    stat_sheets[player] = game_sim.new_statsheet()
+                for key in sheet:
+                    stat_sheets[player][key] += sheet[key]
+            for proc_season, counts in procs.items():
+                for base, count in counts.items():
+                    total_procs[proc_season][base] += count
+        if output_text:
+            with open(os.path.join('season_sim', 'results', 'daily', f"s{season}_d{day}_results.txt"), 'a') as fd:
+                fd.write(output_text)
+        daily_strikeouts[day] = strikeouts
+        game_sim.add_day_statsheets(season_statsheets, stat_sheets, sim_length)
+    game_sim.write_season_results(season, sim_length, s_predicted_wins, s_a_favored_wins, daily_strikeouts,
+                                  season_statsheets)
+
+
+def run_seasons(seasons, sim_length, master_seed, workers, compiled=False, log_games=True, stopping_rule=None,
+                sampling=INDEPENDENT, store_dir=None, probability_cache_path=None):
+    # only the parent reads stlats, workers are sent each game's slice
+    store = StlatsStore(store_dir) if store_dir is not None else None
+    total_procs = {season: {base: 0 for base in procs} for season, procs in game_sim.base_instincts_procs.items()}
+    if workers == 1:
+        _init_worker(compiled, probability_cache_path)
+        executor = InlineExecutor()
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                       initargs=(compiled, probability_cache_path))
+    with executor:
+        for season in seasons:
+            run_season(executor, season, sim_length, master_seed, total_procs, log_games, stopping_rule, sampling,
+                       store)
+    print(total_procs)
+    return total_procs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the season backtest across a pool of worker processes")
+    parser.add_argument("--iterations", type=int, default=10, help="simulations per game")
+    parser.add_argument("--seed", type=int, default=0, help="master seed, results are identical for a seed")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--first-season", type=int, default=7)
+    parser.add_argument("--last-season", type=int, default=10)
+    parser.add_argument("--compiled", action="store_true",
+                        help="use the numpy model exports from python -m src.compiled_models instead of sklearn")
+    parser.add_argument("--no-game-logs", dest="log_games", action="store_false",
+                        help="skip recording and writing the play by play game logs")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="replicate each game until its win rate has converged instead of --iterations times")
+    parser.add_argument("--win-half-width", type=float, default=DEFAULT_WIN_HALF_WIDTH,
+                        help="adaptive runs stop once the win rate confidence interval is this wide on each side")
+    parser.add_argument("--score-half-width", type=float, default=None,
+                        help="adaptive runs also wait for the mean scores to be this precise")
+    parser.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE)
+    parser.add_argument("--min-replicas", type=int, default=DEFAULT_MIN_REPLICAS)
+    parser.add_argument("--max-replicas", type=int, default=DEFAULT_MAX_REPLICAS)
+    parser.add_argument("--sampling", choices=SAMPLING_MODES, default=INDEPENDENT,
+                        help="variance reduction for the replica draws, runs with the same --seed share common "
+                             "random numbers")
+    parser.add_argument("--store", default=None,
+                        help="read stlats and schedules from a store written by python -m src.stlats_store "
+                             "instead of the json files")
+    parser.add_argument("--probability-cache", default=None,
+                        help="sqlite file of model outputs kept across runs, a repeat backtest reads them back "
+                             "instead of running the models")
+    args = parser.parse_args()
+
+    stopping_rule = None
+    if args.adaptive:
+        stopping_rule = StoppingRule(args.win_half_width, args.score_half_width, args.confidence,
+                                     args.min_replicas, args.max_replicas)
+    run_seasons(range(args.first_season, args.last_season + 1), args.iterations, args.seed, args.workers,
+                args.compiled, args.log_games, stopping_rule, args.sampling, args.store, args.probability_cache)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(game_sim.sum_strikeouts(args.iterations))
+    loop.run_until_complete(game_sim.compare_stats(args.iterations))
+    loop.run_until_complete(game_sim.summarize_diffs())
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
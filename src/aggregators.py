@@ -0,0 +1,191 @@
+from typing import Dict, Iterator, Tuple
+import math
+
+from src.running_stats import RunningStats
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+# values closer to zero than this all land in the zero bucket of a QuantileSketch
+DEFAULT_MIN_VALUE = 1e-9
+
+
+class IntegerHistogram(RunningStats):
+    def __init__(self) -> None:
+        """A RunningStats over integer values, runs or strikeouts, that keeps their whole distribution.
+
+        Memory grows with the number of distinct values, not the number of replicas.  Sums are kept as integers
+        so the mean and variance are exact however many values there are, and merging two histograms gives
+        exactly the histogram of all their values.
+        """
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self._total = 0
+        self._total_squares = 0
+
+    def update(self, value: int, count: int = 1) -> None:
+        self.counts[value] = self.counts.get(value, 0) + count
+        self.count += count
+        self._total += value * count
+        self._total_squares += value * value * count
+
+    def merge(self, other: "IntegerHistogram") -> None:
+        for value, count in other.counts.items():
+            self.update(value, count)
+
+    @property
+    def mean(self) -> float:
+        return self._total / self.count if self.count > 0 else 0.0
+
+    @property
+    def variance(self) -> float:
+        if self.count < 2:
+            return 0.0
+        return (self.count * self._total_squares - self._total * self._total) / (self.count * (self.count - 1))
+
+    def frequency(self, value: int) -> int:
+        return self.counts.get(value, 0)
+
+    def items(self) -> Iterator[Tuple[int, int]]:
+        """(value, count) pairs from the smallest value up"""
+        return iter(sorted(self.counts.items()))
+
+    def quantile(self, q: float) -> int:
+        """The smallest value with more than q * (count - 1) values at or below it"""
+        if self.count == 0:
+            raise ValueError("No values to take a quantile of")
+        rank = q * (self.count - 1)
+        seen = 0
+        for value, count in self.items():
+            seen += count
+            if seen > rank:
+                return value
+        return max(self.counts)
+
+
+class QuantileSketch(object):
+    def __init__(
+        self,
+        relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+        min_value: float = DEFAULT_MIN_VALUE,
+    ) -> None:
+        """A DDSketch of a stream of real values, for quantiles of diffs without keeping the diffs.
+
+        Values go into logarithmic buckets so every quantile comes back within relative_accuracy of a value at
+        that rank.  Sketches with the same accuracy merge exactly, the bucket counts just add up.
+        """
+        if not 0.0 < relative_accuracy < 1.0:
+            raise ValueError(f"relative_accuracy must be between 0 and 1, got {relative_accuracy}")
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self._gamma = (1.0 + relative_accuracy) / (1.0 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _key(self, magnitude: float) -> int:
+        return math.ceil(math.log(magnitude) / self._log_gamma)
+
+    def _bucket_value(self, key: int) -> float:
+        return 2.0 * self._gamma ** key / (self._gamma + 1.0)
+
+    def update(self, value: float) -> None:
+        if value > self.min_value:
+            key = self._key(value)
+            self.positive[key] = self.positive.get(key, 0) + 1
+        elif value < -self.min_value:
+            key = self._key(-value)
+            self.negative[key] = self.negative.get(key, 0) + 1
+        else:
+            self.zero_count += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "QuantileSketch") -> None:
+        if other.relative_accuracy != self.relative_accuracy or other.min_value != self.min_value:
+            raise ValueError("Only sketches with the same relative accuracy and min value can be merged")
+        for key, count in other.positive.items():
+            self.positive[key] = self.positive.get(key, 0) + count
+        for key, count in other.negative.items():
+            self.negative[key] = self.negative.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count > 0 else 0.0
+
+    def quantile(self, q: float) -> float:
+        """A value within relative_accuracy of the value with q * (count - 1) values below it"""
+        if self.count == 0:
+            raise ValueError("No values to take a quantile of")
+        # the exact extremes are known, so the ends come back exact and no bucket midpoint goes past them
+        if q <= 0.0:
+            return self.min
+        if q >= 1.0:
+            return self.max
+        rank = q * (self.count - 1)
+        seen = 0
+        value = None
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                value = -self._bucket_value(key)
+                break
+        if value is None:
+            seen += self.zero_count
+            if seen > rank:
+                value = 0.0
+        if value is None:
+            for key in sorted(self.positive):
+                seen += self.positive[key]
+                if seen > rank:
+                    value = self._bucket_value(key)
+                    break
+        if value is None:
+            value = self.max
+        return min(max(value, self.min), self.max)
+
+
+class GameAggregate(object):
+    def __init__(self) -> None:
+        """Everything simulate keeps about a game's replicas, in constant memory and mergeable across workers"""
+        self.home_runs = IntegerHistogram()
+        self.away_runs = IntegerHistogram()
+        self.run_differential = IntegerHistogram()
+        self.home_wins = IntegerHistogram()
+        # strikeouts by each side's hitters, home_strikeouts are the away pitcher's
+        self.home_strikeouts = IntegerHistogram()
+        self.away_strikeouts = IntegerHistogram()
+        self.innings = IntegerHistogram()
+
+    @property
+    def replicas(self) -> int:
+        return self.home_runs.count
+
+    def update(self, home_score: int, away_score: int, home_strikeouts: int, away_strikeouts: int,
+               innings: int) -> None:
+        self.home_runs.update(home_score)
+        self.away_runs.update(away_score)
+        self.run_differential.update(home_score - away_score)
+        self.home_wins.update(int(home_score > away_score))
+        self.home_strikeouts.update(home_strikeouts)
+        self.away_strikeouts.update(away_strikeouts)
+        self.innings.update(innings)
+
+    def merge(self, other: "GameAggregate") -> None:
+        self.home_runs.merge(other.home_runs)
+        self.away_runs.merge(other.away_runs)
+        self.run_differential.merge(other.run_differential)
+        self.home_wins.merge(other.home_wins)
+        self.home_strikeouts.merge(other.home_strikeouts)
+        self.away_strikeouts.merge(other.away_strikeouts)
+        self.innings.merge(other.innings)
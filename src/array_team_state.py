@@ -0,0 +1,196 @@
+from typing import Dict, Iterator, List, Mapping, MutableMapping, Tuple
+import math
+
+import numpy as np
+
+from src.common import BlaseballStatistics as Stats
+from src.common import ForbiddenKnowledge as FK
+from src.common import BloodType
+from src.team_state import BATTER_FEATURES, DEF_ID, DEFENSE_FEATURES, PITCHER_FEATURES, RUNNER_FEATURES, TeamState
+
+# column of every stlat in ArrayTeamState.stlat_matrix
+STLAT_COLUMNS: Dict[FK, int] = {stlat: column for column, stlat in enumerate(FK)}
+COLUMN_STLATS: List[FK] = list(FK)
+# stlat matrix columns of each feature vector, in model column order
+BATTER_COLUMNS: List[int] = [STLAT_COLUMNS[stlat] for stlat in BATTER_FEATURES]
+RUNNER_COLUMNS: List[int] = [STLAT_COLUMNS[stlat] for stlat in RUNNER_FEATURES]
+PITCHER_COLUMNS: List[int] = [STLAT_COLUMNS[stlat] for stlat in PITCHER_FEATURES]
+DEFENSE_COLUMNS: List[int] = [STLAT_COLUMNS[stlat] for stlat in DEFENSE_FEATURES]
+
+
+class PlayerStlatsView(MutableMapping):
+    def __init__(self, team: "ArrayTeamState", player_id: str) -> None:
+        """One player's row of an ArrayTeamState presented as the Dict[FK, float] TeamState uses"""
+        self.team = team
+        self.player_id = player_id
+
+    def __getitem__(self, stlat: FK) -> float:
+        value = self.team.stlat_matrix[self.team.player_index[self.player_id], STLAT_COLUMNS[stlat]]
+        if math.isnan(value):
+            raise KeyError(stlat)
+        return float(value)
+
+    def __setitem__(self, stlat: FK, value: float) -> None:
+        self.team.set_stlat(self.player_id, stlat, value)
+
+    def __delitem__(self, stlat: FK) -> None:
+        if stlat not in self:
+            raise KeyError(stlat)
+        self.team.set_stlat(self.player_id, stlat, math.nan)
+
+    def __iter__(self) -> Iterator[FK]:
+        row = self.team.stlat_matrix[self.team.player_index[self.player_id]]
+        return iter([COLUMN_STLATS[column] for column in np.flatnonzero(~np.isnan(row))])
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(~np.isnan(self.team.stlat_matrix[self.team.player_index[self.player_id]])))
+
+
+class StlatsView(MutableMapping):
+    def __init__(self, team: "ArrayTeamState") -> None:
+        """The stlat matrix of an ArrayTeamState presented as the Dict[str, Dict[FK, float]] TeamState uses"""
+        self.team = team
+
+    def __getitem__(self, player_id: str) -> PlayerStlatsView:
+        if player_id not in self.team.player_index:
+            raise KeyError(player_id)
+        return PlayerStlatsView(self.team, player_id)
+
+    def __setitem__(self, player_id: str, stlats: Mapping[FK, float]) -> None:
+        self.team.set_player_stlats(player_id, stlats)
+
+    def __delitem__(self, player_id: str) -> None:
+        self.team.remove_player_stlats(player_id)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.team.player_index))
+
+    def __len__(self) -> int:
+        return len(self.team.player_index)
+
+
+class ArrayTeamState(TeamState):
+    def __init__(
+        self,
+        team_id: str,
+        season: int,
+        day: int,
+        num_bases: int,
+        balls_for_walk: int,
+        strikes_for_out: int,
+        outs_for_inning: int,
+        lineup: Dict[int, str],
+        starting_pitcher: str,
+        stlats: Dict[str, Dict[FK, float]],
+        game_stats: Dict[str, Dict[Stats, float]],
+        blood: Dict[str, BloodType],
+        player_names: Dict[str, str],
+        cur_batter_pos: int,
+    ) -> None:
+        """A TeamState that keeps its stlats in a dense players x ForbiddenKnowledge float matrix.
+
+        The batter, runner, pitcher and defense feature matrices are precomputed in model column order and the
+        get_*_feature_vector methods return read-only rows of them instead of building lists.  Stlats a player
+        does not have are NaN.  self.stlats is a dict like view over the matrix, so code written against
+        TeamState keeps working and edits made through it are reflected in the feature matrices.
+        """
+        super().__init__(
+            team_id,
+            season,
+            day,
+            num_bases,
+            balls_for_walk,
+            strikes_for_out,
+            outs_for_inning,
+            lineup,
+            starting_pitcher,
+            stlats,
+            game_stats,
+            blood,
+            player_names,
+            cur_batter_pos,
+        )
+        # TeamState.__init__ has added the DEF_ID row to the plain dict, move everything into the matrix
+        self.player_index: Dict[str, int] = {}
+        self.stlat_matrix: np.ndarray = np.full((len(stlats), len(COLUMN_STLATS)), np.nan)
+        for row, (player_id, player_stlats) in enumerate(stlats.items()):
+            self.player_index[player_id] = row
+            for stlat, value in player_stlats.items():
+                self.stlat_matrix[row, STLAT_COLUMNS[stlat]] = value
+        self.stlats = StlatsView(self)
+        self._refresh_feature_matrices()
+
+    @classmethod
+    def from_team_state(cls, team_state: TeamState) -> "ArrayTeamState":
+        return cls.from_config(team_state.to_dict())
+
+    def clone(self) -> "ArrayTeamState":
+        team = super().clone()
+        # the view has to point at the clone so edits through it refresh the clone's feature matrices
+        team.stlats = StlatsView(team)
+        return team
+
+    def stlat_rows(self) -> Tuple[List[str], np.ndarray]:
+        return sorted(self.player_index, key=self.player_index.__getitem__), self.stlat_matrix
+
+    def restore_stlats(self, player_ids: List[str], stlats: List[FK], matrix: np.ndarray) -> None:
+        self.player_index = {player_id: row for row, player_id in enumerate(player_ids)}
+        if stlats == COLUMN_STLATS:
+            self.stlat_matrix = matrix
+        else:
+            self.stlat_matrix = np.full((len(player_ids), len(COLUMN_STLATS)), np.nan)
+            self.stlat_matrix[:, [STLAT_COLUMNS[stlat] for stlat in stlats]] = matrix
+        self.stlats = StlatsView(self)
+        self._refresh_feature_matrices()
+
+    def _refresh_feature_matrices(self) -> None:
+        self.batter_features: np.ndarray = self._feature_matrix(BATTER_COLUMNS)
+        self.runner_features: np.ndarray = self._feature_matrix(RUNNER_COLUMNS)
+        self.pitcher_features: np.ndarray = self._feature_matrix(PITCHER_COLUMNS)
+        self.defense_features: np.ndarray = self._feature_matrix(DEFENSE_COLUMNS)
+
+    def _feature_matrix(self, columns: List[int]) -> np.ndarray:
+        matrix = self.stlat_matrix[:, columns]
+        matrix.setflags(write=False)
+        return matrix
+
+    def set_stlat(self, player_id: str, stlat: FK, value: float) -> None:
+        self.stlat_matrix[self.player_index[player_id], STLAT_COLUMNS[stlat]] = value
+        self._refresh_feature_matrices()
+
+    def set_player_stlats(self, player_id: str, stlats: Mapping[FK, float]) -> None:
+        """Replace a player's stlats, adding a row for a player the team has not seen"""
+        row = np.full(len(COLUMN_STLATS), np.nan)
+        for stlat, value in stlats.items():
+            row[STLAT_COLUMNS[stlat]] = value
+        if player_id in self.player_index:
+            self.stlat_matrix[self.player_index[player_id]] = row
+        else:
+            self.player_index[player_id] = len(self.stlat_matrix)
+            self.stlat_matrix = np.vstack([self.stlat_matrix, row])
+        self._refresh_feature_matrices()
+
+    def remove_player_stlats(self, player_id: str) -> None:
+        row = self.player_index.pop(player_id)
+        self.stlat_matrix = np.delete(self.stlat_matrix, row, axis=0)
+        self.player_index = {pid: index - (index > row) for pid, index in self.player_index.items()}
+        self._refresh_feature_matrices()
+
+    def get_defense_feature_vector(self) -> np.ndarray:
+        return self.defense_features[self.player_index[DEF_ID]]
+
+    def get_pitcher_feature_vector(self) -> np.ndarray:
+        return self.pitcher_features[self.player_index[self.starting_pitcher]]
+
+    def get_batter_feature_vector(self, player_id: str) -> np.ndarray:
+        return self.batter_features[self.player_index[player_id]]
+
+    def get_runner_feature_vector(self, player_id: str) -> np.ndarray:
+        return self.runner_features[self.player_index[player_id]]
+
+    def get_batter_feature_rows(self, player_ids: List[str]) -> np.ndarray:
+        """Batter feature vectors of many players as one (players x features) matrix"""
+        return self.batter_features[[self.player_index[player_id] for player_id in player_ids]]
+
+    def get_runner_feature_rows(self, player_ids: List[str]) -> np.ndarray:
+        return self.runner_features[[self.player_index[player_id] for player_id in player_ids]]
@@ -0,0 +1,178 @@
+from functools import lru_cache
+from typing import Dict, Iterator, List, Mapping, MutableMapping, NamedTuple, Optional, Tuple
+
+
+class BaseTransition(NamedTuple):
+    """Where every runner ends up after a base running event"""
+    # occupancy bitmask after the event, bit base - 1 is set when the base is occupied
+    state: int
+    runs: int
+    # (from base, to base) of every runner still on base
+    moves: Tuple[Tuple[int, int], ...]
+    # bases of the runners that scored, lead runner first
+    scored: Tuple[int, ...]
+
+
+def base_bit(base: int) -> int:
+    return 1 << (base - 1)
+
+
+class TransitionTables(object):
+    def __init__(self, num_bases: int) -> None:
+        """Every base running outcome for one num_bases setting, indexed by occupancy bitmask.
+
+        Bases run from 1 to num_bases - 1, reaching num_bases scores.  A transition is None where the move
+        would put a runner on an occupied base.
+        """
+        self.num_bases = num_bases
+        self.num_states = 1 << (num_bases - 1)
+        # lead base first, the order runners are processed in
+        self.bases: Tuple[int, ...] = tuple(range(num_bases - 1, 0, -1))
+        # advance[k][state], every runner moves k bases (walks, forced advances, hits)
+        self.advance: List[List[BaseTransition]] = [
+            [self._transition(state, {base: k for base in self._occupied(state)}) for state in range(self.num_states)]
+            for k in range(num_bases + 1)
+        ]
+        # advance_runner[k][state][base], one runner moves k bases (steals, extra bases)
+        self.advance_runner: List[List[List[Optional[BaseTransition]]]] = [
+            [
+                [self._transition(state, {base: k}) if base and state & base_bit(base) else None
+                 for base in range(num_bases)]
+                for state in range(self.num_states)
+            ]
+            for k in range(num_bases + 1)
+        ]
+        # remove_runner[state][base], the runner is out on the bases
+        self.remove_runner: List[List[Optional[BaseTransition]]] = [
+            [
+                self._transition(state, {base: None}) if base and state & base_bit(base) else None
+                for base in range(num_bases)
+            ]
+            for state in range(self.num_states)
+        ]
+        # steal_candidates[state], runners with an open base ahead, lead runner first
+        self.steal_candidates: List[Tuple[int, ...]] = [
+            tuple(base for base in self._occupied(state) if not self._blocked(state, base))
+            for state in range(self.num_states)
+        ]
+        # extra_base_candidates[state], (base, blocking bit) of every runner that may try for an extra base once
+        # the runner ahead has moved, lead runner first.  A runner may go if the blocking bit is 0 or the runner on
+        # that base took the extra base, in which case it is set in the decisions mask.
+        self.extra_base_candidates: List[Tuple[Tuple[int, int], ...]] = [
+            tuple(
+                (base, base_bit(base + 1) if self._blocked(state, base) else 0) for base in self._occupied(state)
+            )
+            for state in range(self.num_states)
+        ]
+        # extra_base[state][decisions], every runner whose bit is set in decisions takes one extra base
+        self.extra_base: List[List[Optional[BaseTransition]]] = [
+            [
+                self._transition(state, {base: 1 for base in self._occupied(decisions)})
+                if decisions & ~state == 0 else None
+                for decisions in range(self.num_states)
+            ]
+            for state in range(self.num_states)
+        ]
+
+    def _occupied(self, state: int) -> Tuple[int, ...]:
+        return tuple(base for base in self.bases if state & base_bit(base))
+
+    def _blocked(self, state: int, base: int) -> bool:
+        return base + 1 < self.num_bases and bool(state & base_bit(base + 1))
+
+    def _transition(self, state: int, moves: Dict[int, Optional[int]]) -> Optional[BaseTransition]:
+        """Apply {base: bases to advance, or None when the runner is out} lead runner first"""
+        new_state = state
+        kept: List[Tuple[int, int]] = []
+        scored: List[int] = []
+        for base in self._occupied(state):
+            new_state &= ~base_bit(base)
+            if base not in moves:
+                new_state |= base_bit(base)
+                kept.append((base, base))
+                continue
+            advance = moves[base]
+            if advance is None:
+                continue
+            new_base = base + advance
+            if new_base >= self.num_bases:
+                scored.append(base)
+            elif new_state & base_bit(new_base):
+                return None
+            else:
+                new_state |= base_bit(new_base)
+                kept.append((base, new_base))
+        return BaseTransition(new_state, len(scored), tuple(kept), tuple(scored))
+
+
+@lru_cache(maxsize=None)
+def transition_tables(num_bases: int) -> TransitionTables:
+    return TransitionTables(num_bases)
+
+
+class BaseRunners(MutableMapping):
+    def __init__(self, num_bases: int, runners: Optional[Mapping[int, str]] = None) -> None:
+        """The runners on base as an occupancy bitmask plus the runner id on each base.
+
+        Base running is done by looking up a BaseTransition in the shared tables for num_bases and applying it.
+        The mapping interface ({base: runner id}) matches the dict GameState used to keep, for code that reads
+        or places individual runners.
+        """
+        self.num_bases = num_bases
+        self.tables: TransitionTables = transition_tables(num_bases)
+        self.occupancy: int = 0
+        self.runners: List[Optional[str]] = [None] * num_bases
+        if runners is not None:
+            for base, runner_id in runners.items():
+                self[int(base)] = runner_id
+
+    def apply(self, transition: Optional[BaseTransition]) -> List[str]:
+        """Move the runners, returning the ids of those who scored, lead runner first"""
+        if transition is None:
+            raise ValueError("a runner can not advance onto an occupied base")
+        runners = self.runners
+        scored = [runners[base] for base in transition.scored]
+        new_runners: List[Optional[str]] = [None] * self.num_bases
+        for base, new_base in transition.moves:
+            new_runners[new_base] = runners[base]
+        self.runners = new_runners
+        self.occupancy = transition.state
+        return scored
+
+    def __getitem__(self, base: int) -> str:
+        if not 0 < base < self.num_bases or not self.occupancy & base_bit(base):
+            raise KeyError(base)
+        return self.runners[base]
+
+    def __setitem__(self, base: int, runner_id: str) -> None:
+        if not 0 < base < self.num_bases:
+            raise KeyError(base)
+        self.occupancy |= base_bit(base)
+        self.runners[base] = runner_id
+
+    def __delitem__(self, base: int) -> None:
+        if base not in self:
+            raise KeyError(base)
+        self.occupancy &= ~base_bit(base)
+        self.runners[base] = None
+
+    def __iter__(self) -> Iterator[int]:
+        return iter([base for base in range(1, self.num_bases) if self.occupancy & base_bit(base)])
+
+    def __len__(self) -> int:
+        return bin(self.occupancy).count("1")
+
+    def clear(self) -> None:
+        self.occupancy = 0
+        self.runners = [None] * self.num_bases
+
+    def copy(self) -> "BaseRunners":
+        runners = BaseRunners.__new__(BaseRunners)
+        runners.num_bases = self.num_bases
+        runners.tables = self.tables
+        runners.occupancy = self.occupancy
+        runners.runners = self.runners[:]
+        return runners
+
+    def __repr__(self) -> str:
+        return f"BaseRunners({self.num_bases}, {dict(self)})"
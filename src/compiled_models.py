@@ -0,0 +1,299 @@
+from typing import Any, Dict, List, Optional, Union
+import argparse
+import glob
+import math
+import os
+
+import numpy as np
+
+COMPILED_EXTENSION = ".npz"
+
+Compiled = Union["CompiledLinearModel", "CompiledTreeModel"]
+
+
+class CompiledLinearModel(object):
+    # how the decision function becomes probabilities
+    LOGISTIC = "logistic"
+    SOFTMAX = "softmax"
+    OVR = "ovr"
+
+    def __init__(self, coef: np.ndarray, intercept: np.ndarray, classes: np.ndarray, link: str) -> None:
+        """A linear classifier as a coefficient matrix, predict_proba is a matrix product and a link function.
+
+        LOGISTIC is a binary model with a single row of coefficients, SOFTMAX a multinomial one and OVR one
+        versus rest, which normalizes the per class sigmoids the way sklearn does.
+        """
+        self.coef_t = np.ascontiguousarray(np.asarray(coef, dtype=np.float64).T)
+        self.intercept = np.asarray(intercept, dtype=np.float64)
+        self.classes_ = np.asarray(classes)
+        self.link = link
+
+    def predict_proba(self, X: Any) -> np.ndarray:
+        return self.apply_link(np.asarray(X, dtype=np.float64) @ self.coef_t + self.intercept)
+
+    def apply_link(self, z: np.ndarray) -> np.ndarray:
+        """Probabilities from the [row, coefficient row] decision function"""
+        if self.link == self.LOGISTIC:
+            p = 1.0 / (1.0 + np.exp(-z))
+            return np.hstack([1.0 - p, p])
+        if self.link == self.SOFTMAX:
+            e = np.exp(z - z.max(axis=1, keepdims=True))
+        else:
+            e = 1.0 / (1.0 + np.exp(-z))
+        return e / e.sum(axis=1, keepdims=True)
+
+    def predict_proba_row(self, features: Any) -> List[float]:
+        """predict_proba for a single feature vector, the link is applied to plain floats since numpy calls on a
+        handful of values cost more than the arithmetic"""
+        z = (np.array(features, dtype=np.float64) @ self.coef_t + self.intercept).tolist()
+        if self.link == self.LOGISTIC:
+            p = 1.0 / (1.0 + math.exp(-z[0]))
+            return [1.0 - p, p]
+        if self.link == self.SOFTMAX:
+            top = max(z)
+            e = [math.exp(value - top) for value in z]
+        else:
+            e = [1.0 / (1.0 + math.exp(-value)) for value in z]
+        total = sum(e)
+        return [value / total for value in e]
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"coef": self.coef_t.T, "intercept": self.intercept, "classes": self.classes_,
+                "link": np.array(self.link)}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "CompiledLinearModel":
+        return cls(arrays["coef"], arrays["intercept"], arrays["classes"], str(arrays["link"]))
+
+
+class CompiledTreeModel(object):
+    # how the summed leaf values become probabilities
+    AVERAGE = "average"
+    LOGISTIC = "logistic"
+    SOFTMAX = "softmax"
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        value: np.ndarray,
+        roots: np.ndarray,
+        init: np.ndarray,
+        classes: np.ndarray,
+        link: str,
+    ) -> None:
+        """Any number of decision trees flattened into one set of node arrays.
+
+        left and right hold absolute node indexes, -1 marks a leaf, and roots is the first node of each tree.
+        The leaf values of every tree are summed onto init: for AVERAGE they are class probabilities already
+        divided by the number of trees (random forests and single trees), for LOGISTIC and SOFTMAX they are
+        learning rate scaled gradient boosting scores.  Features are compared as float32, as sklearn does.
+        """
+        self.feature = np.asarray(feature, dtype=np.int64)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.left = np.asarray(left, dtype=np.int64)
+        self.right = np.asarray(right, dtype=np.int64)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.roots = np.asarray(roots, dtype=np.int64)
+        self.init = np.asarray(init, dtype=np.float64)
+        self.classes_ = np.asarray(classes)
+        self.link = link
+        self._node_lists: Optional[tuple] = None
+
+    def leaves(self, X: Any) -> np.ndarray:
+        """[row, tree] leaf node reached, every row walks every tree one level per step"""
+        x = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(x))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(x), len(self.roots))).copy()
+        while True:
+            inner = self.left[nodes] != -1
+            if not inner.any():
+                return nodes
+            go_left = x[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(inner, np.where(go_left, self.left[nodes], self.right[nodes]), nodes)
+
+    def predict_proba(self, X: Any) -> np.ndarray:
+        raw = self.value[self.leaves(X)].sum(axis=1) + self.init
+        if self.link == self.AVERAGE:
+            return raw
+        if self.link == self.LOGISTIC:
+            p = 1.0 / (1.0 + np.exp(-raw))
+            return np.hstack([1.0 - p, p])
+        e = np.exp(raw - raw.max(axis=1, keepdims=True))
+        return e / e.sum(axis=1, keepdims=True)
+
+    def predict_proba_row(self, features: Any) -> List[float]:
+        """predict_proba for a single feature vector, walking the trees in plain python"""
+        if self._node_lists is None:
+            self._node_lists = (self.feature.tolist(), self.threshold.tolist(), self.left.tolist(),
+                                self.right.tolist(), self.value.tolist())
+        feature, threshold, left, right, value = self._node_lists
+        x = np.asarray(features, dtype=np.float32).tolist()
+        raw = self.init.tolist()
+        for node in self.roots.tolist():
+            while left[node] != -1:
+                node = left[node] if x[feature[node]] <= threshold[node] else right[node]
+            raw = [total + leaf for total, leaf in zip(raw, value[node])]
+        if self.link == self.AVERAGE:
+            return raw
+        if self.link == self.LOGISTIC:
+            p = 1.0 / (1.0 + math.exp(-raw[0]))
+            return [1.0 - p, p]
+        top = max(raw)
+        e = [math.exp(score - top) for score in raw]
+        total = sum(e)
+        return [score / total for score in e]
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"feature": self.feature, "threshold": self.threshold, "left": self.left, "right": self.right,
+                "value": self.value, "roots": self.roots, "init": self.init, "classes": self.classes_,
+                "link": np.array(self.link)}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "CompiledTreeModel":
+        return cls(arrays["feature"], arrays["threshold"], arrays["left"], arrays["right"], arrays["value"],
+                   arrays["roots"], arrays["init"], arrays["classes"], str(arrays["link"]))
+
+
+_compiled_kinds = {
+    "linear": CompiledLinearModel,
+    "trees": CompiledTreeModel,
+}
+
+
+def _flatten_trees(trees: List[Any], leaf_values: List[np.ndarray], num_outputs: int) -> Dict[str, np.ndarray]:
+    """Concatenate sklearn Tree objects, leaf_values[i] holds the [node, output] values of tree i"""
+    feature, threshold, left, right, value, roots = [], [], [], [], [], []
+    offset = 0
+    for tree, values in zip(trees, leaf_values):
+        roots.append(offset)
+        leaf = tree.children_left == -1
+        feature.append(np.where(leaf, 0, tree.feature))
+        threshold.append(tree.threshold)
+        left.append(np.where(leaf, -1, tree.children_left + offset))
+        right.append(np.where(leaf, -1, tree.children_right + offset))
+        value.append(np.asarray(values, dtype=np.float64).reshape(tree.node_count, num_outputs))
+        offset += tree.node_count
+    return {
+        "feature": np.concatenate(feature),
+        "threshold": np.concatenate(threshold),
+        "left": np.concatenate(left),
+        "right": np.concatenate(right),
+        "value": np.concatenate(value),
+        "roots": np.array(roots),
+    }
+
+
+def _class_fractions(tree: Any) -> np.ndarray:
+    counts = tree.value[:, 0, :]
+    return counts / counts.sum(axis=1, keepdims=True)
+
+
+def compile_model(clf: Any) -> Compiled:
+    """Convert a fitted sklearn classifier to a compiled model, supported are linear models with predict_proba
+    (LogisticRegression and friends), decision trees, random forests / extra trees and gradient boosting"""
+    classes = getattr(clf, "classes_", None)
+    if classes is None:
+        raise ValueError(f"Can not compile a {type(clf).__name__}, it is not a fitted classifier")
+    if hasattr(clf, "coef_"):
+        coef = np.atleast_2d(clf.coef_)
+        intercept = np.atleast_1d(clf.intercept_)
+        if len(classes) == 2:
+            link = CompiledLinearModel.LOGISTIC
+        elif (type(clf).__name__ == "LogisticRegression" and getattr(clf, "multi_class", "auto") != "ovr"
+              and clf.solver != "liblinear"):
+            link = CompiledLinearModel.SOFTMAX
+        else:
+            # SGDClassifier and one versus rest logistic regression normalize per class sigmoids
+            link = CompiledLinearModel.OVR
+        return CompiledLinearModel(coef, intercept, classes, link)
+
+    if hasattr(clf, "tree_"):
+        arrays = _flatten_trees([clf.tree_], [_class_fractions(clf.tree_)], len(classes))
+        return CompiledTreeModel(init=np.zeros(len(classes)), classes=classes, link=CompiledTreeModel.AVERAGE,
+                                 **arrays)
+
+    estimators = getattr(clf, "estimators_", None)
+    if isinstance(estimators, list) and estimators and hasattr(estimators[0], "tree_"):
+        trees = [estimator.tree_ for estimator in estimators]
+        arrays = _flatten_trees(trees, [_class_fractions(tree) / len(trees) for tree in trees], len(classes))
+        return CompiledTreeModel(init=np.zeros(len(classes)), classes=classes, link=CompiledTreeModel.AVERAGE,
+                                 **arrays)
+
+    if isinstance(estimators, np.ndarray) and hasattr(clf, "learning_rate"):
+        num_outputs = estimators.shape[1]
+        trees, values = [], []
+        for stage in estimators:
+            for k, estimator in enumerate(stage):
+                tree = estimator.tree_
+                scores = np.zeros((tree.node_count, num_outputs))
+                scores[:, k] = clf.learning_rate * tree.value[:, 0, 0]
+                trees.append(tree)
+                values.append(scores)
+        arrays = _flatten_trees(trees, values, num_outputs)
+        # the init estimator is a class prior, so its raw prediction is the same for every row
+        init = clf._raw_predict_init(np.zeros((1, clf.n_features_in_), dtype=np.float32))[0]
+        link = CompiledTreeModel.LOGISTIC if num_outputs == 1 else CompiledTreeModel.SOFTMAX
+        return CompiledTreeModel(init=init, classes=classes, link=link, **arrays)
+
+    raise ValueError(f"Can not compile a {type(clf).__name__}")
+
+
+def save_compiled(model: Compiled, path: str) -> None:
+    kind = [name for name, kind_cls in _compiled_kinds.items() if isinstance(model, kind_cls)][0]
+    with open(path, "wb") as fd:
+        np.savez(fd, kind=np.array(kind), **model.arrays())
+
+
+def load_compiled(path: str) -> Compiled:
+    """Load a compiled model, this needs numpy only"""
+    with np.load(path, allow_pickle=False) as npz:
+        arrays = {key: npz[key] for key in npz.files}
+    return _compiled_kinds[str(arrays.pop("kind"))].from_arrays(arrays)
+
+
+def compiled_path(joblib_path: str) -> str:
+    return os.path.splitext(joblib_path)[0] + COMPILED_EXTENSION
+
+
+def max_probability_error(clf: Any, compiled: Compiled, X: np.ndarray) -> float:
+    return float(np.abs(clf.predict_proba(X) - compiled.predict_proba(X)).max())
+
+
+def check_rows(clf: Any, rows: int = 2000, seed: int = 0) -> np.ndarray:
+    """Rows to compare a compiled model against sklearn on, uniform over the range stlats take"""
+    return np.random.default_rng(seed).uniform(-0.5, 2.0, (rows, clf.n_features_in_))
+
+
+def export_model(joblib_path: str, tolerance: float = 1e-9, X: Optional[np.ndarray] = None) -> str:
+    """Compile the model in joblib_path to an .npz next to it, refusing to write it unless the compiled
+    probabilities match sklearn within tolerance"""
+    from joblib import load
+
+    clf = load(joblib_path)
+    compiled = compile_model(clf)
+    error = max_probability_error(clf, compiled, check_rows(clf) if X is None else X)
+    if error > tolerance:
+        raise ValueError(f"Compiled {joblib_path} differs from sklearn by {error}")
+    path = compiled_path(joblib_path)
+    save_compiled(compiled, path)
+    return path
+
+
+def export_models(model_dir: str, tolerance: float = 1e-9) -> List[str]:
+    return [export_model(path, tolerance) for path in sorted(glob.glob(os.path.join(model_dir, "*.joblib")))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the sklearn models to numpy arrays for simulation")
+    parser.add_argument("model_dir", nargs="?", default=os.path.join("season_sim", "models"))
+    parser.add_argument("--tolerance", type=float, default=1e-9, help="largest allowed probability difference")
+    args = parser.parse_args()
+    for path in export_models(args.model_dir, args.tolerance):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+from array import array
+from enum import IntEnum
+from typing import Dict, Iterator, List, Mapping, NamedTuple, Optional
+
+import numpy as np
+
+from src.common import BlaseballStatistics as Stats
+from src.game_stats import GameStats
+
+
+class EventType(IntEnum):
+    HALF_INNING = 0
+    AT_BAT = 1
+    STRIKEOUT = 2
+    WALK = 3
+    FLYOUT = 4
+    GROUNDOUT = 5
+    SINGLE = 6
+    DOUBLE = 7
+    TRIPLE = 8
+    HOME_RUN = 9
+    STOLEN_BASE = 10
+    CAUGHT_STEALING = 11
+    GAME_OVER = 12
+
+
+# fields of a record, every one is a signed 16 bit integer
+RECORD_FIELDS = ("event", "inning", "bottom", "batter", "pitcher", "runner", "bases", "outs", "runs", "value")
+RECORD_WIDTH = len(RECORD_FIELDS)
+NO_PLAYER = -1
+
+HIT_NAMES: Dict[int, str] = {
+    EventType.SINGLE: "a single",
+    EventType.DOUBLE: "a double",
+    EventType.TRIPLE: "a triple",
+    EventType.HOME_RUN: "a home run",
+    EventType.FLYOUT: "a flyout",
+    EventType.GROUNDOUT: "a ground out",
+}
+
+# stats credited to the batter and to the pitcher for each event
+BATTER_EVENT_STATS: Dict[int, List[Stats]] = {
+    EventType.STRIKEOUT: [Stats.BATTER_STRIKEOUTS],
+    EventType.WALK: [Stats.BATTER_WALKS],
+    EventType.FLYOUT: [Stats.BATTER_FLYOUTS, Stats.BATTER_AT_BATS],
+    EventType.GROUNDOUT: [Stats.BATTER_GROUNDOUTS, Stats.BATTER_AT_BATS],
+    EventType.SINGLE: [Stats.BATTER_HITS, Stats.BATTER_SINGLES, Stats.BATTER_AT_BATS],
+    EventType.DOUBLE: [Stats.BATTER_HITS, Stats.BATTER_DOUBLES, Stats.BATTER_AT_BATS],
+    EventType.TRIPLE: [Stats.BATTER_HITS, Stats.BATTER_TRIPLES, Stats.BATTER_AT_BATS],
+    EventType.HOME_RUN: [Stats.BATTER_HITS, Stats.BATTER_HRS, Stats.BATTER_AT_BATS],
+}
+PITCHER_EVENT_STATS: Dict[int, List[Stats]] = {
+    EventType.STRIKEOUT: [Stats.PITCHER_STRIKEOUTS],
+    EventType.WALK: [Stats.PITCHER_WALKS],
+    EventType.FLYOUT: [Stats.PITCHER_FLYOUTS],
+    EventType.GROUNDOUT: [Stats.PITCHER_GROUNDOUTS],
+    EventType.SINGLE: [Stats.PITCHER_HITS_ALLOWED],
+    EventType.DOUBLE: [Stats.PITCHER_HITS_ALLOWED, Stats.PITCHER_XBH_ALLOWED],
+    EventType.TRIPLE: [Stats.PITCHER_HITS_ALLOWED, Stats.PITCHER_XBH_ALLOWED],
+    EventType.HOME_RUN: [Stats.PITCHER_HITS_ALLOWED, Stats.PITCHER_HRS_ALLOWED],
+}
+
+
+class Event(NamedTuple):
+    event: EventType
+    inning: int
+    bottom: bool
+    batter: Optional[str]
+    pitcher: Optional[str]
+    runner: Optional[str]
+    # occupancy bitmask after the event, bit base - 1 is set when the base is occupied
+    bases: int
+    outs: int
+    # runs the batting team scored on the event
+    runs: int
+    # bases reached on a walk, base stolen on a steal
+    value: int
+
+
+def ordinal(number: int) -> str:
+    suffix = {1: "st", 2: "nd", 3: "rd"}.get(number % 10 if number > 20 else number, "th")
+    return f"{number}{suffix}"
+
+
+class EventTape(object):
+    def __init__(self, capacity: int = 256, enabled: bool = True) -> None:
+        """A game's play by play as fixed width integer records in one preallocated array.
+
+        Recording an event writes a handful of small integers, players are stored as slots into a table of ids
+        that is kept across games so a reused tape stops growing it.  Text is only built when render is called
+        and per player stats can be recomputed with to_game_stats.  A disabled tape ignores every record call,
+        for bulk Monte Carlo runs where nobody reads the log.
+        """
+        self.enabled = enabled
+        self.capacity = capacity
+        self.records: array = array("h", bytes(2 * RECORD_WIDTH * capacity))
+        self.length = 0
+        self.players: List[str] = []
+        self._slots: Dict[str, int] = {}
+        self.inning = 0
+        self.bottom = 0
+        self.day: Optional[int] = None
+        self.away_team: Optional[str] = None
+        self.home_team: Optional[str] = None
+        self.away_pitcher: Optional[str] = None
+        self.home_pitcher: Optional[str] = None
+        self.away_score = 0
+        self.home_score = 0
+
+    def start(
+        self,
+        away_team: str,
+        home_team: str,
+        away_pitcher: Optional[str] = None,
+        home_pitcher: Optional[str] = None,
+        day: Optional[int] = None,
+        away_score: int = 0,
+        home_score: int = 0,
+    ) -> None:
+        """Clear the tape for a new game, the player table is kept"""
+        self.length = 0
+        self.inning = 0
+        self.bottom = 0
+        self.day = day
+        self.away_team = away_team
+        self.home_team = home_team
+        self.away_pitcher = away_pitcher
+        self.home_pitcher = home_pitcher
+        self.away_score = away_score
+        self.home_score = home_score
+
+    def copy(self) -> "EventTape":
+        tape = EventTape.__new__(EventTape)
+        tape.__dict__.update(self.__dict__)
+        tape.records = self.records[:]
+        tape.players = self.players[:]
+        tape._slots = dict(self._slots)
+        return tape
+
+    def slot(self, player_id: Optional[str]) -> int:
+        if player_id is None:
+            return NO_PLAYER
+        slot = self._slots.get(player_id)
+        if slot is None:
+            slot = len(self.players)
+            self._slots[player_id] = slot
+            self.players.append(player_id)
+        return slot
+
+    def half_inning(self, inning: int, bottom: bool, batter_id: Optional[str], pitcher_id: Optional[str]) -> None:
+        if not self.enabled:
+            return
+        self.inning = inning
+        self.bottom = int(bottom)
+        self.record(EventType.HALF_INNING, batter_id, pitcher_id)
+
+    def record(
+        self,
+        event: int,
+        batter_id: Optional[str],
+        pitcher_id: Optional[str],
+        runner_id: Optional[str] = None,
+        bases: int = 0,
+        outs: int = 0,
+        runs: int = 0,
+        value: int = 0,
+    ) -> None:
+        if not self.enabled:
+            return
+        if self.length == self.capacity:
+            self.records.extend(array("h", bytes(2 * RECORD_WIDTH * self.capacity)))
+            self.capacity *= 2
+        offset = self.length * RECORD_WIDTH
+        records = self.records
+        records[offset] = event
+        records[offset + 1] = self.inning
+        records[offset + 2] = self.bottom
+        records[offset + 3] = self.slot(batter_id)
+        records[offset + 4] = self.slot(pitcher_id)
+        records[offset + 5] = self.slot(runner_id)
+        records[offset + 6] = bases
+        records[offset + 7] = outs
+        records[offset + 8] = runs
+        records[offset + 9] = value
+        self.length += 1
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self) -> Iterator[Event]:
+        records = self.records
+        players = self.players
+        for offset in range(0, self.length * RECORD_WIDTH, RECORD_WIDTH):
+            event, inning, bottom, batter, pitcher, runner, bases, outs, runs, value = \
+                records[offset:offset + RECORD_WIDTH]
+            yield Event(
+                EventType(event),
+                inning,
+                bool(bottom),
+                players[batter] if batter != NO_PLAYER else None,
+                players[pitcher] if pitcher != NO_PLAYER else None,
+                players[runner] if runner != NO_PLAYER else None,
+                bases,
+                outs,
+                runs,
+                value,
+            )
+
+    def to_numpy(self) -> np.ndarray:
+        """A (events x RECORD_FIELDS) copy of the records"""
+        return np.array(self.records[:self.length * RECORD_WIDTH], dtype=np.int16).reshape(self.length, RECORD_WIDTH)
+
+    def render(self, names: Optional[Mapping[str, str]] = None) -> List[str]:
+        """The play by play as lines of text, names maps player and team ids to display names"""
+        names = names or {}
+
+        def name(player_id: Optional[str]) -> str:
+            return names.get(player_id, player_id) if player_id is not None else "Nobody"
+
+        lines: List[str] = []
+        if self.day is not None:
+            lines.append(f"Day {self.day}.")
+        if self.home_pitcher is not None and self.away_pitcher is not None:
+            lines.append(f"{name(self.home_pitcher)} pitching for the {name(self.home_team)} at home.")
+            lines.append(f"{name(self.away_pitcher)} pitching for the {name(self.away_team)} on the road.")
+        else:
+            lines.append("Play ball.")
+        away_score, home_score = self.away_score, self.home_score
+        for event in self:
+            if event.bottom:
+                home_score += event.runs
+            else:
+                away_score += event.runs
+            batting_team = name(self.home_team if event.bottom else self.away_team)
+            run_msg = f" {event.runs} scores." if event.runs > 0 else ""
+            kind = event.event
+            if kind == EventType.HALF_INNING:
+                lines.append(f"\n{'Bottom' if event.bottom else 'Top'} of the {event.inning}, {batting_team} batting.")
+                lines.append(f"{name(self.home_team)}: {home_score} - {name(self.away_team)}: {away_score}")
+            elif kind == EventType.AT_BAT:
+                lines.append(f"{name(event.batter)} batting for the {batting_team}")
+            elif kind == EventType.STRIKEOUT:
+                lines.append(f"{name(event.batter)} struck out.")
+            elif kind == EventType.WALK:
+                instincts = f" Base Instincts takes them to {ordinal(event.value)} base." if event.value > 1 else ""
+                lines.append(f"{name(event.batter)} drew a walk.{instincts}{run_msg}")
+            elif kind in HIT_NAMES:
+                lines.append(f"{name(event.batter)} hit {HIT_NAMES[kind]}.{run_msg}")
+            elif kind == EventType.STOLEN_BASE:
+                scores = " and scores" if event.runs > 0 else ""
+                lines.append(f"{name(event.runner)} steals {ordinal(event.value)} base{scores}.")
+            elif kind == EventType.CAUGHT_STEALING:
+                lines.append(f"{name(event.runner)} caught stealing {ordinal(event.value)} base.")
+            elif kind == EventType.GAME_OVER:
+                if home_score > away_score:
+                    lines.append(f"Game Over. {name(self.home_team)} win {home_score} - {away_score}")
+                else:
+                    lines.append(f"Game Over. {name(self.away_team)} win {away_score} - {home_score}")
+        return lines
+
+    def to_game_stats(self) -> GameStats:
+        """Per player stats recomputed from the tape.
+
+        Batters are credited with their plate appearance results and the runs driven in on them, pitchers with
+        what they allowed and every run scored against them, runners with their steals.
+        """
+        game_stats = GameStats()
+        for event in self:
+            kind = event.event
+            if kind in BATTER_EVENT_STATS:
+                game_stats.add_player(event.batter)
+                game_stats.add_player(event.pitcher)
+                game_stats.add(event.batter, Stats.BATTER_PLATE_APPEARANCES, 1.0)
+                for stat in BATTER_EVENT_STATS[kind]:
+                    game_stats.add(event.batter, stat, 1.0)
+                for stat in PITCHER_EVENT_STATS[kind]:
+                    game_stats.add(event.pitcher, stat, 1.0)
+                game_stats.add(event.batter, Stats.BATTER_RBIS, event.runs)
+                game_stats.add(event.pitcher, Stats.PITCHER_EARNED_RUNS, event.runs)
+            elif kind == EventType.STOLEN_BASE or kind == EventType.CAUGHT_STEALING:
+                game_stats.add_player(event.runner)
+                game_stats.add_player(event.pitcher)
+                game_stats.add(event.runner, Stats.STOLEN_BASE_ATTEMPTS, 1.0)
+                game_stats.add(event.runner,
+                               Stats.STOLEN_BASES if kind == EventType.STOLEN_BASE else Stats.CAUGHT_STEALINGS, 1.0)
+                game_stats.add(event.pitcher, Stats.PITCHER_EARNED_RUNS, event.runs)
+        return game_stats
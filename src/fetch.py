@@ -0,0 +1,287 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+import asyncio
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+import requests
+
+DEFAULT_CACHE_DIR = os.path.join("season_sim", "http_cache")
+DEFAULT_HEADERS = {
+    'User-Agent': 'sibrGameSim/0.1test (tehstone#8448@sibr)'
+}
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TRIES = 10
+# first retry waits up to this many seconds, each later one up to twice as long, capped at DEFAULT_MAX_BACKOFF
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 30.0
+DEFAULT_TIMEOUT = 30.0
+# rate limited and server side failures are worth another try, any other status is final
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+REFERENCE_API = "https://api.blaseball-reference.com/v1"
+PLAYER_STATS_CHUNK = 50
+
+
+class FetchResponse(object):
+    def __init__(self, url: str, status_code: int, content: bytes, headers: Dict[str, str],
+                 from_cache: bool = False) -> None:
+        """A fetched body, from the network or the response cache, with the parts of requests.Response callers use"""
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.from_cache = from_cache
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf8")
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+
+class ResponseCache(object):
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR) -> None:
+        """Response bodies on disk, one file per url, with the validators to revalidate them.
+
+        An entry is a json line of metadata followed by the body, written to a temporary file and renamed into
+        place, so processes sharing the directory only ever read whole entries.
+        """
+        self.cache_dir = cache_dir
+
+    def path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf8")).hexdigest() + ".entry")
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """The entry's metadata with its body under "content", None if the url was never stored"""
+        try:
+            with open(self.path(url), 'rb') as entry_file:
+                meta = json.loads(entry_file.readline())
+                meta["content"] = entry_file.read()
+        except FileNotFoundError:
+            return None
+        return meta if meta.get("url") == url else None
+
+    def put(self, url: str, content: bytes, headers: Dict[str, str]) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        meta = {"url": url, "etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified"),
+                "content_type": headers.get("Content-Type"), "fetched_at": time.time()}
+        descriptor, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, 'wb') as entry_file:
+                entry_file.write(json.dumps(meta).encode("utf8") + b"\n")
+                entry_file.write(content)
+            os.replace(temp_path, self.path(url))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+
+class _Retry(Exception):
+    def __init__(self, retry_after: Optional[float] = None) -> None:
+        super().__init__()
+        self.retry_after = retry_after
+
+
+class AsyncFetcher(object):
+    def __init__(
+        self,
+        cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        tries: int = DEFAULT_TRIES,
+        backoff: float = DEFAULT_BACKOFF,
+        max_backoff: float = DEFAULT_MAX_BACKOFF,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_age: Optional[float] = None,
+        offline: bool = False,
+        headers: Optional[Dict[str, str]] = None,
+        rng: Optional[random.Random] = None,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+    ) -> None:
+        """GETs that do not block the event loop, for the reference stats the backtest is compared against.
+
+        Requests run on a pool of concurrency threads, each keeping one pooled requests.Session, and at most
+        concurrency are in flight however many are awaited at once.  Failed attempts are retried after an
+        exponentially growing delay with full jitter, or the server's Retry-After, successes return at once.
+        Bodies are kept in a ResponseCache: an entry younger than max_age is served as is, an older one is
+        revalidated with If-None-Match or If-Modified-Since, and one whose url keeps failing is served stale.
+        offline serves only from the cache and never touches the network.
+        """
+        if concurrency < 1:
+            raise ValueError(f"concurrency must be at least 1, got {concurrency}")
+        if tries < 1:
+            raise ValueError(f"tries must be at least 1, got {tries}")
+        self.cache = ResponseCache(cache_dir) if cache_dir is not None else None
+        if offline and self.cache is None:
+            raise ValueError("An offline fetcher needs a cache_dir to serve from")
+        self.concurrency = concurrency
+        self.tries = tries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.max_age = max_age
+        self.offline = offline
+        self.headers = dict(DEFAULT_HEADERS if headers is None else headers)
+        self.rng = rng or random.Random()
+        self.sleep = sleep
+        self.requests = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.revalidated = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._local = threading.local()
+        self._sessions: List[requests.Session] = []
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            session.headers.update(self.headers)
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def _attempt(self, url: str, cached: Optional[Dict[str, Any]]) -> Optional[FetchResponse]:
+        """One GET on a worker thread.  Returns the response, None if the url can not be fetched, or raises
+        _Retry"""
+        headers = {}
+        if cached is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        with self._lock:
+            self.requests += 1
+        try:
+            response = self._session().get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException:
+            raise _Retry()
+        if response.status_code == 304 and cached is not None:
+            with self._lock:
+                self.revalidated += 1
+            content = cached["content"]
+            response_headers = {"ETag": cached.get("etag"), "Last-Modified": cached.get("last_modified"),
+                                "Content-Type": cached.get("content_type")}
+            # the refreshed fetch time restarts max_age
+            self.cache.put(url, content, {key: value for key, value in response_headers.items() if value})
+            return FetchResponse(url, 200, content, response_headers, from_cache=True)
+        if response.status_code == 200:
+            if self.cache is not None:
+                self.cache.put(url, response.content, response.headers)
+            return FetchResponse(url, 200, response.content, dict(response.headers))
+        if response.status_code in RETRY_STATUSES:
+            retry_after = response.headers.get("Retry-After")
+            raise _Retry(float(retry_after) if retry_after and retry_after.isdigit() else None)
+        return None
+
+    def _delay(self, attempt: int) -> float:
+        return self.rng.uniform(0.0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _bind_loop(self) -> asyncio.Semaphore:
+        # a semaphore belongs to one event loop, each asyncio.run gets its own
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="fetch")
+        return self._semaphore
+
+    async def get(self, url: str, tries: Optional[int] = None) -> Optional[FetchResponse]:
+        """The url's body, None if it could not be fetched and was never cached"""
+        cached = self.cache.get(url) if self.cache is not None else None
+        if cached is not None and (self.offline or (self.max_age is not None
+                                                    and time.time() - cached["fetched_at"] < self.max_age)):
+            self.cache_hits += 1
+            return FetchResponse(url, 200, cached["content"], {}, from_cache=True)
+        if self.offline:
+            return None
+        semaphore = self._bind_loop()
+        loop = asyncio.get_running_loop()
+        tries = tries or self.tries
+        for attempt in range(tries):
+            async with semaphore:
+                try:
+                    response = await loop.run_in_executor(self._executor, self._attempt, url, cached)
+                except _Retry as retry:
+                    delay = retry.retry_after
+                else:
+                    return response
+            if attempt + 1 < tries:
+                self.retries += 1
+                # the slot is released while waiting so other urls keep going
+                await self.sleep(delay if delay is not None else self._delay(attempt))
+        if cached is not None:
+            self.cache_hits += 1
+            return FetchResponse(url, 200, cached["content"], {}, from_cache=True)
+        return None
+
+    async def get_many(self, urls: Sequence[str], tries: Optional[int] = None) -> List[Optional[FetchResponse]]:
+        """get for every url at once, responses in the order of urls"""
+        return list(await asyncio.gather(*[self.get(url, tries) for url in urls]))
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions = []
+        self._local = threading.local()
+
+    def __enter__(self) -> "AsyncFetcher":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def player_stats_urls(season: int, category: str, player_ids: Sequence[str], chunk_size: int = PLAYER_STATS_CHUNK,
+                      base_url: str = REFERENCE_API) -> List[str]:
+    chunks = [player_ids[i:i + chunk_size] for i in range(0, len(player_ids), chunk_size)]
+    return [f"{base_url}/playerStats?category={category}&season={season}&playerIds={','.join(chunk)}"
+            for chunk in chunks]
+
+
+async def fetch_player_stats(fetcher: AsyncFetcher, season: int, category: str, player_ids: Sequence[str],
+                             chunk_size: int = PLAYER_STATS_CHUNK,
+                             base_url: str = REFERENCE_API) -> Dict[str, Any]:
+    """{player id: stats} of a season's batting or pitching stats, every chunk of ids fetched at once"""
+    urls = player_stats_urls(season, category, player_ids, chunk_size, base_url)
+    stats = {}
+    for url, response in zip(urls, await fetcher.get_many(urls)):
+        if response is None:
+            raise ValueError(f"Could not fetch {url}")
+        for player in response.json():
+            stats[player["player_id"]] = player
+    return stats
+
+
+_default_fetcher: Optional[AsyncFetcher] = None
+
+
+def get_fetcher() -> AsyncFetcher:
+    """Get the process wide fetcher, created on first use"""
+    global _default_fetcher
+    if _default_fetcher is None:
+        _default_fetcher = AsyncFetcher()
+    return _default_fetcher
+
+
+def set_fetcher(fetcher: Optional[AsyncFetcher]) -> Optional[AsyncFetcher]:
+    """Replace the process wide fetcher, returning the previous one so callers can restore it"""
+    global _default_fetcher
+    previous = _default_fetcher
+    _default_fetcher = fetcher
+    return previous
@@ -0,0 +1,101 @@
+from typing import Any, Dict, Hashable, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+from src.compiled_models import CompiledLinearModel
+
+
+class ProbabilityBlock(object):
+    def __init__(self, player_ids: Sequence[str], columns: Dict[Hashable, slice], probs: np.ndarray) -> None:
+        """Every head's probabilities for many players in one [player, outcome] array.
+
+        A head's probabilities for a player are probs[rows[player_id], columns[head]], the accessors hand out
+        views into the block rather than copies.
+        """
+        self.player_ids = list(player_ids)
+        self.rows: Dict[str, int] = {player_id: row for row, player_id in enumerate(self.player_ids)}
+        self.columns = columns
+        self.probs = probs
+
+    def get(self, head: Hashable, player_id: str) -> np.ndarray:
+        return self.probs[self.rows[player_id], self.columns[head]]
+
+    def head(self, head: Hashable) -> np.ndarray:
+        """[player, outcome] probabilities of one head"""
+        return self.probs[:, self.columns[head]]
+
+    def head_rows(self, head: Hashable) -> Dict[str, np.ndarray]:
+        """{player id: probabilities} of one head, in the shape game_sim's models dict uses"""
+        columns = self.columns[head]
+        return {player_id: self.probs[row, columns] for player_id, row in self.rows.items()}
+
+
+class FusedModel(object):
+    def __init__(self, heads: Mapping[Hashable, Any]) -> None:
+        """Several models that take the same feature vector, evaluated in one pass.
+
+        The feature matrix is converted and validated once for all heads.  Compiled linear heads are stacked
+        into one coefficient matrix so their decision functions come out of a single matrix product, every
+        other head gets the shared float64 matrix.  The results land side by side in one ProbabilityBlock.
+        """
+        self.heads: Dict[Hashable, Any] = dict(heads)
+        self.linear_heads: List[Hashable] = [key for key, clf in self.heads.items()
+                                              if isinstance(clf, CompiledLinearModel)]
+        self._linear_columns: Dict[Hashable, slice] = {}
+        self._coef_t: Optional[np.ndarray] = None
+        self._intercept: Optional[np.ndarray] = None
+        if self.linear_heads:
+            start = 0
+            for key in self.linear_heads:
+                width = self.heads[key].coef_t.shape[1]
+                self._linear_columns[key] = slice(start, start + width)
+                start += width
+            self._coef_t = np.ascontiguousarray(np.hstack([self.heads[key].coef_t for key in self.linear_heads]))
+            self._intercept = np.concatenate([self.heads[key].intercept for key in self.linear_heads])
+
+        self.num_features: Optional[int] = None
+        if self._coef_t is not None:
+            self.num_features = self._coef_t.shape[0]
+        else:
+            for clf in self.heads.values():
+                if hasattr(clf, "n_features_in_"):
+                    self.num_features = clf.n_features_in_
+                    break
+
+    def validate(self, X: Any) -> np.ndarray:
+        features = np.asarray(X, dtype=np.float64)
+        if features.ndim != 2:
+            raise ValueError(f"Expected a feature matrix, got an array of shape {features.shape}")
+        if self.num_features is not None and features.shape[1] != self.num_features:
+            raise ValueError(f"Expected {self.num_features} features, got {features.shape[1]}")
+        if not np.isfinite(features).all():
+            raise ValueError("Feature matrix has NaN or infinite values")
+        return features
+
+    def predict_proba(self, X: Any) -> Dict[Hashable, np.ndarray]:
+        """{head: [row, outcome] probabilities}, views into one block"""
+        block = self.predict_block([str(row) for row in range(len(X))], X)
+        return {key: block.head(key) for key in self.heads}
+
+    def predict_block(self, player_ids: Sequence[str], X: Any) -> ProbabilityBlock:
+        """Every head's probabilities for the feature matrix X, one row per player id"""
+        features = self.validate(X)
+        outputs: Dict[Hashable, np.ndarray] = {}
+        if self.linear_heads:
+            z = features @ self._coef_t + self._intercept
+            for key in self.linear_heads:
+                outputs[key] = self.heads[key].apply_link(z[:, self._linear_columns[key]])
+        for key, clf in self.heads.items():
+            if key not in outputs:
+                outputs[key] = np.asarray(clf.predict_proba(features), dtype=np.float64)
+
+        columns: Dict[Hashable, slice] = {}
+        start = 0
+        for key in self.heads:
+            width = outputs[key].shape[1]
+            columns[key] = slice(start, start + width)
+            start += width
+        probs = np.empty((len(features), start))
+        for key, head_columns in columns.items():
+            probs[:, head_columns] = outputs[key]
+        return ProbabilityBlock(player_ids, columns, probs)
@@ -0,0 +1,228 @@
+from multiprocessing.util import Finalize
+from typing import Any, BinaryIO, Dict, List, Optional, Sequence, TextIO, Tuple
+import argparse
+import glob
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+
+DEFAULT_LOG_DIR = os.path.join("season_sim", "game_logs")
+DEFAULT_LEVEL = 6
+# logs waiting for the writer thread before write blocks, about a megabyte of rendered text
+DEFAULT_MAX_PENDING = 256
+ARCHIVE_EXTENSION = ".gamelogs"
+INDEX_EXTENSION = ".index"
+
+# (season, day, game, replica), game is game_sim.game_stream_id
+LogKey = Tuple[int, int, str, int]
+
+_FLUSH = object()
+_STOP = object()
+
+
+def archive_paths(log_dir: str, season: int, writer: str) -> Tuple[str, str]:
+    stem = os.path.join(log_dir, f"s{season}-{writer}")
+    return stem + ARCHIVE_EXTENSION, stem + INDEX_EXTENSION
+
+
+class GameLogSink(object):
+    def __init__(
+        self,
+        log_dir: str = DEFAULT_LOG_DIR,
+        level: int = DEFAULT_LEVEL,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        writer: Optional[str] = None,
+    ) -> None:
+        """Game logs appended to one compressed archive per season, written on a background thread.
+
+        write only queues a log, the writer thread compresses it and appends it to the season's archive with a
+        json line in the season's index giving its offset, so files stay open and nothing is synced per game.
+        Every writer, by default one per process, owns its own archive and index, so pool workers never share a
+        file.  A log written again for the same key supersedes the earlier one.  flush waits for everything
+        queued to reach the files, close also stops the thread.
+        """
+        self.log_dir = log_dir
+        self.level = level
+        self.writer = writer or str(os.getpid())
+        self.written = 0
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._files: Dict[int, Tuple[BinaryIO, TextIO]] = {}
+        self._error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+
+    def write(self, season: int, day: int, game: str, replica: int, lines: Sequence[str],
+              away: Optional[str] = None, home: Optional[str] = None) -> None:
+        """Queue a game's rendered log lines, away and home are team names kept in the index for lookups"""
+        self._raise_error()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="game-log-writer", daemon=True)
+                self._thread.start()
+        text = "".join(f"{line}\n" for line in lines)
+        self._queue.put(((season, day, game, replica), away, home, text, time.time_ns()))
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                if item is _FLUSH:
+                    for data_file, index_file in self._files.values():
+                        data_file.flush()
+                        index_file.flush()
+                elif self._error is None:
+                    self._append(*item)
+            except BaseException as error:
+                self._error = error
+            finally:
+                self._queue.task_done()
+
+    def _append(self, key: LogKey, away: Optional[str], home: Optional[str], text: str, written: int) -> None:
+        season, day, game, replica = key
+        files = self._files.get(season)
+        if files is None:
+            os.makedirs(self.log_dir, exist_ok=True)
+            data_path, index_path = archive_paths(self.log_dir, season, self.writer)
+            files = self._files[season] = (open(data_path, 'ab'), open(index_path, 'a', encoding='utf8'))
+        data_file, index_file = files
+        record = zlib.compress(text.encode("utf8"), self.level)
+        offset = data_file.tell()
+        data_file.write(record)
+        index_file.write(json.dumps({"season": season, "day": day, "game": game, "replica": replica,
+                                     "away": away, "home": home, "offset": offset, "length": len(record),
+                                     "written": written}) + "\n")
+        self.written += 1
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def flush(self) -> None:
+        if self._thread is not None:
+            self._queue.put(_FLUSH)
+            self._queue.join()
+        self._raise_error()
+
+    def close(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_FLUSH)
+            self._queue.put(_STOP)
+            thread.join()
+        for data_file, index_file in self._files.values():
+            # the archive is closed first, so an index line never points past the end of its archive
+            data_file.close()
+            index_file.close()
+        self._files = {}
+        self._raise_error()
+
+    def __enter__(self) -> "GameLogSink":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+class GameLogArchive(object):
+    def __init__(self, log_dir: str = DEFAULT_LOG_DIR) -> None:
+        """Random access to the logs GameLogSinks wrote to log_dir.
+
+        A season's indexes are read once into {(season, day, game, replica): entry}, reading a log is then one
+        seek and one decompress.  Indexes are read again when any of them has grown.
+        """
+        self.log_dir = log_dir
+        self._entries: Dict[int, Dict[LogKey, Dict[str, Any]]] = {}
+        self._sizes: Dict[int, Dict[str, int]] = {}
+
+    def _index_sizes(self, season: int) -> Dict[str, int]:
+        pattern = os.path.join(glob.escape(self.log_dir), f"s{season}-*{INDEX_EXTENSION}")
+        return {path: os.path.getsize(path) for path in glob.glob(pattern)}
+
+    def entries(self, season: int) -> Dict[LogKey, Dict[str, Any]]:
+        """Every log of a season, the latest written where a key was written more than once"""
+        sizes = self._index_sizes(season)
+        if self._sizes.get(season) != sizes:
+            entries: Dict[LogKey, Dict[str, Any]] = {}
+            for index_path in sorted(sizes):
+                data_path = index_path[:-len(INDEX_EXTENSION)] + ARCHIVE_EXTENSION
+                data_size = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+                with open(index_path, 'r', encoding='utf8') as index_file:
+                    for line in index_file:
+                        # a writer that died mid line leaves a partial last line
+                        if not line.endswith("\n"):
+                            break
+                        entry = json.loads(line)
+                        # and a running writer's index can reach the disk before the log it points at
+                        if entry["offset"] + entry["length"] > data_size:
+                            continue
+                        entry["path"] = data_path
+                        key = (entry["season"], entry["day"], entry["game"], entry["replica"])
+                        if key not in entries or entries[key]["written"] <= entry["written"]:
+                            entries[key] = entry
+            self._entries[season] = entries
+            self._sizes[season] = sizes
+        return self._entries[season]
+
+    def read(self, season: int, day: int, game: str, replica: int = 0) -> List[str]:
+        """The log lines of one replica of a game"""
+        entry = self.entries(season).get((season, day, game, replica))
+        if entry is None:
+            raise ValueError(f"No log of season {season} day {day} game {game} replica {replica} in {self.log_dir}")
+        with open(entry["path"], 'rb') as data_file:
+            data_file.seek(entry["offset"])
+            record = data_file.read(entry["length"])
+        return zlib.decompress(record).decode("utf8").splitlines()
+
+
+_default_sink: Optional[GameLogSink] = None
+_default_pid: Optional[int] = None
+
+
+def get_log_sink() -> GameLogSink:
+    """Get this process's sink, created on first use and closed when the process exits"""
+    global _default_sink, _default_pid
+    # a forked child inherits the parent's sink but not its writer thread, it gets a sink of its own
+    if _default_sink is None or _default_pid != os.getpid():
+        _default_sink = GameLogSink()
+        _default_pid = os.getpid()
+        # multiprocessing runs these finalizers as pool workers exit, atexit alone does not
+        Finalize(_default_sink, _default_sink.close, exitpriority=10)
+    return _default_sink
+
+
+def set_log_sink(sink: Optional[GameLogSink]) -> Optional[GameLogSink]:
+    """Replace this process's sink, returning the previous one so callers can restore it"""
+    global _default_sink, _default_pid
+    previous = _default_sink
+    _default_sink = sink
+    _default_pid = os.getpid()
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List or print the game logs of a season's archives")
+    parser.add_argument("season", type=int)
+    parser.add_argument("--day", type=int, default=None)
+    parser.add_argument("--game", default=None, help="game id, or home team id for games without one")
+    parser.add_argument("--replica", type=int, default=0)
+    parser.add_argument("--log-dir", default=DEFAULT_LOG_DIR)
+    args = parser.parse_args()
+
+    archive = GameLogArchive(args.log_dir)
+    if args.day is not None and args.game is not None:
+        print("\n".join(archive.read(args.season, args.day, args.game, args.replica)))
+        return
+    for (season, day, game, replica), entry in sorted(archive.entries(args.season).items()):
+        if args.day is None or day == args.day:
+            print(f"s{season} d{day} {game} replica {replica}: {entry['away']} at {entry['home']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,27 @@
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Generator, List, Mapping, Optional, Tuple
 from enum import Enum
-from joblib import load
 
+import copy
 import json
 import logging
-import os
 import random
 
+from src.array_team_state import ArrayTeamState
+from src.base_state import BaseRunners, base_bit
+from src.event_tape import EventTape, EventType
+from src.model_registry import ModelRegistry, get_model_registry
+from src.rng import spawn_stream
+from src.snapshot import GAME_SNAPSHOT, SnapshotReader, SnapshotWriter
 from src.team_state import DEF_ID, TeamState
 from src.common import BlaseballStatistics as Stats
 from src.common import MachineLearnedModel as Ml
 from src.common import BloodType, PitchEventTeamBuff, team_pitch_event_map
 
+BATTER_MODELS = [Ml.PITCH, Ml.IS_HIT, Ml.HIT_TYPE]
+RUNNER_MODELS = [Ml.RUNNER_ADV_OUT, Ml.RUNNER_ADV_HIT, Ml.SB_ATTEMPT, Ml.SB_SUCCESS]
+# tape event of each HIT_TYPE outcome
+HIT_EVENTS = [EventType.SINGLE, EventType.DOUBLE, EventType.TRIPLE, EventType.HOME_RUN]
+
 CHARM_TRIGGER_PERCENTAGE = 0.02
 # TODO(kjc): validate priors for zap and base instincts
 ZAP_TRIGGER_PERCENTAGE = 0.02
@@ -34,6 +44,23 @@ class InningHalf(Enum):
     BOTTOM = 2
 
 
+class RollRequest(object):
+    def __init__(self, model: Ml, player_id: str, batting_team: TeamState, pitching_team: TeamState) -> None:
+        """A model roll a simulation step is waiting on, answered by sending back the sampled outcome index"""
+        self.model = model
+        self.player_id = player_id
+        self.batting_team = batting_team
+        self.pitching_team = pitching_team
+
+    @property
+    def key(self) -> Tuple[Ml, str, str, str]:
+        """The GameState.probability_tables key holding this roll's outcome probabilities"""
+        return self.model, self.player_id, self.pitching_team.starting_pitcher, self.pitching_team.team_id
+
+    def feature_vector(self) -> List[float]:
+        return GameState.gen_model_fv(self.model, self.batting_team, self.pitching_team, self.player_id)
+
+
 class GameState(object):
     def __init__(
         self,
@@ -49,8 +76,18 @@ class GameState(object):
         outs: int,
         strikes: int,
         balls: int,
+        model_registry: Optional[ModelRegistry] = None,
+        rng: Any = None,
+        event_tape: Optional[EventTape] = None,
     ) -> None:
-        """ A container class that holds the team state for a given game """
+        """ A container class that holds the team state for a given game
+
+        Models are not loaded here, they are pulled lazily from model_registry (the process wide registry
+        by default) so constructing a game is cheap and every live game shares one copy of each model.
+        rng is anything with a random() method, the global random module by default, pass a stream from
+        src.rng.RngStreams to make the game reproducible.  The play by play goes to event_tape, pass a disabled
+        EventTape to skip logging entirely.
+        """
         self.game_id = game_id
         self.season = season
         self.day = day
@@ -74,26 +111,47 @@ class GameState(object):
         self.balls_for_walk = self.cur_batting_team.balls_for_walk
         self.strikes_for_out = self.cur_batting_team.strikes_for_out
         self.outs_for_inning = self.cur_batting_team.outs_for_inning
-        self.cur_base_runners: Dict[int, str] = {}
+        self.cur_base_runners = {}
         self.is_game_over = False
-        self.clf: Dict[Ml, Any] = {}
-        self.game_log: List[str] = ["Play ball."]
-        self._load_ml_models()
+        self.model_registry: ModelRegistry = model_registry or get_model_registry()
+        self.rng = rng if rng is not None else random
+        # (model, batter or runner id, pitcher id, defending team id) -> outcome probabilities
+        self.probability_tables: Dict[Tuple[Ml, str, str, str], List[float]] = {}
+        self.event_tape: EventTape = event_tape if event_tape is not None else EventTape()
+        self.start_event_tape()
         self.refresh_game_status()
 
-    def _load_ml_models(self):
-        self.clf = {
-            Ml.PITCH: load(os.path.join("..", "season_sim", "models", "pitch_v1.joblib")),
-            Ml.IS_HIT: load(os.path.join("..", "season_sim", "models", "is_hit_v1.joblib")),
-            Ml.HIT_TYPE: load(os.path.join("..", "season_sim", "models", "hit_type_v1.joblib")),
-            Ml.RUNNER_ADV_OUT: load(os.path.join("..", "season_sim", "models", "runner_advanced_on_out_v1.joblib")),
-            Ml.RUNNER_ADV_HIT: load(os.path.join("..", "season_sim", "models", "extra_base_on_hit_v1.joblib")),
-            Ml.SB_ATTEMPT: load(os.path.join("..", "season_sim", "models", "sba_v1.joblib")),
-            Ml.SB_SUCCESS: load(os.path.join("..", "season_sim", "models", "sb_success_v1.joblib")),
-        }
-
-    def log_event(self, event: str) -> None:
-        self.game_log.append(event)
+    @property
+    def cur_base_runners(self) -> BaseRunners:
+        return self._cur_base_runners
+
+    @cur_base_runners.setter
+    def cur_base_runners(self, runners: Mapping[int, str]) -> None:
+        """Accepts any {base: runner id} mapping, it is stored as a BaseRunners for the current num_bases"""
+        self._cur_base_runners = BaseRunners(self.num_bases, runners)
+
+    @property
+    def game_log(self) -> List[str]:
+        """The event tape rendered as text"""
+        names = {**self.away_team.player_names, **self.home_team.player_names,
+                 self.away_team.team_id: self.away_team.team_enum.name,
+                 self.home_team.team_id: self.home_team.team_enum.name}
+        return self.event_tape.render(names)
+
+    def start_event_tape(self) -> None:
+        self.event_tape.start(self.away_team.team_id, self.home_team.team_id, self.away_team.starting_pitcher,
+                              self.home_team.starting_pitcher, self.day, self.away_score, self.home_score)
+        self._logged_score = self.away_score + self.home_score
+
+    def record_event(self, event: EventType, runner_id: Optional[str] = None, value: int = 0) -> None:
+        """Write an event to the tape along with the runs scored since the previous one"""
+        tape = self.event_tape
+        if not tape.enabled:
+            return
+        score = self.away_score + self.home_score
+        tape.record(event, self.cur_batting_team.cur_batter, self.cur_pitching_team.starting_pitcher, runner_id,
+                    self.cur_base_runners.occupancy, self.outs, score - self._logged_score, value)
+        self._logged_score = score
 
     def reset_game_state(self) -> None:
         """Reset the game state to the start of the game"""
@@ -105,27 +163,27 @@ class GameState(object):
         self.away_team.reset_team_state()
         self.home_score = 0
         self.away_score = 0
-        self.game_log = ["Play ball."]
+        self.cur_base_runners = {}
+        self.is_game_over = False
+        self.start_event_tape()
         self.refresh_game_status()
 
     def refresh_game_status(self):
         """Refresh game state variables dependant on which team is batting"""
         if self.half == InningHalf.TOP:
-            self.log_event(f'Top of the {self.inning}, {self.away_team.team_enum.name} batting.')
-            self.log_event(f'{self.away_team.get_cur_batter_name()} at bat. {self.home_team.get_cur_pitcher_name()} '
-                           f'pitching.')
             self.cur_batting_team = self.away_team
             self.cur_pitching_team = self.home_team
         else:
-            self.log_event(f'\nBottom of the {self.inning}, {self.home_team.team_enum.name} batting.')
-            self.log_event(f'{self.home_team.get_cur_batter_name()} at bat. {self.away_team.get_cur_pitcher_name()} '
-                           f'pitching.')
             self.cur_batting_team = self.home_team
             self.cur_pitching_team = self.away_team
+        self.event_tape.half_inning(self.inning, self.half == InningHalf.BOTTOM, self.cur_batting_team.cur_batter,
+                                    self.cur_pitching_team.starting_pitcher)
         self.num_bases = self.cur_batting_team.num_bases
         self.balls_for_walk = self.cur_batting_team.balls_for_walk
         self.strikes_for_out = self.cur_batting_team.strikes_for_out
         self.outs_for_inning = self.cur_batting_team.outs_for_inning
+        if self.cur_base_runners.num_bases != self.num_bases:
+            self.cur_base_runners = self.cur_base_runners
 
     def reset_inning_counts(self):
         """Reset the counts of an inning"""
@@ -151,7 +209,7 @@ class GameState(object):
             "balls": self.balls,
             "home_score": self.home_score,
             "away_score": self.away_score,
-            "cur_base_runners": self.cur_base_runners,
+            "cur_base_runners": dict(self.cur_base_runners),
             "home_team": self.home_team.to_dict(),
             "away_team": self.away_team.to_dict(),
         }
@@ -163,12 +221,12 @@ class GameState(object):
             json.dump(self.to_dict(), json_file)
 
     @classmethod
-    def load(cls, storage_path: str):
+    def load(cls, storage_path: str, model_registry: Optional[ModelRegistry] = None, rng: Any = None):
         """Load a game state from json"""
         with open(storage_path, "r") as game_state_file:
             game_state_json = json.load(game_state_file)
             try:
-                return GameState.from_config(game_state_json)
+                return GameState.from_config(game_state_json, model_registry, rng)
             except KeyError:
                 logging.warning(
                     "Unable to load game state file: " + storage_path
@@ -176,7 +234,7 @@ class GameState(object):
                 return None
 
     @classmethod
-    def from_config(cls, game_state: Dict[str, Any]):
+    def from_config(cls, game_state: Dict[str, Any], model_registry: Optional[ModelRegistry] = None, rng: Any = None):
         """Reconstructs a team state from a json file."""
         game_id: str = game_state["game_id"]
         season: int = game_state["season"]
@@ -204,32 +262,114 @@ class GameState(object):
             outs,
             strikes,
             balls,
+            model_registry,
+            rng,
         )
         ret_val.refresh_game_status()
         ret_val.cur_base_runners = cur_base_runners
         return ret_val
 
+    def clone(self, rng: Any = None) -> "GameState":
+        """A copy to branch the game from its current state.
+
+        Only the mutable parts are copied: score, count, inning, base runners, both teams' batting order and game
+        stats, and the event tape.  Rosters and stlats are shared with this game, as are the model registry and
+        the probability tables, which only ever cache values that are the same for both games.  Unless it is given
+        its own rng the clone draws from a child stream of this game's, see src.rng.spawn_stream, so the two games
+        don't consume each other's draws.
+        """
+        game = copy.copy(self)
+        game.home_team = self.home_team.clone()
+        game.away_team = self.away_team.clone()
+        if self.cur_batting_team is self.home_team:
+            game.cur_batting_team, game.cur_pitching_team = game.home_team, game.away_team
+        else:
+            game.cur_batting_team, game.cur_pitching_team = game.away_team, game.home_team
+        game._cur_base_runners = self._cur_base_runners.copy()
+        game.event_tape = self.event_tape.copy()
+        game.rng = rng if rng is not None else spawn_stream(self.rng)
+        return game
+
+    def to_snapshot(self) -> bytes:
+        """A versioned binary snapshot of the game and both teams, see src.snapshot.
+
+        from_snapshot restores it exactly.  The event tape, probability tables, model registry and rng are not
+        part of the snapshot.
+        """
+        writer = SnapshotWriter(GAME_SNAPSHOT)
+        writer.ints([self.season, self.day, self.inning, self.half.value, self.outs, self.strikes, self.balls,
+                     self.home_score, self.away_score, int(self.is_game_over)])
+        runners = self.cur_base_runners
+        bases = list(runners)
+        writer.ints(bases)
+        writer.strings([runners[base] for base in bases])
+        writer.strings([self.game_id])
+        for team in [self.home_team, self.away_team]:
+            writer.ints([int(isinstance(team, ArrayTeamState))])
+            team.write_snapshot(writer)
+        return writer.getvalue()
+
+    @classmethod
+    def from_snapshot(
+        cls,
+        data: bytes,
+        model_registry: Optional[ModelRegistry] = None,
+        rng: Any = None,
+        event_tape: Optional[EventTape] = None,
+    ) -> "GameState":
+        reader = SnapshotReader(data, GAME_SNAPSHOT)
+        season, day, inning, half, outs, strikes, balls, home_score, away_score, is_game_over = reader.ints()
+        runners = dict(zip(reader.ints(), reader.strings()))
+        (game_id,) = reader.strings()
+        teams: List[TeamState] = []
+        for _ in range(2):
+            (array_team,) = reader.ints()
+            teams.append((ArrayTeamState if array_team else TeamState).read_snapshot(reader))
+        game = cls(game_id, season, day, teams[0], teams[1], home_score, away_score, inning, InningHalf(half), outs,
+                   strikes, balls, model_registry, rng, event_tape)
+        game.cur_base_runners = runners
+        game.is_game_over = bool(is_game_over)
+        return game
+
+    def save_snapshot(self, storage_path: str) -> None:
+        with open(storage_path, "wb") as snapshot_file:
+            snapshot_file.write(self.to_snapshot())
+
+    @classmethod
+    def load_snapshot(cls, storage_path: str, model_registry: Optional[ModelRegistry] = None,
+                      rng: Any = None) -> "GameState":
+        with open(storage_path, "rb") as snapshot_file:
+            return cls.from_snapshot(snapshot_file.read(), model_registry, rng)
+
     def simulate_game(self) -> None:
         """Loop until the game over state is true"""
+        self.precompute_probability_tables()
+        self.run_rolls(self.simulate_game_rolls())
+
+    def simulate_game_rolls(self) -> Generator[RollRequest, int, None]:
+        """simulate_game as a generator that yields every model roll it needs instead of making it.
+
+        Whoever drives the generator answers each RollRequest by sending back the sampled outcome index, which
+        lets a scheduler interleave many games and batch their inference.  run_rolls is the simple driver.
+        """
         while not self.is_game_over:
-            if not self.stolen_base_sim():
-                self.pitch_sim()
+            stole = yield from self.stolen_base_sim_rolls()
+            if not stole:
+                yield from self.pitch_sim_rolls()
             self.attempt_to_advance_inning()
 
     # PITCH MECHANICS
     def pitch_sim(self) -> None:
         """Simulate a pitch with the pre-pitch events and the 4 possible pitch outcomes."""
+        self.run_rolls(self.pitch_sim_rolls())
+
+    def pitch_sim_rolls(self) -> Generator[RollRequest, int, None]:
         if self.resolve_team_pre_pitch_event():
             # A pre-pitch event occurred, skip the pitch and let the game state try to advance
             return
         self.cur_pitching_team.update_stat(self.cur_pitching_team.starting_pitcher, Stats.PITCHER_PITCHES_THROWN, 1.0)
         self.cur_batting_team.update_stat(self.cur_batting_team.cur_batter, Stats.BATTER_PITCHES_FACED, 1.0)
-        pitch_fv = self.gen_pitch_fv(
-            self.cur_batting_team.get_cur_batter_feature_vector(),
-            self.cur_pitching_team.get_pitcher_feature_vector(),
-            self.cur_pitching_team.get_defense_feature_vector(),
-        )
-        pitch_result = self.generic_model_roll(Ml.PITCH, pitch_fv)
+        pitch_result = yield self.batter_roll_request(Ml.PITCH)
         # 0 = ball, 1 = strike, 2 = foul, 3 = in_play
         if pitch_result == 0:
             self.cur_pitching_team.update_stat(self.cur_pitching_team.starting_pitcher, Stats.PITCHER_BALLS_THROWN, 1.0)
@@ -264,7 +404,7 @@ class GameState(object):
                 Stats.PITCHER_BATTERS_FACED,
                 1.0
             )
-            self.in_play_sim(pitch_fv)
+            yield from self.in_play_sim_rolls()
             self.reset_pitch_count()
             self.cur_batting_team.next_batter()
             return
@@ -274,6 +414,7 @@ class GameState(object):
         self.cur_pitching_team.update_stat(self.cur_pitching_team.starting_pitcher, Stats.PITCHER_WALKS, 1.0)
         self.cur_batting_team.update_stat(self.cur_batting_team.cur_batter, Stats.BATTER_WALKS, 1.0)
         self.cur_base_runners[num_bases_to_advance] = self.cur_batting_team.cur_batter
+        self.record_event(EventType.WALK, value=num_bases_to_advance)
         self.reset_pitch_count()
         self.cur_batting_team.next_batter()
 
@@ -281,12 +422,16 @@ class GameState(object):
         self.cur_pitching_team.update_stat(self.cur_pitching_team.starting_pitcher, Stats.PITCHER_STRIKEOUTS, 1.0)
         self.cur_batting_team.update_stat(self.cur_batting_team.cur_batter, Stats.BATTER_STRIKEOUTS, 1.0)
         self.outs += 1
+        self.record_event(EventType.STRIKEOUT)
         self.reset_pitch_count()
         self.cur_batting_team.next_batter()
 
     # HIT MECHANICS
-    def in_play_sim(self, pitch_feature_vector: List[float]):
-        contact_type = self.generic_model_roll(Ml.IS_HIT, pitch_feature_vector)
+    def in_play_sim(self) -> None:
+        self.run_rolls(self.in_play_sim_rolls())
+
+    def in_play_sim_rolls(self) -> Generator[RollRequest, int, None]:
+        contact_type = yield self.batter_roll_request(Ml.IS_HIT)
         # 0 = Flyout, 1 = Groundout, 2 = Hit
         if contact_type == 0:
             self.outs += 1
@@ -294,7 +439,8 @@ class GameState(object):
             self.cur_batting_team.update_stat(self.cur_batting_team.cur_batter, Stats.BATTER_FLYOUTS, 1.0)
             self.cur_batting_team.update_stat(self.cur_batting_team.cur_batter, Stats.BATTER_AT_BATS, 1.0)
             if self.outs < self.outs_for_inning:
-                self.attempt_to_advance_runners_on_flyout()
+                yield from self.attempt_to_advance_runners_on_flyout_rolls()
+            self.record_event(EventType.FLYOUT)
         if contact_type == 1:
             self.outs += 1
             self.cur_pitching_team.update_stat(self.cur_pitching_team.starting_pitcher, Stats.PITCHER_GROUNDOUTS, 1.0)
@@ -303,71 +449,77 @@ class GameState(object):
                 self.resolve_fc_dp()
             else:
                 self.cur_batting_team.update_stat(self.cur_batting_team.cur_batter, Stats.BATTER_AT_BATS, 1.0)
+            self.record_event(EventType.GROUNDOUT)
         if contact_type == 2:
             self.cur_batting_team.update_stat(self.cur_batting_team.cur_batter, Stats.BATTER_AT_BATS, 1.0)
-            self.hit_sim(pitch_feature_vector)
+            yield from self.hit_sim_rolls()
         self.reset_pitch_count()
 
-    def hit_sim(self, pitch_feature_vector) -> None:
+    def hit_sim(self) -> None:
+        self.run_rolls(self.hit_sim_rolls())
+
+    def hit_sim_rolls(self) -> Generator[RollRequest, int, None]:
         # lets figure out what kind of hit
         self.cur_batting_team.update_stat(self.cur_batting_team.cur_batter, Stats.BATTER_HITS, 1.0)
         self.cur_pitching_team.update_stat(self.cur_pitching_team.starting_pitcher, Stats.PITCHER_HITS_ALLOWED, 1.0)
-        hit_type = self.generic_model_roll(Ml.HIT_TYPE, pitch_feature_vector)
+        hit_type = yield self.batter_roll_request(Ml.HIT_TYPE)
         # 0 = Single, 1 = Double, 2 = Triple, 3 = HR
         if hit_type == 0:
             self.advance_all_runners(1)
             self.cur_batting_team.update_stat(self.cur_batting_team.cur_batter, Stats.BATTER_SINGLES, 1.0)
-            self.attempt_to_advance_runners_on_hit()
+            yield from self.attempt_to_advance_runners_on_hit_rolls()
             self.cur_base_runners[1] = self.cur_batting_team.cur_batter
         if hit_type == 1:
             self.advance_all_runners(2)
             self.cur_batting_team.update_stat(self.cur_batting_team.cur_batter, Stats.BATTER_DOUBLES, 1.0)
             self.cur_pitching_team.update_stat(self.cur_pitching_team.starting_pitcher, Stats.PITCHER_XBH_ALLOWED, 1.0)
-            self.attempt_to_advance_runners_on_hit()
+            yield from self.attempt_to_advance_runners_on_hit_rolls()
             self.cur_base_runners[2] = self.cur_batting_team.cur_batter
         if hit_type == 2:
             self.advance_all_runners(3)
             self.cur_batting_team.update_stat(self.cur_batting_team.cur_batter, Stats.BATTER_TRIPLES, 1.0)
             self.cur_pitching_team.update_stat(self.cur_pitching_team.starting_pitcher, Stats.PITCHER_XBH_ALLOWED, 1.0)
-            self.attempt_to_advance_runners_on_hit()
+            yield from self.attempt_to_advance_runners_on_hit_rolls()
             self.cur_base_runners[3] = self.cur_batting_team.cur_batter
         if hit_type == 3:
             self.advance_all_runners(self.num_bases)
             self.cur_batting_team.update_stat(self.cur_batting_team.cur_batter, Stats.BATTER_HRS, 1.0)
             self.cur_batting_team.update_stat(self.cur_batting_team.cur_batter, Stats.BATTER_RBIS, 1.0)
             self.cur_batting_team.update_stat(self.cur_batting_team.cur_batter, Stats.BATTER_RUNS_SCORED, 1.0)
-        self.reset_pitch_count()
-        self.cur_batting_team.next_batter()
+            self.cur_pitching_team.update_stat(self.cur_pitching_team.starting_pitcher, Stats.PITCHER_HRS_ALLOWED, 1.0)
+            self.cur_pitching_team.update_stat(
+                self.cur_pitching_team.starting_pitcher,
+                Stats.PITCHER_EARNED_RUNS,
+                1.0
+            )
+            self.increase_batting_team_runs(1)
+        self.record_event(HIT_EVENTS[hit_type])
+        # pitch_sim moves on to the next batter once the ball is no longer in play
 
     def attempt_to_advance_runners_on_hit(self) -> None:
-        for base in reversed(sorted(self.cur_base_runners.keys())):
-            new_base = base + 1
-            if new_base not in self.cur_base_runners.keys():
-                # Base ahead is open.  Let's see if we can advance 1 extra base.
-                base_runner_id = self.cur_base_runners[base]
-                base_runner_fv = self.gen_runner_fv(
-                    self.cur_batting_team.get_runner_feature_vector(base_runner_id),
-                    self.cur_pitching_team.get_defense_feature_vector(),
-                    self.cur_pitching_team.get_pitcher_feature_vector(),
-                )
-                if self.generic_model_roll(Ml.RUNNER_ADV_HIT, base_runner_fv) == 1:
-                    self.update_base_runner(base, Stats.GENERIC_ADVANCEMENT, 1)
-        return
+        self.run_rolls(self.attempt_to_advance_runners_on_hit_rolls())
+
+    def attempt_to_advance_runners_on_hit_rolls(self) -> Generator[RollRequest, int, None]:
+        yield from self.attempt_to_advance_runners_rolls(Ml.RUNNER_ADV_HIT)
 
     def attempt_to_advance_runners_on_flyout(self) -> None:
-        for base in reversed(sorted(self.cur_base_runners.keys())):
-            new_base = base + 1
-            if new_base not in self.cur_base_runners.keys():
-                # Base ahead is open.  Let's see if we can advance 1 extra base.
-                base_runner_id = self.cur_base_runners[base]
-                base_runner_fv = self.gen_runner_fv(
-                    self.cur_batting_team.get_runner_feature_vector(base_runner_id),
-                    self.cur_pitching_team.get_defense_feature_vector(),
-                    self.cur_pitching_team.get_pitcher_feature_vector(),
-                )
-                if self.generic_model_roll(Ml.RUNNER_ADV_OUT, base_runner_fv) == 1:
-                    self.update_base_runner(base, Stats.GENERIC_ADVANCEMENT, 1)
-        return
+        self.run_rolls(self.attempt_to_advance_runners_on_flyout_rolls())
+
+    def attempt_to_advance_runners_on_flyout_rolls(self) -> Generator[RollRequest, int, None]:
+        yield from self.attempt_to_advance_runners_rolls(Ml.RUNNER_ADV_OUT)
+
+    def attempt_to_advance_runners_rolls(self, model: Ml) -> Generator[RollRequest, int, None]:
+        """Give every runner with an open base ahead a model roll to take one extra base, lead runner first"""
+        runners = self.cur_base_runners
+        state = runners.occupancy
+        decisions = 0
+        for base, blocking_bit in runners.tables.extra_base_candidates[state]:
+            # the base ahead is open, or opened up when its runner took the extra base
+            if blocking_bit == 0 or decisions & blocking_bit:
+                if (yield self.runner_roll_request(model, runners.runners[base])) == 1:
+                    decisions |= base_bit(base)
+        if decisions:
+            self.score_runners(runners.apply(runners.tables.extra_base[state][decisions]))
 
     def resolve_fc_dp(self) -> None:
         # TODO(kjc9): implement this logic, for now, treat it as if everyone advances 1 base
@@ -382,29 +534,31 @@ class GameState(object):
             # Possible event, let's validate
             event, start_season, end_season, req_blood = team_pitch_event_map[self.cur_pitching_team.team_enum]
             # First let's check if a pre-pitch event for the pitcher should trigger
-            if team_pitch_event_map[self.cur_pitching_team.team_enum] in valid_pre_pitch_pitching_events:
+            if event in valid_pre_pitch_pitching_events:
                 # Let's figure out which pitch event it is and deal with it here
 
                 # Deal with charm strikeout chance
                 if event == PitchEventTeamBuff.CHARM and self.check_valid_season(start_season, end_season):
                     if self.is_start_of_at_bat() and \
                             self.check_blood_requirement(self.cur_pitching_team.starting_pitcher, req_blood):
-                        roll = random.random()
+                        roll = self.rng.random()
                         if roll < CHARM_TRIGGER_PERCENTAGE:
                             self.resolve_strikeout()
                             return True
                     return False
                 # TODO: Add additional pre pitch pitching events here as needed
 
+        if self.cur_batting_team.team_enum in team_pitch_event_map:
+            event, start_season, end_season, req_blood = team_pitch_event_map[self.cur_batting_team.team_enum]
             # Second, let's check if a pre-pitch event for the batter should trigger
-            if team_pitch_event_map[self.cur_batting_team.team_enum] in valid_pre_pitch_batting_events:
+            if event in valid_pre_pitch_batting_events:
                 # Let's figure out which batting event it is and deal with it here
 
                 # Deal with charm walk chance
                 if event == PitchEventTeamBuff.CHARM and self.check_valid_season(start_season, end_season):
                     if self.is_start_of_at_bat() and \
                             self.check_blood_requirement(self.cur_batting_team.cur_batter, req_blood):
-                        roll = random.random()
+                        roll = self.rng.random()
                         if roll < CHARM_TRIGGER_PERCENTAGE:
                             self.resolve_walk(1)
                             return True
@@ -414,7 +568,7 @@ class GameState(object):
                 if event == PitchEventTeamBuff.ELECTRIC and self.check_valid_season(start_season, end_season):
                     if self.is_start_of_at_bat() and \
                             self.check_blood_requirement(self.cur_batting_team.cur_batter, req_blood):
-                        roll = random.random()
+                        roll = self.rng.random()
                         if roll < ZAP_TRIGGER_PERCENTAGE:
                             self.strikes -= 1
                             return True
@@ -441,7 +595,7 @@ class GameState(object):
             if event == PitchEventTeamBuff.BASE_INSTINCTS and \
                     self.check_valid_season(start_season, end_season) and\
                     self.check_blood_requirement(self.cur_batting_team.cur_batter, req_blood):
-                roll = random.random()
+                roll = self.rng.random()
                 cur_base_prior = BASE_INSTINCT_PRIORS[self.cur_batting_team.num_bases]
                 total_priors = 0.0
                 for num_base in reversed(sorted(cur_base_prior.keys())):
@@ -468,61 +622,72 @@ class GameState(object):
 
     # STOLEN BASE MECHANICS
     def stolen_base_sim(self) -> bool:
-        for base in reversed(sorted(self.cur_base_runners.keys())):
-            # no one should ever be on home (4 or 5) so this is ok
-            next_base = base + 1
-            if next_base not in self.cur_base_runners.keys():
-                # base is open and available for theft
-                base_runner_id = self.cur_base_runners[base]
-                base_runner_fv = self.gen_runner_fv(
-                    self.cur_batting_team.get_runner_feature_vector(base_runner_id),
-                    self.cur_pitching_team.get_defense_feature_vector(),
-                    self.cur_pitching_team.get_pitcher_feature_vector(),
+        return self.run_rolls(self.stolen_base_sim_rolls())
+
+    def stolen_base_sim_rolls(self) -> Generator[RollRequest, int, bool]:
+        runners = self.cur_base_runners
+        # every runner with an open base ahead, lead runner first
+        for base in runners.tables.steal_candidates[runners.occupancy]:
+            base_runner_id = runners.runners[base]
+            if (yield self.runner_roll_request(Ml.SB_ATTEMPT, base_runner_id)) == 1:
+                self.cur_batting_team.update_stat(base_runner_id, Stats.STOLEN_BASE_ATTEMPTS, 1.0)
+                self.cur_pitching_team.update_stat(DEF_ID, Stats.DEFENSE_STOLEN_BASE_ATTEMPTS, 1.0)
+                self.cur_pitching_team.update_stat(
+                    self.cur_pitching_team.starting_pitcher,
+                    Stats.DEFENSE_STOLEN_BASE_ATTEMPTS,
+                    1.0
                 )
-                if self.generic_model_roll(Ml.SB_ATTEMPT, base_runner_fv) == 1:
-                    self.cur_batting_team.update_stat(base_runner_id, Stats.STOLEN_BASE_ATTEMPT, 1.0)
-                    self.cur_pitching_team.update_stat(DEF_ID, Stats.DEFENSE_STOLEN_BASE_ATTEMPTS, 1.0)
+                if (yield self.runner_roll_request(Ml.SB_SUCCESS, base_runner_id)) == 1:
+                    self.cur_batting_team.update_stat(base_runner_id, Stats.STOLEN_BASES, 1.0)
+                    self.cur_pitching_team.update_stat(DEF_ID, Stats.DEFENSE_STOLEN_BASES, 1.0)
                     self.cur_pitching_team.update_stat(
                         self.cur_pitching_team.starting_pitcher,
-                        Stats.DEFENSE_STOLEN_BASE_ATTEMPTS,
+                        Stats.DEFENSE_STOLEN_BASES,
                         1.0
                     )
-                    if self.generic_model_roll(Ml.SB_SUCCESS, base_runner_fv) == 1:
-                        self.cur_batting_team.update_stat(base_runner_id, Stats.STOLEN_BASE, 1.0)
-                        self.cur_pitching_team.update_stat(DEF_ID, Stats.DEFENSE_STOLEN_BASE, 1.0)
-                        self.cur_pitching_team.update_stat(
-                            self.cur_pitching_team.starting_pitcher,
-                            Stats.DEFENSE_STOLEN_BASE,
-                            1.0
-                        )
-                        self.update_base_runner(base, Stats.STOLEN_BASE)
-                    else:
-                        self.cur_batting_team.update_stat(base_runner_id, Stats.CAUGHT_STEALINGS, 1.0)
-                        self.cur_pitching_team.update_stat(DEF_ID, Stats.DEFENSE_CAUGHT_STEALINGS, 1.0)
-                        self.cur_pitching_team.update_stat(
-                            self.cur_pitching_team.starting_pitcher,
-                            Stats.DEFENSE_CAUGHT_STEALINGS,
-                            1.0
-                        )
-                        self.update_base_runner(base, Stats.CAUGHT_STEALINGS)
-                    # runner attempted to steal
-                    return True
+                    self.update_base_runner(base, Stats.STOLEN_BASES)
+                    self.record_event(EventType.STOLEN_BASE, base_runner_id, base + 1)
+                else:
+                    self.cur_batting_team.update_stat(base_runner_id, Stats.CAUGHT_STEALINGS, 1.0)
+                    self.cur_pitching_team.update_stat(DEF_ID, Stats.DEFENSE_CAUGHT_STEALINGS, 1.0)
+                    self.cur_pitching_team.update_stat(
+                        self.cur_pitching_team.starting_pitcher,
+                        Stats.DEFENSE_CAUGHT_STEALINGS,
+                        1.0
+                    )
+                    self.update_base_runner(base, Stats.CAUGHT_STEALINGS)
+                    self.record_event(EventType.CAUGHT_STEALING, base_runner_id, base + 1)
+                # runner attempted to steal
+                return True
         # No steal attempt was made by any runner
         return False
 
     # BASE RUNNING MECHANICS
     def advance_all_runners(self, num_bases_to_advance: int) -> None:
-        for base in reversed(sorted(self.cur_base_runners.keys())):
-            self.update_base_runner(base, Stats.GENERIC_ADVANCEMENT, num_bases_to_advance)
+        runners = self.cur_base_runners
+        self.score_runners(runners.apply(runners.tables.advance[num_bases_to_advance][runners.occupancy]))
+
+    def score_runners(self, runner_ids: List[str]) -> None:
+        """Credit runs driven in by the current batter"""
+        for runner_id in runner_ids:
+            self.cur_batting_team.update_stat(self.cur_batting_team.cur_batter, Stats.BATTER_RBIS, 1.0)
+            self.cur_batting_team.update_stat(runner_id, Stats.BATTER_RUNS_SCORED, 1.0)
+            self.cur_pitching_team.update_stat(
+                self.cur_pitching_team.starting_pitcher,
+                Stats.PITCHER_EARNED_RUNS,
+                1.0
+            )
+            self.increase_batting_team_runs(1)
 
     def update_base_runner(self, base: int, action: Stats, num_bases_to_advance: int = 1) -> None:
+        runners = self.cur_base_runners
         if action == Stats.CAUGHT_STEALINGS:
             self.outs += 1
-            del self.cur_base_runners[base]
+            runners.apply(runners.tables.remove_runner[runners.occupancy][base])
             return
         if action == Stats.STOLEN_BASES:
             # Can only steal 1 base at a time so no variable here
-            if base == self.num_bases - 1:
+            for _ in runners.apply(runners.tables.advance_runner[1][runners.occupancy][base]):
                 # run scores
                 self.cur_pitching_team.update_stat(
                     self.cur_pitching_team.starting_pitcher,
@@ -530,34 +695,10 @@ class GameState(object):
                     1.0
                 )
                 self.increase_batting_team_runs(1)
-                del self.cur_base_runners[base]
-            else:
-                new_base = base + 1
-                assert new_base not in self.cur_base_runners
-                assert new_base < self.num_bases
-                runner_id = self.cur_base_runners[base]
-                self.cur_base_runners[new_base] = runner_id
-                del self.cur_base_runners[base]
             return
         if action == Stats.GENERIC_ADVANCEMENT:
-            if base >= self.num_bases - num_bases_to_advance:
-                # run scores
-                self.cur_batting_team.update_stat(self.cur_batting_team.cur_batter, Stats.BATTER_RBIS, 1.0)
-                self.cur_batting_team.update_stat(self.cur_base_runners[base], Stats.BATTER_RUNS_SCORED, 1.0)
-                self.cur_pitching_team.update_stat(
-                    self.cur_pitching_team.starting_pitcher,
-                    Stats.PITCHER_EARNED_RUNS,
-                    1.0
-                )
-                self.increase_batting_team_runs(1)
-                del self.cur_base_runners[base]
-            else:
-                new_base = base + num_bases_to_advance
-                assert new_base not in self.cur_base_runners
-                assert new_base < self.num_bases
-                runner_id = self.cur_base_runners[base]
-                self.cur_base_runners[new_base] = runner_id
-                del self.cur_base_runners[base]
+            transition = runners.tables.advance_runner[num_bases_to_advance][runners.occupancy][base]
+            self.score_runners(runners.apply(transition))
             return
 
     # GENERIC HELPER METHODS
@@ -565,9 +706,42 @@ class GameState(object):
         return self.balls == 0 and self.strikes == 0
 
     def generic_model_roll(self, model: Ml, feature_vector: List[float]) -> int:
-        probs: List[float] = self.clf[model].predict_proba(feature_vector)
+        clf = self.model_registry.get(model)
+        # compiled models have a single row path that skips building a batch
+        predict_row = getattr(clf, "predict_proba_row", None)
+        probs: List[float] = predict_row(feature_vector) if predict_row else clf.predict_proba([feature_vector])[0]
+        return self.roll_from_probs(probs, self.rng.random())
+
+    def batter_model_roll(self, model: Ml) -> int:
+        return self.resolve_roll(self.batter_roll_request(model))
+
+    def runner_model_roll(self, model: Ml, runner_id: str) -> int:
+        return self.resolve_roll(self.runner_roll_request(model, runner_id))
+
+    def batter_roll_request(self, model: Ml) -> RollRequest:
+        return RollRequest(model, self.cur_batting_team.cur_batter, self.cur_batting_team, self.cur_pitching_team)
+
+    def runner_roll_request(self, model: Ml, runner_id: str) -> RollRequest:
+        return RollRequest(model, runner_id, self.cur_batting_team, self.cur_pitching_team)
+
+    def resolve_roll(self, request: RollRequest) -> int:
+        """Answer a roll request from the probability tables, filling the missing row if need be"""
+        return self.roll_from_probs(self.roll_probs(request), self.rng.random())
+
+    def run_rolls(self, rolls: Generator[RollRequest, int, Any]) -> Any:
+        """Drive a *_rolls generator to completion, answering each request locally, and return its result"""
+        try:
+            request = next(rolls)
+            while True:
+                request = rolls.send(self.resolve_roll(request))
+        except StopIteration as stop:
+            return stop.value
+
+    @classmethod
+    def roll_from_probs(cls, probs: List[float], roll: Optional[float] = None) -> int:
         # generate random float between 0-1
-        roll = random.random()
+        if roll is None:
+            roll = random.random()
         total = 0
         for i in range(len(probs)):
             # add the odds of the next outcome to the running total
@@ -575,6 +749,66 @@ class GameState(object):
             # if the random roll is less than the new total, return this outcome
             if roll < total:
                 return i
+        # the probabilities can sum to a hair under 1.0, treat that sliver as the last outcome
+        return len(probs) - 1
+
+    # PROBABILITY TABLES
+    def roll_probs(self, request: RollRequest) -> List[float]:
+        """Outcome probabilities of a roll request, filling its row on first use."""
+        probs = self.probability_tables.get(request.key)
+        if probs is None:
+            self._fill_probability_tables(request.batting_team, request.pitching_team, [request.player_id],
+                                          [request.model])
+            probs = self.probability_tables[request.key]
+        return probs
+
+    def get_batter_probs(self, model: Ml, batter_id: str) -> List[float]:
+        """Outcome probabilities of a batter model against the current pitcher and defense."""
+        return self.roll_probs(RollRequest(model, batter_id, self.cur_batting_team, self.cur_pitching_team))
+
+    def get_runner_probs(self, model: Ml, runner_id: str) -> List[float]:
+        """Outcome probabilities of a runner model against the current pitcher and defense."""
+        return self.roll_probs(self.runner_roll_request(model, runner_id))
+
+    def precompute_probability_tables(self) -> None:
+        """Fill the probability tables for every batter and runner in both lineups.
+
+        This makes one predict_proba call per model per side rather than one per roll.  Players whose rows are
+        already in the tables, from an earlier call or a batched fill across games, are skipped.  Any key that
+        is still missing afterwards (a pinch runner, a new pitcher) is filled on first use.
+        """
+        models = BATTER_MODELS + RUNNER_MODELS
+        for batting_team, pitching_team in [(self.away_team, self.home_team), (self.home_team, self.away_team)]:
+            player_ids = [
+                batting_team.lineup[pos] for pos in sorted(batting_team.lineup.keys())
+                if any((model, batting_team.lineup[pos], pitching_team.starting_pitcher, pitching_team.team_id)
+                       not in self.probability_tables for model in models)
+            ]
+            if player_ids:
+                self._fill_probability_tables(batting_team, pitching_team, player_ids, models)
+
+    def clear_probability_tables(self) -> None:
+        """Drop every cached probability, needed after changing stlats, pitchers or lineups mid game."""
+        self.probability_tables = {}
+
+    def _fill_probability_tables(
+            self,
+            batting_team: TeamState,
+            pitching_team: TeamState,
+            player_ids: List[str],
+            models: List[Ml],
+    ) -> None:
+        # models sharing a feature vector are evaluated together, building the vector once per player
+        for group in [BATTER_MODELS, RUNNER_MODELS]:
+            heads = [model for model in models if model in group]
+            if not heads:
+                continue
+            fvs = [self.gen_model_fv(heads[0], batting_team, pitching_team, player_id) for player_id in player_ids]
+            block = self.model_registry.predict_block(heads, player_ids, fvs)
+            for model in heads:
+                for player_id, probs in zip(player_ids, block.head(model).tolist()):
+                    key = (model, player_id, pitching_team.starting_pitcher, pitching_team.team_id)
+                    self.probability_tables[key] = probs
 
     def increase_batting_team_runs(self, amt: int) -> None:
         if self.half == InningHalf.TOP:
@@ -598,22 +832,40 @@ class GameState(object):
         else:
             # Game can now be over when advancing, must check state
             if self.outs == self.outs_for_inning:
+                self.cur_base_runners = {}
                 if self.half == InningHalf.TOP:
                     if self.home_score > self.away_score:
                         self.is_game_over = True
+                        self.record_event(EventType.GAME_OVER)
                     else:
                         self.half = InningHalf.BOTTOM
                         self.refresh_game_status()
                         self.reset_inning_counts()
-                if self.half == InningHalf.BOTTOM:
+                elif self.half == InningHalf.BOTTOM:
                     if self.home_score != self.away_score:
                         self.is_game_over = True
+                        self.record_event(EventType.GAME_OVER)
                     else:
                         self.half = InningHalf.TOP
                         self.inning += 1
                         self.refresh_game_status()
                         self.reset_inning_counts()
 
+    @classmethod
+    def gen_model_fv(cls, model: Ml, batting_team: TeamState, pitching_team: TeamState, player_id: str) -> List[float]:
+        """The feature vector model expects for player_id batting or running against pitching_team"""
+        if model in BATTER_MODELS:
+            return cls.gen_pitch_fv(
+                batting_team.get_batter_feature_vector(player_id),
+                pitching_team.get_pitcher_feature_vector(),
+                pitching_team.get_defense_feature_vector(),
+            )
+        return cls.gen_runner_fv(
+            batting_team.get_runner_feature_vector(player_id),
+            pitching_team.get_defense_feature_vector(),
+            pitching_team.get_pitcher_feature_vector(),
+        )
+
     @classmethod
     def gen_runner_fv(
             cls,
@@ -621,10 +873,8 @@ class GameState(object):
             defense_stlats: List[float],
             pitcher_stlats: List[float]
     ) -> List[float]:
-        ret_val = runner_stlats
-        ret_val.extend(defense_stlats)
-        ret_val.extend(pitcher_stlats)
-        return ret_val
+        # build a new list, the inputs may be cached rows owned by the team state
+        return [*runner_stlats, *defense_stlats, *pitcher_stlats]
 
     @classmethod
     def gen_pitch_fv(
@@ -633,7 +883,4 @@ class GameState(object):
             pitcher_stlats: List[float],
             defense_stlats: List[float],
     ) -> List[float]:
-        ret_val = batter_stlats
-        ret_val.extend(pitcher_stlats)
-        ret_val.extend(defense_stlats)
-        return ret_val
+        return [*batter_stlats, *pitcher_stlats, *defense_stlats]
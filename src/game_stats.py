@@ -0,0 +1,115 @@
+from array import array
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+from src.common import BlaseballStatistics as Stats
+
+# column of every stat in a player's row, keyed by the enum value since hashing an Enum member is slow
+STAT_COLUMNS: Dict[int, int] = {stat.value: column for column, stat in enumerate(Stats)}
+COLUMN_STATS: List[Stats] = list(Stats)
+NUM_STATS = len(COLUMN_STATS)
+
+
+class GameStats(object):
+    def __init__(self, player_ids: Iterable[str] = ()) -> None:
+        """Per player game stats in one flat, preallocated float64 counter array.
+
+        Each player owns a row of NUM_STATS counters and updates are a single indexed add, so players never
+        share counters.  Reset is a single buffer copy, and to_numpy exposes the counters as a
+        (players x stats) array without copying them.
+        """
+        self.player_slots: Dict[str, int] = {}
+        self._offsets: Dict[str, int] = {}
+        self.counts: array = array("d")
+        self._zeros: array = array("d")
+        for player_id in player_ids:
+            self.add_player(player_id)
+
+    def add_player(self, player_id: str) -> int:
+        """Give a player a row of counters if they do not have one yet, returns their slot"""
+        if player_id in self.player_slots:
+            return self.player_slots[player_id]
+        slot = len(self.player_slots)
+        self.player_slots[player_id] = slot
+        self._offsets[player_id] = slot * NUM_STATS
+        # resizing fails while a to_numpy view is alive, add every player before exporting
+        self.counts.extend(array("d", bytes(8 * NUM_STATS)))
+        self._zeros = array("d", bytes(8 * len(self.counts)))
+        return slot
+
+    @property
+    def player_ids(self) -> List[str]:
+        return list(self.player_slots)
+
+    def add(self, player_id: str, stat: Stats, value: float) -> None:
+        self.counts[self._offsets[player_id] + STAT_COLUMNS[stat._value_]] += value
+
+    def get(self, player_id: str, stat: Stats) -> float:
+        return self.counts[self._offsets[player_id] + STAT_COLUMNS[stat._value_]]
+
+    def reset(self) -> None:
+        self.counts[:] = self._zeros
+
+    def player_stats(self, player_id: str) -> Dict[Stats, float]:
+        offset = self._offsets[player_id]
+        return {stat: self.counts[offset + column] for column, stat in enumerate(COLUMN_STATS)}
+
+    def to_numpy(self) -> np.ndarray:
+        """A (players x stats) view of the counters in player slot order, shares memory with this object"""
+        return np.frombuffer(self.counts, dtype=np.float64).reshape(len(self.player_slots), NUM_STATS)
+
+    def to_frame(self) -> Any:
+        """The counters as a pandas DataFrame indexed by player id with a column per stat"""
+        import pandas
+
+        return pandas.DataFrame(self.to_numpy(), index=self.player_ids, columns=[stat.name for stat in COLUMN_STATS],
+                                copy=False)
+
+    def to_dict(self) -> Dict[str, Dict[Stats, float]]:
+        return {player_id: self.player_stats(player_id) for player_id in self.player_slots}
+
+    @classmethod
+    def from_dict(cls, raw: Dict[str, Dict[Stats, float]]) -> "GameStats":
+        game_stats = cls(raw.keys())
+        for player_id, player_stats in raw.items():
+            for stat, value in player_stats.items():
+                game_stats.add(player_id, stat, value)
+        return game_stats
+
+    def copy(self) -> "GameStats":
+        """An independent copy of the counters, cheaper than going through to_dict"""
+        game_stats = GameStats.__new__(GameStats)
+        game_stats.player_slots = dict(self.player_slots)
+        game_stats._offsets = dict(self._offsets)
+        game_stats.counts = self.counts[:]
+        game_stats._zeros = self._zeros
+        return game_stats
+
+    @classmethod
+    def from_numpy(cls, player_ids: List[str], counts: np.ndarray, stats: List[Stats] = COLUMN_STATS) -> "GameStats":
+        """Rebuild from a (players x stats) array whose columns are the given stats, the inverse of to_numpy"""
+        game_stats = cls()
+        game_stats.player_slots = {player_id: slot for slot, player_id in enumerate(player_ids)}
+        game_stats._offsets = {player_id: slot * NUM_STATS for slot, player_id in enumerate(player_ids)}
+        game_stats._zeros = array("d", bytes(8 * NUM_STATS * len(player_ids)))
+        if stats is COLUMN_STATS or stats == COLUMN_STATS:
+            game_stats.counts = array("d", np.ascontiguousarray(counts, dtype=np.float64).tobytes())
+        else:
+            game_stats.counts = game_stats._zeros[:]
+            totals = game_stats.to_numpy()
+            for column, stat in enumerate(stats):
+                totals[:, STAT_COLUMNS[stat.value]] = counts[:, column]
+        return game_stats
+
+    @classmethod
+    def merge(cls, replicas: List["GameStats"]) -> "GameStats":
+        """Sum the stats of many replicas of a game, players are matched up by id"""
+        merged = cls()
+        for replica in replicas:
+            for player_id in replica.player_slots:
+                merged.add_player(player_id)
+        totals = merged.to_numpy()
+        for replica in replicas:
+            totals[[merged.player_slots[player_id] for player_id in replica.player_slots]] += replica.to_numpy()
+        return merged
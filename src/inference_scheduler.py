@@ -0,0 +1,99 @@
+from typing import Dict, Generator, List, Optional, Tuple
+
+from src.common import MachineLearnedModel as Ml
+from src.game_state import BATTER_MODELS, RUNNER_MODELS, GameState, RollRequest
+from src.model_registry import ModelRegistry
+
+ParkedGame = Tuple[GameState, Generator[RollRequest, int, None], RollRequest]
+
+
+class BatchedInferenceScheduler(object):
+    def __init__(self, max_batch_size: Optional[int] = None) -> None:
+        """Run many games as generators, batching the model rolls they wait on across games.
+
+        Each game runs through GameState.simulate_game_rolls.  Rolls whose probabilities are already in the
+        game's probability tables are answered on the spot, a game that needs a row nobody has computed yet is
+        parked.  Once every game is parked or finished, the parked requests are grouped by model and answered
+        with one predict_proba call per model, and the games resume with their sampled outcomes.
+        """
+        self.max_batch_size: Optional[int] = max_batch_size
+        self.predict_calls: int = 0
+        self.rows_predicted: int = 0
+
+    def run(self, games: List[GameState], prefetch: bool = False) -> None:
+        """Simulate every game to completion.
+
+        With prefetch, the lineup tables of all games are filled first with one batched call per model, so the
+        only rolls left to batch are the ones for players outside the starting lineups.
+        """
+        if prefetch:
+            self.precompute_probability_tables(games)
+        parked: List[ParkedGame] = []
+        for game in games:
+            rolls = game.simulate_game_rolls()
+            request = self._advance(game, rolls, None)
+            if request is not None:
+                parked.append((game, rolls, request))
+        while parked:
+            self._answer(parked)
+            still_parked: List[ParkedGame] = []
+            for game, rolls, request in parked:
+                request = self._advance(game, rolls, game.resolve_roll(request))
+                if request is not None:
+                    still_parked.append((game, rolls, request))
+            parked = still_parked
+
+    def precompute_probability_tables(self, games: List[GameState]) -> None:
+        """GameState.precompute_probability_tables for many games, one predict_proba call per model"""
+        requests: List[Tuple[GameState, RollRequest]] = []
+        for game in games:
+            for batting_team, pitching_team in [(game.away_team, game.home_team), (game.home_team, game.away_team)]:
+                for pos in sorted(batting_team.lineup.keys()):
+                    for model in BATTER_MODELS + RUNNER_MODELS:
+                        requests.append(
+                            (game, RollRequest(model, batting_team.lineup[pos], batting_team, pitching_team))
+                        )
+        self._predict(requests)
+
+    @classmethod
+    def _advance(
+        cls,
+        game: GameState,
+        rolls: Generator[RollRequest, int, None],
+        outcome: Optional[int],
+    ) -> Optional[RollRequest]:
+        """Run a game until it waits on a probability row that is not in its tables, None once it is over"""
+        try:
+            request = rolls.send(outcome)
+            while request.key in game.probability_tables:
+                request = rolls.send(game.resolve_roll(request))
+            return request
+        except StopIteration:
+            return None
+
+    def _answer(self, parked: List[ParkedGame]) -> None:
+        self._predict([(game, request) for game, _, request in parked])
+
+    def _predict(self, requests: List[Tuple[GameState, RollRequest]]) -> None:
+        # Games may carry their own registry, only requests sharing both model and registry share a batch
+        batches: Dict[Tuple[Ml, ModelRegistry], List[Tuple[GameState, RollRequest]]] = {}
+        for game, request in requests:
+            if request.key in game.probability_tables:
+                continue
+            batches.setdefault((request.model, game.model_registry), []).append((game, request))
+        for (model, registry), batch in batches.items():
+            chunk_size = self.max_batch_size or len(batch)
+            for start in range(0, len(batch), chunk_size):
+                chunk = batch[start:start + chunk_size]
+                all_probs = registry.get(model).predict_proba([request.feature_vector() for _, request in chunk])
+                self.predict_calls += 1
+                self.rows_predicted += len(chunk)
+                for (game, request), probs in zip(chunk, all_probs):
+                    game.probability_tables[request.key] = list(probs)
+
+
+def simulate_games(games: List[GameState], prefetch: bool = False) -> BatchedInferenceScheduler:
+    """Simulate every game to completion with batched inference, returning the scheduler for its counters"""
+    scheduler = BatchedInferenceScheduler()
+    scheduler.run(games, prefetch)
+    return scheduler
@@ -0,0 +1,511 @@
+from typing import Dict, List, Optional, Tuple
+import hashlib
+
+import numpy as np
+
+from src.base_state import BaseTransition, base_bit, transition_tables
+from src.common import MachineLearnedModel as Ml
+from src.game_state import CHARM_TRIGGER_PERCENTAGE, GameState
+from src.vectorized_sim import AWAY, EMPTY, HOME, MatchupTables
+
+DEFAULT_MAX_RUNS = 25
+DEFAULT_MAX_SCORE = 60
+DEFAULT_MAX_INNINGS = 30
+# extra innings stop once less than this much of the game is still tied
+DEFAULT_TOLERANCE = 1e-12
+
+# (outs, occupancy bitmask, runner lineup slot per base, lineup slot at bat, balls, strikes)
+InningState = Tuple[int, int, Tuple[int, ...], int, int, int]
+
+# (batting lineup, pitcher id, defending team id, starting lineup slot, max runs, fingerprint of the tables)
+_half_inning_cache: Dict[Tuple, np.ndarray] = {}
+
+
+def clear_half_inning_cache() -> None:
+    _half_inning_cache.clear()
+
+
+def _probabilities(cumulative: np.ndarray) -> List[List[float]]:
+    """Per slot outcome probabilities from cumulative tables, the sliver under 1.0 goes to the last outcome the
+    way GameState.roll_from_probs hands it out"""
+    probs = np.diff(cumulative, axis=1, prepend=0.0)
+    probs[:, -1] = 1.0 - cumulative[:, -2] if cumulative.shape[1] > 1 else 1.0
+    return probs.tolist()
+
+
+class HalfInningSolver(object):
+    def __init__(self, matchup: MatchupTables, side: int, max_runs: int = DEFAULT_MAX_RUNS) -> None:
+        """Exact distribution of runs scored and the next lineup slot up for one team's half-innings.
+
+        A half-inning under the GameState rules is a Markov chain over (outs, balls, strikes, runners on base by
+        lineup slot, batter) and the runs scored so far.  Every loop of GameState.simulate_game_rolls raises the
+        outs, num_bases * runs + the bases occupied, or the count, so probability is pushed through the states in
+        that order with numpy, a layer of states at a time.  Fouls with two strikes are the only loops onto the
+        same state and are folded in as a geometric series.  Mass that scores max_runs or more is piled up at
+        max_runs with the lineup slot up at that moment, see truncated_mass for how much of it was cut short.
+        """
+        self.matchup = matchup
+        self.side = side
+        self.max_runs = max_runs
+        self.lineup_len = int(matchup.lineup_len[side])
+        self.num_bases = int(matchup.num_bases[side])
+        self.balls_for_walk = int(matchup.balls_for_walk[side])
+        self.strikes_for_out = int(matchup.strikes_for_out[side])
+        self.outs_for_inning = int(matchup.outs_for_inning[side])
+        self.tables = transition_tables(self.num_bases)
+        self._bases_occupied = [sum(base for base in self.tables.bases if state & base_bit(base))
+                                for state in range(self.tables.num_states)]
+        self.truncated_mass = 0.0
+        self._transition_cache: Dict[InningState, List[Tuple[InningState, int, float]]] = {}
+        self._fingerprint: Optional[str] = None
+
+        length = self.lineup_len
+        self.pitch = _probabilities(matchup.tables[Ml.PITCH][side][:length])
+        self.contact = _probabilities(matchup.tables[Ml.IS_HIT][side][:length])
+        self.hit_type = _probabilities(matchup.tables[Ml.HIT_TYPE][side][:length])
+        # chance of outcome 1 (advance, attempt, success) for the runner models
+        self.adv_out = self._runner_probability(Ml.RUNNER_ADV_OUT)
+        self.adv_hit = self._runner_probability(Ml.RUNNER_ADV_HIT)
+        self.sb_attempt = self._runner_probability(Ml.SB_ATTEMPT)
+        self.sb_success = self._runner_probability(Ml.SB_SUCCESS)
+
+        self.o_no = [bool(flag) for flag in matchup.o_no[side]]
+        # walks as (bases to advance, probability), base instincts batters can walk further
+        self.walks: List[List[Tuple[int, float]]] = []
+        for slot in range(length):
+            walks = [(1, 1.0)]
+            if matchup.base_instincts[side][slot]:
+                previous = 0.0
+                for num_base, cumulative in matchup.base_instinct_priors[side]:
+                    walks.append((int(num_base), cumulative - previous))
+                    walks[0] = (1, walks[0][1] - (cumulative - previous))
+                    previous = cumulative
+            self.walks.append(walks)
+        # charm rolls at the start of each at bat, a charm pitching team never lets the batter's charm trigger
+        self.charm_strikeout = 0.0
+        self.charm_walk = [0.0] * length
+        if matchup.charm_pitching_team[1 - side]:
+            if matchup.charm_pitcher[1 - side]:
+                self.charm_strikeout = CHARM_TRIGGER_PERCENTAGE
+        else:
+            self.charm_walk = [CHARM_TRIGGER_PERCENTAGE if flag else 0.0 for flag in matchup.charm_walk[side]]
+
+    def _runner_probability(self, model: Ml) -> List[float]:
+        probs = _probabilities(self.matchup.tables[model][self.side][:self.lineup_len])
+        return [row[1] if len(row) > 1 else 0.0 for row in probs]
+
+    def fingerprint(self) -> str:
+        """Digest of everything the solution depends on besides the starting slot"""
+        if self._fingerprint is not None:
+            return self._fingerprint
+        digest = hashlib.sha256()
+        for table in [self.pitch, self.contact, self.hit_type, self.adv_out, self.adv_hit, self.sb_attempt,
+                      self.sb_success, self.o_no, self.walks, self.charm_walk]:
+            digest.update(repr(table).encode("utf8"))
+        digest.update(repr((self.num_bases, self.balls_for_walk, self.strikes_for_out, self.outs_for_inning,
+                            self.charm_strikeout)).encode("utf8"))
+        self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def cache_key(self, start_pos: int) -> Tuple:
+        pitching = 1 - self.side
+        return (
+            tuple(self.matchup.lineups[self.side]),
+            self.matchup.pitchers[pitching],
+            self.matchup.team_ids[pitching],
+            start_pos,
+            self.max_runs,
+            self.fingerprint(),
+        )
+
+    def solve_from_start(self, start_pos: int) -> np.ndarray:
+        """solve for a fresh half-inning, cached across solvers and games.  Every starting slot is solved in the
+        same pass, so the whole lineup is cached on the first miss"""
+        key = self.cache_key(start_pos)
+        if key not in _half_inning_cache:
+            starts = [self.inning_state(pos) for pos in range(self.lineup_len)]
+            for pos, result in enumerate(self.solve_states(starts)):
+                _half_inning_cache[self.cache_key(pos)] = result
+        return _half_inning_cache[key]
+
+    def solve(
+        self,
+        start_pos: int,
+        outs: int = 0,
+        balls: int = 0,
+        strikes: int = 0,
+        runners: Optional[Dict[int, int]] = None,
+    ) -> np.ndarray:
+        """[runs, lineup slot leading off the next half-inning] probabilities from the given situation"""
+        return self.solve_states([self.inning_state(start_pos, outs, balls, strikes, runners)])[0]
+
+    def inning_state(
+        self,
+        start_pos: int,
+        outs: int = 0,
+        balls: int = 0,
+        strikes: int = 0,
+        runners: Optional[Dict[int, int]] = None,
+    ) -> InningState:
+        """The chain state of a situation, runners are {base: lineup slot}"""
+        slots = [EMPTY] * self.num_bases
+        occupancy = 0
+        for base, slot in (runners or {}).items():
+            slots[base] = slot
+            occupancy |= base_bit(base)
+        return outs, occupancy, tuple(slots), start_pos, balls, strikes
+
+    def _reachable(self, starts: List[InningState]) -> List[InningState]:
+        """The starts and every state of the half-inning reachable from them, in discovery order"""
+        states = list(dict.fromkeys(starts))
+        index = set(states)
+        for state in states:
+            for next_state, _, _ in self._transitions(state):
+                if next_state[0] < self.outs_for_inning and next_state not in index:
+                    index.add(next_state)
+                    states.append(next_state)
+        return states
+
+    def solve_reachable(self, starts: List[InningState]) -> Tuple[Dict[InningState, int], np.ndarray]:
+        """Row index and [row, runs, lineup slot leading off the next half-inning] probabilities of every state
+        reachable from the starts, all solved in one pass.
+
+        solve_states pushes a column of mass per start through every state, which is quadratic in the number of
+        starts.  This works backwards instead: the chance of scoring k more runs from a state is the chance of its
+        transitions scoring r runs times that of scoring k - r more from where they lead.  Solving for k = 0, 1, ...
+        in turn, the transitions that score are answered by an earlier k and the ones that score nothing only
+        ever move to later states, so each k is one sparse triangular system, factored once.  Mass scoring
+        max_runs or more is piled up at max_runs with the lineup slot up in the state it started from.
+        """
+        # scipy comes with sklearn, it is only needed for solving many states at once
+        from scipy.sparse import csr_matrix, identity
+        from scipy.sparse.linalg import splu
+
+        max_runs = self.max_runs
+        states = self._reachable(starts)
+        index = {state: row for row, state in enumerate(states)}
+        num_states = len(states)
+        finished = np.zeros((max_runs, num_states, self.lineup_len))
+        # (rows, next rows, probabilities) of the transitions staying in the half-inning, by runs scored
+        edges: Dict[int, Tuple[List[int], List[int], List[float]]] = {}
+        for row, state in enumerate(states):
+            for next_state, scored, prob in self._transitions(state):
+                if next_state[0] >= self.outs_for_inning:
+                    if scored < max_runs:
+                        finished[scored, row, next_state[3]] += prob
+                else:
+                    rows, next_rows, probs = edges.setdefault(scored, ([], [], []))
+                    rows.append(row)
+                    next_rows.append(index[next_state])
+                    probs.append(prob)
+        steps = {scored: csr_matrix((probs, (rows, next_rows)), shape=(num_states, num_states))
+                 for scored, (rows, next_rows, probs) in edges.items()}
+        no_runs = steps.pop(0, csr_matrix((num_states, num_states)))
+        solver = splu((identity(num_states, format="csc") - no_runs).tocsc())
+
+        result = np.zeros((max_runs + 1, num_states, self.lineup_len))
+        for runs in range(max_runs):
+            known = finished[runs].copy()
+            for scored, step in steps.items():
+                if scored <= runs:
+                    known += step @ result[runs - scored]
+            result[runs] = solver.solve(known)
+        result[max_runs, np.arange(num_states), [state[3] for state in states]] = \
+            1.0 - result[:max_runs].sum(axis=(0, 2))
+        return index, result.transpose(1, 0, 2)
+
+    def solve_states(self, starts: List[InningState]) -> np.ndarray:
+        """[start, runs, lineup slot leading off the next half-inning] probabilities for many starting states"""
+        max_runs = self.max_runs
+        outs_for_inning = self.outs_for_inning
+        num_starts = len(starts)
+
+        states = self._reachable(starts)
+        index = {state: row for row, state in enumerate(states)}
+        num_states = len(states)
+        # rows past the states collect the half-innings that ended, by the lineup slot up next
+        finished_row = num_states
+        most_scored = self.num_bases + 1
+        width = max_runs + most_scored
+
+        # transitions grouped by (outs, bases occupied, balls + strikes) of the state they leave
+        layers: Dict[Tuple[int, int, int], List[List[float]]] = {}
+        for row, state in enumerate(states):
+            edges = layers.setdefault(self._order(state), [])
+            for next_state, scored, prob in self._transitions(state):
+                dst = finished_row + next_state[3] if next_state[0] >= outs_for_inning else index[next_state]
+                edges.append([row, dst * width + scored, prob])
+        layer_edges = {}
+        for order, edges in layers.items():
+            table = np.array(edges)
+            layer_edges[order] = (table[:, 0].astype(np.int64), table[:, 1].astype(np.int64), table[:, 2])
+
+        # mass[row, runs scored so far, start].  Every transition raises (outs, num_bases * runs + bases occupied,
+        # balls + strikes), so sweeping the (layer, runs) cells in that order finishes each cell before it is
+        # read, and each is read once.
+        mass = np.zeros((finished_row + self.lineup_len, width, num_starts))
+        for column, start in enumerate(starts):
+            mass[index[start], 0, column] += 1.0
+        flat = mass.reshape(-1)
+        start_columns = np.arange(num_starts)
+        most_bases = sum(self.tables.bases)
+        for outs in range(outs_for_inning):
+            for progress in range(self.num_bases * max_runs + most_bases + 1):
+                for count in range(self.balls_for_walk + self.strikes_for_out - 1):
+                    for bases in range(progress % self.num_bases, min(progress, most_bases) + 1, self.num_bases):
+                        edges = layer_edges.get((outs, bases, count))
+                        runs = (progress - bases) // self.num_bases
+                        if edges is None or runs >= max_runs:
+                            continue
+                        src, dst, prob = edges
+                        moved = mass[src, runs] * prob[:, None]
+                        if moved.any():
+                            np.add.at(flat, ((dst + runs)[:, None] * num_starts + start_columns).ravel(), moved.ravel())
+
+        result = np.zeros((num_starts, max_runs + 1, self.lineup_len))
+        result[:, :max_runs] = mass[finished_row:, :max_runs].transpose(2, 1, 0)
+        # whatever reached max_runs, finished or not
+        overflow = mass[:, max_runs:].sum(axis=1)
+        positions = np.array([state[3] for state in states] + list(range(self.lineup_len)))
+        for column in range(num_starts):
+            result[column, max_runs] = np.bincount(positions, overflow[:, column], minlength=self.lineup_len)
+        self.truncated_mass += float(overflow[:num_states].sum())
+        return result
+
+    def _order(self, state: InningState) -> Tuple[int, int, int]:
+        """Every transition that scores nothing moves to a later state in this order"""
+        outs, occupancy, _, _, balls, strikes = state
+        return outs, self._bases_occupied[occupancy], balls + strikes
+
+    def _transitions(self, state: InningState) -> List[Tuple[InningState, int, float]]:
+        """(next state, runs scored, probability) out of a state, memoized since they do not depend on the score"""
+        if state not in self._transition_cache:
+            merged: Dict[Tuple[InningState, int], float] = {}
+
+            def push(next_state: InningState, runs: int, prob: float) -> None:
+                if prob:
+                    merged[(next_state, runs)] = merged.get((next_state, runs), 0.0) + prob
+
+            self._expand(state, push)
+            self._transition_cache[state] = [(next_state, runs, prob) for (next_state, runs), prob in merged.items()]
+        return self._transition_cache[state]
+
+    def _apply(self, runners: Tuple[int, ...], transition: BaseTransition) -> Tuple[int, ...]:
+        new_runners = [EMPTY] * self.num_bases
+        for base, new_base in transition.moves:
+            new_runners[new_base] = runners[base]
+        return tuple(new_runners)
+
+    def _extra_bases(self, occupancy: int, runners: Tuple[int, ...], advance: List[float]) -> List[Tuple[int, float]]:
+        """(decisions mask, probability) of the extra base rolls, lead runner first as GameState rolls them"""
+        outcomes = [(0, 1.0)]
+        for base, blocking_bit in self.tables.extra_base_candidates[occupancy]:
+            p = advance[runners[base]]
+            next_outcomes = []
+            for decisions, prob in outcomes:
+                if blocking_bit == 0 or decisions & blocking_bit:
+                    next_outcomes.append((decisions | base_bit(base), prob * p))
+                    next_outcomes.append((decisions, prob * (1.0 - p)))
+                else:
+                    next_outcomes.append((decisions, prob))
+            outcomes = next_outcomes
+        return outcomes
+
+    def _expand(self, state: InningState, push) -> None:
+        outs, occupancy, runners, pos, balls, strikes = state
+        tables = self.tables
+        next_pos = (pos + 1) % self.lineup_len
+        pitch = self.pitch[pos]
+
+        # chance this loop of the game ends back in this same state: no steal, no charm, then a foul that can
+        # not add a strike, the loop repeats until something else happens
+        no_steal = 1.0
+        for base in tables.steal_candidates[occupancy]:
+            no_steal *= 1.0 - self.sb_attempt[runners[base]]
+        start_of_at_bat = balls == 0 and strikes == 0
+        charm = (self.charm_strikeout + self.charm_walk[pos]) if start_of_at_bat else 0.0
+        o_no = strikes == 2 and balls == 0 and self.o_no[pos]
+        foul = pitch[2] + (pitch[1] if o_no else 0.0)
+        repeat = 0.0
+        if strikes >= self.strikes_for_out - 1:
+            repeat = no_steal * (1.0 - charm) * foul
+        remaining = 1.0 / (1.0 - repeat)
+
+        # STOLEN BASES, lead runner first, one attempt per loop
+        for base in tables.steal_candidates[occupancy]:
+            slot = runners[base]
+            attempt = remaining * self.sb_attempt[slot]
+            if attempt:
+                success = self.sb_success[slot]
+                stolen = tables.advance_runner[1][occupancy][base]
+                push((outs, stolen.state, self._apply(runners, stolen), pos, balls, strikes), stolen.runs,
+                     attempt * success)
+                caught = tables.remove_runner[occupancy][base]
+                push((outs + 1, caught.state, self._apply(runners, caught), pos, balls, strikes), 0,
+                     attempt * (1.0 - success))
+            remaining -= attempt
+
+        # PRE PITCH CHARM
+        if charm:
+            if self.charm_strikeout:
+                push((outs + 1, occupancy, runners, next_pos, 0, 0), 0, remaining * charm)
+            else:
+                self._walk(state, 1, remaining * charm, push)
+            remaining *= 1.0 - charm
+
+        # PITCH, 0 = ball, 1 = strike, 2 = foul, 3 = in_play
+        if balls + 1 == self.balls_for_walk:
+            for num_bases_to_advance, prob in self.walks[pos]:
+                self._walk(state, num_bases_to_advance, remaining * pitch[0] * prob, push)
+        else:
+            push((outs, occupancy, runners, pos, balls + 1, strikes), 0, remaining * pitch[0])
+        if not o_no:
+            if strikes + 1 == self.strikes_for_out:
+                push((outs + 1, occupancy, runners, next_pos, 0, 0), 0, remaining * pitch[1])
+            else:
+                push((outs, occupancy, runners, pos, balls, strikes + 1), 0, remaining * pitch[1])
+        if strikes < self.strikes_for_out - 1:
+            push((outs, occupancy, runners, pos, balls, strikes + 1), 0, remaining * foul)
+        self._in_play(state, remaining * pitch[3], push)
+
+    def _walk(self, state: InningState, num_bases_to_advance: int, prob: float, push) -> None:
+        outs, occupancy, runners, pos, _, _ = state
+        advance = self.tables.advance[num_bases_to_advance][occupancy]
+        new_runners = list(self._apply(runners, advance))
+        new_runners[num_bases_to_advance] = pos
+        push((outs, advance.state | base_bit(num_bases_to_advance), tuple(new_runners), (pos + 1) % self.lineup_len,
+              0, 0), advance.runs, prob)
+
+    def _in_play(self, state: InningState, prob: float, push) -> None:
+        if prob == 0.0:
+            return
+        outs, occupancy, runners, pos, _, _ = state
+        tables = self.tables
+        next_pos = (pos + 1) % self.lineup_len
+        flyout, groundout, hit = self.contact[pos]
+
+        # outs, runners may tag up on a flyout or are all forced along on a groundout
+        if outs + 1 >= self.outs_for_inning:
+            push((outs + 1, occupancy, runners, next_pos, 0, 0), 0, prob * (flyout + groundout))
+        else:
+            for decisions, tag_up in self._extra_bases(occupancy, runners, self.adv_out):
+                moved = tables.extra_base[occupancy][decisions]
+                push((outs + 1, moved.state, self._apply(runners, moved), next_pos, 0, 0), moved.runs,
+                     prob * flyout * tag_up)
+            forced = tables.advance[1][occupancy]
+            push((outs + 1, forced.state, self._apply(runners, forced), next_pos, 0, 0), forced.runs,
+                 prob * groundout)
+
+        # hits, 0 = Single, 1 = Double, 2 = Triple, 3 = HR
+        for hit_type in range(3):
+            hit_prob = prob * hit * self.hit_type[pos][hit_type]
+            if hit_prob == 0.0:
+                continue
+            batter_base = hit_type + 1
+            advance = tables.advance[batter_base][occupancy]
+            advanced = self._apply(runners, advance)
+            for decisions, extra in self._extra_bases(advance.state, advanced, self.adv_hit):
+                moved = tables.extra_base[advance.state][decisions]
+                new_runners = list(self._apply(advanced, moved))
+                new_runners[batter_base] = pos
+                push((outs, moved.state | base_bit(batter_base), tuple(new_runners), next_pos, 0, 0),
+                     advance.runs + moved.runs, hit_prob * extra)
+        home_run = tables.advance[self.num_bases][occupancy]
+        push((outs, 0, tuple([EMPTY] * self.num_bases), next_pos, 0, 0), home_run.runs + 1,
+             prob * hit * self.hit_type[pos][3])
+
+
+class GameDistribution(object):
+    def __init__(self, scores: np.ndarray, unfinished: float) -> None:
+        """Final score probabilities, scores[away runs, home runs], unfinished is the mass of games still tied
+        after the inning limit"""
+        self.scores = scores
+        self.unfinished = unfinished
+
+    def home_win_probability(self) -> float:
+        return float(np.triu(self.scores, 1).sum())
+
+    def away_win_probability(self) -> float:
+        return float(np.tril(self.scores, -1).sum())
+
+    def expected_scores(self) -> Tuple[float, float]:
+        runs = np.arange(self.scores.shape[0])
+        total = self.scores.sum()
+        return float((self.scores.sum(axis=1) * runs).sum() / total), float((self.scores.sum(axis=0) * runs).sum() / total)
+
+
+def solve_game(
+    game_state: GameState,
+    max_runs: int = DEFAULT_MAX_RUNS,
+    max_score: int = DEFAULT_MAX_SCORE,
+    max_innings: int = DEFAULT_MAX_INNINGS,
+    tolerance: float = DEFAULT_TOLERANCE,
+) -> GameDistribution:
+    """Exact final score distribution of a game from its current state, no sampling.
+
+    Half-innings are independent given the batter leading off, since GameState only ends a game between
+    half-innings.  The game is a chain over (away slot, home slot, away score, home score) advanced one
+    half-inning at a time with the cached HalfInningSolver solutions.  Scores are capped at max_score, and
+    extra innings stop at max_innings or once less than tolerance of the game is left, see unfinished.
+    """
+    matchup = MatchupTables(game_state)
+    solvers = [HalfInningSolver(matchup, side, max_runs) for side in [AWAY, HOME]]
+    lengths = [int(length) for length in matchup.lineup_len]
+    # [away slot, home slot, away score, home score]
+    mass = np.zeros((lengths[AWAY], lengths[HOME], max_score + 1, max_score + 1))
+    finished = np.zeros((max_score + 1, max_score + 1))
+    away_score, home_score = (min(int(score), max_score) for score in matchup.start_score)
+    mass[matchup.start_pos[AWAY], matchup.start_pos[HOME], away_score, home_score] = 1.0
+    if matchup.start_game_over:
+        return GameDistribution(mass.sum(axis=(0, 1)), 0.0)
+
+    inning, half = matchup.start_inning, matchup.start_half
+    mid_inning = (matchup.start_outs, matchup.start_balls, matchup.start_strikes, matchup.start_runners)
+    scores = np.arange(max_score + 1)
+    while inning <= max_innings and mass.sum() > (tolerance if inning > 9 else 0.0):
+        solver = solvers[half]
+        start_pos = int(matchup.start_pos[half])
+        # [start slot, runs, end slot]
+        if inning == matchup.start_inning and half == matchup.start_half and mid_inning != (0, 0, 0, {}):
+            runs = np.zeros((lengths[half], max_runs + 1, lengths[half]))
+            runs[start_pos] = solver.solve(start_pos, *mid_inning)
+        else:
+            runs = np.stack([solver.solve_from_start(pos) for pos in range(lengths[half])])
+        # the batting team's axes first, [batting slot, fielding slot, batting score, fielding score]
+        batting = mass if half == AWAY else mass.transpose(1, 0, 3, 2)
+        mass = _play_half_inning(batting, runs)
+        if half == HOME:
+            mass = mass.transpose(1, 0, 3, 2)
+        # GameState only checks for the end of the game from the 9th inning on
+        if inning >= 9:
+            if half == AWAY:
+                over = scores[None, :] > scores[:, None]
+            else:
+                over = scores[None, :] != scores[:, None]
+            finished += (mass * over).sum(axis=(0, 1))
+            mass = mass * ~over
+        if half == HOME:
+            inning += 1
+        half = 1 - half
+    return GameDistribution(finished, float(mass.sum()))
+
+
+def _play_half_inning(batting: np.ndarray, runs: np.ndarray) -> np.ndarray:
+    """[batting slot, fielding slot, batting score, fielding score] after a half-inning with the runs table,
+    only the block of scores that can be reached is worked on and scores pile up at the cap"""
+    max_score = batting.shape[2] - 1
+    live = np.nonzero(batting.any(axis=(0, 1, 3)))[0]
+    fielding_top = np.nonzero(batting.any(axis=(0, 1, 2)))[0][-1] + 1
+    after = np.zeros_like(batting)
+    source = np.ascontiguousarray(batting[:, :, live[0]:live[-1] + 1, :fielding_top])
+    for scored in range(runs.shape[1]):
+        weights = runs[:, scored, :]
+        if not weights.any():
+            continue
+        moved = np.tensordot(weights, source, axes=([0], [0]))
+        low = live[0] + scored
+        kept = max(0, min(moved.shape[2], max_score + 1 - low))
+        after[:, :, low:low + kept, :fielding_top] += moved[:, :, :kept]
+        if kept < moved.shape[2]:
+            after[:, :, max_score, :fielding_top] += moved[:, :, kept:].sum(axis=2)
+    return after
@@ -0,0 +1,122 @@
+from typing import Any, Dict, Optional, Sequence, Tuple
+import os
+import threading
+
+from src.common import MachineLearnedModel as Ml
+from src.compiled_models import COMPILED_EXTENSION, load_compiled
+from src.fused_models import FusedModel, ProbabilityBlock
+from src.probability_cache import ProbabilityCache
+
+DEFAULT_MODEL_DIR = os.path.join("..", "season_sim", "models")
+DEFAULT_MODEL_VERSION = "v1"
+
+model_file_key: Dict[Ml, str] = {
+    Ml.PITCH: "pitch",
+    Ml.IS_HIT: "is_hit",
+    Ml.HIT_TYPE: "hit_type",
+    Ml.RUNNER_ADV_OUT: "runner_advanced_on_out",
+    Ml.RUNNER_ADV_HIT: "extra_base_on_hit",
+    Ml.SB_ATTEMPT: "sba",
+    Ml.SB_SUCCESS: "sb_success",
+}
+
+
+class ModelRegistry(object):
+    def __init__(
+        self,
+        model_dir: str = DEFAULT_MODEL_DIR,
+        default_version: str = DEFAULT_MODEL_VERSION,
+        compiled: bool = False,
+        probability_cache: Optional[ProbabilityCache] = None,
+    ) -> None:
+        """A lazily populated cache of the machine learned models, keyed by model and version.
+
+        Models are deserialized from disk the first time they are requested and then shared by every caller
+        holding this registry.  Stand-in models can be injected with register, which is how tests avoid
+        needing the real joblib files.  With compiled the .npz exports written by src.compiled_models are
+        loaded instead of the joblib files, so sklearn is never imported.  With a probability_cache,
+        predict_block reads rows an earlier run already predicted from it.
+        """
+        self.model_dir: str = model_dir
+        self.default_version: str = default_version
+        self.compiled: bool = compiled
+        self.probability_cache: Optional[ProbabilityCache] = probability_cache
+        self._models: Dict[Tuple[Ml, str], Any] = {}
+        self._fused: Dict[Tuple[Tuple[Ml, ...], str], FusedModel] = {}
+        self._lock = threading.Lock()
+
+    def model_path(self, model: Ml, version: Optional[str] = None) -> str:
+        version = version or self.default_version
+        extension = COMPILED_EXTENSION if self.compiled else ".joblib"
+        return os.path.join(self.model_dir, f"{model_file_key[model]}_{version}{extension}")
+
+    def get(self, model: Ml, version: Optional[str] = None) -> Any:
+        """Get a model, loading it from disk only if no caller has requested it before"""
+        key = (model, version or self.default_version)
+        clf = self._models.get(key)
+        if clf is not None:
+            return clf
+        with self._lock:
+            # Another thread may have loaded the model while we waited on the lock
+            if key not in self._models:
+                self._models[key] = self._load(model, key[1])
+            return self._models[key]
+
+    def get_fused(self, models: Sequence[Ml], version: Optional[str] = None) -> FusedModel:
+        """Get one FusedModel over several models that share a feature vector, heads keyed by model"""
+        key = (tuple(models), version or self.default_version)
+        fused = self._fused.get(key)
+        if fused is None:
+            fused = FusedModel({model: self.get(model, version) for model in models})
+            self._fused[key] = fused
+        return fused
+
+    def predict_block(
+        self,
+        models: Sequence[Ml],
+        player_ids: Sequence[str],
+        X: Any,
+        version: Optional[str] = None,
+    ) -> ProbabilityBlock:
+        """Every model's probabilities for the feature matrix X, through the probability cache if there is one"""
+        fused = self.get_fused(models, version)
+        if self.probability_cache is not None:
+            return self.probability_cache.predict_block(fused, player_ids, X)
+        return fused.predict_block(player_ids, X)
+
+    def register(self, model: Ml, clf: Any, version: Optional[str] = None) -> None:
+        """Inject an already constructed model, replacing anything previously loaded for that key"""
+        with self._lock:
+            self._models[(model, version or self.default_version)] = clf
+            self._fused = {}
+
+    def is_loaded(self, model: Ml, version: Optional[str] = None) -> bool:
+        return (model, version or self.default_version) in self._models
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models = {}
+            self._fused = {}
+
+    def _load(self, model: Ml, version: str) -> Any:
+        if self.compiled:
+            return load_compiled(self.model_path(model, version))
+        # joblib (and sklearn underneath it) is only needed when a model actually comes off disk
+        from joblib import load
+        return load(self.model_path(model, version))
+
+
+_default_registry: ModelRegistry = ModelRegistry()
+
+
+def get_model_registry() -> ModelRegistry:
+    """Get the process wide registry shared by every GameState that was not given its own"""
+    return _default_registry
+
+
+def set_model_registry(registry: ModelRegistry) -> ModelRegistry:
+    """Replace the process wide registry, returning the previous one so callers can restore it"""
+    global _default_registry
+    previous = _default_registry
+    _default_registry = registry
+    return previous
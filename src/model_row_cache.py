@@ -0,0 +1,53 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+import numpy as np
+
+# a league day is a few hundred hitters, this keeps a few days of them
+DEFAULT_MAX_ENTRIES = 4096
+
+
+class ModelRowCache(object):
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        """Probability rows of game_sim's models kept across days, keyed by the feature vector they came from.
+
+        A row found here is exactly the row the models would predict again.  Most stlats, lineups and pitchers
+        carry over from one day to the next, which leaves only the changed hitters for setup_models to run through
+        the models.  Rows belong to one set of models, binding different ones empties the cache.  Least recently
+        used rows are evicted past max_entries.
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._rows: "OrderedDict[Hashable, Dict[str, np.ndarray]]" = OrderedDict()
+        self._clf: Any = None
+
+    def bind(self, clf: Any) -> None:
+        if clf is not self._clf:
+            self.clear()
+            self._clf = clf
+
+    def get(self, key: Hashable) -> Optional[Dict[str, np.ndarray]]:
+        """{model name: probabilities} for key, or None if it has to be predicted"""
+        rows = self._rows.get(key)
+        if rows is None:
+            self.misses += 1
+            return None
+        self._rows.move_to_end(key)
+        self.hits += 1
+        return rows
+
+    def put(self, key: Hashable, rows: Dict[str, np.ndarray]) -> None:
+        # copies, so a cached row does not keep the whole day's probability block alive
+        self._rows[key] = {name: np.array(row) for name, row in rows.items()}
+        self._rows.move_to_end(key)
+        while len(self._rows) > self.max_entries:
+            self._rows.popitem(last=False)
+
+    def clear(self) -> None:
+        self._rows.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
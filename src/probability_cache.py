@@ -0,0 +1,265 @@
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from src.fused_models import FusedModel, ProbabilityBlock
+
+DEFAULT_CACHE_PATH = os.path.join("season_sim", "cache", "probabilities.sqlite")
+# a season is a few tens of thousands of distinct matchups per model group, this keeps several seasons
+DEFAULT_MAX_ENTRIES = 1_000_000
+# seconds a connection waits on another process's write before giving up
+DEFAULT_TIMEOUT = 30.0
+# sqlite caps the variables of one statement, lookups go in chunks of this many keys
+CHUNK_SIZE = 500
+# rows a process inserts between checks of the cache's size
+EVICT_INTERVAL = 10_000
+# hits a process collects before writing their last use back
+TOUCH_INTERVAL = 10_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS probabilities (
+    model TEXT NOT NULL,
+    features BLOB NOT NULL,
+    probs BLOB NOT NULL,
+    last_used INTEGER NOT NULL,
+    PRIMARY KEY (model, features)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS probabilities_last_used ON probabilities (last_used);
+CREATE TABLE IF NOT EXISTS layouts (
+    model TEXT PRIMARY KEY,
+    widths TEXT NOT NULL
+);
+"""
+
+
+def feature_hash(row: np.ndarray) -> bytes:
+    """sha256 of a feature vector's float64 bytes, rows differing in any bit get different hashes"""
+    return hashlib.sha256(np.ascontiguousarray(row, dtype=np.float64).tobytes()).digest()
+
+
+def model_digest(clf: Any) -> str:
+    """sha256 of a model's pickled content, the same model loaded from the same file always gets the same one"""
+    return hashlib.sha256(pickle.dumps(clf, protocol=4)).hexdigest()
+
+
+class ProbabilityCache(object):
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        timeout: float = DEFAULT_TIMEOUT,
+    ) -> None:
+        """Model outputs kept on disk across runs, keyed by the models' content digest and the exact feature vector.
+
+        Rerunning a backtest with another sim length or post processing step builds the same feature vectors
+        from the same stlats, so their probabilities are read back instead of predicted.  A row holds every head
+        of a FusedModel, its key is the digest of all the heads.  The cache is a sqlite database in WAL mode, any
+        number of processes can read while one writes, and each process opens its own connection on first use.
+        Hits refresh their rows' last use, written back in batches and on close or flush, and past max_entries
+        the least recently used rows are evicted.
+        """
+        if max_entries < 1:
+            raise ValueError(f"max_entries must be at least 1, got {max_entries}")
+        self.path = path
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._digests: Dict[int, Tuple[Any, str]] = {}
+        self._widths: Dict[str, List[int]] = {}
+        self._evict_interval = min(max_entries, EVICT_INTERVAL)
+        self._inserted = self._evict_interval
+        self._touched: Dict[Tuple[str, bytes], int] = {}
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # a connection cannot cross a process boundary, the receiving process opens its own
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        state["_pid"] = None
+        state["_lock"] = None
+        state["_touched"] = {}
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # autocommit, writes open their own immediate transactions so two writers never deadlock upgrading
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+            self._pid = os.getpid()
+            self._touched = {}
+        return self._connection
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._flush_touches(self._connection)
+                self._connection.close()
+            self._connection = None
+            self._pid = None
+
+    def digest(self, clf: Any) -> str:
+        """model_digest of clf, worked out once per model object"""
+        known = self._digests.get(id(clf))
+        # the model is kept alongside its digest so its id cannot be reused by another object
+        if known is None or known[0] is not clf:
+            known = self._digests[id(clf)] = (clf, model_digest(clf))
+        return known[1]
+
+    def fused_digest(self, fused: FusedModel) -> str:
+        """Digest of a FusedModel's heads, their keys and order included"""
+        digest = hashlib.sha256()
+        for key, clf in fused.heads.items():
+            digest.update(f"{key!r}:{self.digest(clf)};".encode("utf8"))
+        return digest.hexdigest()
+
+    def get_many(self, model: str, hashes: Sequence[bytes]) -> List[Optional[np.ndarray]]:
+        """Cached probabilities of each feature hash, None where the model has not seen it"""
+        found: Dict[bytes, np.ndarray] = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            connection = self._connect()
+            for start in range(0, len(unique), CHUNK_SIZE):
+                chunk = unique[start:start + CHUNK_SIZE]
+                rows = connection.execute(
+                    f"SELECT features, probs FROM probabilities WHERE model = ? "
+                    f"AND features IN ({','.join('?' * len(chunk))})", [model] + chunk)
+                for features, probs in rows:
+                    found[features] = np.frombuffer(probs, dtype=np.float64)
+            # refreshing last use is a write, hits are only written back in batches
+            now = time.time_ns()
+            self._touched.update(((model, features), now) for features in found)
+            if len(self._touched) >= TOUCH_INTERVAL:
+                self._flush_touches(connection)
+        return [found.get(features) for features in hashes]
+
+    def put_many(self, model: str, items: Sequence[Tuple[bytes, np.ndarray]]) -> None:
+        """Store (feature hash, probabilities) pairs of a model, evicting the least recently used rows past
+        max_entries"""
+        if not items:
+            return
+        now = time.time_ns()
+        rows = [(model, features, np.ascontiguousarray(probs, dtype=np.float64).tobytes(), now)
+                for features, probs in items]
+        with self._lock:
+            connection = self._connect()
+            self._write(connection, "INSERT OR REPLACE INTO probabilities VALUES (?, ?, ?, ?)", rows)
+            self._flush_touches(connection)
+            self._inserted += len(rows)
+            # counting every row is a scan of an index, so the count is only checked every so often, other
+            # processes' inserts are caught by whichever of them checks next
+            if self._inserted >= self._evict_interval:
+                self._inserted = 0
+                self._evict(connection)
+
+    def widths(self, model: str) -> Optional[List[int]]:
+        """Column widths of each head of a model, None if none of its rows were ever stored"""
+        widths = self._widths.get(model)
+        if widths is None:
+            with self._lock:
+                row = self._connect().execute("SELECT widths FROM layouts WHERE model = ?", (model,)).fetchone()
+            if row is not None:
+                widths = self._widths[model] = json.loads(row[0])
+        return widths
+
+    def set_widths(self, model: str, widths: Sequence[int]) -> None:
+        if self._widths.get(model) == list(widths):
+            return
+        with self._lock:
+            self._write(self._connect(), "INSERT OR REPLACE INTO layouts VALUES (?, ?)",
+                        [(model, json.dumps(list(widths)))])
+        self._widths[model] = list(widths)
+
+    def flush(self) -> None:
+        """Write back the last use of every hit since the last write"""
+        with self._lock:
+            if self._touched:
+                self._flush_touches(self._connect())
+
+    def _flush_touches(self, connection: sqlite3.Connection) -> None:
+        if self._touched:
+            self._write(connection, "UPDATE probabilities SET last_used = ? WHERE model = ? AND features = ?",
+                        [(now, model, features) for (model, features), now in self._touched.items()])
+            self._touched = {}
+
+    def _write(self, connection: sqlite3.Connection, statement: str, rows: List[Tuple[Any, ...]]) -> None:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(statement, rows)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            (count,) = connection.execute("SELECT COUNT(*) FROM probabilities").fetchone()
+            if count > self.max_entries:
+                connection.execute(
+                    "DELETE FROM probabilities WHERE (model, features) IN "
+                    "(SELECT model, features FROM probabilities ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,))
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._connect().execute("SELECT COUNT(*) FROM probabilities").fetchone()
+        return count
+
+    def clear(self) -> None:
+        with self._lock:
+            connection = self._connect()
+            connection.execute("DELETE FROM probabilities")
+            self._touched = {}
+        self.hits = 0
+        self.misses = 0
+
+    def predict_block(self, fused: FusedModel, player_ids: Sequence[str], X: Any) -> ProbabilityBlock:
+        """fused.predict_block(player_ids, X), with only the rows missing from the cache run through the models"""
+        features = fused.validate(X)
+        if len(features) == 0:
+            return fused.predict_block(player_ids, features)
+        model = self.fused_digest(fused)
+        hashes = [feature_hash(row) for row in features]
+        cached = self.get_many(model, hashes)
+        missing = [row for row, probs in enumerate(cached) if probs is None]
+        self.hits += len(hashes) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            fresh = fused.predict_block([player_ids[row] for row in missing], features[missing])
+            # the layout goes in first, so a row is never found without it
+            self.set_widths(model, [fresh.columns[key].stop - fresh.columns[key].start for key in fused.heads])
+            self.put_many(model, [(hashes[row], fresh.probs[index]) for index, row in enumerate(missing)])
+            for index, row in enumerate(missing):
+                cached[row] = fresh.probs[index]
+
+        columns: Dict[Hashable, slice] = {}
+        start = 0
+        for key, width in zip(fused.heads, self.widths(model)):
+            columns[key] = slice(start, start + width)
+            start += width
+        return ProbabilityBlock(player_ids, columns, np.stack(cached))
@@ -0,0 +1,126 @@
+from typing import Any, List, Optional, Union
+import hashlib
+import random
+
+import numpy as np
+
+GameKey = Union[int, str]
+
+DEFAULT_BLOCK_SIZE = 4096
+GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX_2 = np.uint64(0x94D049BB133111EB)
+
+
+def game_key(game_id: GameKey) -> int:
+    """Stable integer key for a game id, python's hash() is salted per process so it can't be used"""
+    if isinstance(game_id, int):
+        return game_id
+    return int.from_bytes(hashlib.sha256(game_id.encode("utf8")).digest()[:8], "little")
+
+
+def mix64(x: np.ndarray) -> np.ndarray:
+    """SplitMix64 finalizer, a bijective avalanche on uint64 arrays"""
+    x = x ^ (x >> np.uint64(30))
+    x = x * MIX_1
+    x = x ^ (x >> np.uint64(27))
+    x = x * MIX_2
+    return x ^ (x >> np.uint64(31))
+
+
+class UniformStream(object):
+    def __init__(self, generator: np.random.Generator, block_size: int = DEFAULT_BLOCK_SIZE) -> None:
+        """A drop in for the random module's random() that hands out uniforms generated a block at a time"""
+        self.generator = generator
+        self.block_size = block_size
+        self._block: List[float] = []
+        self._index = 0
+
+    def random(self) -> float:
+        if self._index == len(self._block):
+            self._block = self.generator.random(self.block_size).tolist()
+            self._index = 0
+        value = self._block[self._index]
+        self._index += 1
+        return value
+
+    def spawn(self) -> "UniformStream":
+        """An independent child stream, the n-th spawn of a stream is always the same and the parent's draws are
+        left as they were"""
+        return UniformStream(self.generator.spawn(1)[0], self.block_size)
+
+
+def spawn_stream(rng: Any) -> Any:
+    """A child of a GameState rng for a branched game.
+
+    Streams that can spawn children do so, anything else with a random() method seeds a random.Random from one
+    of its draws.
+    """
+    spawn = getattr(rng, "spawn", None)
+    if spawn is not None:
+        return spawn()
+    return random.Random(int(rng.random() * 2 ** 53))
+
+
+class ReplicaUniforms(object):
+    def __init__(self, keys: np.ndarray, flip: Optional[np.ndarray] = None) -> None:
+        """Counter based uniforms with an independent stream per replica, for the vectorized engines.
+
+        Replica i's k-th draw is a hash of (keys[i], k), so what a replica sees depends only on its own key and
+        how many draws it has made, not on the other replicas or on which of them are still running.  Replicas
+        flagged in flip draw 1 - u instead, two replicas sharing a key with one flipped are an antithetic pair.
+        """
+        self.keys = keys.astype(np.uint64)
+        self.counters = np.zeros(len(keys), dtype=np.uint64)
+        self.flip = flip
+
+    def draw(self, rows: np.ndarray) -> np.ndarray:
+        counters = self.counters[rows]
+        self.counters[rows] = counters + np.uint64(1)
+        with np.errstate(over="ignore"):
+            bits = mix64(mix64(self.keys[rows] + counters * GOLDEN_GAMMA) ^ self.keys[rows])
+        # top 53 bits, the same resolution as random.random()
+        uniforms = (bits >> np.uint64(11)).astype(np.float64) * (1.0 / 9007199254740992.0)
+        if self.flip is not None:
+            uniforms = np.where(self.flip[rows], 1.0 - uniforms, uniforms)
+        return uniforms
+
+
+class RngStreams(object):
+    def __init__(self, master_seed: int) -> None:
+        """Independent, reproducible random streams for every season, day, game and replica.
+
+        Streams come from np.random.SeedSequence spawn keys, so (master_seed, season, day, game, replica) fully
+        determines a stream and any single replica of any game can be replayed without running the rest.
+        """
+        self.master_seed = master_seed
+
+    def seed_sequence(
+        self,
+        season: int,
+        day: int,
+        game_id: GameKey,
+        replica: Optional[int] = None,
+    ) -> np.random.SeedSequence:
+        spawn_key = (season, day, game_key(game_id)) if replica is None else (season, day, game_key(game_id), replica)
+        return np.random.SeedSequence(self.master_seed, spawn_key=spawn_key)
+
+    def generator(self, season: int, day: int, game_id: GameKey, replica: Optional[int] = None) -> np.random.Generator:
+        """A counter based Philox generator for one game, or one replica of it"""
+        return np.random.Generator(np.random.Philox(self.seed_sequence(season, day, game_id, replica)))
+
+    def uniform_stream(
+        self,
+        season: int,
+        day: int,
+        game_id: GameKey,
+        replica: Optional[int] = None,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+    ) -> UniformStream:
+        return UniformStream(self.generator(season, day, game_id, replica), block_size)
+
+    def replica_keys(self, season: int, day: int, game_id: GameKey, replicas: np.ndarray) -> np.ndarray:
+        """Per replica keys for ReplicaUniforms, derived from the game's seed sequence and the replica index"""
+        game_state = self.seed_sequence(season, day, game_id).generate_state(1, np.uint64)[0]
+        with np.errstate(over="ignore"):
+            return mix64(np.uint64(game_state) ^ mix64(np.asarray(replicas, dtype=np.uint64) + GOLDEN_GAMMA))
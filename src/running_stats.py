@@ -0,0 +1,98 @@
+from statistics import NormalDist
+from typing import Optional
+import math
+
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_WIN_HALF_WIDTH = 0.03
+DEFAULT_MIN_REPLICAS = 50
+DEFAULT_MAX_REPLICAS = 2000
+
+
+def z_score(confidence: float) -> float:
+    """Two sided normal quantile, 1.96 for 0.95"""
+    if not 0.0 < confidence < 1.0:
+        raise ValueError(f"confidence must be between 0 and 1, got {confidence}")
+    return NormalDist().inv_cdf(0.5 + confidence / 2.0)
+
+
+class RunningStats(object):
+    def __init__(self) -> None:
+        """Count, mean and variance of a stream of values, updated one value at a time with Welford's method"""
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def update(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    def merge(self, other: "RunningStats") -> None:
+        """Fold in the values other has seen, with Chan's pairwise update, as if they had been updated here"""
+        count = self.count + other.count
+        if other.count == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self._m2 += other._m2 + delta * delta * self.count * other.count / count
+        self.count = count
+
+    @property
+    def variance(self) -> float:
+        """Sample variance, 0.0 until there are two values"""
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def std_error(self) -> float:
+        return math.sqrt(self.variance / self.count) if self.count > 0 else math.inf
+
+    def half_width(self, confidence: float = DEFAULT_CONFIDENCE) -> float:
+        """Half-width of the normal confidence interval around the mean"""
+        return z_score(confidence) * self.std_error()
+
+    def proportion_half_width(self, confidence: float = DEFAULT_CONFIDENCE) -> float:
+        """Half-width of the Wilson score interval, for a stream of 0 / 1 values.
+
+        Unlike the normal interval it does not collapse to zero when every value so far agrees, so a lopsided
+        game still needs a few dozen replicas before it counts as settled.
+        """
+        if self.count == 0:
+            return math.inf
+        z = z_score(confidence)
+        n = self.count
+        p = self.mean
+        return z * math.sqrt(p * (1.0 - p) / n + z * z / (4.0 * n * n)) / (1.0 + z * z / n)
+
+
+class StoppingRule(object):
+    def __init__(
+        self,
+        win_half_width: float = DEFAULT_WIN_HALF_WIDTH,
+        score_half_width: Optional[float] = None,
+        confidence: float = DEFAULT_CONFIDENCE,
+        min_replicas: int = DEFAULT_MIN_REPLICAS,
+        max_replicas: int = DEFAULT_MAX_REPLICAS,
+    ) -> None:
+        """When to stop replicating a game: once the confidence interval on its win rate, and on both mean
+        scores if score_half_width is set, is at most that wide on either side, or at max_replicas"""
+        if not 0 < min_replicas <= max_replicas:
+            raise ValueError(f"need 0 < min_replicas <= max_replicas, got {min_replicas} and {max_replicas}")
+        z_score(confidence)
+        self.win_half_width = win_half_width
+        self.score_half_width = score_half_width
+        self.confidence = confidence
+        self.min_replicas = min_replicas
+        self.max_replicas = max_replicas
+
+    def done(self, home_wins: RunningStats, home_scores: RunningStats, away_scores: RunningStats) -> bool:
+        count = home_wins.count
+        if count < self.min_replicas:
+            return False
+        if count >= self.max_replicas:
+            return True
+        if home_wins.proportion_half_width(self.confidence) > self.win_half_width:
+            return False
+        if self.score_half_width is not None:
+            return max(home_scores.half_width(self.confidence),
+                       away_scores.half_width(self.confidence)) <= self.score_half_width
+        return True
@@ -0,0 +1,90 @@
+from typing import List, Sequence, Tuple
+import struct
+
+import numpy as np
+
+# every snapshot starts with MAGIC, the format version and the kind of object it holds
+MAGIC = b"BLSS"
+SNAPSHOT_VERSION = 1
+HEADER = struct.Struct("<4sHH")
+TEAM_SNAPSHOT = 1
+GAME_SNAPSHOT = 2
+
+_COUNT = struct.Struct("<q")
+
+
+class SnapshotWriter(object):
+    def __init__(self, kind: int) -> None:
+        """Builds a binary snapshot out of sections of little endian int64s, float64 arrays, strings and blobs.
+
+        Every section carries its own length so a reader can walk the buffer without a schema, the order the
+        sections are written in is the format.
+        """
+        self.parts: List[bytes] = [HEADER.pack(MAGIC, SNAPSHOT_VERSION, kind)]
+
+    def ints(self, values: Sequence[int]) -> None:
+        self.parts.append(struct.pack(f"<q{len(values)}q", len(values), *values))
+
+    def floats(self, values: np.ndarray) -> None:
+        data = np.ascontiguousarray(values, dtype="<f8").tobytes()
+        self.parts.append(_COUNT.pack(len(data) // 8))
+        self.parts.append(data)
+
+    def strings(self, values: Sequence[str]) -> None:
+        """Strings are NUL separated, ids and names never contain one"""
+        data = "\x00".join(values).encode("utf-8")
+        self.parts.append(struct.pack("<qq", len(values), len(data)))
+        self.parts.append(data)
+
+    def blob(self, data: bytes) -> None:
+        self.parts.append(_COUNT.pack(len(data)))
+        self.parts.append(data)
+
+    def getvalue(self) -> bytes:
+        return b"".join(self.parts)
+
+
+class SnapshotReader(object):
+    def __init__(self, data: bytes, kind: int) -> None:
+        """Reads the sections of a snapshot back in the order they were written"""
+        self.data = memoryview(data)
+        if len(data) < HEADER.size:
+            raise ValueError("Snapshot is truncated")
+        magic, version, found_kind = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a snapshot")
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {version}, expected {SNAPSHOT_VERSION}")
+        if found_kind != kind:
+            raise ValueError(f"Snapshot holds object kind {found_kind}, expected {kind}")
+        self.offset = HEADER.size
+
+    def _count(self) -> int:
+        (count,) = _COUNT.unpack_from(self.data, self.offset)
+        self.offset += 8
+        return count
+
+    def _take(self, size: int) -> memoryview:
+        if self.offset + size > len(self.data):
+            raise ValueError("Snapshot is truncated")
+        chunk = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return chunk
+
+    def ints(self) -> Tuple[int, ...]:
+        count = self._count()
+        return struct.unpack(f"<{count}q", self._take(8 * count))
+
+    def floats(self) -> np.ndarray:
+        count = self._count()
+        return np.frombuffer(self._take(8 * count), dtype="<f8").astype(np.float64)
+
+    def strings(self) -> List[str]:
+        count = self._count()
+        size = self._count()
+        if count == 0:
+            return []
+        return bytes(self._take(size)).decode("utf-8").split("\x00")
+
+    def blob(self) -> bytes:
+        return bytes(self._take(self._count()))
@@ -0,0 +1,245 @@
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+import argparse
+import json
+import os
+
+import numpy as np
+
+STORE_VERSION = 1
+DEFAULT_STORE_DIR = os.path.join("season_sim", "store")
+DEFAULT_STLATS_DIR = os.path.join("season_sim", "stlats")
+DEFAULT_SEASON_DIR = os.path.join("season_sim", "season_data")
+DEFAULT_DAYS = 99
+MANIFEST = "manifest.json"
+
+# game fields kept as interned strings, integers and floats, outcomes are interned as one json string per game
+GAME_STRING_FIELDS = ["homeTeam", "awayTeam", "homePitcher", "awayPitcher", "homePitcherName", "awayPitcherName",
+                      "homeTeamName", "awayTeamName", "homeTeamNickname", "awayTeamNickname"]
+GAME_INT_FIELDS = ["season", "day", "homeScore", "awayScore"]
+GAME_FLOAT_FIELDS = ["homeOdds", "awayOdds"]
+PLAYER_COLUMNS = ["player", "name", "team", "position_type", "position_id", "blood"]
+GAME_COLUMNS = GAME_STRING_FIELDS + GAME_INT_FIELDS + ["outcomes", "id"]
+# a game without an id
+NO_STRING = -1
+
+
+def group_day_stlats(
+    players: Iterable[Dict[str, Any]],
+) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any], Dict[str, str]]:
+    """player_stlats, team_stlats, player_blood_types and player_names from a day's player records, every
+    team's lineup in position order"""
+    player_stlats = {}
+    team_stlats = {}
+    player_blood_types = {}
+    player_names = {}
+    for player in players:
+        player_stlats[player["player_id"]] = player
+        player_blood_types[player["player_id"]] = player["blood"]
+        player_names[player["player_id"]] = player["player_name"]
+        if player["team_id"] not in team_stlats:
+            team_stlats[player["team_id"]] = {"lineup": {}}
+        if player["position_type_id"] == '0':
+            player_id = player["player_id"]
+            team_stlats[player["team_id"]]["lineup"][player_id] = player
+    for team in team_stlats:
+        us_lineup = team_stlats[team]["lineup"]
+        sorted_lineup = {k: v for k, v in
+                         sorted(us_lineup.items(), key=lambda item: item[1]["position_id"])}
+        team_stlats[team]["lineup"] = sorted_lineup
+    return player_stlats, team_stlats, player_blood_types, player_names
+
+
+def group_season_games(games: Iterable[Dict[str, Any]]) -> Dict[int, List[Dict[str, Any]]]:
+    season_data = {}
+    for game in games:
+        if game['day'] not in season_data:
+            season_data[game['day']] = []
+        season_data[game['day']].append(game)
+    return season_data
+
+
+class _Interner(object):
+    def __init__(self) -> None:
+        self.strings: List[str] = []
+        self._index: Dict[str, int] = {}
+
+    def __call__(self, value: str) -> int:
+        index = self._index.get(value)
+        if index is None:
+            index = self._index[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+
+def ingest_stlats(
+    seasons: Sequence[int],
+    stlat_names: Sequence[str],
+    store_dir: str = DEFAULT_STORE_DIR,
+    stlats_dir: str = DEFAULT_STLATS_DIR,
+    season_dir: str = DEFAULT_SEASON_DIR,
+    days: int = DEFAULT_DAYS,
+    dtype: str = "float32",
+) -> None:
+    """Convert the daily stlats and season schedule json files into a columnar store that StlatsStore maps.
+
+    Ids, names and other strings are interned into one table, every stlat becomes a contiguous dtype column
+    and (season, day) index the rows of each day.  float32 halves the size, but stlats then differ from the
+    json ones past the 7th digit, which can flip a roll, a float64 store reproduces json runs exactly.
+    Missing day files are skipped.  The manifest is written last so a half written store is never opened.
+    """
+    intern = _Interner()
+    players: Dict[str, List[int]] = {column: [] for column in PLAYER_COLUMNS}
+    stlats: List[List[float]] = []
+    day_index = []
+    games: Dict[str, List[Any]] = {column: [] for column in GAME_COLUMNS + GAME_FLOAT_FIELDS}
+    season_index = []
+    for season in seasons:
+        for day in range(days):
+            path = os.path.join(stlats_dir, f"s{season}_d{day}_stlats.json")
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r', encoding='utf8') as json_file:
+                day_players = json.load(json_file)
+            start = len(stlats)
+            for player in day_players:
+                players["player"].append(intern(player["player_id"]))
+                players["name"].append(intern(player["player_name"]))
+                players["team"].append(intern(player["team_id"]))
+                players["position_type"].append(intern(player["position_type_id"]))
+                players["position_id"].append(int(player["position_id"]))
+                players["blood"].append(int(player["blood"]))
+                stlats.append([float(player[stlat]) for stlat in stlat_names])
+            day_index.append([season, day, start, len(stlats)])
+        path = os.path.join(season_dir, f"season{season+1}.json")
+        with open(path, 'r', encoding='utf8') as json_file:
+            season_games = json.load(json_file)
+        start = len(games["season"])
+        for game in season_games:
+            for field in GAME_STRING_FIELDS:
+                games[field].append(intern(game[field]))
+            for field in GAME_INT_FIELDS:
+                games[field].append(int(game[field]))
+            for field in GAME_FLOAT_FIELDS:
+                games[field].append(float(game[field]))
+            games["outcomes"].append(intern(json.dumps(game["outcomes"])))
+            games["id"].append(intern(game["id"]) if "id" in game else NO_STRING)
+        season_index.append([season, start, len(games["season"])])
+
+    os.makedirs(store_dir, exist_ok=True)
+    manifest_path = os.path.join(store_dir, MANIFEST)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    for column, values in players.items():
+        np.save(os.path.join(store_dir, f"player_{column}.npy"), np.array(values, dtype=np.int32))
+    # stlat major, so each stlat is one contiguous column
+    stlat_array = np.array(stlats, dtype=dtype).reshape(-1, len(stlat_names)).T
+    np.save(os.path.join(store_dir, "stlats.npy"), np.ascontiguousarray(stlat_array))
+    np.save(os.path.join(store_dir, "day_index.npy"), np.array(day_index, dtype=np.int64).reshape(-1, 4))
+    for column, values in games.items():
+        column_dtype = np.float64 if column in GAME_FLOAT_FIELDS else np.int32
+        np.save(os.path.join(store_dir, f"game_{column}.npy"), np.array(values, dtype=column_dtype))
+    np.save(os.path.join(store_dir, "season_index.npy"), np.array(season_index, dtype=np.int64).reshape(-1, 3))
+    with open(manifest_path, 'w', encoding='utf8') as manifest_file:
+        json.dump({"version": STORE_VERSION, "dtype": dtype, "stlats": list(stlat_names),
+                   "strings": intern.strings}, manifest_file)
+
+
+class StlatsStore(object):
+    def __init__(self, store_dir: str = DEFAULT_STORE_DIR) -> None:
+        """A memory mapped view of a store written by ingest_stlats.
+
+        Opening it reads the manifest and maps the columns, a day's stlats or a season's games are then a slice
+        of those columns turned back into the dicts game_sim works with, no json is parsed.
+        """
+        manifest_path = os.path.join(store_dir, MANIFEST)
+        if not os.path.exists(manifest_path):
+            raise ValueError(f"No stlats store in {store_dir}, write one with ingest_stlats first")
+        with open(manifest_path, 'r', encoding='utf8') as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest["version"] != STORE_VERSION:
+            raise ValueError(f"Stlats store version {manifest['version']} in {store_dir}, expected {STORE_VERSION}")
+        self.store_dir = store_dir
+        self.dtype: str = manifest["dtype"]
+        self.stlat_names: List[str] = manifest["stlats"]
+        self.strings: List[str] = manifest["strings"]
+        self.players = {column: self._map(f"player_{column}") for column in PLAYER_COLUMNS}
+        self.stlats = self._map("stlats")
+        self.games = {column: self._map(f"game_{column}") for column in GAME_COLUMNS + GAME_FLOAT_FIELDS}
+        self._days = {(int(season), int(day)): (int(start), int(stop))
+                      for season, day, start, stop in self._map("day_index").tolist()}
+        self._seasons = {int(season): (int(start), int(stop))
+                         for season, start, stop in self._map("season_index").tolist()}
+
+    def _map(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.store_dir, f"{name}.npy"), mmap_mode="r")
+
+    def has_day(self, season: int, day: int) -> bool:
+        return (season, day) in self._days
+
+    def day_players(self, season: int, day: int) -> List[Dict[str, Any]]:
+        """The day's player records as the stlats json holds them"""
+        rows = self._days.get((season, day))
+        if rows is None:
+            raise ValueError(f"No stlats for season {season} day {day} in {self.store_dir}")
+        start, stop = rows
+        strings = self.strings
+        columns = {column: values[start:stop].tolist() for column, values in self.players.items()}
+        stlat_rows = self.stlats[:, start:stop].T.tolist()
+        players = []
+        for row, stlat_values in enumerate(stlat_rows):
+            player = {
+                "player_id": strings[columns["player"][row]],
+                "player_name": strings[columns["name"][row]],
+                "team_id": strings[columns["team"][row]],
+                "blood": columns["blood"][row],
+                "position_type_id": strings[columns["position_type"][row]],
+                "position_id": columns["position_id"][row],
+            }
+            player.update(zip(self.stlat_names, stlat_values))
+            players.append(player)
+        return players
+
+    def day_stlats(
+        self,
+        season: int,
+        day: int,
+    ) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any], Dict[str, str]]:
+        """What game_sim.load_day_stlats returns for the day"""
+        return group_day_stlats(self.day_players(season, day))
+
+    def season_games(self, season: int) -> Dict[int, List[Dict[str, Any]]]:
+        """What game_sim.load_season_games returns for the season, games grouped by day"""
+        rows = self._seasons.get(season)
+        if rows is None:
+            raise ValueError(f"No schedule for season {season} in {self.store_dir}")
+        start, stop = rows
+        strings = self.strings
+        columns = {column: values[start:stop].tolist() for column, values in self.games.items()}
+        games = []
+        for row in range(stop - start):
+            game = {field: strings[columns[field][row]] for field in GAME_STRING_FIELDS}
+            game.update({field: columns[field][row] for field in GAME_INT_FIELDS + GAME_FLOAT_FIELDS})
+            game["outcomes"] = json.loads(strings[columns["outcomes"][row]])
+            if columns["id"][row] != NO_STRING:
+                game["id"] = strings[columns["id"][row]]
+            games.append(game)
+        return group_season_games(games)
+
+
+def main():
+    # game_sim imports this module, its stlat list is only needed when ingesting from the command line
+    from game_sim import stlat_list
+    parser = argparse.ArgumentParser(description="Convert the season json files into a memory mapped stlats store")
+    parser.add_argument("seasons", type=int, nargs="+", help="seasons to ingest, e.g. 7 8 9 10")
+    parser.add_argument("--store", default=DEFAULT_STORE_DIR, help="directory to write the store to")
+    parser.add_argument("--stlats-dir", default=DEFAULT_STLATS_DIR)
+    parser.add_argument("--season-dir", default=DEFAULT_SEASON_DIR)
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help="days per season")
+    parser.add_argument("--dtype", choices=["float32", "float64"], default="float32",
+                        help="stlat precision, float64 reproduces runs from the json files exactly")
+    args = parser.parse_args()
+    ingest_stlats(args.seasons, stlat_list, args.store, args.stlats_dir, args.season_dir, args.days, args.dtype)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,71 @@
 from typing import Any, Dict, List, Tuple
+import copy
 import json
 import logging
 import statistics
 
+import numpy as np
+
 from src.common import BlaseballStatistics as Stats
 from src.common import ForbiddenKnowledge as FK
 from src.common import BloodType, Team, team_id_map
+from src.game_stats import COLUMN_STATS, GameStats
+from src.snapshot import TEAM_SNAPSHOT, SnapshotReader, SnapshotWriter
 
 DEF_ID = "DEFENSE"
 
+# Stlats feeding each part of a model feature vector, in the column order the models were trained on
+DEFENSE_FEATURES: List[FK] = [
+    FK.ANTICAPITALISM,
+    FK.CHASINESS,
+    FK.OMNISCIENCE,
+    FK.TENACIOUSNESS,
+    FK.WATCHFULNESS,
+    FK.PRESSURIZATION,
+    FK.CINNAMON,
+]
+PITCHER_FEATURES: List[FK] = [
+    FK.COLDNESS,
+    FK.OVERPOWERMENT,
+    FK.RUTHLESSNESS,
+    FK.SHAKESPEARIANISM,
+    FK.SUPPRESSION,
+    FK.UNTHWACKABILITY,
+    FK.CINNAMON,
+    FK.PRESSURIZATION,
+]
+BATTER_FEATURES: List[FK] = [
+    FK.BUOYANCY,
+    FK.DIVINITY,
+    FK.MARTYRDOM,
+    FK.MOXIE,
+    FK.MUSCLITUDE,
+    FK.PATHETICISM,
+    FK.THWACKABILITY,
+    FK.TRAGICNESS,
+    FK.BASE_THIRST,
+    FK.CONTINUATION,
+    FK.GROUND_FRICTION,
+    FK.INDULGENCE,
+    FK.LASERLIKENESS,
+    FK.CINNAMON,
+    FK.PRESSURIZATION,
+]
+RUNNER_FEATURES: List[FK] = [
+    FK.BASE_THIRST,
+    FK.CONTINUATION,
+    FK.GROUND_FRICTION,
+    FK.INDULGENCE,
+    FK.LASERLIKENESS,
+    FK.CINNAMON,
+    FK.PRESSURIZATION,
+]
+
+# stlat columns of a snapshot's stlat matrix
+SNAPSHOT_STLATS: List[FK] = list(FK)
+SNAPSHOT_STLAT_VALUES: List[int] = [stlat.value for stlat in SNAPSHOT_STLATS]
+SNAPSHOT_STAT_VALUES: List[int] = [stat.value for stat in COLUMN_STATS]
+
 
 class TeamState(object):
     def __init__(
@@ -40,11 +97,13 @@ class TeamState(object):
         self.lineup: Dict[int, str] = lineup
         self.starting_pitcher: str = starting_pitcher
         self.stlats: Dict[str, Dict[FK, float]] = stlats
-        self.game_stats: Dict[str, Dict[Stats, float]] = game_stats
+        # game stats live in a flat counter array, the dict form only exists at the serialization boundary
+        self.game_stats: GameStats = GameStats.from_dict(game_stats)
         self.blood: Dict[str, BloodType] = blood
         self.player_names: Dict[str, str] = player_names
         self.cur_batter_pos: int = cur_batter_pos
         self.cur_batter: str = lineup[cur_batter_pos]
+        self._add_game_stats_players()
         self._calculate_defense()
 
     def _calculate_defense(self):
@@ -88,13 +147,15 @@ class TeamState(object):
         self.cur_batter_pos = 1
         self.cur_batter = self.lineup[self.cur_batter_pos]
 
-    def reset_game_stats(self) -> None:
-        new_dict: Dict[Stats, float] = {}
-        for k in Stats:
-            new_dict[k] = 0.0
+    def _add_game_stats_players(self) -> None:
         for p_key in self.lineup.keys():
-            self.game_stats[self.lineup[p_key]] = new_dict
-        self.game_stats[self.starting_pitcher] = new_dict
+            self.game_stats.add_player(self.lineup[p_key])
+        self.game_stats.add_player(self.starting_pitcher)
+        self.game_stats.add_player(DEF_ID)
+
+    def reset_game_stats(self) -> None:
+        self._add_game_stats_players()
+        self.game_stats.reset()
 
     def to_dict(self) -> Dict[str, Any]:
         """ Gets a dict representation of the state for serialization """
@@ -109,7 +170,7 @@ class TeamState(object):
             "lineup": self.lineup,
             "starting_pitcher": self.starting_pitcher,
             "stlats": TeamState.convert_dict(self.stlats),
-            "game_stats": TeamState.convert_dict(self.game_stats),
+            "game_stats": TeamState.convert_dict(self.game_stats.to_dict()),
             "blood": TeamState.convert_blood(self.blood),
             "player_names": self.player_names,
             "cur_batter_pos": self.cur_batter_pos,
@@ -168,6 +229,105 @@ class TeamState(object):
             cur_batter_pos,
         )
 
+    def clone(self) -> "TeamState":
+        """A copy for branching a game, only the batting order position and game stats are copied.
+
+        The lineup, stlats, blood and names are shared with this team and must be treated as read only by both.
+        """
+        team = copy.copy(self)
+        team.game_stats = self.game_stats.copy()
+        return team
+
+    def to_snapshot(self) -> bytes:
+        """A versioned binary snapshot, see src.snapshot, that from_snapshot restores exactly"""
+        writer = SnapshotWriter(TEAM_SNAPSHOT)
+        self.write_snapshot(writer)
+        return writer.getvalue()
+
+    @classmethod
+    def from_snapshot(cls, data: bytes) -> "TeamState":
+        return cls.read_snapshot(SnapshotReader(data, TEAM_SNAPSHOT))
+
+    def save_snapshot(self, storage_path: str) -> None:
+        with open(storage_path, "wb") as snapshot_file:
+            snapshot_file.write(self.to_snapshot())
+
+    @classmethod
+    def load_snapshot(cls, storage_path: str) -> "TeamState":
+        with open(storage_path, "rb") as snapshot_file:
+            return cls.from_snapshot(snapshot_file.read())
+
+    def stlat_rows(self) -> Tuple[List[str], np.ndarray]:
+        """Player ids and a (players x SNAPSHOT_STLATS) matrix of their stlats, NaN where a player has none"""
+        player_ids = list(self.stlats)
+        matrix = np.array(
+            [[player_stlats.get(stlat, np.nan) for stlat in SNAPSHOT_STLATS]
+             for player_stlats in self.stlats.values()],
+            dtype=np.float64,
+        ).reshape(len(player_ids), len(SNAPSHOT_STLATS))
+        return player_ids, matrix
+
+    def write_snapshot(self, writer: SnapshotWriter) -> None:
+        positions = list(self.lineup)
+        writer.ints([self.season, self.day, self.num_bases, self.balls_for_walk, self.strikes_for_out,
+                     self.outs_for_inning, self.cur_batter_pos])
+        writer.strings([self.team_id, self.starting_pitcher])
+        writer.ints(positions)
+        writer.strings([self.lineup[pos] for pos in positions])
+        player_ids, matrix = self.stlat_rows()
+        writer.strings(player_ids)
+        writer.ints(SNAPSHOT_STLAT_VALUES)
+        writer.floats(matrix)
+        writer.strings(self.game_stats.player_ids)
+        writer.ints(SNAPSHOT_STAT_VALUES)
+        writer.floats(self.game_stats.to_numpy())
+        writer.strings(list(self.blood))
+        writer.ints([blood.value for blood in self.blood.values()])
+        writer.strings(list(self.player_names))
+        writer.strings(list(self.player_names.values()))
+
+    @classmethod
+    def read_snapshot(cls, reader: SnapshotReader) -> "TeamState":
+        """Restore the sections written by write_snapshot without going through __init__"""
+        season, day, num_bases, balls_for_walk, strikes_for_out, outs_for_inning, cur_batter_pos = reader.ints()
+        team_id, starting_pitcher = reader.strings()
+        lineup = dict(zip(reader.ints(), reader.strings()))
+        stlat_ids = reader.strings()
+        stlat_values = reader.ints()
+        stlats = SNAPSHOT_STLATS if list(stlat_values) == SNAPSHOT_STLAT_VALUES else [FK(v) for v in stlat_values]
+        stlat_matrix = reader.floats().reshape(len(stlat_ids), len(stlats))
+        stat_ids = reader.strings()
+        stat_values = reader.ints()
+        stats = COLUMN_STATS if list(stat_values) == SNAPSHOT_STAT_VALUES else [Stats(v) for v in stat_values]
+        stat_matrix = reader.floats().reshape(len(stat_ids), len(stats))
+        blood = {player_id: BloodType(value) for player_id, value in zip(reader.strings(), reader.ints())}
+        player_names = dict(zip(reader.strings(), reader.strings()))
+
+        team = cls.__new__(cls)
+        team.team_id = team_id
+        team.team_enum = team_id_map[team_id]
+        team.season = season
+        team.day = day
+        team.num_bases = num_bases
+        team.balls_for_walk = balls_for_walk
+        team.strikes_for_out = strikes_for_out
+        team.outs_for_inning = outs_for_inning
+        team.lineup = lineup
+        team.starting_pitcher = starting_pitcher
+        team.restore_stlats(stlat_ids, stlats, stlat_matrix)
+        team.game_stats = GameStats.from_numpy(stat_ids, stat_matrix, stats)
+        team.blood = blood
+        team.player_names = player_names
+        team.cur_batter_pos = cur_batter_pos
+        team.cur_batter = lineup[cur_batter_pos]
+        return team
+
+    def restore_stlats(self, player_ids: List[str], stlats: List[FK], matrix: np.ndarray) -> None:
+        self.stlats = {
+            player_id: {stlat: value for stlat, value in zip(stlats, row) if value == value}
+            for player_id, row in zip(player_ids, matrix.tolist())
+        }
+
     @classmethod
     def encode_stlats(cls, raw: Dict[str, Dict[int, float]]) -> Dict[str, Dict[FK, float]]:
         ret_val: Dict[str, Dict[FK, float]] = {}
@@ -219,8 +379,8 @@ class TeamState(object):
             ret_val[key] = encoded[key].value
         return ret_val
 
-    def get_player_stats_by_id(self, player_id: str) -> Dict[str, float]:
-        return self.stats[player_id]
+    def get_player_stats_by_id(self, player_id: str) -> Dict[Stats, float]:
+        return self.game_stats.player_stats(player_id)
 
     def next_batter(self) -> None:
         if len(self.lineup) == self.cur_batter_pos:
@@ -230,65 +390,19 @@ class TeamState(object):
         self.cur_batter = self.lineup[self.cur_batter_pos]
 
     def update_stat(self, player_id: str, stat_id: Stats, value: float) -> None:
-        self.game_stats[player_id][stat_id] += value
+        self.game_stats.add(player_id, stat_id, value)
 
     def get_defense_feature_vector(self) -> List[float]:
-        ret_val: List[float] = [
-            self.stlats[DEF_ID][FK.ANTICAPITALISM],
-            self.stlats[DEF_ID][FK.CHASINESS],
-            self.stlats[DEF_ID][FK.OMNISCIENCE],
-            self.stlats[DEF_ID][FK.TENACIOUSNESS],
-            self.stlats[DEF_ID][FK.WATCHFULNESS],
-            self.stlats[DEF_ID][FK.PRESSURIZATION],
-            self.stlats[DEF_ID][FK.CINNAMON],
-        ]
-        return ret_val
+        return [self.stlats[DEF_ID][stlat] for stlat in DEFENSE_FEATURES]
 
     def get_pitcher_feature_vector(self) -> List[float]:
-        player_id = self.starting_pitcher
-        ret_val: List[float] = [
-            self.stlats[player_id][FK.COLDNESS],
-            self.stlats[player_id][FK.OVERPOWERMENT],
-            self.stlats[player_id][FK.RUTHLESSNESS],
-            self.stlats[player_id][FK.SHAKESPEARIANISM],
-            self.stlats[player_id][FK.SUPPRESSION],
-            self.stlats[player_id][FK.UNTHWACKABILITY],
-            self.stlats[player_id][FK.CINNAMON],
-            self.stlats[player_id][FK.PRESSURIZATION],
-        ]
-        return ret_val
+        return [self.stlats[self.starting_pitcher][stlat] for stlat in PITCHER_FEATURES]
 
     def get_batter_feature_vector(self, player_id: str) -> List[float]:
-        ret_val: List[float] = [
-            self.stlats[player_id][FK.BUOYANCY],
-            self.stlats[player_id][FK.DIVINITY],
-            self.stlats[player_id][FK.MARTYRDOM],
-            self.stlats[player_id][FK.MOXIE],
-            self.stlats[player_id][FK.MUSCLITUDE],
-            self.stlats[player_id][FK.PATHETICISM],
-            self.stlats[player_id][FK.THWACKABILITY],
-            self.stlats[player_id][FK.TRAGICNESS],
-            self.stlats[player_id][FK.BASE_THIRST],
-            self.stlats[player_id][FK.CONTINUATION],
-            self.stlats[player_id][FK.GROUND_FRICTION],
-            self.stlats[player_id][FK.INDULGENCE],
-            self.stlats[player_id][FK.LASERLIKENESS],
-            self.stlats[player_id][FK.CINNAMON],
-            self.stlats[player_id][FK.PRESSURIZATION],
-        ]
-        return ret_val
+        return [self.stlats[player_id][stlat] for stlat in BATTER_FEATURES]
 
     def get_runner_feature_vector(self, player_id: str) -> List[float]:
-        ret_val: List[float] = [
-            self.stlats[player_id][FK.BASE_THIRST],
-            self.stlats[player_id][FK.CONTINUATION],
-            self.stlats[player_id][FK.GROUND_FRICTION],
-            self.stlats[player_id][FK.INDULGENCE],
-            self.stlats[player_id][FK.LASERLIKENESS],
-            self.stlats[player_id][FK.CINNAMON],
-            self.stlats[player_id][FK.PRESSURIZATION],
-        ]
-        return ret_val
+        return [self.stlats[player_id][stlat] for stlat in RUNNER_FEATURES]
 
     def get_cur_batter_feature_vector(self) -> List[float]:
         return self.get_batter_feature_vector(self.cur_batter)
@@ -0,0 +1,121 @@
+import unittest
+
+import numpy as np
+
+from src.aggregators import GameAggregate, IntegerHistogram, QuantileSketch
+from src.running_stats import RunningStats
+from src.variance_reduction import ANTITHETIC, INDEPENDENT, SOBOL, SamplingAccumulator, sampling_estimate
+
+
+def histogram(values):
+    result = IntegerHistogram()
+    for value in values:
+        result.update(int(value))
+    return result
+
+
+class TestIntegerHistogram(unittest.TestCase):
+    def setUp(self):
+        self.values = np.random.default_rng(4).poisson(4.5, 1001)
+
+    def test_matches_numpy(self):
+        runs = histogram(self.values)
+        self.assertEqual(runs.count, 1001)
+        self.assertEqual(runs.mean, float(self.values.sum()) / 1001)
+        self.assertAlmostEqual(runs.variance, float(self.values.var(ddof=1)))
+        self.assertEqual(runs.frequency(0), int((self.values == 0).sum()))
+        self.assertEqual(runs.quantile(0.5), int(np.median(self.values)))
+        self.assertEqual(runs.quantile(0.0), int(self.values.min()))
+        self.assertEqual(runs.quantile(1.0), int(self.values.max()))
+        # it stands in for RunningStats wherever a stopping rule reads one
+        self.assertAlmostEqual(runs.half_width(), 1.959964 * float(self.values.std(ddof=1)) / np.sqrt(1001),
+                               places=5)
+
+    def test_merge_is_exact(self):
+        merged = histogram(self.values[:300])
+        merged.merge(histogram(self.values[300:]))
+        whole = histogram(self.values)
+        self.assertEqual(merged.counts, whole.counts)
+        self.assertEqual(merged.mean, whole.mean)
+        self.assertEqual(merged.variance, whole.variance)
+
+    def test_empty(self):
+        self.assertEqual(IntegerHistogram().mean, 0.0)
+        with self.assertRaises(ValueError):
+            IntegerHistogram().quantile(0.5)
+
+
+class TestQuantileSketch(unittest.TestCase):
+    def test_relative_accuracy(self):
+        values = np.random.default_rng(5).normal(0.0, 0.3, 5000)
+        values[:50] = 0.0
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        for value in values:
+            sketch.update(float(value))
+        ordered = np.sort(values)
+        for q in [0.01, 0.25, 0.5, 0.75, 0.9, 0.99]:
+            exact = float(ordered[int(np.floor(q * (len(values) - 1)))])
+            self.assertLessEqual(abs(sketch.quantile(q) - exact), 0.01 * abs(exact) + 1e-12)
+        self.assertEqual(sketch.quantile(0.0), float(values.min()))
+        self.assertEqual(sketch.quantile(1.0), float(values.max()))
+        self.assertAlmostEqual(sketch.mean, float(values.mean()))
+        self.assertLess(len(sketch.positive) + len(sketch.negative), 2000)
+
+    def test_merge(self):
+        values = np.random.default_rng(6).exponential(1.0, 2000)
+        first, second, whole = QuantileSketch(), QuantileSketch(), QuantileSketch()
+        for index, value in enumerate(values):
+            (first if index % 3 else second).update(float(value))
+            whole.update(float(value))
+        first.merge(second)
+        self.assertEqual(first.positive, whole.positive)
+        self.assertEqual((first.count, first.min, first.max), (whole.count, whole.min, whole.max))
+        self.assertEqual(first.quantile(0.9), whole.quantile(0.9))
+        with self.assertRaises(ValueError):
+            first.merge(QuantileSketch(relative_accuracy=0.05))
+
+
+class TestMergingStats(unittest.TestCase):
+    def test_running_stats_merge(self):
+        values = np.random.default_rng(7).normal(3.0, 2.0, 500)
+        merged, rest = RunningStats(), RunningStats()
+        for value in values[:120]:
+            merged.update(value)
+        for value in values[120:]:
+            rest.update(value)
+        merged.merge(rest)
+        merged.merge(RunningStats())
+        self.assertEqual(merged.count, 500)
+        self.assertAlmostEqual(merged.mean, float(values.mean()))
+        self.assertAlmostEqual(merged.variance, float(values.var(ddof=1)))
+
+    def test_game_aggregate(self):
+        rng = np.random.default_rng(8)
+        replicas = [(int(h), int(a), int(hk), int(ak), 9) for h, a, hk, ak in rng.integers(0, 12, (200, 4))]
+        whole, first, second = GameAggregate(), GameAggregate(), GameAggregate()
+        for index, replica in enumerate(replicas):
+            whole.update(*replica)
+            (first if index < 77 else second).update(*replica)
+        first.merge(second)
+        self.assertEqual(first.replicas, 200)
+        self.assertEqual(first.run_differential.counts, whole.run_differential.counts)
+        self.assertEqual(first.home_wins.mean, sum(h > a for h, a, _, _, _ in replicas) / 200)
+        self.assertEqual(first.away_strikeouts.mean, whole.away_strikeouts.mean)
+
+
+class TestSamplingAccumulator(unittest.TestCase):
+    def test_matches_array_estimators(self):
+        values = np.random.default_rng(9).normal(1.0, 3.0, 403)
+        for sampling in [INDEPENDENT, ANTITHETIC, SOBOL]:
+            accumulator = SamplingAccumulator(sampling)
+            for value in values:
+                accumulator.update(float(value))
+            streamed, expected = accumulator.estimate(), sampling_estimate(values, sampling)
+            self.assertEqual(streamed.samples, expected.samples)
+            self.assertAlmostEqual(streamed.estimate, expected.estimate)
+            self.assertAlmostEqual(streamed.variance, expected.variance)
+            self.assertAlmostEqual(streamed.naive_variance, expected.naive_variance)
+
+
+if __name__ == "__main__":
+    unittest.main()
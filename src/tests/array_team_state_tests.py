@@ -0,0 +1,69 @@
+import numpy as np
+
+from src.array_team_state import ArrayTeamState
+from src.common import ForbiddenKnowledge as FK
+from src.common import MachineLearnedModel as Ml
+from src.game_state import BATTER_MODELS, RUNNER_MODELS, GameState
+from src.team_state import DEF_ID
+from src.tests import team_state_tests
+from src.tests.game_state_tests import TestGameState, stand_in_registry
+
+
+class TestArrayInit(team_state_tests.TestInit):
+    def setUp(self):
+        super().setUp()
+        self.team_state = ArrayTeamState.from_team_state(self.team_state)
+
+
+class TestArraySerialization(team_state_tests.TestSerialization):
+    def setUp(self):
+        super().setUp()
+        self.team_state = ArrayTeamState.from_team_state(self.team_state)
+
+
+class TestArrayTeamState(TestGameState):
+    def setUp(self):
+        super().setUp()
+        self.dict_game = self.game_state
+        self.game_state = GameState(
+            "1", 11, 1,
+            ArrayTeamState.from_team_state(self.home_team_state),
+            ArrayTeamState.from_team_state(self.away_team_state),
+            0, 0, 1, self.dict_game.half, 0, 0, 0,
+            stand_in_registry(),
+        )
+
+    def test_feature_vectors_match(self):
+        for model in BATTER_MODELS + RUNNER_MODELS:
+            expected = GameState.gen_model_fv(model, self.away_team_state, self.home_team_state, "p12")
+            actual = GameState.gen_model_fv(model, self.game_state.away_team, self.game_state.home_team, "p12")
+            self.assertEqual(actual, expected)
+
+    def test_rows_are_read_only(self):
+        row = self.game_state.away_team.get_batter_feature_vector("p11")
+        with self.assertRaises(ValueError):
+            row[0] = 1.0
+        rows = self.game_state.away_team.get_runner_feature_rows(["p11", "p13"])
+        self.assertEqual(rows.shape, (2, 7))
+
+    def test_dict_view(self):
+        team = self.game_state.home_team
+        self.assertEqual(set(team.stlats), {"p1", "p2", "p3", "p4", DEF_ID})
+        self.assertEqual(dict(team.stlats["p1"]), dict(self.home_team_state.stlats["p1"]))
+        team.stlats["p1"][FK.MOXIE] = 0.25
+        self.assertEqual(team.get_batter_feature_vector("p1")[3], 0.25)
+        team.stlats["p9"] = {FK.MOXIE: 0.5}
+        self.assertEqual(team.get_batter_feature_vector("p9")[3], 0.5)
+        self.assertTrue(np.isnan(team.get_batter_feature_vector("p9")[0]))
+        with self.assertRaises(KeyError):
+            team.stlats["p9"][FK.BUOYANCY]
+        del team.stlats["p2"]
+        self.assertNotIn("p2", team.stlats)
+        self.assertEqual(team.get_batter_feature_vector("p9")[3], 0.5)
+        self.assertEqual(team.get_defense_feature_vector().tolist(),
+                         self.home_team_state.get_defense_feature_vector())
+
+    def test_simulate_game(self):
+        self.game_state.simulate_game()
+        self.assertTrue(self.game_state.is_game_over)
+        self.assertIn((Ml.PITCH, "p11", "p4", self.home_team_state.team_id), self.game_state.probability_tables)
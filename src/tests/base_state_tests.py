@@ -0,0 +1,70 @@
+import unittest
+
+from src.base_state import BaseRunners, transition_tables
+
+
+def dict_advance_all(runners, num_bases, k):
+    """The dict based advance_all_runners the tables replace"""
+    runners = dict(runners)
+    scored = []
+    for base in reversed(sorted(runners.keys())):
+        if base >= num_bases - k:
+            scored.append(runners.pop(base))
+        else:
+            runners[base + k] = runners.pop(base)
+    return runners, scored
+
+
+class TestTransitionTables(unittest.TestCase):
+    def test_advance_all_matches_dict(self):
+        for num_bases in [4, 5]:
+            tables = transition_tables(num_bases)
+            for state in range(tables.num_states):
+                start = {base: f"r{base}" for base in range(1, num_bases) if state & (1 << (base - 1))}
+                for k in range(1, num_bases + 1):
+                    runners = BaseRunners(num_bases, start)
+                    scored = runners.apply(tables.advance[k][state])
+                    expected_runners, expected_scored = dict_advance_all(start, num_bases, k)
+                    self.assertEqual(dict(runners), expected_runners)
+                    self.assertEqual(scored, expected_scored)
+                    self.assertEqual(tables.advance[k][state].runs, len(expected_scored))
+
+    def test_blocked_moves(self):
+        tables = transition_tables(4)
+        # runners on first and second, the runner on first can not take second
+        self.assertIsNone(tables.advance_runner[1][0b011][1])
+        self.assertEqual(tables.advance_runner[1][0b011][2].state, 0b101)
+        with self.assertRaises(ValueError):
+            BaseRunners(4, {1: "a", 2: "b"}).apply(tables.advance_runner[1][0b011][1])
+
+    def test_steal_candidates(self):
+        tables = transition_tables(4)
+        self.assertEqual(tables.steal_candidates[0b111], (3,))
+        self.assertEqual(tables.steal_candidates[0b011], (2,))
+        self.assertEqual(tables.steal_candidates[0b101], (3, 1))
+        self.assertEqual(transition_tables(5).steal_candidates[0b0111], (3,))
+
+    def test_extra_base(self):
+        tables = transition_tables(4)
+        # runners on second and first, both take the extra base once the lead runner has gone
+        self.assertEqual(tables.extra_base_candidates[0b011], ((2, 0), (1, 0b010)))
+        runners = BaseRunners(4, {1: "a", 2: "b"})
+        self.assertEqual(runners.apply(tables.extra_base[0b011][0b011]), [])
+        self.assertEqual(dict(runners), {2: "a", 3: "b"})
+        runners = BaseRunners(4, {3: "c"})
+        self.assertEqual(runners.apply(tables.extra_base[0b100][0b100]), ["c"])
+        self.assertEqual(len(runners), 0)
+
+
+class TestBaseRunners(unittest.TestCase):
+    def test_mapping(self):
+        runners = BaseRunners(5, {"4": "d", 1: "a"})
+        self.assertEqual(runners.occupancy, 0b1001)
+        self.assertEqual(list(runners), [1, 4])
+        self.assertEqual(runners, {1: "a", 4: "d"})
+        del runners[4]
+        self.assertEqual(runners, {1: "a"})
+        with self.assertRaises(KeyError):
+            runners[5] = "e"
+        runners.clear()
+        self.assertEqual(runners, {})
@@ -0,0 +1,53 @@
+import json
+import unittest
+
+import numpy as np
+
+from benchmarks.fixtures import synthetic_day, synthetic_game_state, synthetic_models, synthetic_registry
+from benchmarks.run_benchmarks import compare, run_benchmarks
+
+
+class TestFixtures(unittest.TestCase):
+    def test_deterministic(self):
+        first, second = synthetic_models(3), synthetic_models(3)
+        for model in first:
+            self.assertTrue(np.array_equal(first[model].coef_, second[model].coef_))
+        self.assertEqual(synthetic_day(4, seed=3), synthetic_day(4, seed=3))
+        games, player_stlats, team_stlats, _, _ = synthetic_day(4, seed=3)
+        self.assertEqual(len(games), 4)
+        for game in games:
+            self.assertIn(game["homePitcher"], player_stlats)
+            self.assertEqual(len(team_stlats[game["awayTeam"]]["lineup"]), 9)
+
+    def test_game_runs(self):
+        game = synthetic_game_state(synthetic_registry(synthetic_models()), seed=5)
+        game.simulate_game()
+        self.assertTrue(game.is_game_over)
+        self.assertNotEqual(game.home_score, game.away_score)
+
+
+class TestRunBenchmarks(unittest.TestCase):
+    def test_report(self):
+        report = run_benchmarks(["team_state_init", "game_state_load"], rounds=2, min_round_time=0.0, games=2)
+        report = json.loads(json.dumps(report))
+        self.assertEqual(sorted(report["benchmarks"]), ["game_state_load", "team_state_init"])
+        result = report["benchmarks"]["team_state_init"]
+        self.assertEqual(result["rounds"], 2)
+        self.assertLessEqual(result["min_seconds"], result["median_seconds"])
+        self.assertAlmostEqual(result["per_second"], 1.0 / result["median_seconds"])
+        with self.assertRaises(ValueError):
+            run_benchmarks(["teleport"], rounds=1, min_round_time=0.0, games=2)
+
+    def test_compare(self):
+        baseline = {"benchmarks": {"a": {"median_seconds": 1.0}, "b": {"median_seconds": 1.0}}}
+        current = {"benchmarks": {"a": {"median_seconds": 1.05}, "b": {"median_seconds": 1.5},
+                                  "c": {"median_seconds": 1.0}}}
+        rows = {row["name"]: row for row in compare(baseline, current, threshold=0.1)}
+        self.assertEqual(sorted(rows), ["a", "b"])
+        self.assertFalse(rows["a"]["regression"])
+        self.assertTrue(rows["b"]["regression"])
+        self.assertAlmostEqual(rows["b"]["ratio"], 1.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
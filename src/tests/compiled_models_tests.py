@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from joblib import dump
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.tree import DecisionTreeClassifier
+
+from src.common import MachineLearnedModel as Ml
+from src.compiled_models import (
+    check_rows,
+    compile_model,
+    compiled_path,
+    export_model,
+    load_compiled,
+    max_probability_error,
+    save_compiled,
+)
+from src.model_registry import ModelRegistry
+
+
+def fitted_models(num_classes):
+    rng = np.random.default_rng(num_classes)
+    features = rng.random((400, 22))
+    labels = rng.integers(0, num_classes, 400)
+    models = [
+        LogisticRegression(max_iter=500),
+        SGDClassifier(loss="log_loss", random_state=0),
+        DecisionTreeClassifier(max_depth=6, random_state=0),
+        RandomForestClassifier(n_estimators=10, max_depth=5, random_state=0),
+        GradientBoostingClassifier(n_estimators=10, random_state=0),
+    ]
+    return [model.fit(features, labels) for model in models]
+
+
+class TestCompiledModels(unittest.TestCase):
+    def test_matches_sklearn(self):
+        for num_classes in [2, 4]:
+            for clf in fitted_models(num_classes):
+                compiled = compile_model(clf)
+                rows = check_rows(clf, 500)
+                self.assertLess(max_probability_error(clf, compiled, rows), 1e-9, type(clf).__name__)
+                for row in rows[:20]:
+                    self.assertTrue(np.allclose(compiled.predict_proba_row(list(row)), clf.predict_proba([row])[0]),
+                                    type(clf).__name__)
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as model_dir:
+            for index, clf in enumerate(fitted_models(3)):
+                path = os.path.join(model_dir, f"model_{index}.npz")
+                save_compiled(compile_model(clf), path)
+                loaded = load_compiled(path)
+                self.assertLess(max_probability_error(clf, loaded, check_rows(clf, 200)), 1e-9)
+                self.assertEqual(list(loaded.classes_), list(clf.classes_))
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            compile_model(object())
+
+    def test_export_and_registry(self):
+        clf = fitted_models(4)[0]
+        with tempfile.TemporaryDirectory() as model_dir:
+            joblib_path = os.path.join(model_dir, "pitch_v1.joblib")
+            dump(clf, joblib_path)
+            self.assertEqual(export_model(joblib_path), compiled_path(joblib_path))
+            registry = ModelRegistry(model_dir=model_dir, compiled=True)
+            self.assertTrue(registry.model_path(Ml.PITCH).endswith("pitch_v1.npz"))
+            rows = check_rows(clf, 50)
+            self.assertTrue(np.allclose(registry.get(Ml.PITCH).predict_proba(rows), clf.predict_proba(rows)))
+
+    def test_export_refuses_mismatch(self):
+        clf = fitted_models(2)[0]
+        with tempfile.TemporaryDirectory() as model_dir:
+            joblib_path = os.path.join(model_dir, "sba_v1.joblib")
+            dump(clf, joblib_path)
+            with self.assertRaises(ValueError):
+                export_model(joblib_path, tolerance=-1.0)
+            self.assertFalse(os.path.exists(compiled_path(joblib_path)))
+
+
+if __name__ == "__main__":
+    unittest.main()
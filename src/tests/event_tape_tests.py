@@ -0,0 +1,93 @@
+import unittest
+
+from src.common import BlaseballStatistics as Stats
+from src.event_tape import EventTape, EventType, ordinal
+from src.tests.game_state_tests import TestGameState, stand_in_registry
+
+
+class TestEventTape(unittest.TestCase):
+    def setUp(self):
+        self.tape = EventTape(capacity=4)
+        self.tape.start("away", "home", "ap", "hp", day=3)
+
+    def test_record_and_render(self):
+        self.tape.half_inning(1, False, "a1", "hp")
+        self.tape.record(EventType.WALK, "a1", "hp", bases=1, value=1)
+        self.tape.record(EventType.STOLEN_BASE, "a2", "hp", "a1", bases=2, value=2)
+        self.tape.record(EventType.HOME_RUN, "a2", "hp", bases=0, runs=2)
+        self.tape.half_inning(1, True, "h1", "ap")
+        self.tape.record(EventType.GAME_OVER, None, None)
+        events = list(self.tape)
+        self.assertEqual(len(events), 6)
+        self.assertEqual(events[2].runner, "a1")
+        self.assertEqual(events[3].runs, 2)
+        self.assertTrue(events[4].bottom)
+        self.assertEqual(self.tape.to_numpy().shape, (6, 10))
+        self.assertEqual(self.tape.render({"a1": "Alice", "away": "Aways", "home": "Homes"}), [
+            "Day 3.",
+            "hp pitching for the Homes at home.",
+            "ap pitching for the Aways on the road.",
+            "\nTop of the 1, Aways batting.",
+            "Homes: 0 - Aways: 0",
+            "Alice drew a walk.",
+            "Alice steals 2nd base.",
+            "a2 hit a home run. 2 scores.",
+            "\nBottom of the 1, Homes batting.",
+            "Homes: 0 - Aways: 2",
+            "Game Over. Aways win 2 - 0",
+        ])
+
+    def test_restart_keeps_players(self):
+        self.tape.record(EventType.SINGLE, "a1", "hp")
+        self.tape.start("away", "home")
+        self.assertEqual(len(self.tape), 0)
+        self.assertEqual(self.tape.render(), ["Play ball."])
+        self.tape.record(EventType.SINGLE, "a2", "hp")
+        self.assertEqual(self.tape.players, ["a1", "hp", "a2"])
+
+    def test_disabled(self):
+        tape = EventTape(enabled=False)
+        tape.start("away", "home")
+        tape.half_inning(1, False, "a1", "hp")
+        tape.record(EventType.SINGLE, "a1", "hp")
+        self.assertEqual(len(tape), 0)
+        self.assertEqual(tape.players, [])
+
+    def test_ordinal(self):
+        self.assertEqual([ordinal(n) for n in [1, 2, 3, 4, 11, 12, 21]], ["1st", "2nd", "3rd", "4th", "11th", "12th",
+                                                                          "21st"])
+
+
+class TestGameStateTape(TestGameState):
+    def setUp(self):
+        super().setUp()
+        self.game_state.model_registry = stand_in_registry()
+
+    def test_stats_from_tape(self):
+        self.game_state.simulate_game()
+        tape_stats = self.game_state.event_tape.to_game_stats()
+        self.assertGreater(len(self.game_state.event_tape), 20)
+        compared = [Stats.BATTER_STRIKEOUTS, Stats.BATTER_WALKS, Stats.BATTER_HITS, Stats.BATTER_DOUBLES,
+                    Stats.BATTER_HRS, Stats.BATTER_RBIS, Stats.BATTER_FLYOUTS, Stats.BATTER_GROUNDOUTS,
+                    Stats.STOLEN_BASES, Stats.CAUGHT_STEALINGS, Stats.PITCHER_STRIKEOUTS, Stats.PITCHER_WALKS,
+                    Stats.PITCHER_HITS_ALLOWED, Stats.PITCHER_EARNED_RUNS]
+        for team in [self.game_state.home_team, self.game_state.away_team]:
+            for player_id in tape_stats.player_ids:
+                if player_id not in team.game_stats.player_slots:
+                    continue
+                for stat in compared:
+                    self.assertEqual(tape_stats.get(player_id, stat), team.game_stats.get(player_id, stat),
+                                     (player_id, stat))
+        log = self.game_state.game_log
+        self.assertTrue(log[-1].startswith("Game Over."))
+        self.assertIn(f"win {max(self.game_state.home_score, self.game_state.away_score)}", log[-1])
+
+    def test_disabled_tape(self):
+        self.game_state.event_tape.enabled = False
+        self.game_state.reset_game_state()
+        self.game_state.simulate_game()
+        self.assertEqual(len(self.game_state.event_tape), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
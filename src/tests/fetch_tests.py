@@ -0,0 +1,170 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import asyncio
+import json
+import random
+import tempfile
+import threading
+import time
+import unittest
+
+from src.fetch import AsyncFetcher, ResponseCache, fetch_player_stats, player_stats_urls
+
+
+class StandInReference(object):
+    def __init__(self, failures=0, delay=0.0):
+        """A local stand-in for the reference stats api.
+
+        playerStats answers with one record per requested id and an ETag, /flaky fails its first failures
+        requests with a 503 and /missing is a 404.  Requests and the most in flight at once are counted.
+        """
+        self.failures = failures
+        self.delay = delay
+        self.paths = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        reference = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                reference.handle(self)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def handle(self, request):
+        with self.lock:
+            self.paths.append(request.path)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            url = urlparse(request.path)
+            if url.path.endswith("/missing"):
+                request.send_response(404)
+                request.end_headers()
+                return
+            if url.path.endswith("/flaky"):
+                with self.lock:
+                    fail = self.failures > 0
+                    self.failures -= 1
+                if fail:
+                    request.send_response(503)
+                    request.end_headers()
+                    return
+            query = parse_qs(url.query)
+            ids = query["playerIds"][0].split(",") if "playerIds" in query else []
+            body = json.dumps([{"player_id": pid, "season": query.get("season", [""])[0]} for pid in ids]).encode()
+            etag = f'"{len(body)}"'
+            if request.headers.get("If-None-Match") == etag:
+                request.send_response(304)
+                request.end_headers()
+                return
+            request.send_response(200)
+            request.send_header("ETag", etag)
+            request.send_header("Content-Type", "application/json")
+            request.send_header("Content-Length", str(len(body)))
+            request.end_headers()
+            request.wfile.write(body)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestAsyncFetcher(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.delays = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def fetcher(self, **kwargs):
+        async def record_sleep(seconds):
+            self.delays.append(seconds)
+
+        kwargs.setdefault("cache_dir", self.directory.name)
+        return AsyncFetcher(rng=random.Random(0), sleep=record_sleep, **kwargs)
+
+    def test_bounded_concurrency(self):
+        reference = StandInReference(delay=0.05)
+        ids = [f"p{i}" for i in range(400)]
+        with self.fetcher(concurrency=4) as fetcher:
+            stats = asyncio.run(fetch_player_stats(fetcher, 7, "batting", ids, base_url=reference.base_url))
+        reference.close()
+        self.assertEqual(sorted(stats), sorted(ids))
+        self.assertEqual(stats["p399"]["season"], "7")
+        self.assertEqual(len(reference.paths), 8)
+        self.assertGreater(reference.max_in_flight, 1)
+        self.assertLessEqual(reference.max_in_flight, 4)
+
+    def test_retries_with_backoff(self):
+        reference = StandInReference(failures=3)
+        with self.fetcher(backoff=1.0, max_backoff=3.0) as fetcher:
+            response = asyncio.run(fetcher.get(f"{reference.base_url}/flaky"))
+            self.assertEqual(response.json(), [])
+            self.assertEqual(fetcher.retries, 3)
+            # full jitter below 1, 2 and then the 3 second cap
+            self.assertEqual(len(self.delays), 3)
+            for delay, cap in zip(self.delays, [1.0, 2.0, 3.0]):
+                self.assertTrue(0.0 <= delay <= cap)
+            # a final status is not retried, and a url that never succeeds gives None
+            self.assertIsNone(asyncio.run(fetcher.get(f"{reference.base_url}/missing")))
+            self.assertEqual(fetcher.retries, 3)
+            reference.failures = 10
+            self.assertIsNone(asyncio.run(fetcher.get(f"{reference.base_url}/flaky?uncached", tries=2)))
+        reference.close()
+
+    def test_revalidation(self):
+        reference = StandInReference()
+        url = player_stats_urls(8, "pitching", ["a", "b"], base_url=reference.base_url)[0]
+        with self.fetcher() as fetcher:
+            first = asyncio.run(fetcher.get(url))
+            self.assertFalse(first.from_cache)
+            # the second run sends the stored ETag and gets the body back from disk on a 304
+            second = asyncio.run(fetcher.get(url))
+            self.assertTrue(second.from_cache)
+            self.assertEqual(second.content, first.content)
+            self.assertEqual(fetcher.revalidated, 1)
+        with self.fetcher(max_age=3600.0) as fetcher:
+            self.assertEqual(asyncio.run(fetcher.get(url)).json(), first.json())
+            self.assertEqual(fetcher.requests, 0)
+        reference.close()
+        # with the server gone the cached body is served stale
+        with self.fetcher(tries=2) as fetcher:
+            self.assertEqual(asyncio.run(fetcher.get(url)).content, first.content)
+        with self.fetcher(offline=True) as fetcher:
+            self.assertEqual(asyncio.run(fetcher.get(url)).content, first.content)
+            self.assertIsNone(asyncio.run(fetcher.get(url + "c")))
+            self.assertEqual(fetcher.requests, 0)
+
+    def test_response_cache(self):
+        cache = ResponseCache(self.directory.name)
+        self.assertIsNone(cache.get("http://a"))
+        cache.put("http://a", b"[1]", {"ETag": '"1"'})
+        entry = cache.get("http://a")
+        self.assertEqual((entry["content"], entry["etag"], entry["last_modified"]), (b"[1]", '"1"', None))
+        with self.assertRaises(ValueError):
+            AsyncFetcher(cache_dir=None, offline=True)
+        with self.assertRaises(ValueError):
+            AsyncFetcher(concurrency=0)
+
+    def test_player_stats_urls(self):
+        urls = player_stats_urls(9, "batting", [str(i) for i in range(120)], base_url="http://x")
+        self.assertEqual(len(urls), 3)
+        self.assertEqual(urls[2], "http://x/playerStats?category=batting&season=9&playerIds="
+                         + ",".join(str(i) for i in range(100, 120)))
+
+
+if __name__ == "__main__":
+    unittest.main()
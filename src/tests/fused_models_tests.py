@@ -0,0 +1,53 @@
+import unittest
+
+import numpy as np
+
+from src.common import MachineLearnedModel as Ml
+from src.compiled_models import check_rows, compile_model
+from src.fused_models import FusedModel
+from src.game_state import BATTER_MODELS
+from src.model_registry import ModelRegistry
+from src.tests.compiled_models_tests import fitted_models
+
+
+class TestFusedModels(unittest.TestCase):
+    def test_matches_per_model(self):
+        sklearn_models = fitted_models(2) + fitted_models(3)
+        heads = {index: compile_model(clf) for index, clf in enumerate(sklearn_models)}
+        # an uncompiled head is evaluated alongside the stacked linear heads
+        heads["sklearn"] = sklearn_models[0]
+        rows = check_rows(sklearn_models[0], 300)
+        block = FusedModel(heads).predict_block([f"p{row}" for row in range(len(rows))], rows)
+        for key, clf in heads.items():
+            expected = clf.predict_proba(rows)
+            self.assertTrue(np.allclose(block.head(key), expected, atol=1e-12), key)
+            self.assertTrue(np.allclose(block.get(key, "p7"), expected[7], atol=1e-12), key)
+            self.assertTrue(np.allclose(block.head_rows(key)["p11"], expected[11], atol=1e-12), key)
+        self.assertEqual(block.probs.shape, (len(rows), 2 * 5 + 3 * 5 + 2))
+
+    def test_invalid_features(self):
+        fused = FusedModel({"a": compile_model(fitted_models(2)[0])})
+        with self.assertRaises(ValueError):
+            fused.predict_proba(np.zeros((3, 5)))
+        with self.assertRaises(ValueError):
+            fused.predict_proba(np.zeros(22))
+        rows = np.zeros((3, 22))
+        rows[1, 4] = np.nan
+        with self.assertRaises(ValueError):
+            fused.predict_proba(rows)
+
+    def test_registry(self):
+        registry = ModelRegistry()
+        clfs = [compile_model(clf) for clf in fitted_models(3)[:3]]
+        for model, clf in zip(BATTER_MODELS, clfs):
+            registry.register(model, clf)
+        fused = registry.get_fused(BATTER_MODELS)
+        self.assertIs(registry.get_fused(BATTER_MODELS), fused)
+        self.assertEqual(list(fused.heads), BATTER_MODELS)
+        registry.register(Ml.PITCH, clfs[1])
+        self.assertIsNot(registry.get_fused(BATTER_MODELS), fused)
+        self.assertIs(registry.get_fused(BATTER_MODELS).heads[Ml.PITCH], clfs[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+
+from src.game_log_archive import GameLogArchive, GameLogSink, archive_paths
+
+
+class TestGameLogArchive(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.log_dir = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        with GameLogSink(self.log_dir, writer="a") as sink:
+            for day in range(3):
+                for replica in range(2):
+                    sink.write(7, day, "game", replica, [f"day {day}", f"replica {replica}"], "Tacos", "Crabs")
+            sink.write(8, 0, "game", 0, ["next season"])
+        self.assertEqual(sink.written, 7)
+        archive = GameLogArchive(self.log_dir)
+        self.assertEqual(archive.read(7, 2, "game", 1), ["day 2", "replica 1"])
+        self.assertEqual(archive.read(8, 0, "game"), ["next season"])
+        entry = archive.entries(7)[(7, 0, "game", 0)]
+        self.assertEqual((entry["away"], entry["home"]), ("Tacos", "Crabs"))
+        self.assertEqual(len(archive.entries(7)), 6)
+        # one archive and one index per season, not a file per log
+        self.assertEqual(len(os.listdir(self.log_dir)), 4)
+        with self.assertRaises(ValueError):
+            archive.read(7, 3, "game", 0)
+
+    def test_writers_and_rewrites(self):
+        archive = GameLogArchive(self.log_dir)
+        with GameLogSink(self.log_dir, writer="a") as first, GameLogSink(self.log_dir, writer="b") as second:
+            first.write(7, 0, "x", 0, ["from a"])
+            second.write(7, 0, "y", 0, ["from b"])
+            first.flush()
+            second.flush()
+            self.assertEqual(archive.read(7, 0, "y"), ["from b"])
+            # a later run writing the same key supersedes the earlier log, the grown index is read again
+            second.write(7, 0, "x", 0, ["rewritten"])
+            second.flush()
+            self.assertEqual(archive.read(7, 0, "x"), ["rewritten"])
+            self.assertEqual(archive.read(7, 0, "y"), ["from b"])
+
+    def test_partial_writes_ignored(self):
+        with GameLogSink(self.log_dir, writer="a") as sink:
+            sink.write(7, 0, "x", 0, ["whole"])
+            sink.write(7, 0, "x", 1, ["cut short"])
+        data_path, index_path = archive_paths(self.log_dir, 7, "a")
+        with open(data_path, 'rb+') as data_file:
+            data_file.truncate(os.path.getsize(data_path) - 1)
+        with open(index_path, 'a', encoding='utf8') as index_file:
+            index_file.write('{"season": 7, "day": 0, "ga')
+        archive = GameLogArchive(self.log_dir)
+        self.assertEqual(sorted(archive.entries(7)), [(7, 0, "x", 0)])
+        self.assertEqual(archive.read(7, 0, "x"), ["whole"])
+
+    def test_writer_errors_surface(self):
+        blocked = os.path.join(self.log_dir, "not a directory")
+        with open(blocked, 'w') as blocked_file:
+            blocked_file.write("")
+        sink = GameLogSink(blocked, writer="a")
+        sink.write(7, 0, "x", 0, ["lost"])
+        with self.assertRaises(OSError):
+            sink.flush()
+        sink.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
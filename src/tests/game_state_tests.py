@@ -2,9 +2,12 @@ import os
 import unittest
 
 from src.game_state import GameState, InningHalf
-from src.team_state import TeamState
+from src.model_registry import ModelRegistry
+from src.rng import RngStreams
+from src.team_state import DEF_ID, TeamState
 from src.common import BlaseballStatistics as Stats
 from src.common import ForbiddenKnowledge as FK
+from src.common import MachineLearnedModel as Ml
 from src.common import BloodType, Team
 
 DEFAULT_FKS = {
@@ -36,6 +39,34 @@ DEFAULT_FKS = {
     FK.CINNAMON: 0.0,
 }
 
+STAND_IN_PROBS = {
+    Ml.PITCH: [0.3, 0.3, 0.2, 0.2],
+    Ml.IS_HIT: [0.35, 0.35, 0.3],
+    Ml.HIT_TYPE: [0.6, 0.2, 0.1, 0.1],
+    Ml.RUNNER_ADV_OUT: [0.7, 0.3],
+    Ml.RUNNER_ADV_HIT: [0.7, 0.3],
+    Ml.SB_ATTEMPT: [0.9, 0.1],
+    Ml.SB_SUCCESS: [0.3, 0.7],
+}
+
+
+class StandInModel(object):
+    def __init__(self, probs):
+        self.probs = probs
+        self.calls = 0
+
+    def predict_proba(self, feature_vectors):
+        self.calls += 1
+        return [list(self.probs) for _ in feature_vectors]
+
+
+def stand_in_registry() -> ModelRegistry:
+    registry = ModelRegistry(model_dir="nowhere")
+    for model, probs in STAND_IN_PROBS.items():
+        registry.register(model, StandInModel(probs))
+    return registry
+
+
 class TestGameState(unittest.TestCase):
     def setUp(self):
         self.home_team_state = TeamState(
@@ -219,4 +250,142 @@ class TestBaseAdvancement(TestGameState):
         self.assertEqual(self.game_state.away_score, 3)
 
 
+class TestGameRules(TestGameState):
+    def setUp(self):
+        super().setUp()
+        self.registry = stand_in_registry()
+        # every pitch is put in play for a hit, the hit type is set by each test
+        self.registry.register(Ml.PITCH, StandInModel([0.0, 0.0, 0.0, 1.0]))
+        self.registry.register(Ml.IS_HIT, StandInModel([0.0, 0.0, 1.0]))
+        self.game_state.model_registry = self.registry
+
+    def hit(self, hit_type: int) -> None:
+        probs = [0.0, 0.0, 0.0, 0.0]
+        probs[hit_type] = 1.0
+        self.registry.register(Ml.HIT_TYPE, StandInModel(probs))
+        self.game_state.pitch_sim()
+
+    def test_home_run_scores_batter(self):
+        self.hit(3)
+        self.assertEqual(self.game_state.away_score, 1)
+        self.assertEqual(self.game_state.cur_base_runners, {})
+        pitcher_stats = self.home_team_state.game_stats
+        self.assertEqual(pitcher_stats.get("p4", Stats.PITCHER_HRS_ALLOWED), 1.0)
+        self.assertEqual(pitcher_stats.get("p4", Stats.PITCHER_EARNED_RUNS), 1.0)
+
+    def test_hit_moves_to_next_batter(self):
+        self.hit(0)
+        self.assertEqual(self.game_state.cur_base_runners, {1: "p11"})
+        self.assertEqual(self.away_team_state.cur_batter, "p12")
+        self.hit(0)
+        self.assertEqual(self.away_team_state.cur_batter, "p13")
+
+    def test_home_trailing_bats_in_ninth(self):
+        self.game_state.inning = 9
+        self.game_state.outs = 3
+        self.game_state.away_score = 1
+        self.game_state.attempt_to_advance_inning()
+        self.assertFalse(self.game_state.is_game_over)
+        self.assertEqual(self.game_state.half, InningHalf.BOTTOM)
+        self.assertIs(self.game_state.cur_batting_team, self.home_team_state)
+
+        self.game_state.reset_game_state()
+        self.game_state.inning = 9
+        self.game_state.outs = 3
+        self.game_state.home_score = 1
+        self.game_state.attempt_to_advance_inning()
+        self.assertTrue(self.game_state.is_game_over)
+
+    def test_extra_innings_clear_bases(self):
+        self.game_state.inning = 10
+        self.game_state.outs = 3
+        self.game_state.cur_base_runners = {2: "p11"}
+        self.game_state.attempt_to_advance_inning()
+        self.assertEqual(self.game_state.half, InningHalf.BOTTOM)
+        self.assertEqual(self.game_state.cur_base_runners, {})
+
+    def test_pre_pitch_event_without_batting_buff(self):
+        # the sunbeams pitch with a buff, the tigers bat without one
+        self.game_state.half = InningHalf.BOTTOM
+        self.game_state.refresh_game_status()
+        self.assertFalse(self.game_state.resolve_team_pre_pitch_event())
+
+    def test_reset(self):
+        self.assertIn(DEF_ID, self.home_team_state.game_stats.player_ids)
+        self.game_state.cur_base_runners = {1: "p11"}
+        self.game_state.is_game_over = True
+        self.game_state.reset_game_state()
+        self.assertEqual(self.game_state.cur_base_runners, {})
+        self.assertFalse(self.game_state.is_game_over)
+
+
+class TestProbabilityTables(TestGameState):
+    def setUp(self):
+        super().setUp()
+        self.registry = stand_in_registry()
+        self.game_state.model_registry = self.registry
+
+    def test_lazy_fill(self):
+        self.assertEqual(self.game_state.probability_tables, {})
+        probs = self.game_state.get_batter_probs(Ml.PITCH, "p11")
+        self.assertEqual(probs, STAND_IN_PROBS[Ml.PITCH])
+        self.game_state.get_batter_probs(Ml.PITCH, "p11")
+        self.assertEqual(self.registry.get(Ml.PITCH).calls, 1)
+        self.assertIn((Ml.PITCH, "p11", "p4", self.home_team_state.team_id), self.game_state.probability_tables)
+
+    def test_precompute(self):
+        self.game_state.precompute_probability_tables()
+        for model in STAND_IN_PROBS:
+            # one batched call for each side of the game
+            self.assertEqual(self.registry.get(model).calls, 2)
+        self.assertEqual(len(self.game_state.probability_tables), len(STAND_IN_PROBS) * 6)
+        # rows already in the tables are not predicted again
+        self.game_state.precompute_probability_tables()
+        self.assertEqual(self.registry.get(Ml.PITCH).calls, 2)
+        for _ in range(20):
+            self.game_state.batter_model_roll(Ml.PITCH)
+            self.game_state.runner_model_roll(Ml.SB_ATTEMPT, "p12")
+        self.assertEqual(self.registry.get(Ml.PITCH).calls, 2)
+        self.assertEqual(self.registry.get(Ml.SB_ATTEMPT).calls, 2)
+        self.game_state.clear_probability_tables()
+        self.assertEqual(self.game_state.probability_tables, {})
+
+    def test_roll_from_probs(self):
+        self.assertEqual(GameState.roll_from_probs([0.0, 1.0]), 1)
+        self.assertEqual(GameState.roll_from_probs([1.0, 0.0]), 0)
+        self.assertEqual(GameState.roll_from_probs([0.0, 0.0]), 1)
+        self.assertEqual(GameState.roll_from_probs([0.25, 0.25, 0.5], 0.4), 1)
+
+    def test_seeded_rng(self):
+        logs = []
+        for _ in range(2):
+            self.game_state.rng = RngStreams(3).uniform_stream(self.game_state.season, self.game_state.day,
+                                                               self.game_state.game_id)
+            self.game_state.reset_game_state()
+            self.game_state.simulate_game()
+            logs.append(list(self.game_state.game_log))
+        self.assertEqual(logs[0], logs[1])
+
+
+class TestRollGenerators(TestGameState):
+    def setUp(self):
+        super().setUp()
+        self.game_state.model_registry = stand_in_registry()
+
+    def test_yields_requests(self):
+        self.game_state.cur_base_runners[3] = "p11"
+        rolls = self.game_state.stolen_base_sim_rolls()
+        request = next(rolls)
+        self.assertEqual(request.model, Ml.SB_ATTEMPT)
+        self.assertEqual(request.player_id, "p11")
+        self.assertEqual(request.key, (Ml.SB_ATTEMPT, "p11", "p4", self.home_team_state.team_id))
+        self.assertEqual(len(request.feature_vector()), 22)
+        # send back "no attempt", nobody else can run so the generator finishes with no steal
+        with self.assertRaises(StopIteration) as stop:
+            rolls.send(0)
+        self.assertFalse(stop.exception.value)
 
+    def test_run_rolls(self):
+        self.game_state.cur_base_runners[3] = "p11"
+        stole = self.game_state.run_rolls(self.game_state.stolen_base_sim_rolls())
+        self.assertIn(stole, [True, False])
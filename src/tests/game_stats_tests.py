@@ -0,0 +1,58 @@
+import unittest
+
+import numpy as np
+
+from src.common import BlaseballStatistics as Stats
+from src.game_stats import NUM_STATS, GameStats
+from src.team_state import DEF_ID
+from src.tests.team_state_tests import TestTeamState
+
+
+class TestGameStats(unittest.TestCase):
+    def setUp(self):
+        self.game_stats = GameStats(["p1", "p2"])
+
+    def test_players_independent(self):
+        self.game_stats.add("p1", Stats.BATTER_HITS, 1.0)
+        self.game_stats.add("p1", Stats.BATTER_HITS, 1.0)
+        self.assertEqual(self.game_stats.get("p1", Stats.BATTER_HITS), 2.0)
+        self.assertEqual(self.game_stats.get("p2", Stats.BATTER_HITS), 0.0)
+        self.assertEqual(self.game_stats.get("p1", Stats.BATTER_WALKS), 0.0)
+
+    def test_numpy_view(self):
+        view = self.game_stats.to_numpy()
+        self.assertEqual(view.shape, (2, NUM_STATS))
+        self.game_stats.add("p2", Stats.PITCHER_WALKS, 3.0)
+        self.assertEqual(view.sum(), 3.0)
+        self.game_stats.reset()
+        self.assertEqual(view.sum(), 0.0)
+
+    def test_dict_round_trip(self):
+        self.game_stats.add("p2", Stats.STOLEN_BASES, 1.0)
+        restored = GameStats.from_dict(self.game_stats.to_dict())
+        self.assertEqual(restored.player_ids, ["p1", "p2"])
+        self.assertTrue(np.array_equal(restored.to_numpy(), self.game_stats.to_numpy()))
+
+    def test_merge(self):
+        other = GameStats(["p3", "p2"])
+        other.add("p2", Stats.BATTER_HITS, 2.0)
+        self.game_stats.add("p2", Stats.BATTER_HITS, 1.0)
+        merged = GameStats.merge([self.game_stats, other])
+        self.assertEqual(merged.player_ids, ["p1", "p2", "p3"])
+        self.assertEqual(merged.get("p2", Stats.BATTER_HITS), 3.0)
+        self.assertEqual(merged.get("p3", Stats.BATTER_HITS), 0.0)
+
+
+class TestTeamGameStats(TestTeamState):
+    def test_reset_keeps_players_independent(self):
+        self.team_state.reset_game_stats()
+        self.team_state.update_stat("p1", Stats.BATTER_HITS, 1.0)
+        self.team_state.update_stat(DEF_ID, Stats.DEFENSE_STOLEN_BASES, 1.0)
+        self.assertEqual(self.team_state.get_player_stats_by_id("p1")[Stats.BATTER_HITS], 1.0)
+        self.assertEqual(self.team_state.get_player_stats_by_id("p2")[Stats.BATTER_HITS], 0.0)
+        self.assertEqual(self.team_state.get_player_stats_by_id("p4")[Stats.DEFENSE_STOLEN_BASES], 0.0)
+
+    def test_serialized_stats(self):
+        self.assertEqual(self.team_state.to_dict()["game_stats"]["p1"][Stats.BATTER_AT_BATS.value], 1.0)
+        self.team_state.reset_game_stats()
+        self.assertEqual(self.team_state.to_dict()["game_stats"]["p1"][Stats.BATTER_AT_BATS.value], 0.0)
@@ -0,0 +1,42 @@
+import random
+
+from src.inference_scheduler import BatchedInferenceScheduler
+from src.tests.game_state_tests import TestGameState, stand_in_registry
+from src.game_state import GameState
+from src.common import MachineLearnedModel as Ml
+
+
+class TestBatchedInferenceScheduler(TestGameState):
+    def setUp(self):
+        super().setUp()
+        self.registry = stand_in_registry()
+        self.games = []
+        for i in range(5):
+            game = GameState.from_config(self.game_state.to_dict(), self.registry)
+            game.game_id = str(i)
+            game.reset_game_state()
+            self.games.append(game)
+
+    def test_batches_across_games(self):
+        random.seed(4)
+        scheduler = BatchedInferenceScheduler()
+        scheduler.run(self.games)
+        for game in self.games:
+            self.assertTrue(game.is_game_over)
+            self.assertNotEqual(game.home_score, game.away_score)
+        # rows needed by several games at once share a predict_proba call
+        self.assertLess(scheduler.predict_calls, scheduler.rows_predicted)
+        self.assertLessEqual(scheduler.rows_predicted, 5 * 6 * len(Ml))
+
+    def test_prefetch(self):
+        random.seed(4)
+        scheduler = BatchedInferenceScheduler()
+        scheduler.run(self.games, prefetch=True)
+        self.assertEqual(scheduler.predict_calls, len(Ml))
+        self.assertEqual(scheduler.rows_predicted, 5 * 6 * len(Ml))
+        self.assertTrue(all(game.is_game_over for game in self.games))
+
+    def test_max_batch_size(self):
+        scheduler = BatchedInferenceScheduler(max_batch_size=10)
+        scheduler.precompute_probability_tables(self.games)
+        self.assertEqual(scheduler.predict_calls, len(Ml) * 3)
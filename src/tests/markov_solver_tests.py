@@ -0,0 +1,87 @@
+import unittest
+
+import numpy as np
+
+from src.markov_solver import HalfInningSolver, _half_inning_cache, clear_half_inning_cache, solve_game
+from src.tests.game_state_tests import TestGameState, stand_in_registry
+from src.vectorized_sim import AWAY, HOME, MatchupTables, simulate_replicas
+
+
+class TestMarkovSolver(TestGameState):
+    def setUp(self):
+        super().setUp()
+        self.game_state.model_registry = stand_in_registry()
+        clear_half_inning_cache()
+
+    def test_half_inning_distribution(self):
+        solver = HalfInningSolver(MatchupTables(self.game_state), AWAY)
+        runs = solver.solve(0)
+        self.assertEqual(runs.shape, (solver.max_runs + 1, 3))
+        self.assertAlmostEqual(float(runs.sum()), 1.0, places=9)
+        self.assertLess(solver.truncated_mass, 1e-9)
+        # most half-innings are scoreless
+        self.assertGreater(runs[0].sum(), 0.5)
+
+    def test_solve_states_matches_solve(self):
+        solver = HalfInningSolver(MatchupTables(self.game_state), HOME)
+        runners = {2: 1}
+        together = solver.solve_states([(0, 0, (-1, -1, -1, -1), 1, 0, 0), (1, 2, (-1, -1, 1, -1), 2, 1, 2)])
+        self.assertTrue(np.allclose(together[0], solver.solve(1)))
+        self.assertTrue(np.allclose(together[1], solver.solve(2, outs=1, balls=1, strikes=2, runners=runners)))
+
+    def test_solve_reachable_matches_solve_states(self):
+        solver = HalfInningSolver(MatchupTables(self.game_state), HOME)
+        index, solutions = solver.solve_reachable([solver.inning_state(0)])
+        states = [solver.inning_state(0), solver.inning_state(2, outs=1, balls=1, strikes=2, runners={2: 1}),
+                  solver.inning_state(1, outs=2, balls=3, runners={1: 0, 3: 2})]
+        for state, expected in zip(states, solver.solve_states(states)):
+            self.assertTrue(np.allclose(solutions[index[state]], expected, atol=1e-12))
+        self.assertTrue(np.allclose(solutions.sum(axis=(1, 2)), 1.0))
+
+    def test_cache(self):
+        solver = HalfInningSolver(MatchupTables(self.game_state), AWAY)
+        first = solver.solve_from_start(1)
+        self.assertEqual(len(_half_inning_cache), 3)
+        again = HalfInningSolver(MatchupTables(self.game_state), AWAY).solve_from_start(1)
+        self.assertIs(first, again)
+
+    def test_matches_simulation(self):
+        distribution = solve_game(self.game_state)
+        self.assertAlmostEqual(float(distribution.scores.sum()) + distribution.unfinished, 1.0, places=9)
+        results = simulate_replicas(self.game_state, 20000, np.random.default_rng(13))
+        away, home = distribution.expected_scores()
+        self.assertAlmostEqual(away, float(np.mean(results.away_score)), delta=0.1)
+        self.assertAlmostEqual(home, float(np.mean(results.home_score)), delta=0.1)
+        self.assertAlmostEqual(distribution.home_win_probability(), results.home_win_probability(), delta=0.02)
+        self.assertAlmostEqual(
+            distribution.home_win_probability() + distribution.away_win_probability() + distribution.unfinished,
+            1.0,
+            places=9,
+        )
+
+    def test_mid_game(self):
+        self.game_state.inning = 9
+        self.game_state.half = self.game_state.half.BOTTOM
+        self.game_state.refresh_game_status()
+        self.game_state.away_score = 3
+        self.game_state.home_score = 2
+        self.game_state.outs = 1
+        self.game_state.cur_base_runners = {1: "p2"}
+        distribution = solve_game(self.game_state)
+        results = simulate_replicas(self.game_state, 20000, np.random.default_rng(17))
+        self.assertAlmostEqual(distribution.home_win_probability(), results.home_win_probability(), delta=0.02)
+        self.assertEqual(float(distribution.scores[:3].sum()), 0.0)
+
+    def test_game_over(self):
+        self.game_state.inning = 9
+        self.game_state.half = self.game_state.half.BOTTOM
+        self.game_state.refresh_game_status()
+        self.game_state.home_score = 0
+        self.game_state.away_score = 50
+        distribution = solve_game(self.game_state)
+        self.assertEqual(distribution.home_win_probability(), 0.0)
+        self.assertAlmostEqual(float(distribution.scores[50].sum()), 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+from src.model_registry import ModelRegistry, get_model_registry, set_model_registry
+from src.common import MachineLearnedModel as Ml
+
+
+class StandInModel(object):
+    def __init__(self, probs):
+        self.probs = probs
+
+    def predict_proba(self, feature_vectors):
+        return [list(self.probs) for _ in feature_vectors]
+
+
+class CountingRegistry(ModelRegistry):
+    def __init__(self):
+        super().__init__(model_dir="nowhere")
+        self.loads = 0
+
+    def _load(self, model, version):
+        self.loads += 1
+        return StandInModel([1.0])
+
+
+class TestModelRegistry(unittest.TestCase):
+    def test_model_path(self):
+        registry = ModelRegistry(model_dir="models")
+        self.assertTrue(registry.model_path(Ml.SB_ATTEMPT).endswith("sba_v1.joblib"))
+        self.assertTrue(registry.model_path(Ml.RUNNER_ADV_HIT, "v2").endswith("extra_base_on_hit_v2.joblib"))
+
+    def test_lazy_single_load(self):
+        registry = CountingRegistry()
+        self.assertFalse(registry.is_loaded(Ml.PITCH))
+        self.assertEqual(registry.loads, 0)
+        first = registry.get(Ml.PITCH)
+        second = registry.get(Ml.PITCH)
+        self.assertIs(first, second)
+        self.assertEqual(registry.loads, 1)
+        registry.get(Ml.PITCH, "v2")
+        self.assertEqual(registry.loads, 2)
+
+    def test_register(self):
+        registry = CountingRegistry()
+        model = StandInModel([0.5, 0.5])
+        registry.register(Ml.IS_HIT, model)
+        self.assertIs(registry.get(Ml.IS_HIT), model)
+        self.assertEqual(registry.loads, 0)
+
+    def test_set_default_registry(self):
+        registry = CountingRegistry()
+        previous = set_model_registry(registry)
+        try:
+            self.assertIs(get_model_registry(), registry)
+        finally:
+            set_model_registry(previous)
+        self.assertIs(get_model_registry(), previous)
@@ -0,0 +1,64 @@
+import asyncio
+import unittest
+
+import numpy as np
+
+import game_sim
+from benchmarks.fixtures import sim_models, synthetic_day, synthetic_models
+from src.model_row_cache import ModelRowCache
+
+
+def day_models(clf, cache=None, changed=None):
+    """setup_models on a fresh copy of the synthetic day, setup_models applies effects to the lineups in place"""
+    games, player_stlats, team_stlats, _, _ = synthetic_day(4, seed=2)
+    if changed is not None:
+        player_stlats[changed]["moxie"] = 0.123
+    return asyncio.run(game_sim.setup_models(games, clf, player_stlats, team_stlats, cache))
+
+
+class TestModelRowCache(unittest.TestCase):
+    def test_lru(self):
+        cache = ModelRowCache(max_entries=2)
+        cache.bind("models")
+        row = np.arange(3.0)
+        cache.put("a", {"pitch": row})
+        row[0] = 9.0
+        self.assertEqual(cache.get("a")["pitch"][0], 0.0)
+        cache.put("b", {"pitch": row})
+        cache.get("a")
+        cache.put("c", {"pitch": row})
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+        cache.bind("other models")
+        self.assertEqual(len(cache), 0)
+
+    def test_reuses_unchanged_rows(self):
+        clf = sim_models(synthetic_models())
+        cache = ModelRowCache()
+        expected = day_models(clf)
+        for _ in range(2):
+            models = day_models(clf, cache)
+            for name, rows in expected.items():
+                self.assertEqual(set(models[name]), set(rows))
+                for hitter_id, row in rows.items():
+                    self.assertTrue(np.array_equal(models[name][hitter_id], row))
+        hitters = len(expected["pitch"])
+        self.assertEqual((cache.hits, cache.misses), (hitters, hitters))
+
+        # moxie is not averaged into the defense, so a hitter's new moxie changes only their own rows
+        games, _, team_stlats, _, _ = synthetic_day(4, seed=2)
+        changed = list(team_stlats[games[1]["homeTeam"]]["lineup"])[0]
+        models = day_models(clf, cache, changed)
+        self.assertEqual(cache.misses, hitters + 1)
+        self.assertFalse(np.array_equal(models["pitch"][changed], expected["pitch"][changed]))
+        for hitter_id, row in expected["pitch"].items():
+            if hitter_id != changed:
+                self.assertTrue(np.array_equal(models["pitch"][hitter_id], row))
+        # predicted on their own rather than in the whole day's batch, which can move the last bit
+        fresh = day_models(clf, changed=changed)
+        self.assertTrue(np.allclose(models["pitch"][changed], fresh["pitch"][changed], rtol=0, atol=1e-15))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import asyncio
+import multiprocessing
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+
+import game_sim
+from benchmarks.fixtures import sim_models, synthetic_day, synthetic_game_state, synthetic_models, synthetic_registry
+from src.common import MachineLearnedModel as Ml
+from src.fused_models import FusedModel
+from src.probability_cache import ProbabilityCache, feature_hash, model_digest
+
+
+def put_rows(path, model, values):
+    cache = ProbabilityCache(path)
+    cache.put_many(model, [(feature_hash(np.array([value])), np.array([value, 1.0 - value])) for value in values])
+    cache.close()
+
+
+class TestProbabilityCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache", "probabilities.sqlite")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        cache = ProbabilityCache(self.path)
+        hashes = [feature_hash(np.array([0.1, 0.2])), feature_hash(np.array([0.1, 0.3]))]
+        self.assertNotEqual(hashes[0], hashes[1])
+        self.assertEqual(feature_hash([0.1, 0.2]), hashes[0])
+        cache.put_many("model", [(hashes[0], np.array([0.25, 0.75]))])
+        found = cache.get_many("model", hashes + [hashes[0]])
+        self.assertEqual(found[0].tolist(), [0.25, 0.75])
+        self.assertIsNone(found[1])
+        self.assertEqual(found[2].tolist(), [0.25, 0.75])
+        self.assertEqual(cache.get_many("other model", hashes[:1]), [None])
+        cache.close()
+        # another connection, as a later run would open, sees the same rows
+        self.assertEqual(ProbabilityCache(self.path).get_many("model", hashes[:1])[0].tolist(), [0.25, 0.75])
+        with self.assertRaises(ValueError):
+            ProbabilityCache(self.path, max_entries=0)
+
+    def test_lru_eviction(self):
+        cache = ProbabilityCache(self.path, max_entries=2)
+        rows = {name: feature_hash(np.array([value])) for name, value in [("a", 0.0), ("b", 1.0), ("c", 2.0)]}
+        cache.put_many("model", [(rows["a"], np.zeros(2))])
+        cache.put_many("model", [(rows["b"], np.zeros(2))])
+        cache.get_many("model", [rows["a"]])
+        cache.put_many("model", [(rows["c"], np.zeros(2))])
+        self.assertEqual(len(cache), 2)
+        found = cache.get_many("model", [rows["a"], rows["b"], rows["c"]])
+        self.assertEqual([probs is not None for probs in found], [True, False, True])
+
+    def test_concurrent_writers(self):
+        # workers of a pool share one cache file, each through its own connection
+        context = multiprocessing.get_context("spawn")
+        workers = [context.Process(target=put_rows, args=(self.path, "model", np.arange(50) / 100 + offset))
+                   for offset in [0.0, 0.5]]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+        cache = ProbabilityCache(self.path)
+        self.assertEqual(len(cache), 100)
+        self.assertEqual(cache.get_many("model", [feature_hash(np.array([0.75]))])[0].tolist(), [0.75, 0.25])
+        # pickled for a worker, the copy opens its own connection
+        self.assertEqual(len(pickle.loads(pickle.dumps(cache))), 100)
+
+    def test_predict_block(self):
+        models = synthetic_models()
+        fused = FusedModel({model: models[model] for model in [Ml.PITCH, Ml.IS_HIT, Ml.HIT_TYPE]})
+        X = np.random.default_rng(3).random((6, fused.num_features))
+        ids = [f"p{row}" for row in range(6)]
+        expected = fused.predict_block(ids, X)
+        cache = ProbabilityCache(self.path)
+        cache.predict_block(fused, ids[:4], X[:4])
+        block = cache.predict_block(fused, ids, X)
+        self.assertEqual((cache.hits, cache.misses), (4, 6))
+        self.assertEqual(block.columns, expected.columns)
+        self.assertTrue(np.array_equal(block.probs, expected.probs))
+        self.assertTrue(np.array_equal(block.get(Ml.IS_HIT, "p5"), expected.get(Ml.IS_HIT, "p5")))
+        # another model never reads these rows
+        other = FusedModel({Ml.PITCH: synthetic_models(seed=1)[Ml.PITCH]})
+        self.assertNotEqual(cache.fused_digest(other), cache.fused_digest(fused))
+        self.assertEqual(model_digest(models[Ml.PITCH]), model_digest(pickle.loads(pickle.dumps(models[Ml.PITCH]))))
+
+    def test_setup_models(self):
+        clf = sim_models(synthetic_models())
+
+        def day_models(probability_cache=None):
+            games, player_stlats, team_stlats, _, _ = synthetic_day(4, seed=2)
+            return asyncio.run(game_sim.setup_models(games, clf, player_stlats, team_stlats,
+                                                     probability_cache=probability_cache))
+
+        expected = day_models()
+        for _ in range(2):
+            # a fresh cache object each time, as a separate run would have
+            cache = ProbabilityCache(self.path)
+            models = day_models(cache)
+            for name, rows in expected.items():
+                for hitter_id, row in rows.items():
+                    self.assertTrue(np.array_equal(models[name][hitter_id], row))
+            cache.close()
+        self.assertEqual((cache.hits, cache.misses), (len(expected["pitch"]) * 2, 0))
+
+    def test_game_state(self):
+        expected = synthetic_game_state(synthetic_registry(synthetic_models()), seed=4)
+        expected.simulate_game()
+        for _ in range(2):
+            registry = synthetic_registry(synthetic_models())
+            registry.probability_cache = ProbabilityCache(self.path)
+            game = synthetic_game_state(registry, seed=4)
+            game.simulate_game()
+            self.assertEqual((game.home_score, game.away_score), (expected.home_score, expected.away_score))
+            self.assertEqual(game.probability_tables, expected.probability_tables)
+        self.assertEqual(registry.probability_cache.misses, 0)
+        self.assertGreater(registry.probability_cache.hits, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import random
+import unittest
+
+import numpy as np
+
+import game_sim
+from benchmarks.fixtures import simulate_synthetic_day
+from src.rng import ReplicaUniforms, RngStreams, UniformStream, game_key, spawn_stream
+
+
+class TestRngStreams(unittest.TestCase):
+    def test_streams_reproducible(self):
+        first = RngStreams(42).generator(8, 3, "game-a", 5).random(10)
+        second = RngStreams(42).generator(8, 3, "game-a", 5).random(10)
+        self.assertTrue(np.array_equal(first, second))
+
+    def test_streams_independent(self):
+        streams = RngStreams(42)
+        base = streams.generator(8, 3, "game-a", 5).random(10)
+        for other in [
+            RngStreams(43).generator(8, 3, "game-a", 5),
+            streams.generator(9, 3, "game-a", 5),
+            streams.generator(8, 4, "game-a", 5),
+            streams.generator(8, 3, "game-b", 5),
+            streams.generator(8, 3, "game-a", 6),
+            streams.generator(8, 3, "game-a"),
+        ]:
+            self.assertFalse(np.array_equal(base, other.random(10)))
+
+    def test_game_key_stable(self):
+        self.assertEqual(game_key("game-a"), game_key("game-a"))
+        self.assertNotEqual(game_key("game-a"), game_key("game-b"))
+        self.assertEqual(game_key(7), 7)
+
+    def test_uniform_stream_blocks(self):
+        expected = RngStreams(1).generator(8, 0, "game-a").random(10)
+        stream = UniformStream(RngStreams(1).generator(8, 0, "game-a"), block_size=3)
+        self.assertEqual([stream.random() for _ in range(10)], expected.tolist())
+
+    def test_spawn_stream(self):
+        parent = RngStreams(1).uniform_stream(8, 0, "game-a")
+        untouched = RngStreams(1).uniform_stream(8, 0, "game-a")
+        first = [spawn_stream(parent).random() for _ in range(3)]
+        self.assertEqual(spawn_stream(RngStreams(1).uniform_stream(8, 0, "game-a")).random(), first[0])
+        self.assertEqual(len(set(first)), 3)
+        self.assertEqual(parent.random(), untouched.random())
+        self.assertNotEqual(spawn_stream(random.Random(2)).random(), random.Random(2).random())
+
+    def test_simulate_restores_roll_source(self):
+        simulate_synthetic_day(games=1, sim_length=2)
+        self.assertIs(game_sim.rng, random)
+
+    def test_replica_uniforms_independent_of_batch(self):
+        streams = RngStreams(5)
+        all_replicas = ReplicaUniforms(streams.replica_keys(8, 0, "game-a", np.arange(100)))
+        # draw for a changing subset of replicas, replica 37 only ever sees its own counter
+        seen = []
+        for step in range(20):
+            rows = np.flatnonzero(np.arange(100) % (step % 3 + 1) == 0)
+            rows = np.union1d(rows, [37])
+            draws = all_replicas.draw(rows)
+            seen.append(draws[np.searchsorted(rows, 37)])
+        alone = ReplicaUniforms(streams.replica_keys(8, 0, "game-a", np.array([37])))
+        replayed = [alone.draw(np.array([0]))[0] for _ in range(20)]
+        self.assertEqual(seen, replayed)
+
+    def test_replica_uniforms_range(self):
+        uniforms = ReplicaUniforms(RngStreams(5).replica_keys(8, 0, "game-a", np.arange(1000)))
+        draws = np.concatenate([uniforms.draw(np.arange(1000)) for _ in range(20)])
+        self.assertTrue(np.all((draws >= 0.0) & (draws < 1.0)))
+        self.assertAlmostEqual(float(draws.mean()), 0.5, delta=0.01)
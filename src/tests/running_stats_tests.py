@@ -0,0 +1,78 @@
+import math
+import unittest
+
+import numpy as np
+
+from benchmarks.fixtures import simulate_synthetic_day
+from game_sim import team_names
+from src.running_stats import RunningStats, StoppingRule, z_score
+
+
+def running(values):
+    stats = RunningStats()
+    for value in values:
+        stats.update(value)
+    return stats
+
+
+class TestRunningStats(unittest.TestCase):
+    def test_matches_numpy(self):
+        values = np.random.default_rng(3).normal(4.5, 2.0, 1000)
+        stats = running(values)
+        self.assertEqual(stats.count, 1000)
+        self.assertAlmostEqual(stats.mean, float(values.mean()))
+        self.assertAlmostEqual(stats.variance, float(values.var(ddof=1)))
+        self.assertAlmostEqual(stats.half_width(0.95), 1.959964 * float(values.std(ddof=1)) / math.sqrt(1000),
+                               places=5)
+
+    def test_empty(self):
+        stats = RunningStats()
+        self.assertEqual(stats.variance, 0.0)
+        self.assertEqual(stats.half_width(), math.inf)
+        self.assertEqual(stats.proportion_half_width(), math.inf)
+
+    def test_proportion_half_width(self):
+        self.assertAlmostEqual(z_score(0.95), 1.959964, places=5)
+        # unanimous results still leave an interval
+        self.assertGreater(running([1.0] * 50).proportion_half_width(), 0.03)
+        coin_flips = running([0.0, 1.0] * 500)
+        self.assertAlmostEqual(coin_flips.proportion_half_width(), 0.0309, places=3)
+        self.assertLess(running([0.0] + [1.0] * 999).proportion_half_width(), coin_flips.proportion_half_width())
+
+    def test_stopping_rule(self):
+        rule = StoppingRule(win_half_width=0.05, min_replicas=20, max_replicas=400)
+        scores = running([3.0, 5.0] * 200)
+        self.assertFalse(rule.done(running([1.0] * 19), scores, scores))
+        self.assertTrue(rule.done(running([0.0] * 60), scores, scores))
+        self.assertFalse(rule.done(running([0.0, 1.0] * 100), scores, scores))
+        self.assertTrue(rule.done(running([0.0, 1.0] * 200), scores, scores))
+        strict = StoppingRule(win_half_width=0.05, score_half_width=0.01, min_replicas=20, max_replicas=1000)
+        self.assertFalse(strict.done(running([0.0] * 400), scores, scores))
+
+    def test_bad_rules(self):
+        with self.assertRaises(ValueError):
+            StoppingRule(min_replicas=100, max_replicas=10)
+        with self.assertRaises(ValueError):
+            StoppingRule(confidence=1.5)
+
+
+class TestAdaptiveSimulate(unittest.TestCase):
+    def test_reports_replicas(self):
+        rule = StoppingRule(win_half_width=0.25, min_replicas=10, max_replicas=400)
+        games, (_, _, strikeouts, stat_sheets, output_text) = simulate_synthetic_day(seed=3, sim_length=50,
+                                                                                     stopping_rule=rule)
+        # the per game reports come back for the caller to write, season_runner merges them from its workers
+        lines = output_text.splitlines()
+        self.assertEqual(len(lines), len(games))
+        for game, line in zip(games, lines):
+            replicas = strikeouts[game["homePitcher"]]["replicas"]
+            self.assertTrue(rule.min_replicas <= replicas < rule.max_replicas)
+            self.assertTrue(line.startswith(f"{team_names[game['awayTeam']]} at {team_names[game['homeTeam']]}: "
+                                            f"{replicas} replicas, home win "))
+            # every replica is a win or a loss for each pitcher, scaled to sim_length
+            for pitcher in [game["homePitcher"], game["awayPitcher"]]:
+                self.assertAlmostEqual(stat_sheets[pitcher]["wins"] + stat_sheets[pitcher]["losses"], 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
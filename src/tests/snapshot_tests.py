@@ -0,0 +1,89 @@
+import struct
+import unittest
+
+from src.array_team_state import ArrayTeamState
+from src.common import BlaseballStatistics as Stats
+from src.game_state import GameState, InningHalf
+from src.rng import RngStreams
+from src.snapshot import HEADER, MAGIC
+from src.team_state import TeamState
+from src.tests.game_state_tests import TestGameState, stand_in_registry
+
+
+class TestSnapshots(TestGameState):
+    def setUp(self):
+        super().setUp()
+        self.game_state.model_registry = stand_in_registry()
+
+    def play_some(self):
+        self.game_state.precompute_probability_tables()
+        rolls = self.game_state.simulate_game_rolls()
+        request = next(rolls)
+        for _ in range(60):
+            request = rolls.send(self.game_state.resolve_roll(request))
+
+    def test_team_round_trip(self):
+        team = self.game_state.home_team
+        team.update_stat("p1", Stats.BATTER_HITS, 2.0)
+        for cls in [TeamState, ArrayTeamState]:
+            restored = cls.from_snapshot(team.to_snapshot())
+            self.assertIsInstance(restored, cls)
+            self.assertEqual(restored.to_dict(), team.to_dict())
+            self.assertEqual(restored.to_snapshot(), team.to_snapshot())
+        array_team = ArrayTeamState.from_team_state(team)
+        restored = ArrayTeamState.from_snapshot(array_team.to_snapshot())
+        self.assertEqual(restored.to_dict(), team.to_dict())
+        self.assertEqual(list(restored.get_batter_feature_vector("p1")), list(team.get_batter_feature_vector("p1")))
+
+    def test_game_round_trip(self):
+        self.play_some()
+        snapshot = self.game_state.to_snapshot()
+        restored = GameState.from_snapshot(snapshot, stand_in_registry())
+        self.assertEqual(restored.to_dict(), self.game_state.to_dict())
+        self.assertEqual(restored.to_snapshot(), snapshot)
+        self.assertIs(restored.cur_batting_team, restored.home_team if self.game_state.half == InningHalf.BOTTOM
+                      else restored.away_team)
+
+    def test_rejects_bad_snapshots(self):
+        snapshot = self.game_state.to_snapshot()
+        with self.assertRaises(ValueError):
+            TeamState.from_snapshot(snapshot)
+        with self.assertRaises(ValueError):
+            GameState.from_snapshot(HEADER.pack(MAGIC, 99, 2) + snapshot[HEADER.size:])
+        with self.assertRaises(ValueError):
+            GameState.from_snapshot(b"nope" + snapshot[4:])
+        with self.assertRaises((ValueError, struct.error)):
+            GameState.from_snapshot(snapshot[:len(snapshot) // 2])
+
+    def test_clone_is_independent(self):
+        self.play_some()
+        before = self.game_state.to_dict()
+        tape_length = len(self.game_state.event_tape)
+        clone = self.game_state.clone()
+        self.assertIs(clone.home_team.stlats, self.game_state.home_team.stlats)
+        self.assertEqual(clone.to_dict(), before)
+        clone.simulate_game()
+        self.assertTrue(clone.is_game_over)
+        self.assertEqual(self.game_state.to_dict(), before)
+        self.assertEqual(len(self.game_state.event_tape), tape_length)
+        self.assertGreater(len(clone.event_tape), tape_length)
+
+    def test_clone_rng(self):
+        self.game_state.rng = RngStreams(4).uniform_stream(self.game_state.season, self.game_state.day,
+                                                           self.game_state.game_id)
+        clone = self.game_state.clone()
+        self.assertIsNot(clone.rng, self.game_state.rng)
+        stream = RngStreams(4).uniform_stream(self.game_state.season, self.game_state.day, self.game_state.game_id)
+        self.assertIs(self.game_state.clone(rng=stream).rng, stream)
+
+    def test_array_team_clone(self):
+        team = ArrayTeamState.from_team_state(self.game_state.home_team)
+        clone = team.clone()
+        clone.update_stat("p1", Stats.BATTER_HITS, 1.0)
+        self.assertEqual(team.game_stats.get("p1", Stats.BATTER_HITS), 0.0)
+        self.assertIs(clone.stlats.team, clone)
+        self.assertIs(clone.stlat_matrix, team.stlat_matrix)
+
+
+if __name__ == "__main__":
+    unittest.main()
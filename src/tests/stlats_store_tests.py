@@ -0,0 +1,67 @@
+import json
+import os
+import tempfile
+import unittest
+
+from benchmarks.fixtures import synthetic_day, synthetic_players, synthetic_team_ids
+from game_sim import stlat_list
+from src.stlats_store import StlatsStore, group_day_stlats, group_season_games, ingest_stlats
+
+
+class TestStlatsStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.stlats_dir = os.path.join(self.directory.name, "stlats")
+        self.season_dir = os.path.join(self.directory.name, "season_data")
+        os.makedirs(self.stlats_dir)
+        os.makedirs(self.season_dir)
+        self.players = {}
+        for day in [0, 1, 3]:
+            self.players[day] = synthetic_players(synthetic_team_ids(4), seed=day)
+            with open(os.path.join(self.stlats_dir, f"s7_d{day}_stlats.json"), "w") as json_file:
+                json.dump(self.players[day], json_file)
+        self.games = []
+        for day in [0, 1, 3]:
+            self.games += synthetic_day(2, day=day, seed=day)[0]
+        self.games[0]["id"] = "first-game"
+        self.games[1]["outcomes"] = ["Rogue Umpire incinerated a player"]
+        with open(os.path.join(self.season_dir, "season8.json"), "w") as json_file:
+            json.dump(self.games, json_file)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def ingest(self, dtype):
+        store_dir = os.path.join(self.directory.name, dtype)
+        ingest_stlats([7], stlat_list, store_dir, self.stlats_dir, self.season_dir, days=5, dtype=dtype)
+        return StlatsStore(store_dir)
+
+    def test_round_trip(self):
+        store = self.ingest("float64")
+        for day in [0, 1, 3]:
+            self.assertTrue(store.has_day(7, day))
+            self.assertEqual(store.day_stlats(7, day), group_day_stlats(self.players[day]))
+        self.assertFalse(store.has_day(7, 2))
+        self.assertEqual(store.season_games(7), group_season_games(self.games))
+        with self.assertRaises(ValueError):
+            store.day_stlats(7, 2)
+        with self.assertRaises(ValueError):
+            store.season_games(8)
+
+    def test_float32(self):
+        store = self.ingest("float32")
+        self.assertEqual(str(store.stlats.dtype), "float32")
+        self.assertEqual(store.stlats.shape, (len(stlat_list), 3 * len(self.players[0])))
+        player_stlats, team_stlats, _, _ = store.day_stlats(7, 1)
+        for player in self.players[1]:
+            for stlat in stlat_list:
+                self.assertAlmostEqual(player_stlats[player["player_id"]][stlat], player[stlat], places=6)
+        self.assertEqual(list(team_stlats), synthetic_team_ids(4))
+
+    def test_missing_store(self):
+        with self.assertRaises(ValueError):
+            StlatsStore(os.path.join(self.directory.name, "nowhere"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import math
+import re
+import unittest
+
+import numpy as np
+
+from benchmarks.fixtures import simulate_synthetic_day
+from src.rng import RngStreams
+from src.tests.game_state_tests import TestGameState, stand_in_registry
+from src.variance_reduction import ANTITHETIC, INDEPENDENT, SOBOL, antithetic_estimate, batch_estimate
+from src.variance_reduction import common_random_numbers_estimate, independent_estimate, replica_stream
+from src.variance_reduction import replica_uniforms, sampling_estimate, sobol_points
+from src.vectorized_sim import MatchupTables, VectorizedGameSim
+
+
+class TestUniforms(unittest.TestCase):
+    def setUp(self):
+        self.streams = RngStreams(7)
+        self.replicas = np.arange(16)
+        self.game = np.zeros(16, dtype=np.int64)
+
+    def test_antithetic_pairs(self):
+        uniforms = replica_uniforms(self.streams, [(11, 3, "game")], self.game, self.replicas, ANTITHETIC)
+        for _ in range(3):
+            draws = uniforms.draw(self.replicas)
+            self.assertTrue(np.allclose(draws[0::2] + draws[1::2], 1.0))
+        even = replica_stream(self.streams, 11, 3, "game", 4, ANTITHETIC)
+        odd = replica_stream(self.streams, 11, 3, "game", 5, ANTITHETIC)
+        self.assertAlmostEqual(even.random() + odd.random(), 1.0)
+
+    def test_sobol(self):
+        points = sobol_points(np.arange(64), dimensions=5, batches=4, seed=3)
+        self.assertEqual(points.shape, (64, 5))
+        self.assertTrue(((points >= 0.0) & (points < 1.0)).all())
+        # a prefix of the replicas gets the same points however many are asked for
+        self.assertTrue(np.array_equal(sobol_points(np.arange(16), 5, 4, 3), points[:16]))
+        # every scramble covers each half of every dimension evenly
+        for batch in range(4):
+            self.assertEqual(int((points[batch::4] < 0.5).sum()), 16 * 5 // 2)
+
+        uniforms = replica_uniforms(self.streams, [(11, 3, "game")], self.game, self.replicas, SOBOL)
+        dimensions = uniforms.dimensions
+        first = uniforms.draw(self.replicas)
+        self.assertTrue(np.array_equal(first, uniforms.points[:, 0]))
+        for _ in range(dimensions):
+            uniforms.draw(self.replicas)
+        self.assertEqual(uniforms.fallback.counters[0], 1)
+
+    def test_common_random_numbers(self):
+        first = replica_uniforms(self.streams, [(11, 3, "shared")], self.game, self.replicas)
+        second = replica_uniforms(self.streams, [(11, 3, "shared")], self.game, self.replicas)
+        self.assertTrue(np.array_equal(first.draw(self.replicas), second.draw(self.replicas)))
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            replica_uniforms(self.streams, [(11, 3, "game")], self.game, self.replicas, "lucky")
+
+
+class TestEstimators(unittest.TestCase):
+    def test_independent(self):
+        values = np.random.default_rng(1).normal(size=400)
+        estimate = independent_estimate(values)
+        self.assertEqual(estimate.variance_reduction, 1.0)
+        self.assertAlmostEqual(estimate.std_error, float(values.std(ddof=1)) / 20.0)
+
+    def test_antithetic(self):
+        noise = np.random.default_rng(2).normal(size=200)
+        # partners that cancel almost exactly
+        values = np.stack([3.0 + noise, 3.0 - noise + 0.01 * noise ** 2], axis=1).ravel()
+        estimate = antithetic_estimate(np.append(values, 100.0))
+        self.assertEqual(estimate.samples, 400)
+        self.assertAlmostEqual(estimate.estimate, 3.0, places=1)
+        self.assertGreater(estimate.variance_reduction, 100.0)
+        self.assertEqual(sampling_estimate(values, ANTITHETIC).variance, estimate.variance)
+
+    def test_batches(self):
+        values = np.tile(np.repeat([1.0, 2.0, 3.0, 4.0], 4), 12)
+        estimate = batch_estimate(values, batches=4)
+        # every scramble saw the same mix, so the batch means can not tell any error
+        self.assertAlmostEqual(estimate.variance, 0.0)
+        self.assertGreater(estimate.variance_reduction, 1e6)
+
+    def test_common_random_numbers(self):
+        first = np.random.default_rng(3).normal(size=300)
+        estimate = common_random_numbers_estimate(first, first - 0.5)
+        self.assertAlmostEqual(estimate.estimate, 0.5)
+        self.assertGreater(estimate.variance_reduction, 1e6)
+        with self.assertRaises(ValueError):
+            common_random_numbers_estimate(first, first[:10])
+
+
+class TestSimulationModes(TestGameState):
+    def setUp(self):
+        super().setUp()
+        self.game_state.model_registry = stand_in_registry()
+        self.matchup = MatchupTables(self.game_state)
+
+    def test_common_key(self):
+        results = [VectorizedGameSim([self.matchup], 200, streams=RngStreams(5), common_key="compare").run()
+                   for _ in range(2)]
+        self.assertTrue(np.array_equal(results[0].home_score, results[1].home_score))
+        estimate = common_random_numbers_estimate(results[0].home_score, results[1].home_score)
+        self.assertEqual(estimate.estimate, 0.0)
+        self.assertEqual(estimate.variance_reduction, math.inf)
+
+    def test_modes_agree(self):
+        means = {}
+        for sampling in [INDEPENDENT, ANTITHETIC, SOBOL]:
+            results = VectorizedGameSim([self.matchup], 2000, streams=RngStreams(9), sampling=sampling).run()
+            means[sampling] = sampling_estimate(results.home_score - results.away_score, sampling)
+        for sampling in [ANTITHETIC, SOBOL]:
+            self.assertAlmostEqual(means[sampling].estimate, means[INDEPENDENT].estimate, delta=0.5)
+            self.assertGreater(means[sampling].variance_reduction, 0.0)
+
+
+class TestSampledSimulate(unittest.TestCase):
+    def test_reports_variance_reduction(self):
+        games, (_, _, strikeouts, _, output_text) = simulate_synthetic_day(seed=4, sampling=ANTITHETIC)
+        lines = output_text.splitlines()
+        self.assertEqual(len(lines), len(games))
+        for game, line in zip(games, lines):
+            match = re.search(rf": {ANTITHETIC} sampling, run differential \S+ \+/- \S+, (\S+)x variance reduction$",
+                              line)
+            self.assertIsNotNone(match)
+            reduction = strikeouts[game["homePitcher"]]["variance_reduction"]
+            self.assertEqual(match.group(1), f"{reduction:.2f}")
+
+
+if __name__ == "__main__":
+    unittest.main()
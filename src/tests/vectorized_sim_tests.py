@@ -0,0 +1,87 @@
+import random
+import statistics
+
+import numpy as np
+
+from src.common import MachineLearnedModel as Ml
+from src.rng import RngStreams
+from src.tests.game_state_tests import StandInModel, TestGameState, stand_in_registry
+from src.vectorized_sim import AWAY, EMPTY, HOME, MatchupTables, VectorizedGameSim, simulate_replicas, simulate_slate
+
+
+class TestVectorizedSim(TestGameState):
+    def setUp(self):
+        super().setUp()
+        self.game_state.model_registry = stand_in_registry()
+
+    def test_games_finish(self):
+        results = simulate_replicas(self.game_state, 2000, np.random.default_rng(7))
+        self.assertEqual(len(results), 2000)
+        self.assertTrue(np.all(results.innings >= 9))
+        self.assertTrue(np.all(results.home_score != results.away_score))
+
+    def test_reproducible(self):
+        first = simulate_replicas(self.game_state, 500, np.random.default_rng(3))
+        second = simulate_replicas(self.game_state, 500, np.random.default_rng(3))
+        self.assertTrue(np.array_equal(first.home_score, second.home_score))
+        self.assertTrue(np.array_equal(first.away_strikeouts, second.away_strikeouts))
+
+    def test_replay_single_replica(self):
+        results = simulate_replicas(self.game_state, 300, streams=RngStreams(9))
+        again = simulate_replicas(self.game_state, 300, streams=RngStreams(9))
+        self.assertTrue(np.array_equal(results.home_score, again.home_score))
+        for replica in [0, 123, 299]:
+            alone = simulate_replicas(self.game_state, 1, streams=RngStreams(9), replica_offset=replica)
+            self.assertEqual(alone.home_score[0], results.home_score[replica])
+            self.assertEqual(alone.away_score[0], results.away_score[replica])
+            self.assertEqual(alone.innings[0], results.innings[replica])
+
+    def test_slate(self):
+        results = simulate_slate([self.game_state, self.game_state], 300, np.random.default_rng(5))
+        self.assertEqual(len(results), 600)
+        self.assertEqual(len(results.for_game(1)), 300)
+
+    def test_start_from_mid_game(self):
+        self.game_state.inning = 9
+        self.game_state.half = self.game_state.half.BOTTOM
+        self.game_state.refresh_game_status()
+        self.game_state.home_score = 0
+        self.game_state.away_score = 50
+        self.game_state.outs = 2
+        self.game_state.cur_base_runners = {1: "p2"}
+        sim = VectorizedGameSim([MatchupTables(self.game_state)], 100, np.random.default_rng(1))
+        self.assertTrue(np.all(sim.runners[:, 1] == 1))
+        self.assertTrue(np.all(sim.half == HOME))
+        results = sim.run()
+        self.assertTrue(np.all(results.away_score == 50))
+        self.assertEqual(results.home_win_probability(), 0.0)
+
+    def test_groundout_matches_game_state(self):
+        # no steals, every pitch is put in play for a groundout
+        self.game_state.model_registry.register(Ml.SB_ATTEMPT, StandInModel([1.0, 0.0]))
+        self.game_state.model_registry.register(Ml.PITCH, StandInModel([0.0, 0.0, 0.0, 1.0]))
+        self.game_state.model_registry.register(Ml.IS_HIT, StandInModel([0.0, 1.0, 0.0]))
+        self.game_state.cur_base_runners = {1: "p12", 3: "p13"}
+        sim = VectorizedGameSim([MatchupTables(self.game_state)], 10, np.random.default_rng(2))
+        sim.step()
+        self.game_state.pitch_sim()
+        self.assertEqual(self.game_state.outs, 1)
+        self.assertEqual(self.game_state.away_score, 1)
+        self.assertEqual(self.game_state.cur_base_runners, {2: "p12"})
+        self.assertTrue(np.all(sim.outs == 1))
+        self.assertTrue(np.all(sim.score[:, AWAY] == 1))
+        self.assertTrue(np.all(sim.runners[:, 2] == 1))
+        self.assertTrue(np.all(sim.runners[:, [1, 3]] == EMPTY))
+
+    def test_matches_game_state(self):
+        results = simulate_replicas(self.game_state, 4000, np.random.default_rng(11))
+        random.seed(11)
+        away_scores = []
+        home_scores = []
+        for _ in range(400):
+            self.game_state.reset_game_state()
+            self.game_state.simulate_game()
+            away_scores.append(self.game_state.away_score)
+            home_scores.append(self.game_state.home_score)
+        self.assertAlmostEqual(float(np.mean(results.away_score)), statistics.mean(away_scores), delta=0.5)
+        self.assertAlmostEqual(float(np.mean(results.home_score)), statistics.mean(home_scores), delta=0.5)
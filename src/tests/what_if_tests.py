@@ -0,0 +1,96 @@
+import unittest
+
+import numpy as np
+
+from src.common import BlaseballStatistics as Stats
+from src.markov_solver import clear_half_inning_cache, solve_game
+from src.tests.game_state_tests import TestGameState, stand_in_registry
+from src.what_if import BranchSimulator, simulate_branches
+
+
+class TestWhatIf(TestGameState):
+    def setUp(self):
+        super().setUp()
+        self.game_state.model_registry = stand_in_registry()
+        clear_half_inning_cache()
+
+    def test_matches_solver(self):
+        results = simulate_branches(self.game_state, 20000, np.random.default_rng(3))
+        distribution = solve_game(self.game_state)
+        self.assertEqual(len(results), 20000)
+        self.assertAlmostEqual(results.home_win_probability(), distribution.home_win_probability(), delta=0.02)
+        away, home = distribution.expected_scores()
+        self.assertAlmostEqual(results.expected_scores()[0], away, delta=0.1)
+        self.assertAlmostEqual(results.expected_scores()[1], home, delta=0.1)
+        self.assertAlmostEqual(float(results.score_distribution().sum()), 1.0)
+        self.assertTrue((results.innings >= 9).all())
+        # the away team bats at least nine full half-innings from the first pitch
+        self.assertTrue((results.outs[:, 0] >= 27).all())
+
+    def test_mid_game(self):
+        simulator = BranchSimulator(self.game_state, 20000, np.random.default_rng(5))
+        matchup = simulator.matchup
+        self.game_state.inning = 9
+        self.game_state.half = self.game_state.half.BOTTOM
+        self.game_state.refresh_game_status()
+        self.game_state.away_score = 3
+        self.game_state.home_score = 2
+        self.game_state.outs = 1
+        self.game_state.cur_base_runners = {1: "p2"}
+        results = simulator.run(self.game_state)
+        # the tables are reused, only the start state is read again
+        self.assertIs(simulator.matchup, matchup)
+        distribution = solve_game(self.game_state)
+        self.assertAlmostEqual(results.home_win_probability(), distribution.home_win_probability(), delta=0.02)
+        self.assertEqual(float(results.score_distribution()[:3].sum()), 0.0)
+        self.assertTrue((results.outs[:, 1] % 3 == 2).all())
+        # the away team only bats again in extra innings
+        self.assertTrue((results.score[results.innings == 9, 0] == 3).all())
+        stats = results.expected_remaining_stats()
+        self.assertAlmostEqual(stats["p4"][Stats.PITCHER_INNINGS_PITCHED], float(results.outs[:, 0].mean()) / 3)
+        self.assertAlmostEqual(stats["p4"][Stats.PITCHER_WINS], results.home_win_probability())
+
+    def test_mid_inning_lookups(self):
+        simulator = BranchSimulator(self.game_state, 100, np.random.default_rng(17))
+        self.game_state.outs = 1
+        self.game_state.strikes = 2
+        simulator.run(self.game_state)
+        index, solutions = simulator._half_innings[0]
+        # the next pitches of the half-inning read the solutions made on the first one
+        self.game_state.balls = 1
+        self.game_state.cur_base_runners = {2: "p12"}
+        simulator.run(self.game_state)
+        self.assertIs(simulator._half_innings[0][1], solutions)
+        self.assertEqual(simulator._mid_inning, {})
+        self.assertIsNone(simulator._half_innings[1])
+        solver = simulator.solvers[0]
+        state = solver.inning_state(0, 1, 1, 2, {2: 1})
+        self.assertTrue(np.allclose(solutions[index[state]], solver.solve_states([state])[0], atol=1e-6))
+
+    def test_game_over(self):
+        self.game_state.inning = 9
+        self.game_state.half = self.game_state.half.BOTTOM
+        self.game_state.refresh_game_status()
+        self.game_state.home_score = 0
+        self.game_state.away_score = 50
+        self.game_state.is_game_over = True
+        results = simulate_branches(self.game_state, 100, np.random.default_rng(7))
+        self.assertEqual(results.away_win_probability(), 1.0)
+        self.assertEqual(results.expected_remaining_runs(), (0.0, 0.0))
+
+    def test_roster_change_rebuilds(self):
+        simulator = BranchSimulator(self.game_state, 100, np.random.default_rng(11))
+        matchup = simulator.matchup
+        self.game_state.home_team.starting_pitcher = "p3"
+        simulator.run(self.game_state)
+        self.assertIsNot(simulator.matchup, matchup)
+        self.assertEqual(simulator.matchup.pitchers[1], "p3")
+
+    def test_seeded(self):
+        first = simulate_branches(self.game_state, 500, np.random.default_rng(13))
+        second = simulate_branches(self.game_state, 500, np.random.default_rng(13))
+        self.assertTrue(np.array_equal(first.score, second.score))
+
+
+if __name__ == "__main__":
+    unittest.main()
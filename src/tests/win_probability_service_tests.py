@@ -0,0 +1,113 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.markov_solver import clear_half_inning_cache
+from src.tests.game_state_tests import TestGameState, stand_in_registry
+from src.win_probability_service import Overloaded, WinProbabilityClient, WinProbabilityService
+
+
+class TestWinProbabilityService(TestGameState):
+    def setUp(self):
+        super().setUp()
+        clear_half_inning_cache()
+        self.payload = self.game_state.to_dict()
+
+    def serve(self, scenario, unix_path=None, **options):
+        """Run scenario(service, client) against a service started on a free local port"""
+        async def run():
+            service = WinProbabilityService(stand_in_registry(), branches=2000, rng=np.random.default_rng(1),
+                                            **options)
+            await service.start(unix_path=unix_path)
+            client = WinProbabilityClient(port=service.port, unix_path=unix_path)
+            try:
+                return await scenario(service, client)
+            finally:
+                await service.close()
+        return asyncio.run(run())
+
+    def test_win_probability(self):
+        async def scenario(service, client):
+            return await client.win_probability(self.payload), await client.stats()
+        response, stats = self.serve(scenario)
+        self.assertEqual(response["game_id"], "1")
+        self.assertEqual(response["branches"], 2000)
+        self.assertAlmostEqual(response["home_win_probability"] + response["away_win_probability"]
+                               + response["unfinished_probability"], 1.0)
+        self.assertAlmostEqual(sum(probability for _, _, probability in response["score_distribution"]), 1.0)
+        self.assertEqual(stats["served"], 1)
+        self.assertEqual(stats["cold_games"], 1)
+
+    def test_micro_batching(self):
+        mid_game = dict(self.payload, inning=9, half=2, outs=1, away_score=3, home_score=2,
+                        cur_base_runners={1: "p2"})
+
+        async def scenario(service, client):
+            first = await asyncio.gather(*[client.win_probability(self.payload) for _ in range(6)],
+                                         *[client.win_probability(mid_game, 500) for _ in range(2)])
+            await client.win_probability(mid_game)
+            return first, await client.stats()
+        responses, stats = self.serve(scenario, batch_window=0.05, latency_target=10.0)
+        self.assertEqual(stats["served"], 9)
+        self.assertLess(stats["batches"], 9)
+        # identical requests in a batch share one simulation, and the game's tables were only built once
+        self.assertLess(stats["simulations"], 9)
+        self.assertEqual(stats["cold_games"], 1)
+        self.assertEqual(responses[-1]["branches"], 500)
+        self.assertGreaterEqual(responses[-1]["expected_remaining_runs"]["home"], 0.0)
+
+    def test_bad_requests(self):
+        async def scenario(service, client):
+            with self.assertRaises(ValueError):
+                await client.win_probability({"game_id": "1"})
+            with self.assertRaises(ValueError):
+                await client.win_probability(self.payload, branches=0)
+            return await client.request("GET", "/nowhere")
+        status, _ = self.serve(scenario)
+        self.assertEqual(status, 404)
+
+    def test_bad_payload_fails_alone(self):
+        broken = dict(self.payload, game_id="broken")
+
+        async def scenario(service, client):
+            simulator = service._simulator
+
+            def failing_simulator(game_state):
+                if game_state.game_id == "broken":
+                    raise RuntimeError("simulator failed")
+                return simulator(game_state)
+            service._simulator = failing_simulator
+            requests = [dict(self.payload, cur_base_runners=[]), dict(self.payload, outs=5),
+                        dict(self.payload, balls=-1), broken, self.payload]
+            return await asyncio.gather(*[client.request("POST", "/win-probability", payload)
+                                          for payload in requests]), await client.stats()
+        responses, stats = self.serve(scenario, batch_window=0.05, latency_target=10.0)
+        self.assertEqual([status for status, _ in responses], [400, 400, 400, 500, 200])
+        self.assertIn("outs must be between 0 and 2", responses[1][1]["error"])
+        self.assertIn("simulator failed", responses[3][1]["error"])
+        self.assertEqual(stats["batches"], 1)
+        self.assertEqual(stats["failed"], 4)
+
+    def test_load_shedding(self):
+        async def scenario(service, client):
+            with self.assertRaises(Overloaded):
+                await client.win_probability(self.payload)
+            return await client.stats()
+        stats = self.serve(scenario, latency_target=0.0, batch_window=0.01)
+        self.assertEqual(stats["shed"], 1)
+        stats = self.serve(scenario, max_queue=0)
+        self.assertEqual(stats["rejected"], 1)
+
+    def test_unix_socket(self):
+        async def scenario(service, client):
+            return await client.win_probability(self.payload, 100)
+        with tempfile.TemporaryDirectory() as directory:
+            response = self.serve(scenario, unix_path=os.path.join(directory, "odds.sock"))
+        self.assertEqual(response["branches"], 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
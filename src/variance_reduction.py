@@ -0,0 +1,269 @@
+from typing import Any, List, Optional, Sequence, Tuple
+import math
+import warnings
+
+import numpy as np
+
+from src.rng import GameKey, ReplicaUniforms, RngStreams, UniformStream
+from src.running_stats import RunningStats
+
+# how replicas draw their uniforms
+INDEPENDENT = "independent"
+# replica 2k + 1 replays replica 2k's draws as 1 - u
+ANTITHETIC = "antithetic"
+# the first draws of each replica come from a randomly scrambled Sobol sequence
+SOBOL = "sobol"
+SAMPLING_MODES = [INDEPENDENT, ANTITHETIC, SOBOL]
+
+# draws per replica taken from the Sobol sequence before falling back to pseudo random uniforms
+DEFAULT_SOBOL_DIMENSIONS = 128
+# independent scrambles, their spread is what estimates the error of a quasi random run
+DEFAULT_SOBOL_BATCHES = 8
+
+
+def check_sampling(sampling: str) -> None:
+    if sampling not in SAMPLING_MODES:
+        raise ValueError(f"Unknown sampling mode {sampling}, expected one of {SAMPLING_MODES}")
+
+
+def key_replicas(replicas: np.ndarray, sampling: str) -> np.ndarray:
+    """The replica whose random stream each replica draws from, antithetic pairs share the first one's"""
+    replicas = np.asarray(replicas, dtype=np.int64)
+    return replicas - replicas % 2 if sampling == ANTITHETIC else replicas
+
+
+def sobol_points(
+    replicas: np.ndarray,
+    dimensions: int = DEFAULT_SOBOL_DIMENSIONS,
+    batches: int = DEFAULT_SOBOL_BATCHES,
+    seed: int = 0,
+) -> np.ndarray:
+    """[replica, dimension] scrambled Sobol points.
+
+    Replica r belongs to scramble r % batches and takes point r // batches of it, so any prefix of the replicas
+    spreads evenly over the scrambles.  Each scramble is an independent randomization of the same sequence,
+    which keeps every point uniform and lets batch_estimate measure the error from the spread between them.
+    """
+    # scipy comes with sklearn, it is only imported when quasi random sampling is asked for
+    from scipy.stats import qmc
+    replicas = np.asarray(replicas, dtype=np.int64)
+    points = np.zeros((len(replicas), dimensions))
+    if len(replicas) == 0:
+        return points
+    positions = replicas // batches
+    length = int(positions.max()) + 1
+    for batch in range(batches):
+        rows = np.flatnonzero(replicas % batches == batch)
+        if len(rows) == 0:
+            continue
+        sampler = qmc.Sobol(dimensions, scramble=True, seed=np.random.default_rng([seed, batch]))
+        with warnings.catch_warnings():
+            # balance is only guaranteed for powers of two, a prefix of the sequence is still a fine sample
+            warnings.simplefilter("ignore", UserWarning)
+            sequence = sampler.random(length)
+        points[rows] = sequence[positions[rows]]
+    return points
+
+
+class QuasiRandomUniforms(object):
+    def __init__(self, points: np.ndarray, fallback: ReplicaUniforms) -> None:
+        """ReplicaUniforms for the vectorized engines whose first draws come from per replica Sobol points"""
+        self.points = points
+        self.dimensions = points.shape[1]
+        self.fallback = fallback
+        self.counters = np.zeros(len(points), dtype=np.int64)
+
+    def draw(self, rows: np.ndarray) -> np.ndarray:
+        counters = self.counters[rows]
+        self.counters[rows] = counters + 1
+        quasi = counters < self.dimensions
+        uniforms = np.empty(len(rows))
+        uniforms[quasi] = self.points[rows[quasi], counters[quasi]]
+        if not quasi.all():
+            uniforms[~quasi] = self.fallback.draw(rows[~quasi])
+        return uniforms
+
+
+def replica_uniforms(
+    streams: RngStreams,
+    games: Sequence[Tuple[int, int, GameKey]],
+    game: np.ndarray,
+    replicas: np.ndarray,
+    sampling: str = INDEPENDENT,
+    dimensions: int = DEFAULT_SOBOL_DIMENSIONS,
+    batches: int = DEFAULT_SOBOL_BATCHES,
+) -> Any:
+    """Uniforms for the vectorized engines, row i is replica replicas[i] of the game (season, day, game id)
+    games[game[i]], drawn the sampling way.
+
+    Runs given the same streams and game ids draw common random numbers, replica k of one sees what replica k
+    of the other does, which is what makes comparing them cheap.
+    """
+    check_sampling(sampling)
+    replicas = np.asarray(replicas, dtype=np.int64)
+    keys = np.zeros(len(replicas), dtype=np.uint64)
+    points = np.zeros((len(replicas), dimensions)) if sampling == SOBOL else None
+    for index, (season, day, game_id) in enumerate(games):
+        rows = np.flatnonzero(game == index)
+        keys[rows] = streams.replica_keys(season, day, game_id, key_replicas(replicas[rows], sampling))
+        if points is not None:
+            seed = int(streams.seed_sequence(season, day, game_id).generate_state(1)[0])
+            points[rows] = sobol_points(replicas[rows], dimensions, batches, seed)
+    if sampling == ANTITHETIC:
+        return ReplicaUniforms(keys, replicas % 2 == 1)
+    if points is not None:
+        return QuasiRandomUniforms(points, ReplicaUniforms(keys))
+    return ReplicaUniforms(keys)
+
+
+class AntitheticStream(object):
+    def __init__(self, stream: Any) -> None:
+        """1 - u for every draw of stream, the partner of a replica that draws from stream itself"""
+        self.stream = stream
+
+    def random(self) -> float:
+        return 1.0 - self.stream.random()
+
+
+class QuasiRandomStream(object):
+    def __init__(self, point: Sequence[float], fallback: Any) -> None:
+        """The coordinates of a Sobol point one draw at a time, then the draws of fallback"""
+        self.point: List[float] = list(point)
+        self.fallback = fallback
+        self._index = 0
+
+    def random(self) -> float:
+        if self._index < len(self.point):
+            value = self.point[self._index]
+            self._index += 1
+            return value
+        return self.fallback.random()
+
+
+def replica_stream(
+    streams: RngStreams,
+    season: int,
+    day: int,
+    game_id: GameKey,
+    replica: int,
+    sampling: str = INDEPENDENT,
+    points: Optional[np.ndarray] = None,
+) -> Any:
+    """A random() source for one replica of the scalar engines, points are the game's sobol_points when the
+    sampling is SOBOL"""
+    check_sampling(sampling)
+    if sampling == ANTITHETIC:
+        stream = streams.uniform_stream(season, day, game_id, replica - replica % 2)
+        return AntitheticStream(stream) if replica % 2 else stream
+    stream: UniformStream = streams.uniform_stream(season, day, game_id, replica)
+    if sampling == SOBOL:
+        return QuasiRandomStream(points[replica], stream)
+    return stream
+
+
+class VarianceEstimate(object):
+    def __init__(self, estimate: float, variance: float, naive_variance: float, samples: int) -> None:
+        """A Monte Carlo estimate with the variance of the estimator the sampling achieved and the variance the
+        same number of independent samples would have had"""
+        self.estimate = estimate
+        self.variance = variance
+        self.naive_variance = naive_variance
+        self.samples = samples
+
+    @property
+    def std_error(self) -> float:
+        return math.sqrt(self.variance)
+
+    @property
+    def variance_reduction(self) -> float:
+        """How many times fewer replicas the sampling needs for the same precision as independent sampling"""
+        if self.variance == 0.0:
+            return 1.0 if self.naive_variance == 0.0 else math.inf
+        return self.naive_variance / self.variance
+
+    def __repr__(self) -> str:
+        return (f"VarianceEstimate({self.estimate:.4f} +/- {self.std_error:.4f}, "
+                f"{self.variance_reduction:.2f}x variance reduction over {self.samples} samples)")
+
+
+def _variance_of_mean(values: np.ndarray) -> float:
+    return float(values.var(ddof=1)) / len(values) if len(values) > 1 else math.inf
+
+
+def independent_estimate(values: Sequence[float]) -> VarianceEstimate:
+    values = np.asarray(values, dtype=np.float64)
+    variance = _variance_of_mean(values)
+    return VarianceEstimate(float(values.mean()), variance, variance, len(values))
+
+
+def antithetic_estimate(values: Sequence[float]) -> VarianceEstimate:
+    """Estimate from antithetic replicas in pair order, an unpaired last replica is left out"""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[:len(values) - len(values) % 2]
+    pairs = values.reshape(-1, 2).mean(axis=1)
+    return VarianceEstimate(float(values.mean()), _variance_of_mean(pairs), _variance_of_mean(values), len(values))
+
+
+def batch_estimate(values: Sequence[float], batches: int = DEFAULT_SOBOL_BATCHES) -> VarianceEstimate:
+    """Estimate from quasi random replicas, replica r in scramble r % batches as sobol_points lays them out"""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[:len(values) - len(values) % batches]
+    means = values.reshape(-1, batches).mean(axis=0)
+    return VarianceEstimate(float(values.mean()), _variance_of_mean(means), _variance_of_mean(values), len(values))
+
+
+def sampling_estimate(values: Sequence[float], sampling: str, batches: int = DEFAULT_SOBOL_BATCHES) -> VarianceEstimate:
+    check_sampling(sampling)
+    if sampling == ANTITHETIC:
+        return antithetic_estimate(values)
+    if sampling == SOBOL:
+        return batch_estimate(values, batches)
+    return independent_estimate(values)
+
+
+def common_random_numbers_estimate(first: Sequence[float], second: Sequence[float]) -> VarianceEstimate:
+    """Estimate of mean(first) - mean(second) from replicas run on common random numbers, replica i of both
+    runs drawing from the same stream"""
+    first = np.asarray(first, dtype=np.float64)
+    second = np.asarray(second, dtype=np.float64)
+    if len(first) != len(second):
+        raise ValueError(f"Common random number runs need the same replicas, got {len(first)} and {len(second)}")
+    naive = _variance_of_mean(first) + _variance_of_mean(second)
+    return VarianceEstimate(float(first.mean() - second.mean()), _variance_of_mean(first - second), naive, len(first))
+
+
+class SamplingAccumulator(object):
+    def __init__(self, sampling: str, batches: int = DEFAULT_SOBOL_BATCHES) -> None:
+        """sampling_estimate one replica at a time, in memory that does not grow with the replicas.
+
+        Replicas are folded in by group, antithetic pairs or one replica from every Sobol scramble, and an
+        unfinished last group is left out just as the array estimators leave it out.
+        """
+        check_sampling(sampling)
+        self.sampling = sampling
+        self.group_size = {ANTITHETIC: 2, SOBOL: batches}.get(sampling, 1)
+        self.values = RunningStats()
+        # pair means for antithetic sampling, replicas for independent sampling
+        self.groups = RunningStats()
+        self.batches = [RunningStats() for _ in range(batches)] if sampling == SOBOL else []
+        self._pending: List[float] = []
+
+    def update(self, value: float) -> None:
+        self._pending.append(value)
+        if len(self._pending) < self.group_size:
+            return
+        for index, pending in enumerate(self._pending):
+            self.values.update(pending)
+            if self.batches:
+                self.batches[index].update(pending)
+        self.groups.update(sum(self._pending) / self.group_size)
+        self._pending = []
+
+    def estimate(self) -> VarianceEstimate:
+        if self.batches:
+            means = np.array([batch.mean for batch in self.batches]) if self.values.count else np.zeros(0)
+            variance = _variance_of_mean(means)
+        else:
+            variance = self.groups.variance / self.groups.count if self.groups.count > 1 else math.inf
+        naive = self.values.variance / self.values.count if self.values.count > 1 else math.inf
+        return VarianceEstimate(self.values.mean, variance, naive, self.values.count)
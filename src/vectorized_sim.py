@@ -0,0 +1,493 @@
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from src.common import MachineLearnedModel as Ml
+from src.common import PitchEventTeamBuff, team_pitch_event_map
+from src.game_state import BASE_INSTINCT_PRIORS, BATTER_MODELS, CHARM_TRIGGER_PERCENTAGE, RUNNER_MODELS
+from src.game_state import GameState, InningHalf
+from src.rng import GameKey, RngStreams
+from src.team_state import TeamState
+from src.variance_reduction import INDEPENDENT, replica_uniforms
+
+AWAY = 0
+HOME = 1
+EMPTY = -1
+
+
+class MatchupTables(object):
+    def __init__(self, game_state: GameState) -> None:
+        """Dense outcome tables for both sides of one game, plus the game state to start replicas from.
+
+        Every table is indexed [batting side, lineup slot, outcome] where side 0 is the away team, slot is the
+        0 based lineup position and the outcome axis holds cumulative probabilities, so a categorical draw is
+        a single comparison against a uniform.  The tables are read out of the GameState probability tables,
+        so any stand-in models registered with the game are honored.
+        """
+        game_state.precompute_probability_tables()
+        self.game_id: str = game_state.game_id
+        self.season: int = game_state.season
+        self.day: int = game_state.day
+        teams: List[TeamState] = [game_state.away_team, game_state.home_team]
+        self.lineups: List[List[str]] = [[team.lineup[pos] for pos in sorted(team.lineup.keys())] for team in teams]
+        self.lineup_len = np.array([len(lineup) for lineup in self.lineups], dtype=np.int64)
+        self.team_ids: List[str] = [team.team_id for team in teams]
+        self.pitchers: List[str] = [team.starting_pitcher for team in teams]
+        self.num_bases = np.array([team.num_bases for team in teams], dtype=np.int64)
+        self.balls_for_walk = np.array([team.balls_for_walk for team in teams], dtype=np.int64)
+        self.strikes_for_out = np.array([team.strikes_for_out for team in teams], dtype=np.int64)
+        self.outs_for_inning = np.array([team.outs_for_inning for team in teams], dtype=np.int64)
+
+        self.tables: Dict[Ml, List[np.ndarray]] = {}
+        for model in BATTER_MODELS + RUNNER_MODELS:
+            self.tables[model] = []
+            for side in [AWAY, HOME]:
+                pitching = teams[1 - side]
+                rows = [
+                    game_state.probability_tables[(model, player_id, pitching.starting_pitcher, pitching.team_id)]
+                    for player_id in self.lineups[side]
+                ]
+                self.tables[model].append(np.cumsum(np.array(rows, dtype=np.float64), axis=1))
+
+        # Team buffs, mirroring the checks GameState makes before and during each pitch
+        self.o_no: List[np.ndarray] = []
+        self.base_instincts: List[np.ndarray] = []
+        self.charm_walk: List[np.ndarray] = []
+        self.charm_pitching_team = np.zeros(2, dtype=bool)
+        self.charm_pitcher = np.zeros(2, dtype=bool)
+        for side in [AWAY, HOME]:
+            team = teams[side]
+            o_no = np.zeros(len(self.lineups[side]), dtype=bool)
+            base_instincts = np.zeros(len(self.lineups[side]), dtype=bool)
+            charm_walk = np.zeros(len(self.lineups[side]), dtype=bool)
+            if team.team_enum in team_pitch_event_map:
+                event, start_season, end_season, req_blood = team_pitch_event_map[team.team_enum]
+                if game_state.check_valid_season(start_season, end_season):
+                    for slot, player_id in enumerate(self.lineups[side]):
+                        has_blood = team.blood.get(player_id) == req_blood
+                        o_no[slot] = has_blood and event == PitchEventTeamBuff.O_NO
+                        base_instincts[slot] = has_blood and event == PitchEventTeamBuff.BASE_INSTINCTS
+                        charm_walk[slot] = has_blood and event == PitchEventTeamBuff.CHARM
+                    if event == PitchEventTeamBuff.CHARM:
+                        self.charm_pitching_team[side] = True
+                        self.charm_pitcher[side] = team.blood.get(team.starting_pitcher) == req_blood
+            self.o_no.append(o_no)
+            self.base_instincts.append(base_instincts)
+            self.charm_walk.append(charm_walk)
+
+        # Base instincts priors as (bases to walk, cumulative probability) checked from the furthest base down
+        self.base_instinct_priors: List[List[List[float]]] = []
+        for side in [AWAY, HOME]:
+            priors = BASE_INSTINCT_PRIORS.get(int(self.num_bases[side]), {})
+            total = 0.0
+            cumulative = []
+            for num_base in reversed(sorted(priors.keys())):
+                total += priors[num_base]
+                cumulative.append([num_base, total])
+            self.base_instinct_priors.append(cumulative)
+
+        self.set_start(game_state)
+
+    def same_roster(self, game_state: GameState) -> bool:
+        """True when the tables still describe the game, so set_start is all it takes to follow it"""
+        teams = [game_state.away_team, game_state.home_team]
+        return (
+            [team.team_id for team in teams] == self.team_ids
+            and [team.starting_pitcher for team in teams] == self.pitchers
+            and [[team.lineup[pos] for pos in sorted(team.lineup.keys())] for team in teams] == self.lineups
+        )
+
+    def set_start(self, game_state: GameState) -> None:
+        """Capture where replicas start from, which is the beginning of the game for a freshly reset GameState"""
+        teams: List[TeamState] = [game_state.away_team, game_state.home_team]
+        self.start_inning: int = game_state.inning
+        self.start_half: int = AWAY if game_state.half == InningHalf.TOP else HOME
+        self.start_outs: int = game_state.outs
+        self.start_balls: int = game_state.balls
+        self.start_strikes: int = game_state.strikes
+        self.start_score = np.array([game_state.away_score, game_state.home_score], dtype=np.int64)
+        self.start_pos = np.array([team.cur_batter_pos - 1 for team in teams], dtype=np.int64)
+        self.start_game_over: bool = game_state.is_game_over
+        self.start_runners: Dict[int, int] = {}
+        batting_lineup = self.lineups[self.start_half]
+        for base, runner_id in game_state.cur_base_runners.items():
+            if runner_id not in batting_lineup:
+                raise ValueError(f"Base runner {runner_id} is not in the batting lineup")
+            self.start_runners[int(base)] = batting_lineup.index(runner_id)
+
+
+class ReplicaResults(object):
+    def __init__(
+        self,
+        game: np.ndarray,
+        away_score: np.ndarray,
+        home_score: np.ndarray,
+        innings: np.ndarray,
+        away_strikeouts: np.ndarray,
+        home_strikeouts: np.ndarray,
+    ) -> None:
+        """Final outcome of every replica, one entry per replica; game is the index of its matchup"""
+        self.game = game
+        self.away_score = away_score
+        self.home_score = home_score
+        self.innings = innings
+        self.away_strikeouts = away_strikeouts
+        self.home_strikeouts = home_strikeouts
+
+    def for_game(self, game: int) -> "ReplicaResults":
+        mask = self.game == game
+        return ReplicaResults(
+            self.game[mask],
+            self.away_score[mask],
+            self.home_score[mask],
+            self.innings[mask],
+            self.away_strikeouts[mask],
+            self.home_strikeouts[mask],
+        )
+
+    def home_win_probability(self) -> float:
+        return float(np.mean(self.home_score > self.away_score))
+
+    def __len__(self) -> int:
+        return len(self.game)
+
+
+class VectorizedGameSim(object):
+    def __init__(
+        self,
+        matchups: List[MatchupTables],
+        replicas: int,
+        rng: Optional[np.random.Generator] = None,
+        streams: Optional[RngStreams] = None,
+        replica_offset: int = 0,
+        sampling: str = INDEPENDENT,
+        common_key: Optional[GameKey] = None,
+    ) -> None:
+        """Simulate many replicas of one or more games in lockstep.
+
+        The state of every replica lives in flat arrays (struct of arrays) and each call to step advances all
+        unfinished replicas through one iteration of the GameState.simulate_game loop: a stolen base check,
+        then a pitch if nobody ran, then the end of inning check.  Replicas are masked out as their game ends.
+
+        Draws come from rng by default.  With streams every replica gets its own counter based stream keyed by
+        (season, day, game_id, replica index), so replica k of a game plays out the same whether it is run
+        alone (replicas=1, replica_offset=k) or as part of a large batch.  sampling picks a variance reduction
+        mode from src.variance_reduction, and common_key keys every game's streams by it instead of its game
+        id, so sims of different matchups or models given the same common_key draw common random numbers.
+        """
+        self.matchups = matchups
+        self.replicas = replicas
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.n = len(matchups) * replicas
+        self.game = np.repeat(np.arange(len(matchups), dtype=np.int64), replicas)
+        self.replica_index = np.tile(np.arange(replica_offset, replica_offset + replicas, dtype=np.int64),
+                                     len(matchups))
+        self.replica_uniforms: Optional[Any] = None
+        if streams is None and (sampling != INDEPENDENT or common_key is not None):
+            streams = RngStreams(int(self.rng.integers(2 ** 63)))
+        if streams is not None:
+            games = [(m.season, m.day, m.game_id if common_key is None else common_key) for m in matchups]
+            self.replica_uniforms = replica_uniforms(streams, games, self.game, self.replica_index, sampling)
+
+        max_slots = max(int(m.lineup_len.max()) for m in matchups)
+        self.max_bases = max(int(m.num_bases.max()) for m in matchups)
+        # [game, side, slot, outcome], short lineups are padded with their last row which is never indexed
+        self.tables: Dict[Ml, np.ndarray] = {}
+        for model in BATTER_MODELS + RUNNER_MODELS:
+            self.tables[model] = np.stack([
+                np.stack([self._pad(m.tables[model][side], max_slots) for side in [AWAY, HOME]]) for m in matchups
+            ])
+        self.o_no = np.stack([np.stack([self._pad(m.o_no[s], max_slots) for s in [AWAY, HOME]]) for m in matchups])
+        self.base_instincts = np.stack([
+            np.stack([self._pad(m.base_instincts[s], max_slots) for s in [AWAY, HOME]]) for m in matchups
+        ])
+        self.charm_walk = np.stack([
+            np.stack([self._pad(m.charm_walk[s], max_slots) for s in [AWAY, HOME]]) for m in matchups
+        ])
+        self.charm_pitching_team = np.stack([m.charm_pitching_team for m in matchups])
+        self.charm_pitcher = np.stack([m.charm_pitcher for m in matchups])
+        self.lineup_len = np.stack([m.lineup_len for m in matchups])
+        self.num_bases = np.stack([m.num_bases for m in matchups])
+        self.balls_for_walk = np.stack([m.balls_for_walk for m in matchups])
+        self.strikes_for_out = np.stack([m.strikes_for_out for m in matchups])
+        self.outs_for_inning = np.stack([m.outs_for_inning for m in matchups])
+        max_priors = max(len(priors) for m in matchups for priors in m.base_instinct_priors) or 1
+        # [game, side, prior, (bases, cumulative probability)], padding can never trigger
+        self.base_instinct_priors = np.zeros((len(matchups), 2, max_priors, 2), dtype=np.float64)
+        self.base_instinct_priors[:, :, :, 1] = -1.0
+        for g, m in enumerate(matchups):
+            for side in [AWAY, HOME]:
+                for i, (num_base, cumulative) in enumerate(m.base_instinct_priors[side]):
+                    self.base_instinct_priors[g, side, i] = [num_base, cumulative]
+        self.reset()
+
+    @classmethod
+    def _pad(cls, table: np.ndarray, length: int) -> np.ndarray:
+        if len(table) == length:
+            return table
+        padding = np.repeat(table[-1:], length - len(table), axis=0)
+        return np.concatenate([table, padding])
+
+    def reset(self) -> None:
+        """Put every replica back at the state its matchup was captured in"""
+        n = self.n
+        self.inning = np.array([m.start_inning for m in self.matchups], dtype=np.int64)[self.game]
+        self.half = np.array([m.start_half for m in self.matchups], dtype=np.int64)[self.game]
+        self.outs = np.array([m.start_outs for m in self.matchups], dtype=np.int64)[self.game]
+        self.balls = np.array([m.start_balls for m in self.matchups], dtype=np.int64)[self.game]
+        self.strikes = np.array([m.start_strikes for m in self.matchups], dtype=np.int64)[self.game]
+        self.score = np.stack([m.start_score for m in self.matchups])[self.game]
+        self.pos = np.stack([m.start_pos for m in self.matchups])[self.game]
+        self.strikeouts = np.zeros((n, 2), dtype=np.int64)
+        # runner lineup slot per base, columns at and beyond home are always empty
+        self.runners = np.full((n, self.max_bases + 1), EMPTY, dtype=np.int64)
+        for g, m in enumerate(self.matchups):
+            for base, slot in m.start_runners.items():
+                self.runners[self.game == g, base] = slot
+        self.done = np.array([m.start_game_over for m in self.matchups], dtype=bool)[self.game]
+
+    def run(self) -> ReplicaResults:
+        while not self.done.all():
+            self.step()
+        return self.results()
+
+    def results(self) -> ReplicaResults:
+        return ReplicaResults(
+            self.game.copy(),
+            self.score[:, AWAY].copy(),
+            self.score[:, HOME].copy(),
+            self.inning.copy(),
+            self.strikeouts[:, AWAY].copy(),
+            self.strikeouts[:, HOME].copy(),
+        )
+
+    def step(self) -> None:
+        rows = np.flatnonzero(~self.done)
+        if len(rows) == 0:
+            return
+        stole = self._stolen_base_phase(rows)
+        self._pitch_phase(rows[~stole])
+        self._advance_inning(rows)
+
+    # RANDOM DRAWS
+    def _uniforms(self, rows: np.ndarray) -> np.ndarray:
+        if self.replica_uniforms is not None:
+            return self.replica_uniforms.draw(rows)
+        return self.rng.random(len(rows))
+
+    @classmethod
+    def _categorical(cls, cumulative: np.ndarray, roll: np.ndarray) -> np.ndarray:
+        """Vectorized GameState.roll_from_probs over rows of cumulative probabilities"""
+        outcome = (roll[:, None] >= cumulative).sum(axis=1)
+        return np.minimum(outcome, cumulative.shape[1] - 1)
+
+    def _roll(self, model: Ml, rows: np.ndarray, slots: np.ndarray) -> np.ndarray:
+        roll = self._uniforms(rows)
+        return self._categorical(self.tables[model][self.game[rows], self.half[rows], slots], roll)
+
+    # PITCH MECHANICS
+    def _pitch_phase(self, rows: np.ndarray) -> None:
+        if len(rows) == 0:
+            return
+        g = self.game[rows]
+        side = self.half[rows]
+        slots = self.pos[rows, side]
+
+        # Charm pre-pitch events, both use one roll at the start of an at bat
+        start_of_at_bat = (self.balls[rows] == 0) & (self.strikes[rows] == 0)
+        charm_roll = self._uniforms(rows) < CHARM_TRIGGER_PERCENTAGE
+        charm_team = self.charm_pitching_team[g, 1 - side]
+        charm_strikeout = start_of_at_bat & charm_team & self.charm_pitcher[g, 1 - side] & charm_roll
+        charm_walk = start_of_at_bat & ~charm_team & self.charm_walk[g, side, slots] & charm_roll
+        self._strikeout(rows[charm_strikeout])
+        self._walk(rows[charm_walk], np.ones(int(charm_walk.sum()), dtype=np.int64))
+        pitched = ~(charm_strikeout | charm_walk)
+        rows, g, side, slots = rows[pitched], g[pitched], side[pitched], slots[pitched]
+
+        # 0 = ball, 1 = strike, 2 = foul, 3 = in_play
+        pitch = self._roll(Ml.PITCH, rows, slots)
+        instinct_roll = self._uniforms(rows)
+
+        ball = pitch == 0
+        self.balls[rows[ball]] += 1
+        walk = ball & (self.balls[rows] == self.balls_for_walk[g, side])
+        self._walk(rows[walk], self._base_instincts(g[walk], side[walk], slots[walk], instinct_roll[walk]))
+
+        o_no = (pitch == 1) & (self.strikes[rows] == 2) & (self.balls[rows] == 0) & self.o_no[g, side, slots]
+        strike = (pitch == 1) & ~o_no
+        self.strikes[rows[strike]] += 1
+        strikeout = strike & (self.strikes[rows] == self.strikes_for_out[g, side])
+        self._strikeout(rows[strikeout])
+
+        foul = ((pitch == 2) | o_no) & (self.strikes[rows] < self.strikes_for_out[g, side] - 1)
+        self.strikes[rows[foul]] += 1
+
+        self._in_play(rows[pitch == 3])
+
+    def _base_instincts(self, g: np.ndarray, side: np.ndarray, slots: np.ndarray, roll: np.ndarray) -> np.ndarray:
+        num_bases = np.ones(len(g), dtype=np.int64)
+        priors = self.base_instinct_priors[g, side]
+        eligible = self.base_instincts[g, side, slots]
+        decided = ~eligible
+        for i in range(priors.shape[1]):
+            hit = ~decided & (roll < priors[:, i, 1])
+            num_bases[hit] = priors[hit, i, 0].astype(np.int64)
+            decided |= hit
+        return num_bases
+
+    def _walk(self, rows: np.ndarray, num_bases_to_advance: np.ndarray) -> None:
+        if len(rows) == 0:
+            return
+        self._advance_all_runners(rows, num_bases_to_advance)
+        self.runners[rows, num_bases_to_advance] = self.pos[rows, self.half[rows]]
+        self._next_batter(rows)
+
+    def _strikeout(self, rows: np.ndarray) -> None:
+        if len(rows) == 0:
+            return
+        self.outs[rows] += 1
+        self.strikeouts[rows, self.half[rows]] += 1
+        self._next_batter(rows)
+
+    def _next_batter(self, rows: np.ndarray) -> None:
+        side = self.half[rows]
+        self.balls[rows] = 0
+        self.strikes[rows] = 0
+        self.pos[rows, side] = (self.pos[rows, side] + 1) % self.lineup_len[self.game[rows], side]
+
+    # HIT MECHANICS
+    def _in_play(self, rows: np.ndarray) -> None:
+        if len(rows) == 0:
+            return
+        g = self.game[rows]
+        side = self.half[rows]
+        slots = self.pos[rows, side]
+        # 0 = Flyout, 1 = Groundout, 2 = Hit
+        contact = self._roll(Ml.IS_HIT, rows, slots)
+        # 0 = Single, 1 = Double, 2 = Triple, 3 = HR
+        hit_type = self._roll(Ml.HIT_TYPE, rows, slots)
+
+        out = contact < 2
+        self.outs[rows[out]] += 1
+        inning_continues = out & (self.outs[rows] < self.outs_for_inning[g, side])
+        self._attempt_to_advance_runners(rows[inning_continues & (contact == 0)], Ml.RUNNER_ADV_OUT)
+        groundout = inning_continues & (contact == 1)
+        # a groundout that does not end the inning advances every runner one base, as GameState.resolve_fc_dp does
+        self._advance_all_runners(rows[groundout], np.ones(int(groundout.sum()), dtype=np.int64))
+
+        hit = (contact == 2) & (hit_type < 3)
+        hit_rows = rows[hit]
+        self._advance_all_runners(hit_rows, hit_type[hit] + 1)
+        self._attempt_to_advance_runners(hit_rows, Ml.RUNNER_ADV_HIT)
+        self.runners[hit_rows, hit_type[hit] + 1] = slots[hit]
+
+        home_run = (contact == 2) & (hit_type == 3)
+        hr_rows = rows[home_run]
+        self._advance_all_runners(hr_rows, self.num_bases[g[home_run], side[home_run]])
+        self.score[hr_rows, side[home_run]] += 1
+
+        self._next_batter(rows)
+
+    # BASE RUNNING MECHANICS
+    def _advance_all_runners(self, rows: np.ndarray, num_bases_to_advance: np.ndarray) -> None:
+        if len(rows) == 0:
+            return
+        side = self.half[rows]
+        num_bases = self.num_bases[self.game[rows], side]
+        old = self.runners[rows]
+        new = np.full_like(old, EMPTY)
+        runs = np.zeros(len(rows), dtype=np.int64)
+        for base in range(1, self.max_bases):
+            occupied = old[:, base] != EMPTY
+            new_base = base + num_bases_to_advance
+            scores = occupied & (new_base >= num_bases)
+            moves = np.flatnonzero(occupied & ~scores)
+            runs += scores
+            new[moves, new_base[moves]] = old[moves, base]
+        self.runners[rows] = new
+        self.score[rows, side] += runs
+
+    def _attempt_to_advance_runners(self, rows: np.ndarray, model: Ml) -> None:
+        """Each runner with an open base ahead, lead runner first, may take one extra base"""
+        if len(rows) == 0:
+            return
+        side = self.half[rows]
+        num_bases = self.num_bases[self.game[rows], side]
+        for base in range(self.max_bases - 1, 0, -1):
+            runner = self.runners[rows, base]
+            eligible = np.flatnonzero((runner != EMPTY) & (self.runners[rows, base + 1] == EMPTY))
+            if len(eligible) == 0:
+                continue
+            advance = eligible[self._roll(model, rows[eligible], runner[eligible]) == 1]
+            scores = advance[base >= num_bases[advance] - 1]
+            moves = advance[base < num_bases[advance] - 1]
+            self.runners[rows[moves], base + 1] = runner[moves]
+            self.runners[rows[advance], base] = EMPTY
+            self.score[rows[scores], side[scores]] += 1
+
+    # STOLEN BASE MECHANICS
+    def _stolen_base_phase(self, rows: np.ndarray) -> np.ndarray:
+        """Returns which rows had a steal attempt, those rows skip their pitch this step"""
+        side = self.half[rows]
+        num_bases = self.num_bases[self.game[rows], side]
+        attempted = np.zeros(len(rows), dtype=bool)
+        for base in range(self.max_bases - 1, 0, -1):
+            runner = self.runners[rows, base]
+            eligible = np.flatnonzero(~attempted & (runner != EMPTY) & (self.runners[rows, base + 1] == EMPTY))
+            if len(eligible) == 0:
+                continue
+            attempt = eligible[self._roll(Ml.SB_ATTEMPT, rows[eligible], runner[eligible]) == 1]
+            success = self._roll(Ml.SB_SUCCESS, rows[attempt], runner[attempt]) == 1
+            caught = attempt[~success]
+            self.outs[rows[caught]] += 1
+            scores = attempt[success & (base == num_bases[attempt] - 1)]
+            moves = attempt[success & (base < num_bases[attempt] - 1)]
+            self.runners[rows[moves], base + 1] = runner[moves]
+            self.runners[rows[attempt], base] = EMPTY
+            self.score[rows[scores], side[scores]] += 1
+            attempted[attempt] = True
+        return attempted
+
+    # INNING MECHANICS
+    def _advance_inning(self, rows: np.ndarray) -> None:
+        side = self.half[rows]
+        rows = rows[self.outs[rows] == self.outs_for_inning[self.game[rows], side]]
+        if len(rows) == 0:
+            return
+        away = self.score[rows, AWAY]
+        home = self.score[rows, HOME]
+        late = self.inning[rows] >= 9
+        top = self.half[rows] == AWAY
+        over = late & ((top & (home > away)) | (~top & (home != away)))
+        self.done[rows[over]] = True
+        rows = rows[~over]
+        self.runners[rows] = EMPTY
+        self.outs[rows] = 0
+        self.balls[rows] = 0
+        self.strikes[rows] = 0
+        self.inning[rows] += self.half[rows] == HOME
+        self.half[rows] = 1 - self.half[rows]
+
+
+def simulate_replicas(
+    game_state: GameState,
+    replicas: int,
+    rng: Optional[np.random.Generator] = None,
+    streams: Optional[RngStreams] = None,
+    replica_offset: int = 0,
+    sampling: str = INDEPENDENT,
+) -> ReplicaResults:
+    """Play out replicas copies of a game from its current state"""
+    return VectorizedGameSim([MatchupTables(game_state)], replicas, rng, streams, replica_offset, sampling).run()
+
+
+def simulate_slate(
+    game_states: List[GameState],
+    replicas: int,
+    rng: Optional[np.random.Generator] = None,
+    streams: Optional[RngStreams] = None,
+    sampling: str = INDEPENDENT,
+) -> ReplicaResults:
+    """Play out replicas copies of every game in a slate together, use ReplicaResults.for_game to split them"""
+    matchups = [MatchupTables(game_state) for game_state in game_states]
+    return VectorizedGameSim(matchups, replicas, rng, streams, sampling=sampling).run()
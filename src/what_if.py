@@ -0,0 +1,215 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.common import BlaseballStatistics as Stats
+from src.game_state import GameState
+from src.markov_solver import DEFAULT_MAX_INNINGS, DEFAULT_MAX_RUNS, HalfInningSolver
+from src.vectorized_sim import AWAY, HOME, MatchupTables
+
+# mid-inning solutions kept per simulator for situations the half-inning solutions do not reach
+MAX_MID_INNING_SOLUTIONS = 256
+
+
+class BranchResults(object):
+    def __init__(
+        self,
+        start_score: np.ndarray,
+        score: np.ndarray,
+        innings: np.ndarray,
+        half_innings: np.ndarray,
+        outs: np.ndarray,
+        unfinished: np.ndarray,
+        pitchers: List[str],
+    ) -> None:
+        """Final outcome of every branch played out from one game state.
+
+        score, half_innings and outs are [branch, side] with side 0 the away team, half_innings counts the
+        half-innings each side batted in from the start state on and outs the outs made in them.  Branches
+        still tied at the inning limit are flagged in unfinished and count as neither a win nor a loss.
+        """
+        self.start_score = start_score
+        self.score = score
+        self.innings = innings
+        self.half_innings = half_innings
+        self.outs = outs
+        self.unfinished = unfinished
+        self.pitchers = pitchers
+
+    def __len__(self) -> int:
+        return len(self.score)
+
+    def home_win_probability(self) -> float:
+        return float(np.mean(self.score[:, HOME] > self.score[:, AWAY]))
+
+    def away_win_probability(self) -> float:
+        return float(np.mean(self.score[:, AWAY] > self.score[:, HOME]))
+
+    def unfinished_probability(self) -> float:
+        return float(np.mean(self.unfinished))
+
+    def score_distribution(self) -> np.ndarray:
+        """Final score probabilities as [away runs, home runs], the layout of GameDistribution.scores"""
+        top = int(self.score.max()) + 1
+        counts = np.bincount(self.score[:, AWAY] * top + self.score[:, HOME], minlength=top * top)
+        return counts.reshape(top, top) / len(self)
+
+    def expected_scores(self) -> Tuple[float, float]:
+        away, home = self.score.mean(axis=0)
+        return float(away), float(home)
+
+    def expected_remaining_runs(self) -> Tuple[float, float]:
+        away, home = self.score.mean(axis=0) - self.start_score
+        return float(away), float(home)
+
+    def expected_remaining_stats(self) -> Dict[str, Dict[Stats, float]]:
+        """Expected stats still to come for each starting pitcher, who pitch the rest of the game in the sim"""
+        runs_allowed = self.score.mean(axis=0) - self.start_score
+        outs_recorded = self.outs.mean(axis=0)
+        stats = {}
+        for side, pitcher_id in enumerate(self.pitchers):
+            batting = 1 - side
+            stats[pitcher_id] = {
+                Stats.PITCHER_EARNED_RUNS: float(runs_allowed[batting]),
+                Stats.PITCHER_INNINGS_PITCHED: float(outs_recorded[batting]) / 3.0,
+                Stats.PITCHER_WINS: float(np.mean(self.score[:, side] > self.score[:, batting])),
+                Stats.PITCHER_LOSSES: float(np.mean(self.score[:, side] < self.score[:, batting])),
+                Stats.PITCHER_SHUTOUTS: float(np.mean(
+                    (self.score[:, batting] == 0) & (self.score[:, side] > 0) & ~self.unfinished
+                )),
+            }
+        return stats
+
+
+class BranchSimulator(object):
+    def __init__(
+        self,
+        game_state: GameState,
+        branches: int = 10000,
+        rng: Optional[np.random.Generator] = None,
+        max_runs: int = DEFAULT_MAX_RUNS,
+        max_innings: int = DEFAULT_MAX_INNINGS,
+    ) -> None:
+        """What-if continuations of a live game, for in-game odds that are asked for after every pitch.
+
+        Branches are sampled a half-inning at a time.  HalfInningSolver gives the exact joint distribution of
+        the runs a half-inning scores and the lineup slot leading off the next one, so each step is a single
+        categorical draw per branch out of a flattened [start slot, runs x next slot] cumulative table, and
+        every branch stays in lockstep on the inning.  Half-innings are independent given the leadoff slot, so
+        the branches follow the same law as playing every pitch with VectorizedGameSim.
+
+        The outcome tables and the fresh half-inning solutions are built once and reused by run while the
+        rosters and pitchers of the game are unchanged; a changed roster rebuilds them.  The first time a side
+        is asked about mid-inning, every state its half-innings can reach is solved in one pass, so the pitches
+        after it are table lookups.
+        """
+        self.branches = branches
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.max_runs = max_runs
+        self.max_innings = max_innings
+        self.matchup: Optional[MatchupTables] = None
+        self._build(game_state)
+
+    def _build(self, game_state: GameState) -> None:
+        self.matchup = MatchupTables(game_state)
+        self.solvers = [HalfInningSolver(self.matchup, side, self.max_runs) for side in [AWAY, HOME]]
+        self.lineup_len = [int(length) for length in self.matchup.lineup_len]
+        self.outs_for_inning = [int(outs) for outs in self.matchup.outs_for_inning]
+        # [side] -> cumulative [start slot, runs * lineup length + next slot], each row offset by its start slot
+        self.fresh_tables = [self._flatten([solver.solve_from_start(pos) for pos in range(length)])
+                             for solver, length in zip(self.solvers, self.lineup_len)]
+        # [side] -> (state index, [state, runs, next slot] probabilities) of every reachable mid-inning state,
+        # float32 since a table per side is kept for each warm game
+        self._half_innings: List[Optional[Tuple[Dict[Tuple, int], np.ndarray]]] = [None, None]
+        self._mid_inning: Dict[Tuple, np.ndarray] = {}
+
+    @classmethod
+    def _flatten(cls, solutions: List[np.ndarray]) -> np.ndarray:
+        """Stacked solutions as one increasing array, so a single searchsorted draws every branch's outcome"""
+        probs = np.stack(solutions).reshape(len(solutions), -1)
+        cumulative = np.cumsum(probs / probs.sum(axis=1, keepdims=True), axis=1)
+        cumulative[:, -1] = 1.0
+        return (cumulative + np.arange(len(solutions))[:, None]).ravel()
+
+    def _mid_inning_table(self, side: int, start_pos: int) -> np.ndarray:
+        matchup = self.matchup
+        solver = self.solvers[side]
+        state = solver.inning_state(start_pos, matchup.start_outs, matchup.start_balls, matchup.start_strikes,
+                                    matchup.start_runners)
+        if self._half_innings[side] is None:
+            # every half-inning is reachable from a fresh start at some slot
+            starts = [solver.inning_state(pos) for pos in range(self.lineup_len[side])] + [state]
+            index, solutions = solver.solve_reachable(starts)
+            self._half_innings[side] = index, solutions.astype(np.float32)
+        index, solutions = self._half_innings[side]
+        row = index.get(state)
+        if row is not None:
+            return self._flatten([solutions[row].astype(np.float64)])
+        # a situation the game rules here can not reach, e.g. one left by an event the sim does not model
+        key = (side, state)
+        table = self._mid_inning.get(key)
+        if table is None:
+            if len(self._mid_inning) >= MAX_MID_INNING_SOLUTIONS:
+                self._mid_inning.clear()
+            table = self._flatten([solver.solve_states([state])[0]])
+            self._mid_inning[key] = table
+        return table
+
+    def run(self, game_state: Optional[GameState] = None, branches: Optional[int] = None) -> BranchResults:
+        """Play branches continuations of game_state, or of the state the simulator was built from"""
+        if game_state is not None:
+            if self.matchup.same_roster(game_state):
+                self.matchup.set_start(game_state)
+            else:
+                self._build(game_state)
+        matchup = self.matchup
+        n = branches if branches is not None else self.branches
+        start_score = matchup.start_score.copy()
+        score = np.tile(start_score, (n, 1))
+        pos = np.tile(matchup.start_pos, (n, 1))
+        half_innings = np.zeros((n, 2), dtype=np.int64)
+        outs = np.zeros((n, 2), dtype=np.int64)
+        innings = np.full(n, matchup.start_inning, dtype=np.int64)
+        live = np.full(n, not matchup.start_game_over)
+        rows = np.flatnonzero(live)
+
+        inning, half = matchup.start_inning, matchup.start_half
+        mid_inning = (matchup.start_outs, matchup.start_balls, matchup.start_strikes, matchup.start_runners)
+        first = True
+        while len(rows) and inning <= self.max_innings:
+            length = self.lineup_len[half]
+            slots = pos[rows, half]
+            if first and mid_inning != (0, 0, 0, {}):
+                table = self._mid_inning_table(half, int(matchup.start_pos[half]))
+                offset = 0
+            else:
+                table = self.fresh_tables[half]
+                offset = slots
+            width = (self.max_runs + 1) * length
+            draw = np.searchsorted(table, self.rng.random(len(rows)) + offset, side="right")
+            outcome = np.minimum(draw - offset * width, width - 1)
+            score[rows, half] += outcome // length
+            pos[rows, half] = outcome % length
+            half_innings[rows, half] += 1
+            outs[rows, half] += self.outs_for_inning[half] - (matchup.start_outs if first else 0)
+            first = False
+            innings[rows] = inning
+            # GameState only checks for the end of the game from the 9th inning on
+            if inning >= 9:
+                away, home = score[rows, AWAY], score[rows, HOME]
+                over = home > away if half == AWAY else home != away
+                live[rows[over]] = False
+                rows = rows[~over]
+            if half == HOME:
+                inning += 1
+            half = 1 - half
+        return BranchResults(start_score, score, innings, half_innings, outs, live, list(matchup.pitchers))
+
+
+def simulate_branches(
+    game_state: GameState,
+    branches: int = 10000,
+    rng: Optional[np.random.Generator] = None,
+) -> BranchResults:
+    """Play out branches what-if continuations of a game from its current state"""
+    return BranchSimulator(game_state, branches, rng).run()
@@ -0,0 +1,468 @@
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+import numpy as np
+
+from src.common import MachineLearnedModel as Ml
+from src.game_state import GameState
+from src.inference_scheduler import BatchedInferenceScheduler
+from src.model_registry import ModelRegistry, get_model_registry
+from src.what_if import BranchResults, BranchSimulator
+
+DEFAULT_BRANCHES = 10000
+MAX_BRANCHES = 100000
+# a request still queued this long after it arrived is shed rather than answered late
+DEFAULT_LATENCY_TARGET = 0.05
+# how long the batcher holds the first request of a batch open for others to join it
+DEFAULT_BATCH_WINDOW = 0.002
+DEFAULT_MAX_BATCH_SIZE = 64
+# requests waiting beyond this are turned away on arrival
+DEFAULT_MAX_QUEUE = 256
+# warm simulators kept, least recently used games are dropped first
+DEFAULT_MAX_GAMES = 512
+MAX_BODY_BYTES = 1 << 20
+RECENT_LATENCIES = 1000
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class Overloaded(Exception):
+    """A request the service shed instead of answering past its latency target"""
+
+
+class PendingRequest(object):
+    def __init__(self, payload: Dict[str, Any], branches: int, future: asyncio.Future) -> None:
+        self.payload = payload
+        self.branches = branches
+        self.future = future
+        self.arrived = time.monotonic()
+
+
+def check_game_state(game_state: GameState) -> None:
+    """Raise ValueError for a game state no game can be in, the branches would be played from nonsense"""
+    if game_state.inning < 1:
+        raise ValueError(f"inning must be at least 1, got {game_state.inning}")
+    for name, value, limit in [("outs", game_state.outs, game_state.outs_for_inning),
+                               ("balls", game_state.balls, game_state.balls_for_walk),
+                               ("strikes", game_state.strikes, game_state.strikes_for_out)]:
+        if not 0 <= value < limit:
+            raise ValueError(f"{name} must be between 0 and {limit - 1}, got {value}")
+    if game_state.away_score < 0 or game_state.home_score < 0:
+        raise ValueError(f"scores can not be negative, got {game_state.away_score}-{game_state.home_score}")
+
+
+def branch_summary(game_state: GameState, results: BranchResults) -> Dict[str, Any]:
+    """The response body for one game, the score distribution is sparse [away runs, home runs, probability]"""
+    distribution = results.score_distribution()
+    away_runs, home_runs = np.nonzero(distribution)
+    expected_away, expected_home = results.expected_scores()
+    remaining_away, remaining_home = results.expected_remaining_runs()
+    return {
+        "game_id": game_state.game_id,
+        "branches": len(results),
+        "home_win_probability": results.home_win_probability(),
+        "away_win_probability": results.away_win_probability(),
+        "unfinished_probability": results.unfinished_probability(),
+        "expected_scores": {"away": expected_away, "home": expected_home},
+        "expected_remaining_runs": {"away": remaining_away, "home": remaining_home},
+        "score_distribution": [[int(away), int(home), float(distribution[away, home])]
+                               for away, home in zip(away_runs, home_runs)],
+    }
+
+
+class WinProbabilityService(object):
+    def __init__(
+        self,
+        model_registry: Optional[ModelRegistry] = None,
+        branches: int = DEFAULT_BRANCHES,
+        latency_target: float = DEFAULT_LATENCY_TARGET,
+        batch_window: float = DEFAULT_BATCH_WINDOW,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        max_games: int = DEFAULT_MAX_GAMES,
+        rng: Optional[np.random.Generator] = None,
+    ) -> None:
+        """Long running win probability service for live games, served over HTTP on TCP or a Unix socket.
+
+        Requests carry a game state in the GameState.to_dict schema and are answered with what-if branches from
+        src.what_if.  The models stay loaded in model_registry and a BranchSimulator is kept warm per game, so
+        a request for a game already seen only pays for sampling its branches.
+
+        Requests are micro-batched: the first request to arrive holds a batch open for batch_window, or until
+        max_batch_size requests have joined.  Within a batch identical requests are simulated once, and the
+        probability tables of every game without a warm simulator are filled together, one predict_proba call
+        per model.  Batches run one at a time on a worker thread so the event loop keeps accepting.
+
+        Load is shed in two places: a request arriving with max_queue requests already waiting is refused, and
+        a request that waited past latency_target before its batch started is dropped unanswered.  Both come
+        back as 503 with Retry-After.
+        """
+        self.model_registry: ModelRegistry = model_registry or get_model_registry()
+        self.branches = branches
+        self.latency_target = latency_target
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.max_queue = max_queue
+        self.max_games = max_games
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.scheduler = BatchedInferenceScheduler()
+        # (season, day, game id) -> warm simulator
+        self.simulators: "OrderedDict[Tuple[int, int, str], BranchSimulator]" = OrderedDict()
+        self.queue: Optional[asyncio.Queue] = None
+        self._batcher: Optional[asyncio.Task] = None
+        self._servers: List[asyncio.AbstractServer] = []
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self.counters: Dict[str, int] = {"served": 0, "shed": 0, "rejected": 0, "failed": 0, "batches": 0,
+                                         "simulations": 0, "cold_games": 0}
+        self.latencies: Deque[float] = deque(maxlen=RECENT_LATENCIES)
+
+    def preload(self) -> None:
+        """Load every model now rather than on the first request"""
+        for model in Ml:
+            self.model_registry.get(model)
+
+    async def start(self, host: Optional[str] = None, port: int = 0, unix_path: Optional[str] = None) -> None:
+        """Start the batcher and listen on host:port, on unix_path, or on both"""
+        self.queue = asyncio.Queue()
+        self._batcher = asyncio.create_task(self._run_batches())
+        if unix_path is not None:
+            self._servers.append(await asyncio.start_unix_server(self._handle, path=unix_path))
+        if host is not None or unix_path is None:
+            self._servers.append(await asyncio.start_server(self._handle, host or "127.0.0.1", port))
+
+    @property
+    def port(self) -> Optional[int]:
+        """The TCP port being served, useful after starting on port 0"""
+        for server in self._servers:
+            for sock in server.sockets:
+                address = sock.getsockname()
+                if isinstance(address, tuple):
+                    return address[1]
+        return None
+
+    async def serve_forever(self) -> None:
+        await asyncio.gather(*[server.serve_forever() for server in self._servers])
+
+    async def close(self) -> None:
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers = []
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+            self._batcher = None
+        self._executor.shutdown(wait=True)
+
+    # REQUESTS
+    async def submit(self, payload: Dict[str, Any], branches: Optional[int] = None) -> Dict[str, Any]:
+        """Queue a game state for the next batch and wait for its answer.
+
+        Raises Overloaded when the request is shed and ValueError when the payload is not a game state.
+        """
+        if self.queue.qsize() >= self.max_queue:
+            self.counters["rejected"] += 1
+            raise Overloaded(f"{self.queue.qsize()} requests already queued")
+        branches = self.branches if branches is None else branches
+        if not 0 < branches <= MAX_BRANCHES:
+            raise ValueError(f"branches must be between 1 and {MAX_BRANCHES}, got {branches}")
+        request = PendingRequest(payload, branches, asyncio.get_running_loop().create_future())
+        self.queue.put_nowait(request)
+        result = await request.future
+        self.latencies.append(time.monotonic() - request.arrived)
+        return result
+
+    async def _next_batch(self) -> List[PendingRequest]:
+        batch = [await self.queue.get()]
+        closes = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = closes - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        while len(batch) < self.max_batch_size and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _run_batches(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            now = time.monotonic()
+            live = []
+            for request in batch:
+                if request.future.done():
+                    continue
+                if now - request.arrived > self.latency_target:
+                    self.counters["shed"] += 1
+                    request.future.set_exception(Overloaded(
+                        f"queued {1000 * (now - request.arrived):.1f}ms, past the "
+                        f"{1000 * self.latency_target:.0f}ms target"
+                    ))
+                else:
+                    live.append(request)
+            if not live:
+                continue
+            self.counters["batches"] += 1
+            try:
+                outcomes = await loop.run_in_executor(self._executor, self.answer_batch,
+                                                      [(request.payload, request.branches) for request in live])
+            except Exception as e:
+                logging.exception("Win probability batch failed")
+                outcomes = [e] * len(live)
+            for request, outcome in zip(live, outcomes):
+                if request.future.done():
+                    continue
+                if isinstance(outcome, Exception):
+                    self.counters["failed"] += 1
+                    request.future.set_exception(outcome)
+                else:
+                    self.counters["served"] += 1
+                    request.future.set_result(outcome)
+
+    def answer_batch(self, requests: List[Tuple[Dict[str, Any], int]]) -> List[Any]:
+        """Answer a batch of (game state payload, branches), an answer is a response body or the exception
+        answering it raised, a ValueError for a payload that is not a valid game state.  A failing game only
+        fails its own requests.  Identical requests in the batch are simulated once."""
+        unique: Dict[Tuple[str, int], int] = {}
+        games: List[Any] = []
+        order: List[int] = []
+        for payload, branches in requests:
+            key = (json.dumps(payload, sort_keys=True), branches)
+            if key not in unique:
+                unique[key] = len(games)
+                try:
+                    game_state = GameState.from_config(payload, self.model_registry)
+                    check_game_state(game_state)
+                    games.append((game_state, branches))
+                except Exception as e:
+                    games.append(ValueError(f"Not a game state: {e!r}"))
+            order.append(unique[key])
+
+        # one game state per game lacking a warm simulator, the rest of the batch reuses the one it builds
+        cold: Dict[Tuple[int, int, str], GameState] = {}
+        for game in games:
+            if isinstance(game, Exception):
+                continue
+            game_state, _ = game
+            key = self._game_key(game_state)
+            simulator = self.simulators.get(key)
+            if key not in cold and (simulator is None or not simulator.matchup.same_roster(game_state)):
+                cold[key] = game_state
+        if cold:
+            # one predict_proba call per model for every game that needs its tables
+            try:
+                self.scheduler.precompute_probability_tables(list(cold.values()))
+            except Exception:
+                # each game fills its own tables when its simulator is built, so a bad one only fails itself
+                logging.exception("Batched probability tables failed, filling them per game")
+            self.counters["cold_games"] += len(cold)
+
+        answers: List[Any] = []
+        for game in games:
+            if isinstance(game, Exception):
+                answers.append(game)
+                continue
+            game_state, branches = game
+            try:
+                answers.append(branch_summary(game_state, self._simulator(game_state).run(game_state, branches)))
+            except Exception as e:
+                logging.exception(f"Win probability for game {game_state.game_id} failed")
+                answers.append(e)
+            self.counters["simulations"] += 1
+        return [answers[index] for index in order]
+
+    @classmethod
+    def _game_key(cls, game_state: GameState) -> Tuple[int, int, str]:
+        return game_state.season, game_state.day, game_state.game_id
+
+    def _simulator(self, game_state: GameState) -> BranchSimulator:
+        key = self._game_key(game_state)
+        simulator = self.simulators.get(key)
+        if simulator is None:
+            simulator = BranchSimulator(game_state, self.branches, self.rng)
+            self.simulators[key] = simulator
+            while len(self.simulators) > self.max_games:
+                self.simulators.popitem(last=False)
+        self.simulators.move_to_end(key)
+        return simulator
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = np.array(self.latencies) * 1000.0
+        summary: Dict[str, Any] = dict(self.counters)
+        summary["queued"] = self.queue.qsize() if self.queue is not None else 0
+        summary["warm_games"] = len(self.simulators)
+        summary["latency_target_ms"] = self.latency_target * 1000.0
+        if len(latencies):
+            summary["latency_ms"] = {"p50": float(np.percentile(latencies, 50)),
+                                     "p99": float(np.percentile(latencies, 99)),
+                                     "max": float(latencies.max())}
+        return summary
+
+    # HTTP
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """HTTP/1.1 with keep-alive, just enough of it for local clients"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {"error": f"body over {MAX_BODY_BYTES} bytes"}, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                status, response, extra = await self._route(method, target, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, response, extra, close=not keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, target: str, body: bytes) -> Tuple[int, Dict[str, Any], Dict[str, str]]:
+        url = urlsplit(target)
+        if url.path == "/health":
+            return 200, {"status": "ok"}, {}
+        if url.path == "/stats":
+            return 200, self.stats(), {}
+        if url.path != "/win-probability":
+            return 404, {"error": f"no route {url.path}"}, {}
+        if method != "POST":
+            return 405, {"error": "POST a game state"}, {"Allow": "POST"}
+        try:
+            query = parse_qs(url.query)
+            branches = int(query["branches"][0]) if "branches" in query else None
+            payload = json.loads(body)
+            if not isinstance(payload, dict):
+                raise ValueError("expected a json object")
+            return 200, await self.submit(payload, branches), {}
+        except Overloaded as e:
+            return 503, {"error": str(e)}, {"Retry-After": "1"}
+        except ValueError as e:
+            return 400, {"error": str(e)}, {}
+        except Exception as e:
+            logging.exception("Win probability request failed")
+            return 500, {"error": repr(e)}, {}
+
+    @classmethod
+    async def _respond(
+        cls,
+        writer: asyncio.StreamWriter,
+        status: int,
+        response: Dict[str, Any],
+        extra_headers: Optional[Dict[str, str]] = None,
+        close: bool = False,
+    ) -> None:
+        body = json.dumps(response).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Content-Length": str(len(body)),
+                   "Connection": "close" if close else "keep-alive", **(extra_headers or {})}
+        head = f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n" + \
+            "".join(f"{name}: {value}\r\n" for name, value in headers.items()) + "\r\n"
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+
+class WinProbabilityClient(object):
+    def __init__(self, host: str = "127.0.0.1", port: Optional[int] = None, unix_path: Optional[str] = None) -> None:
+        """Minimal asyncio client for WinProbabilityService, one connection per request so calls can overlap"""
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+
+    async def request(self, method: str, path: str, payload: Any = None) -> Tuple[int, Dict[str, Any]]:
+        if self.unix_path is not None:
+            reader, writer = await asyncio.open_unix_connection(self.unix_path)
+        else:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+            writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n"
+                         f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1")
+                         + body)
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.strip().lower() == "content-length":
+                    length = int(value)
+            return status, json.loads(await reader.readexactly(length))
+        finally:
+            writer.close()
+
+    async def win_probability(self, game_state: Dict[str, Any], branches: Optional[int] = None) -> Dict[str, Any]:
+        """POST a GameState.to_dict payload, raising Overloaded on 503 and ValueError on any other error"""
+        path = "/win-probability" if branches is None else f"/win-probability?branches={branches}"
+        status, response = await self.request("POST", path, game_state)
+        if status == 503:
+            raise Overloaded(response.get("error"))
+        if status != 200:
+            raise ValueError(f"{status}: {response.get('error')}")
+        return response
+
+    async def stats(self) -> Dict[str, Any]:
+        return (await self.request("GET", "/stats"))[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve live win probabilities for game states over HTTP")
+    parser.add_argument("--host", default=None, help="TCP address to listen on, 127.0.0.1 if no socket is given")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix-socket", default=None, help="path of a Unix socket to listen on")
+    parser.add_argument("--model-dir", default=None)
+    parser.add_argument("--compiled", action="store_true", help="use the numpy model exports instead of sklearn")
+    parser.add_argument("--branches", type=int, default=DEFAULT_BRANCHES, help="branches per request by default")
+    parser.add_argument("--latency-target-ms", type=float, default=DEFAULT_LATENCY_TARGET * 1000)
+    parser.add_argument("--batch-window-ms", type=float, default=DEFAULT_BATCH_WINDOW * 1000)
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE)
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.model_dir, compiled=args.compiled) if args.model_dir else \
+        ModelRegistry(compiled=args.compiled)
+    service = WinProbabilityService(registry, args.branches, args.latency_target_ms / 1000,
+                                    args.batch_window_ms / 1000, args.max_batch, args.max_queue)
+    service.preload()
+
+    async def serve():
+        await service.start(args.host, args.port, args.unix_socket)
+        address = args.unix_socket or f"{args.host or '127.0.0.1'}:{service.port}"
+        print(f"serving win probabilities on {address}")
+        try:
+            await service.serve_forever()
+        finally:
+            await service.close()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()